@@ -0,0 +1,55 @@
+"""add_appointment_overlap_exclusion
+
+Revision ID: 5e2c7a91b3d4
+Revises: 115422716842
+Create Date: 2026-10-18 09:00:00.000000-03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2c7a91b3d4'
+down_revision = '115422716842'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Impede no banco dois agendamentos ativos sobrepostos no mesmo negócio.
+    # end_time nulo (ou igual ao início) geraria intervalo vazio, que não se
+    # sobrepõe a nada e escaparia da constraint: preenche pela duração do
+    # serviço (60 min se ausente, como booking_guard.appointment_end) e torna
+    # a coluna obrigatória. Falha se já existirem sobreposições: resolva-as
+    # antes de aplicar.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("""
+        UPDATE appointments AS a
+        SET end_time = a.date_time + make_interval(mins => COALESCE(NULLIF(s.duration_minutes, 0), 60))
+        FROM services AS s
+        WHERE s.id = a.service_id
+          AND (a.end_time IS NULL OR a.end_time <= a.date_time)
+    """)
+    op.alter_column('appointments', 'end_time', existing_type=sa.DateTime(timezone=True), nullable=False)
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute("""
+        ALTER TABLE appointments
+        ADD CONSTRAINT appointments_no_overlap
+        EXCLUDE USING gist (
+            business_id WITH =,
+            tstzrange(date_time, end_time, '[)') WITH &&
+        )
+        WHERE (status IN ('pendente', 'confirmado', 'reagendado'))
+    """)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE appointments DROP CONSTRAINT IF EXISTS appointments_no_overlap")
+    op.alter_column('appointments', 'end_time', existing_type=sa.DateTime(timezone=True), nullable=True)
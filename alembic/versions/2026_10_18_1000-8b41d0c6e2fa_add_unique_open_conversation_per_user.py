@@ -0,0 +1,43 @@
+"""add_unique_open_conversation_per_user
+
+Revision ID: 8b41d0c6e2fa
+Revises: 5e2c7a91b3d4
+Create Date: 2026-10-18 10:00:00.000000-03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d0c6e2fa'
+down_revision = '5e2c7a91b3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fecha conversas abertas duplicadas, mantendo a mais recente de cada usuário,
+    # para que o índice único parcial possa ser criado
+    op.execute("""
+        UPDATE conversations SET status = 'closed'
+        WHERE status IN ('active', 'human')
+          AND id NOT IN (
+              SELECT MAX(id) FROM conversations
+              WHERE status IN ('active', 'human')
+              GROUP BY user_id
+          )
+    """)
+
+    # Alvo do INSERT ... ON CONFLICT em ConversationService.get_or_create_conversation
+    open_statuses = sa.text("status IN ('active', 'human')")
+    op.create_index(
+        'uq_conversations_user_open', 'conversations', ['user_id'],
+        unique=True,
+        postgresql_where=open_statuses,
+        sqlite_where=open_statuses
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_conversations_user_open', table_name='conversations')
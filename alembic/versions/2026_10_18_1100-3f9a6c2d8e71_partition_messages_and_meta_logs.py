@@ -0,0 +1,139 @@
+"""partition_messages_and_meta_logs
+
+Revision ID: 3f9a6c2d8e71
+Revises: 8b41d0c6e2fa
+Create Date: 2026-10-18 11:00:00.000000-03:00
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a6c2d8e71'
+down_revision = '8b41d0c6e2fa'
+branch_labels = None
+depends_on = None
+
+# Partições criadas à frente do mês corrente; depois disso o partition_manager assume
+MONTHS_AHEAD = 3
+
+COLUMNS = {
+    'messages': """
+        id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+        direction VARCHAR(10) NOT NULL,
+        message_id VARCHAR(255),
+        content TEXT,
+        message_type VARCHAR(20),
+        raw_payload JSON,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    """,
+    'meta_logs': """
+        id INTEGER NOT NULL DEFAULT nextval('meta_logs_id_seq'),
+        direction VARCHAR(10) NOT NULL,
+        endpoint VARCHAR(255),
+        method VARCHAR(10),
+        status_code INTEGER,
+        headers JSON,
+        payload JSON,
+        response JSON,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    """,
+}
+
+INDEXES = {
+    'messages': [
+        ('ix_messages_id', 'id'),
+        ('ix_messages_direction', 'direction'),
+        ('ix_messages_message_id', 'message_id'),
+        ('ix_messages_message_type', 'message_type'),
+        ('ix_messages_created_at', 'created_at'),
+        # Histórico da conversa (get_conversation_history) dentro de cada partição
+        ('ix_messages_conversation_id_created_at', 'conversation_id, created_at'),
+    ],
+    'meta_logs': [
+        ('ix_meta_logs_id', 'id'),
+        ('ix_meta_logs_created_at', 'created_at'),
+    ],
+}
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition(table: str) -> None:
+    bind = op.get_bind()
+    legacy = f'{table}_legacy'
+    columns = [line.split()[0] for line in COLUMNS[table].strip().splitlines()]
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"CREATE TABLE {table} ({COLUMNS[table]}) PARTITION BY RANGE (created_at)")
+
+    first = bind.execute(sa.text(f"SELECT MIN(created_at) FROM {legacy}")).scalar()
+    today = date.today().replace(day=1)
+    month = date(first.year, first.month, 1) if first else today
+    while month <= _add_months(today, MONTHS_AHEAD):
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    # Rede de segurança para datas fora das partições mensais
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    select_columns = ", ".join(
+        "COALESCE(created_at, now())" if column == 'created_at' else column for column in columns
+    )
+    op.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select_columns} FROM {legacy}")
+    op.execute(f"DROP TABLE {legacy}")
+
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    # Em tabela particionada a chave primária precisa incluir a chave de partição
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+    for name, expression in INDEXES[table]:
+        op.execute(f"CREATE INDEX {name} ON {table} ({expression})")
+
+
+def _unpartition(table: str) -> None:
+    partitioned = f'{table}_partitioned'
+    columns = [line.split()[0] for line in COLUMNS[table].strip().splitlines()]
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+    op.execute(f"ALTER TABLE {partitioned} DROP CONSTRAINT {table}_pkey")
+    for name, _ in INDEXES[table]:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    op.execute(f"CREATE TABLE {table} ({COLUMNS[table]}, CONSTRAINT {table}_pkey PRIMARY KEY (id))")
+    op.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {partitioned}")
+    op.execute(f"DROP TABLE {partitioned} CASCADE")
+
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    for name, expression in INDEXES[table]:
+        op.execute(f"CREATE INDEX {name} ON {table} ({expression})")
+
+
+def upgrade() -> None:
+    # Particionamento nativo por mês (Postgres). Copia os dados para a nova
+    # tabela pai: faça em janela de manutenção em bases grandes.
+    # Partições já arquivadas pelo partition_manager não voltam no downgrade.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('messages', 'meta_logs'):
+        _partition(table)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('meta_logs', 'messages'):
+        _unpartition(table)
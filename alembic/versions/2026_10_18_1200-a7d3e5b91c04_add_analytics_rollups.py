@@ -0,0 +1,38 @@
+"""add_analytics_rollups
+
+Revision ID: a7d3e5b91c04
+Revises: 3f9a6c2d8e71
+Create Date: 2026-10-18 12:00:00.000000-03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e5b91c04'
+down_revision = '3f9a6c2d8e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Preenchida pelo analytics_rollups; a primeira compactação (sem marca
+    # d'água) preenche todo o histórico das tabelas brutas
+    op.create_table('analytics_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('granularity', sa.String(length=10), nullable=False),
+        sa.Column('metric', sa.String(length=50), nullable=False),
+        sa.Column('dimension', sa.String(length=50), nullable=False, server_default=''),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('value', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('granularity', 'metric', 'dimension', 'bucket_start', name='uq_analytics_rollups_bucket')
+    )
+    op.create_index(op.f('ix_analytics_rollups_id'), 'analytics_rollups', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_analytics_rollups_id'), table_name='analytics_rollups')
+    op.drop_table('analytics_rollups')
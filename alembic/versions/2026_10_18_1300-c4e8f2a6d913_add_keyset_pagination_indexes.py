@@ -0,0 +1,40 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: c4e8f2a6d913
+Revises: a7d3e5b91c04
+Create Date: 2026-10-18 13:00:00.000000-03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8f2a6d913'
+down_revision = 'a7d3e5b91c04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Chaves das listagens paginadas por keyset. Conversas: a faixa com
+    # last_message_at é lida em (last_message_at DESC, id DESC), sem NULLs;
+    # a cauda sem data tem índice parcial próprio
+    op.create_index('ix_conversations_last_message_at_id', 'conversations',
+                    [sa.text('last_message_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_conversations_undated_id', 'conversations', [sa.text('id DESC')], unique=False,
+                    postgresql_where=sa.text('last_message_at IS NULL'),
+                    sqlite_where=sa.text('last_message_at IS NULL'))
+    op.create_index('ix_appointments_date_time_id', 'appointments', ['date_time', 'id'], unique=False)
+
+    # No Postgres o índice já existe na tabela particionada (migração 3f9a6c2d8e71)
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_messages_conversation_id_created_at', 'messages', ['conversation_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_messages_conversation_id_created_at', table_name='messages')
+    op.drop_index('ix_appointments_date_time_id', table_name='appointments')
+    op.drop_index('ix_conversations_undated_id', table_name='conversations')
+    op.drop_index('ix_conversations_last_message_at_id', table_name='conversations')
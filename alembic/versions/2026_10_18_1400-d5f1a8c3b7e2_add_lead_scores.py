@@ -0,0 +1,43 @@
+"""add_lead_scores
+
+Revision ID: d5f1a8c3b7e2
+Revises: c4e8f2a6d913
+Create Date: 2026-10-18 14:00:00.000000-03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1a8c3b7e2'
+down_revision = 'c4e8f2a6d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Preenchida pelo lead_store a partir dos próximos scorings; os leads que
+    # estavam só em memória não são recuperáveis
+    op.create_table('lead_scores',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phone', sa.String(length=32), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('category', sa.String(length=20), nullable=False),
+        sa.Column('priority_level', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('estimated_value', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('conversion_probability', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('profile', sa.JSON(), nullable=True),
+        sa.Column('scored_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('phone')
+    )
+    op.create_index(op.f('ix_lead_scores_id'), 'lead_scores', ['id'], unique=False)
+    op.create_index(op.f('ix_lead_scores_updated_at'), 'lead_scores', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_lead_scores_updated_at'), table_name='lead_scores')
+    op.drop_index(op.f('ix_lead_scores_id'), table_name='lead_scores')
+    op.drop_table('lead_scores')
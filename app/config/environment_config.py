@@ -198,6 +198,42 @@ class BaseConfig(BaseSettings):
         description="URL de conexão com o banco de dados"
     )
     
+    database_read_url: Optional[str] = Field(
+        default=None,
+        env="DATABASE_READ_URL",
+        description="URL da réplica de leitura (analytics, dashboard e listagens)"
+    )
+    
+    read_replica_pool_size: int = Field(
+        default=5,
+        env="READ_REPLICA_POOL_SIZE",
+        ge=1,
+        le=100
+    )
+    
+    read_replica_max_overflow: int = Field(
+        default=10,
+        env="READ_REPLICA_MAX_OVERFLOW",
+        ge=0,
+        le=100
+    )
+    
+    read_replica_max_staleness: float = Field(
+        default=5.0,
+        env="READ_REPLICA_MAX_STALENESS",
+        ge=0.1,
+        le=3600.0,
+        description="Atraso máximo de replicação aceito antes de ler do primário (segundos)"
+    )
+    
+    read_replica_check_interval: float = Field(
+        default=10.0,
+        env="READ_REPLICA_CHECK_INTERVAL",
+        ge=1.0,
+        le=600.0,
+        description="Intervalo entre verificações de atraso/saúde da réplica (segundos)"
+    )
+    
     database_dsn: Optional[str] = Field(
         default=None,
         env="DATABASE_DSN",
@@ -274,7 +310,23 @@ class BaseConfig(BaseSettings):
         le=3600,
         description="TTL do cache em segundos"
     )
-    
+
+    identity_cache_max_entries: int = Field(
+        default=10000,
+        env="IDENTITY_CACHE_MAX_ENTRIES",
+        ge=100,
+        le=1000000,
+        description="Usuários/conversas mantidos no cache em processo (wa_id -> usuário)"
+    )
+
+    conversation_cache_ttl: float = Field(
+        default=30.0,
+        env="CONVERSATION_CACHE_TTL",
+        ge=0.0,
+        le=3600.0,
+        description="TTL da conversa ativa em cache; mudanças de status feitas por outros processos aparecem após esse prazo"
+    )
+
     # ==============================
     # RATE LIMITING
     # ==============================
@@ -359,7 +411,175 @@ class BaseConfig(BaseSettings):
         env="LOG_USER_CONTEXT",
         description="Incluir contexto do usuário nos logs"
     )
-    
+
+    meta_log_batch_size: int = Field(
+        default=200,
+        env="META_LOG_BATCH_SIZE",
+        ge=1,
+        le=5000,
+        description="Registros de auditoria (meta_logs) por INSERT em lote"
+    )
+
+    meta_log_flush_interval: float = Field(
+        default=1.0,
+        env="META_LOG_FLUSH_INTERVAL",
+        ge=0.05,
+        le=60.0,
+        description="Intervalo máximo entre gravações de meta_logs (segundos)"
+    )
+
+    meta_log_max_buffer: int = Field(
+        default=10000,
+        env="META_LOG_MAX_BUFFER",
+        ge=10,
+        le=1000000
+    )
+
+    meta_log_overflow_policy: str = Field(
+        default="drop_oldest",
+        env="META_LOG_OVERFLOW_POLICY",
+        pattern="^(drop_oldest|drop_newest)$",
+        description="O que descartar quando o buffer de meta_logs está cheio"
+    )
+
+    partition_maintenance_enabled: bool = Field(
+        default=True,
+        env="PARTITION_MAINTENANCE_ENABLED",
+        description="Criar/arquivar partições mensais de messages e meta_logs (Postgres)"
+    )
+
+    partition_months_ahead: int = Field(
+        default=3,
+        env="PARTITION_MONTHS_AHEAD",
+        ge=1,
+        le=24,
+        description="Meses futuros com partição já criada"
+    )
+
+    messages_retention_months: int = Field(
+        default=12,
+        env="MESSAGES_RETENTION_MONTHS",
+        ge=1,
+        le=120,
+        description="Meses de messages mantidos no banco antes do arquivamento"
+    )
+
+    meta_logs_retention_months: int = Field(
+        default=3,
+        env="META_LOGS_RETENTION_MONTHS",
+        ge=1,
+        le=120,
+        description="Meses de meta_logs mantidos no banco antes do arquivamento"
+    )
+
+    partition_archive_dir: str = Field(
+        default="archives/partitions",
+        env="PARTITION_ARCHIVE_DIR",
+        description="Diretório dos arquivos .jsonl.gz das partições arquivadas"
+    )
+
+    rollup_compaction_interval: float = Field(
+        default=60.0,
+        env="ROLLUP_COMPACTION_INTERVAL",
+        ge=5.0,
+        le=3600.0,
+        description="Intervalo entre recompactações dos rollups de analytics (segundos)"
+    )
+
+    rollup_late_margin_seconds: int = Field(
+        default=300,
+        env="ROLLUP_LATE_MARGIN_SECONDS",
+        ge=60,
+        le=24 * 3600,
+        description="Quanto antes da marca d'água cada compactação incremental volta (commits atrasados)"
+    )
+
+    rollup_minute_retention_days: int = Field(
+        default=7,
+        env="ROLLUP_MINUTE_RETENTION_DAYS",
+        ge=1,
+        le=90,
+        description="Dias de buckets de minuto mantidos; horas e dias não expiram"
+    )
+
+    lead_hot_set_size: int = Field(
+        default=5000,
+        env="LEAD_HOT_SET_SIZE",
+        ge=10,
+        le=1_000_000,
+        description="Perfis de lead mantidos em memória (LRU); os demais ficam só em lead_scores"
+    )
+
+    lead_flush_interval: float = Field(
+        default=2.0,
+        env="LEAD_FLUSH_INTERVAL",
+        ge=0.1,
+        le=300.0,
+        description="Intervalo de gravação em lote dos scores de lead (segundos)"
+    )
+
+    lead_refresh_interval: float = Field(
+        default=30.0,
+        env="LEAD_REFRESH_INTERVAL",
+        ge=1.0,
+        le=3600.0,
+        description="Intervalo de leitura dos leads alterados por outros workers (segundos)"
+    )
+
+    flow_memory_backend: str = Field(
+        default="memory",
+        env="FLOW_MEMORY_BACKEND",
+        description="Onde fica a memória do fluxo conversacional: memory (por processo) ou redis"
+    )
+
+    flow_memory_ttl: int = Field(
+        default=1800,
+        env="FLOW_MEMORY_TTL",
+        ge=60,
+        le=7 * 24 * 3600,
+        description="Conversas sem mensagens por mais que isso são descartadas (segundos)"
+    )
+
+    flow_memory_max_local: int = Field(
+        default=10000,
+        env="FLOW_MEMORY_MAX_LOCAL",
+        ge=10,
+        le=1_000_000,
+        description="Memórias de fluxo mantidas em cada processo (LRU)"
+    )
+
+    flow_history_window: int = Field(
+        default=10,
+        env="FLOW_HISTORY_WINDOW",
+        ge=1,
+        le=100,
+        description="Itens de histórico de tópicos e perguntas pendentes guardados por conversa"
+    )
+
+    llm_context_max_resident: int = Field(
+        default=5000,
+        env="LLM_CONTEXT_MAX_RESIDENT",
+        ge=10,
+        le=1_000_000,
+        description="Contextos do LLM avançado mantidos em memória (LRU)"
+    )
+
+    llm_context_idle_ttl: int = Field(
+        default=1800,
+        env="LLM_CONTEXT_IDLE_TTL",
+        ge=60,
+        le=24 * 3600,
+        description="Contextos sem mensagens por mais que isso saem da memória (segundos)"
+    )
+
+    llm_context_spill_ttl: int = Field(
+        default=7200,
+        env="LLM_CONTEXT_SPILL_TTL",
+        ge=60,
+        le=7 * 24 * 3600,
+        description="Tempo que um contexto retirado da memória fica no Redis (segundos)"
+    )
+
     # ==============================
     # MONITORING & METRICS
     # ==============================
@@ -570,6 +790,22 @@ class BaseConfig(BaseSettings):
         le=120
     )
     
+    llm_slo_seconds: float = Field(
+        default=12.0,
+        env="LLM_SLO_SECONDS",
+        ge=1.0,
+        le=120.0,
+        description="Orçamento de latência por turno antes de degradar a resposta"
+    )
+    
+    llm_deferred_drain_interval: float = Field(
+        default=30.0,
+        env="LLM_DEFERRED_DRAIN_INTERVAL",
+        ge=1.0,
+        le=3600.0,
+        description="Intervalo (s) entre tentativas de responder os turnos adiados pela escada de degradação"
+    )
+    
     webhook_timeout: int = Field(
         default=10,
         env="WEBHOOK_TIMEOUT",
@@ -577,6 +813,118 @@ class BaseConfig(BaseSettings):
         le=60
     )
     
+    # ==============================
+    # BULKHEADS (CONCORRÊNCIA POR DEPENDÊNCIA)
+    # ==============================
+    bulkhead_whatsapp_api_max_concurrent: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_WHATSAPP_API_MAX_CONCURRENT",
+        ge=1,
+        description="Chamadas simultâneas à Graph API da Meta"
+    )
+    
+    bulkhead_whatsapp_api_max_queue: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_WHATSAPP_API_MAX_QUEUE",
+        ge=1
+    )
+    
+    bulkhead_database_max_concurrent: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_DATABASE_MAX_CONCURRENT",
+        ge=1,
+        description="Sessões simultâneas de banco (pool_size + max_overflow)"
+    )
+    
+    bulkhead_database_max_queue: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_DATABASE_MAX_QUEUE",
+        ge=1
+    )
+    
+    bulkhead_redis_max_concurrent: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_REDIS_MAX_CONCURRENT",
+        ge=1
+    )
+    
+    bulkhead_redis_max_queue: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_REDIS_MAX_QUEUE",
+        ge=1
+    )
+    
+    bulkhead_crewai_max_concurrent: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_CREWAI_MAX_CONCURRENT",
+        ge=1,
+        description="Threads executando crews do CrewAI ao mesmo tempo"
+    )
+    
+    bulkhead_crewai_max_queue: Optional[int] = Field(
+        default=None,
+        env="BULKHEAD_CREWAI_MAX_QUEUE",
+        ge=1
+    )
+    
+    crewai_task_timeout: Optional[float] = Field(
+        default=None,
+        env="CREWAI_TASK_TIMEOUT",
+        gt=0,
+        description="Tempo máximo (s) de uma execução do crew antes da resposta de fallback"
+    )
+    
+    openai_adaptive_limit_algorithm: str = Field(
+        default="gradient",
+        env="OPENAI_ADAPTIVE_LIMIT_ALGORITHM",
+        pattern="^(gradient|aimd)$",
+        description="Algoritmo do limite adaptativo de concorrência da OpenAI"
+    )
+    
+    openai_adaptive_limit_max: int = Field(
+        default=50,
+        env="OPENAI_ADAPTIVE_LIMIT_MAX",
+        ge=2,
+        le=500
+    )
+
+    openai_hedging_enabled: bool = Field(
+        default=False,
+        env="OPENAI_HEDGING_ENABLED",
+        description="Dispara requisição duplicada quando intenção/extração passam do percentil de latência"
+    )
+
+    openai_hedging_percentile: float = Field(
+        default=95.0,
+        env="OPENAI_HEDGING_PERCENTILE",
+        ge=50.0,
+        le=99.9
+    )
+
+    openai_hedging_budget_ratio: float = Field(
+        default=0.1,
+        env="OPENAI_HEDGING_BUDGET_RATIO",
+        ge=0.0,
+        le=1.0,
+        description="Fração máxima de requisições extras geradas por hedging"
+    )
+
+    hybrid_speculation_mode: str = Field(
+        default="both",
+        env="HYBRID_SPECULATION_MODE",
+        pattern="^(race|fast-with-fallback|both)$",
+        description="Turnos híbridos: race (primeira resposta aprovada vence), "
+                    "fast-with-fallback (LLM, CrewAI só se reprovar) ou both (espera os dois)"
+    )
+
+    hybrid_quality_threshold: float = Field(
+        default=60.0,
+        env="HYBRID_QUALITY_THRESHOLD",
+        ge=0.0,
+        le=100.0,
+        description="Nota mínima (0-100) para aceitar uma resposta e cancelar o outro caminho"
+    )
+
     # ==============================
     # BACKUP & RECOVERY
     # ==============================
@@ -654,7 +1002,14 @@ class BaseConfig(BaseSettings):
             except ValueError:
                 raise ValueError(f"Invalid log format: {v}")
         return v
-    
+
+    @field_validator('flow_memory_backend')
+    @classmethod
+    def validate_flow_memory_backend(cls, v):
+        if v.lower() not in ("memory", "redis"):
+            raise ValueError(f"Invalid flow memory backend: {v}")
+        return v.lower()
+
     @field_validator('alert_email')
     @classmethod
     def validate_email(cls, v):
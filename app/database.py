@@ -4,9 +4,13 @@ Configuração do banco de dados
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
 import os
 from app.config import settings
 from app.utils.logger import get_logger
+from app.services.bulkhead import bulkhead_manager
+from app.services.read_replica import ReadReplicaRouter
 
 logger = get_logger(__name__)
 # Configurar DATABASE_URL com fallback
@@ -36,6 +40,40 @@ logger.info(f"PGPORT: {os.getenv('PGPORT', 'NOT_SET')}")
 logger.info(f"PGDATABASE: {os.getenv('PGDATABASE', 'NOT_SET')}")
 logger.info(f"DATABASE_URL presente: {'Sim' if os.getenv('DATABASE_URL') else 'Não'}")
 
+
+class BulkheadQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool assíncrono que ocupa uma vaga do bulkhead por conexão em uso
+
+    A vaga é obtida antes do checkout e devolvida no checkin: sessões abertas
+    sem conexão (ex.: aguardando o LLM) não ocupam o bulkhead, e a falta de
+    conexões é rejeitada rapidamente (BulkheadFullError) em vez de esperar
+    o pool_timeout.
+    """
+
+    bulkhead_name = "database"
+
+    def _do_get(self):
+        bulkhead = bulkhead_manager.get(self.bulkhead_name)
+        # Checkout de engines assíncronos sempre roda dentro do greenlet do SQLAlchemy
+        await_only(bulkhead.acquire())
+        try:
+            return super()._do_get()
+        except BaseException:
+            bulkhead.release()
+            raise
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            bulkhead_manager.get(self.bulkhead_name).release()
+
+
+class ReadBulkheadQueuePool(BulkheadQueuePool):
+    bulkhead_name = "database_read"
+
+
 # Engine assíncrono
 engine = create_async_engine(
     database_url,
@@ -43,7 +81,8 @@ engine = create_async_engine(
     pool_pre_ping=True,
     pool_recycle=3600,
     pool_size=5,
-    max_overflow=10
+    max_overflow=10,
+    poolclass=BulkheadQueuePool
 )
 
 # Engine síncrono (para dashboard e outras operações síncronas)
@@ -71,10 +110,49 @@ SessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# Réplica de leitura opcional (analytics, dashboard e listagens), com pool próprio
+read_database_url = os.getenv('DATABASE_READ_URL') or getattr(settings, 'database_read_url', None)
+read_engine = None
+sync_read_engine = None
+ReadSessionLocal = None
+if read_database_url:
+    if read_database_url.startswith('postgresql://'):
+        read_database_url = read_database_url.replace('postgresql://', 'postgresql+asyncpg://', 1)
+    elif read_database_url.startswith('postgres://'):
+        read_database_url = read_database_url.replace('postgres://', 'postgresql+asyncpg://', 1)
+    logger.info(f"Réplica de leitura configurada: {read_database_url.split('@')[0]}@***")
+
+    read_pool = dict(
+        echo=False,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=getattr(settings, 'read_replica_pool_size', None) or 5,
+        max_overflow=getattr(settings, 'read_replica_max_overflow', 10)
+    )
+    read_engine = create_async_engine(read_database_url, poolclass=ReadBulkheadQueuePool, **read_pool)
+    sync_read_engine = create_engine(
+        read_database_url.replace('+asyncpg', '').replace('+aiosqlite', ''), **read_pool
+    )
+    ReadSessionLocal = sessionmaker(
+        read_engine,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+
+read_router = ReadReplicaRouter(
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    sync_primary=sync_engine,
+    sync_replica=sync_read_engine
+)
+
 
 async def get_db():
     """
     Dependency para obter sessão do banco de dados (assíncrona)
+    
+    O bulkhead "database" é aplicado por conexão (BulkheadQueuePool), não
+    pela duração da sessão.
     """
     async with AsyncSessionLocal() as session:
         try:
@@ -83,6 +161,18 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    """
+    Dependency para sessões somente leitura (analytics, dashboard, listagens)
+    
+    Usa a réplica quando configurada e dentro do atraso máximo
+    (READ_REPLICA_MAX_STALENESS); caso contrário, o primário. Cada pool
+    aplica seu próprio bulkhead por conexão ("database_read" / "database").
+    """
+    async with read_router.session() as session:
+        yield session
+
+
 def get_sync_db():
     """
     Dependency para obter sessão do banco de dados (síncrona)
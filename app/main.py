@@ -4,23 +4,29 @@ from app.auth import AuthMiddlewareastAPI
 """
 import logging
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
 from app.utils.logger import get_logger
 from app.routes.webhook import router as webhook_router
-from app.database import init_db
+from app.database import get_read_db, init_db, read_router
 from app.services.health_checker import health_checker, HealthStatus
 from app.middleware.rate_limit import RateLimitMiddleware, get_rate_limit_stats
 from app.services.alert_manager import alert_manager
-from app.services.llm_advanced import advanced_llm_service
+from app.services.llm_advanced import advanced_llm_service, get_advanced_llm_service
 from app.services.strategy_compatibility import hybrid_service
 from app.services.lead_scoring import lead_scoring_service
+from app.services.lead_store import lead_store
 from app.services.conversation_flow import conversation_flow_service
 from app.services.cache_service import cache_service
+from app.services.bulkhead import bulkhead_manager, BulkheadFullError
+from app.services.meta_log_sink import meta_log_sink
+from app.services.partition_manager import partition_manager
+from app.services.analytics_rollups import analytics_rollups, COMPACTED_METRICS, GRANULARITIES, LLM_METRICS
 
 # Sistema de Autenticação e Autorização
 from app.auth import AuthMiddleware
@@ -87,6 +93,28 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"⚠️ CDN Manager não pôde ser inicializado: {e}")
         
+        # Gravação em lote dos logs de auditoria da Meta API
+        meta_log_sink.start()
+        
+        # Partições mensais de messages/meta_logs: criação antecipada e arquivamento
+        partition_manager.start()
+        
+        # Rollups de analytics (compactação das tabelas brutas + tokens/custo do LLM)
+        analytics_rollups.start()
+        
+        # Índice dos leads pontuados (analytics/top-N) e gravação em lote
+        await lead_store.refresh()
+        lead_store.start()
+        
+        # Memória do fluxo conversacional (write-behind quando o backend é Redis)
+        conversation_flow_service.store.start()
+        
+        # Turnos adiados pela escada de degradação: respondidos quando o LLM volta
+        try:
+            get_advanced_llm_service().start_deferred_worker()
+        except Exception as e:
+            logger.warning(f"⚠️ Reprocessamento de turnos adiados não iniciado: {e}")
+        
         logger.info("✅ WhatsApp Agent API iniciado com sucesso!")
         logger.info(f"📱 Webhook URL: {settings.webhook_url}")
         
@@ -98,6 +126,18 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Encerrando WhatsApp Agent API...")
+    await meta_log_sink.stop()
+    await partition_manager.stop()
+    await analytics_rollups.stop()
+    await lead_store.stop()
+    await conversation_flow_service.store.stop()
+    from app.services import llm_advanced
+    if llm_advanced.advanced_llm_service is not None:
+        await llm_advanced.advanced_llm_service.degradation_ladder.stop()
+        # Contextos residentes vão para o Redis (se habilitado) antes de encerrar
+        await llm_advanced.advanced_llm_service.state_manager.store.stop()
+    from app.services.crew_agents import whatsapp_crew
+    whatsapp_crew.shutdown()
     await cache_service.close()
     
     # Shutdown
@@ -191,6 +231,20 @@ app.include_router(auth_router, tags=["Admin Authentication"])
 from app.routes.database_optimization import router as db_optimization_router
 app.include_router(db_optimization_router, tags=["Database Optimization"])
 
+# Incluir rotas de listagem administrativa (paginação por keyset)
+from app.routes.admin_listing import router as admin_listing_router
+app.include_router(admin_listing_router, tags=["Admin Listing"])
+
+
+@app.exception_handler(BulkheadFullError)
+async def bulkhead_full_handler(request, exc: BulkheadFullError):
+    """Rejeição rápida quando uma dependência está saturada"""
+    return JSONResponse(
+        content={"error": "Serviço temporariamente sobrecarregado", "dependency": exc.name},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
 
 @app.get("/health")
 async def health_check():
@@ -273,6 +327,17 @@ async def get_metrics():
         )
 
 
+@app.get("/metrics/dashboard")
+async def get_dashboard_metrics(db: AsyncSession = Depends(get_read_db)):
+    """Métricas do dashboard (sessão de leitura: réplica quando configurada)"""
+    try:
+        from app.services.data import MetricsService
+        return await MetricsService.get_dashboard_metrics(db)
+    except Exception as e:
+        logger.error(f"Erro ao obter métricas do dashboard: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+
 @app.get("/metrics/system")
 async def get_system_metrics():
     """Endpoint para métricas do sistema (legacy)"""
@@ -300,7 +365,14 @@ async def get_system_metrics():
             },
             "circuit_breakers": {
                 "whatsapp_api": circuit_breaker_stats
-            }
+            },
+            "bulkheads": bulkhead_manager.get_all_stats(),
+            "meta_log_sink": meta_log_sink.get_stats(),
+            "partitions": partition_manager.get_stats(),
+            "analytics_rollups": analytics_rollups.get_stats(),
+            "lead_store": lead_store.get_stats(),
+            "flow_memory": conversation_flow_service.store.get_stats(),
+            "read_replica": read_router.get_stats()
         }
         
         return metrics
@@ -626,7 +698,7 @@ async def score_lead(request: dict):
         if not message or not phone:
             raise HTTPException(status_code=400, detail="Message e phone são obrigatórios")
         
-        lead_score = lead_scoring_service.score_lead(
+        lead_score = await lead_scoring_service.score_lead(
             message=message,
             phone=phone,
             customer_data=customer_data,
@@ -715,7 +787,7 @@ async def test_lead_scoring():
         
         results = []
         for case in test_cases:
-            lead_score = lead_scoring_service.score_lead(
+            lead_score = await lead_scoring_service.score_lead(
                 message=case["message"],
                 phone=case["phone"],
                 customer_data=case["customer_data"]
@@ -754,6 +826,7 @@ async def test_lead_scoring():
 async def get_conversation_flow(phone: str):
     """Obtém estado atual do fluxo conversacional"""
     try:
+        await conversation_flow_service.prefetch_memory(phone)
         summary = conversation_flow_service.get_conversation_summary(phone)
         return {
             "status": "success",
@@ -841,6 +914,47 @@ async def get_conversation_analytics():
         logger.error(f"Erro ao gerar analytics conversacionais: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analytics/rollups")
+async def get_analytics_rollups(metrics: str = "messages_in,messages_out", granularity: str = "hour",
+                                hours: int = 24, dimension: str = None):
+    """Série temporal das métricas a partir dos rollups (sem varrer as tabelas brutas)"""
+    metric_list = [metric.strip() for metric in metrics.split(",") if metric.strip()]
+    unknown = [metric for metric in metric_list if metric not in COMPACTED_METRICS + LLM_METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Métricas desconhecidas: {', '.join(unknown)}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser um de {', '.join(GRANULARITIES)}")
+    if not 1 <= hours <= 24 * 400:
+        raise HTTPException(status_code=400, detail="hours deve estar entre 1 e 9600")
+    
+    try:
+        end = datetime.now(timezone.utc)
+        start = end - timedelta(hours=hours)
+        return {
+            "status": "success",
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "totals": await analytics_rollups.get_totals(metric_list, start, end),
+            "series": await analytics_rollups.get_series(metric_list, granularity, start, end, dimension)
+        }
+    except Exception as e:
+        logger.error(f"Erro ao ler rollups de analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/rollups/consistency")
+async def check_analytics_rollups(days: int = 2):
+    """Compara os rollups com as tabelas brutas nos últimos dias"""
+    if not 1 <= days <= 31:
+        raise HTTPException(status_code=400, detail="days deve estar entre 1 e 31")
+    
+    try:
+        end = datetime.now(timezone.utc)
+        return await analytics_rollups.check_consistency(end - timedelta(days=days - 1), end)
+    except Exception as e:
+        logger.error(f"Erro ao verificar rollups de analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/conversation/test")
 async def test_conversation_flow():
     """Testa o sistema de fluxo conversacional com cenários diversos"""
@@ -887,6 +1001,7 @@ async def test_conversation_flow():
             scenario_results = []
             for i, message in enumerate(scenario["messages"]):
                 # Processar mensagem
+                await conversation_flow_service.prefetch_memory(phone)
                 flow_decision = conversation_flow_service.process_message_flow(
                     message, phone, {"test": True}
                 )
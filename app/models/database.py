@@ -6,7 +6,7 @@ Modelos SQLAlchemy para o banco de dados
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, JSON, Float, DDL, Index, UniqueConstraint, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -82,6 +82,10 @@ class User(Base):
     messages = relationship("Message", back_populates="user")
 
 
+# Status em que a conversa ainda recebe mensagens (no máximo uma por usuário)
+OPEN_CONVERSATION_STATUSES = ("active", "human")
+
+
 class Conversation(Base):
     """Modelo para conversas/chats"""
     __tablename__ = "conversations"
@@ -97,9 +101,31 @@ class Conversation(Base):
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation")
 
+    __table_args__ = (
+        Index(
+            "uq_conversations_user_open", "user_id",
+            unique=True,
+            postgresql_where=status.in_(OPEN_CONVERSATION_STATUSES),
+            sqlite_where=status.in_(OPEN_CONVERSATION_STATUSES)
+        ),
+        # Chaves da paginação por keyset (ConversationService.get_conversations_page):
+        # conversas com last_message_at na ordem da listagem e a cauda sem data por id
+        Index("ix_conversations_last_message_at_id", last_message_at.desc(), id.desc()),
+        Index(
+            "ix_conversations_undated_id", id.desc(),
+            postgresql_where=last_message_at.is_(None),
+            sqlite_where=last_message_at.is_(None)
+        ),
+    )
+
 
 class Message(Base):
-    """Modelo para mensagens trocadas"""
+    """
+    Modelo para mensagens trocadas
+
+    No Postgres a tabela é particionada por mês em created_at (migração
+    3f9a6c2d8e71, chave primária física (id, created_at)); ver partition_manager
+    """
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -116,6 +142,10 @@ class Message(Base):
     user = relationship("User", back_populates="messages")
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+    )
+
 
 class Business(Base):
     """Modelo para dados da empresa/negócio"""
@@ -177,7 +207,7 @@ class Appointment(Base):
     
     # Data e horário
     date_time = Column(DateTime(timezone=True), nullable=False, index=True)
-    end_time = Column(DateTime(timezone=True))  # Calculado automaticamente
+    end_time = Column(DateTime(timezone=True), nullable=False)  # Início + duração do serviço (booking_guard.appointment_end)
     
     # Status do agendamento
     status = Column(String(20), default="pendente", index=True)  # pendente, confirmado, cancelado, concluido, bloqueado
@@ -207,6 +237,30 @@ class Appointment(Base):
     business = relationship("Business", back_populates="appointments")
     service = relationship("Service", back_populates="appointments")
 
+    __table_args__ = (
+        # Chave da paginação por keyset (AppointmentService.get_appointments_page)
+        Index("ix_appointments_date_time_id", "date_time", "id"),
+    )
+
+
+# Postgres: dois agendamentos ativos do mesmo negócio não podem se sobrepor
+# (mesma constraint da migration 5e2c7a91b3d4, para bancos criados via create_all)
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+event.listen(
+    Appointment.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE appointments ADD CONSTRAINT appointments_no_overlap "
+        "EXCLUDE USING gist (business_id WITH =, "
+        "tstzrange(date_time, end_time, '[)') WITH &&) "
+        "WHERE (status IN ('pendente', 'confirmado', 'reagendado'))"
+    ).execute_if(dialect="postgresql")
+)
+
 
 class BlockedTime(Base):
     """Modelo para horários bloqueados"""
@@ -234,7 +288,7 @@ class BlockedTime(Base):
 
 
 class MetaLog(Base):
-    """Modelo para logs das requisições da Meta API"""
+    """Modelo para logs das requisições da Meta API (particionada por mês no Postgres, como messages)"""
     __tablename__ = "meta_logs"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -248,6 +302,39 @@ class MetaLog(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class AnalyticsRollup(Base):
+    """Agregados por minuto, hora e dia lidos pelos dashboards (ver analytics_rollups)"""
+    __tablename__ = "analytics_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10), nullable=False)  # minute, hour, day
+    metric = Column(String(50), nullable=False)  # messages_in, conversations_started, llm_cost_usd...
+    dimension = Column(String(50), nullable=False, default="")  # ex.: modelo do LLM
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    value = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("granularity", "metric", "dimension", "bucket_start", name="uq_analytics_rollups_bucket"),
+    )
+
+
+class LeadRecord(Base):
+    """Último score e perfil de cada lead (gravados em lote pelo lead_store)"""
+    __tablename__ = "lead_scores"
+
+    id = Column(Integer, primary_key=True, index=True)
+    phone = Column(String(32), unique=True, nullable=False)
+    score = Column(Float, nullable=False)
+    category = Column(String(20), nullable=False)
+    priority_level = Column(Integer, nullable=False, default=1)
+    estimated_value = Column(Float, nullable=False, default=0)
+    conversion_probability = Column(Float, nullable=False, default=0)
+    profile = Column(JSON)  # CustomerProfile serializado
+    scored_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+
 class Admin(Base):
     """Modelo para usuários admin do dashboard"""
     __tablename__ = "admins"
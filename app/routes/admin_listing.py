@@ -0,0 +1,56 @@
+"""
+📋 Rotas de Listagem Administrativa
+==================================
+
+Listagens paginadas por keyset (cursor opaco em next_cursor):
+- Conversas, mais recentes primeiro
+- Agendamentos, em ordem cronológica
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_read_db
+from app.models.database import AdminUser
+from app.routes.admin_auth import get_current_admin_user
+from app.services.data import AppointmentService, ConversationService
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["Admin Listing"])
+
+
+@router.get("/conversations")
+async def list_conversations(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_read_db),
+    admin_user: AdminUser = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Conversas paginadas; passe next_cursor em cursor para a próxima página"""
+    try:
+        return await ConversationService.get_conversations_page(db, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/appointments")
+async def list_appointments(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+    admin_user: AdminUser = Depends(get_current_admin_user)
+) -> Dict[str, Any]:
+    """Agendamentos paginados a partir de start, filtráveis por status"""
+    try:
+        return await AppointmentService.get_appointments_page(
+            db, limit=limit, cursor=cursor, status=status, start=start
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -553,11 +553,12 @@ async def get_active_conversations():
     try:
         active_users = await get_lazy_state_manager().get_active_conversations()
         
-        # Detalhes das conversas ativas
+        # Detalhes das conversas ativas (um MGET por lote)
         conversations = []
+        states = await get_lazy_state_manager().get_states(active_users)
         for user_id in active_users:
             try:
-                state = await get_lazy_state_manager().get_state(user_id)
+                state = states[user_id]
                 conversations.append({
                     "user_id": user_id,
                     "phone": state.phone,
@@ -726,9 +727,10 @@ async def get_active_booking_contexts():
         active_users = await get_lazy_state_manager().get_active_conversations()
         booking_contexts = []
         
+        states = await get_lazy_state_manager().get_states(active_users)
         for user_id in active_users:
             try:
-                state = await get_lazy_state_manager().get_state(user_id)
+                state = states[user_id]
                 if state.booking_context:
                     booking_contexts.append({
                         "user_id": user_id,
@@ -778,9 +780,10 @@ async def get_state_dashboard():
         }
         
         total_duration = 0
+        states = await get_lazy_state_manager().get_states(active_users)
         for user_id in active_users:
             try:
-                state = await get_lazy_state_manager().get_state(user_id)
+                state = states[user_id]
                 
                 # Count by status
                 status = state.status.value
@@ -4,6 +4,7 @@ Rotas do webhook para receber mensagens do WhatsApp COM SANITIZAÇÃO ROBUSTA E
 import json
 import time
 from datetime import datetime
+from functools import lru_cache
 from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
@@ -23,7 +24,9 @@ from app.services.data import (
 )
 from app.services.rate_limiter import whatsapp_rate_limiter
 from app.services.cache_service import cache_service
-from app.models.database import MetaLog
+from app.services.meta_log_sink import meta_log_sink
+from app.services.identity_cache import identity_cache
+from app.services.unit_of_work import unit_of_work
 from app.config import settings
 
 # Prometheus metrics integration
@@ -255,9 +258,18 @@ async def receive_webhook(request: Request, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
+@lru_cache(maxsize=256)
+def _sanitize_header(key: str, value: str) -> tuple:
+    """Header sanitizado; os mesmos headers chegam em toda requisição da Meta"""
+    return RobustValidator.sanitize_sql_input(key[:100]), RobustValidator.sanitize_sql_input(value[:500])
+
+
 async def _log_incoming_request_secure(db: AsyncSession, payload: dict, headers: dict):
     """
     Registra requisição recebida nos logs COM SANITIZAÇÃO
+
+    O registro vai para o meta_log_sink e é gravado em lote fora do caminho
+    do webhook; db é mantido por compatibilidade com os chamadores
     """
     try:
         # 🛡️ Sanitizar headers antes de salvar
@@ -265,12 +277,11 @@ async def _log_incoming_request_secure(db: AsyncSession, payload: dict, headers:
         for key, value in headers.items():
             if isinstance(key, str) and isinstance(value, str):
                 # Sanitizar chave e valor
-                safe_key = RobustValidator.sanitize_sql_input(key[:100])
-                safe_value = RobustValidator.sanitize_sql_input(value[:500])
+                safe_key, safe_value = _sanitize_header(key, value)
                 safe_headers[safe_key] = safe_value
         
-        # Payload já foi sanitizado na função principal
-        log_entry = MetaLog(
+        # Payload já foi sanitizado na função principal; gravação em lote pelo sink
+        meta_log_sink.log(
             direction="in",
             endpoint="/webhook",
             method="POST",
@@ -278,9 +289,7 @@ async def _log_incoming_request_secure(db: AsyncSession, payload: dict, headers:
             headers=safe_headers,
             payload=payload
         )
-        db.add(log_entry)
-        await db.commit()
-        logger.debug("✅ Log de entrada salvo com segurança")
+        logger.debug("✅ Log de entrada enfileirado com segurança")
         
     except Exception as e:
         logger.error(f"❌ Erro ao salvar log de entrada seguro: {e}")
@@ -403,24 +412,21 @@ async def _process_single_message_secure(db: AsyncSession, message: dict, contac
             )
             return
         
-        # Obter ou criar usuário
-        user = await UserService.get_or_create_user(
-            db=db,
-            wa_id=wa_id,
-            nome=contact_info.get("profile", {}).get("name") if contact_info else None,
-            telefone=wa_id
-        )
-        
-        # Obter ou criar conversa
-        conversation = await ConversationService.get_or_create_conversation(
-            db=db, 
-            user_id=user.id
-        )
-        
-        # Verificar se a conversa está em modo humano
-        if conversation.status == "human":
-            logger.info(f"Conversa {conversation.id} em modo humano - mensagem ignorada pelo bot")
-            # Apenas salvar a mensagem, não responder
+        # Usuário, conversa e mensagem recebida em uma única transação; a resposta
+        # (após o LLM) é gravada em outra, sem manter locks durante a geração
+        async with unit_of_work(db):
+            user = await UserService.get_or_create_user(
+                db=db,
+                wa_id=wa_id,
+                nome=contact_info.get("profile", {}).get("name") if contact_info else None,
+                telefone=wa_id
+            )
+            
+            conversation = await ConversationService.get_or_create_conversation(
+                db=db, 
+                user_id=user.id
+            )
+            
             await MessageService.create_message(
                 db=db,
                 user_id=user.id,
@@ -431,19 +437,12 @@ async def _process_single_message_secure(db: AsyncSession, message: dict, contac
                 message_id=message_id,
                 raw_payload=message
             )
-            return
         
-        # Salvar mensagem recebida
-        await MessageService.create_message(
-            db=db,
-            user_id=user.id,
-            conversation_id=conversation.id,
-            direction="in",
-            content=content,
-            message_type=message_type,
-            message_id=message_id,
-            raw_payload=message
-        )
+        # Verificar se a conversa está em modo humano
+        if conversation.status == "human":
+            logger.info(f"Conversa {conversation.id} em modo humano - mensagem ignorada pelo bot")
+            # Mensagem já salva, não responder
+            return
         
         # Processar mensagem e gerar resposta
         await _process_and_respond_secure(db, user, conversation, content, message)
@@ -617,6 +616,7 @@ async def _process_and_respond_secure(db: AsyncSession, user, conversation, cont
             # Atualizar status da conversa
             conversation.status = "human"
             await db.commit()
+            identity_cache.forget_conversation(conversation.id)
             
             # Resposta padrão sanitizada
             handoff_message = sanitize_message(
@@ -651,7 +651,8 @@ async def _process_and_respond_secure(db: AsyncSession, user, conversation, cont
             user_id=user.wa_id,
             message=content,  # Já sanitizado
             conversation_id=conversation.id,
-            message_type=message_type
+            message_type=message_type,
+            allow_defer=True  # o worker de turnos adiados responde pelo WhatsApp
         )
         
         if response and response.text:
@@ -0,0 +1,166 @@
+"""
+Limite de concorrência adaptativo para a OpenAI
+Ajusta o número de chamadas simultâneas a partir do RTT observado e de
+sinais de sobrecarga (429/timeout), nos moldes do concurrency-limits da Netflix
+"""
+import asyncio
+import functools
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from app.config import settings
+from app.utils.metrics import metrics_collector
+from .bulkhead import Bulkhead, BulkheadConfig, bulkhead_manager
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AdaptiveLimitConfig:
+    algorithm: str = "gradient"   # "gradient" ou "aimd"
+    initial_limit: int = 10
+    min_limit: int = 2
+    max_limit: int = 50
+    backoff_ratio: float = 0.9    # redução multiplicativa ao detectar sobrecarga
+    smoothing: float = 0.2        # suavização do novo limite (gradient)
+    rtt_tolerance: float = 1.5    # RTT aceito acima do RTT de referência (gradient)
+    long_window: int = 600        # amostras da média longa de RTT (gradient)
+    timeout: float = 20.0         # RTT acima disto conta como sobrecarga
+    max_queue: int = 100
+    queue_timeout: float = 15.0
+
+
+class AdaptiveLimiter(Bulkhead):
+    """Bulkhead cujo limite de concorrência se ajusta à latência observada"""
+
+    def __init__(self, name: str, config: AdaptiveLimitConfig):
+        super().__init__(name, BulkheadConfig(
+            max_concurrent=config.initial_limit,
+            max_queue=config.max_queue,
+            queue_timeout=config.queue_timeout
+        ))
+        self.limit_config = config
+        self.limit = float(config.initial_limit)
+        self.long_rtt = 0.0
+        self.short_rtt = 0.0
+        self.samples = 0
+        self.drops = 0
+
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Executa corrotina medindo RTT e sinais de sobrecarga"""
+        await self.acquire()
+        in_flight = self._in_flight
+        start = time.monotonic()
+        dropped = None
+        try:
+            result = await func(*args, **kwargs)
+            dropped = False
+            return result
+        except asyncio.CancelledError:
+            # Cortada por prazo externo (wait_for, orçamento da degradação):
+            # chamadas lentas demais são o sinal mais claro de sobrecarga
+            dropped = True
+            raise
+        except Exception as e:
+            dropped = True if self._is_overload(e) else None
+            raise
+        finally:
+            rtt = time.monotonic() - start
+            self.release()
+            # Erros que não indicam sobrecarga (ex.: 400) não viram amostra
+            if dropped is not None:
+                self.on_sample(rtt, in_flight, dropped)
+
+    def wrap(self, func: Callable) -> Callable:
+        """Retorna versão de func limitada por este limiter"""
+        return functools.partial(self.call, func)
+
+    def on_sample(self, rtt: float, in_flight: int, dropped: bool):
+        """Atualiza o limite a partir de uma amostra de RTT"""
+        config = self.limit_config
+        self.samples += 1
+        if dropped or rtt > config.timeout:
+            self.drops += 1
+            new_limit = self.limit * config.backoff_ratio
+        elif config.algorithm == "aimd":
+            new_limit = self._aimd(in_flight)
+        else:
+            new_limit = self._gradient(rtt, in_flight)
+
+        self._set_limit(new_limit)
+
+    def _aimd(self, in_flight: int) -> float:
+        # Só cresce quando o limite está realmente sendo usado
+        if in_flight * 2 >= self.limit:
+            return self.limit + 1.0
+        return self.limit
+
+    def _gradient(self, rtt: float, in_flight: int) -> float:
+        config = self.limit_config
+        if self.samples == 1:
+            self.long_rtt = self.short_rtt = rtt
+        window = min(self.samples, config.long_window)
+        self.long_rtt += (rtt - self.long_rtt) / window
+        self.short_rtt += (rtt - self.short_rtt) / min(self.samples, 10)
+
+        # Fila esvaziou: a média longa não deve reter latência de sobrecarga antiga
+        short_rtt = max(self.short_rtt, 1e-6)
+        if self.long_rtt / short_rtt > 2.0:
+            self.long_rtt *= 0.95
+
+        if in_flight < self.limit / 2:
+            return self.limit
+
+        gradient = max(0.5, min(1.0, config.rtt_tolerance * self.long_rtt / short_rtt))
+        queue_size = math.sqrt(self.limit)
+        new_limit = self.limit * gradient + queue_size
+        return self.limit * (1 - config.smoothing) + new_limit * config.smoothing
+
+    def _set_limit(self, new_limit: float):
+        config = self.limit_config
+        self.limit = max(float(config.min_limit), min(float(config.max_limit), new_limit))
+        new_max = int(self.limit)
+        if new_max != self.config.max_concurrent:
+            logger.debug(f"Limite adaptativo {self.name}: {self.config.max_concurrent} -> {new_max}")
+            self.config.max_concurrent = new_max
+            self._drain()
+            self._publish()
+        metrics_collector.update_adaptive_limit(self.name, self.limit, self.short_rtt)
+
+    @staticmethod
+    def _is_overload(exc: Exception) -> bool:
+        """429, timeouts e limites de taxa sinalizam sobrecarga do provedor"""
+        if isinstance(exc, asyncio.TimeoutError):
+            return True
+        if getattr(exc, "status_code", None) == 429:
+            return True
+        name = type(exc).__name__
+        return "RateLimit" in name or "Timeout" in name
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            "algorithm": self.limit_config.algorithm,
+            "limit": round(self.limit, 2),
+            "long_rtt": round(self.long_rtt, 4),
+            "short_rtt": round(self.short_rtt, 4),
+            "samples": self.samples,
+            "drops": self.drops
+        })
+        return stats
+
+
+def _load_openai_config() -> AdaptiveLimitConfig:
+    config = AdaptiveLimitConfig()
+    config.algorithm = getattr(settings, "openai_adaptive_limit_algorithm", None) or config.algorithm
+    config.max_limit = getattr(settings, "openai_adaptive_limit_max", None) or config.max_limit
+    return config
+
+
+# Instância global para chat.completions.create
+openai_concurrency_limiter = bulkhead_manager.register(
+    AdaptiveLimiter("openai_adaptive", _load_openai_config())
+)
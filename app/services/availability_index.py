@@ -0,0 +1,374 @@
+"""
+Índice de disponibilidade em memória por negócio
+Responde "primeiros N horários livres com duração D a partir de T" sem
+varrer o banco dia a dia; agendamentos são atualizados incrementalmente.
+O índice é por processo: escritas de outros workers só aparecem na
+recarga, então ele serve de dica e os candidatos são conferidos no banco
+"""
+import logging
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, event, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.database import Appointment, BlockedTime, BotConfiguration, Business
+from .booking_guard import BOOKING_ACTIVE_STATUSES
+from .dynamic_scheduling import DynamicSchedulingService
+
+logger = logging.getLogger(__name__)
+
+# Status que ocupam a agenda (os mesmos da verificação de conflito)
+ACTIVE_STATUSES = BOOKING_ACTIVE_STATUSES
+
+Interval = Tuple[datetime, datetime]
+
+
+class DayIndex:
+    """Intervalos ocupados de um dia; a união ordenada é recalculada só quando muda"""
+
+    def __init__(self):
+        self.intervals: Dict[Tuple[str, int], Interval] = {}
+        self._merged: Optional[List[Interval]] = None
+        self._starts: List[datetime] = []
+
+    def add(self, key: Tuple[str, int], interval: Interval):
+        start, end = interval
+        if end <= start:
+            # Sem duração: ocupa apenas o instante de início
+            end = start + timedelta(microseconds=1)
+        self.intervals[key] = (start, end)
+        self._merged = None
+
+    def remove(self, key: Tuple[str, int]):
+        if self.intervals.pop(key, None) is not None:
+            self._merged = None
+
+    def busy(self) -> Tuple[List[Interval], List[datetime]]:
+        if self._merged is None:
+            merged: List[Interval] = []
+            for start, end in sorted(self.intervals.values()):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self._merged = merged
+            self._starts = [start for start, _ in merged]
+        return self._merged, self._starts
+
+
+@dataclass
+class BusinessAvailability:
+    """Estado carregado de um negócio"""
+    business_id: int
+    business_hours: Dict
+    step_minutes: int
+    window_start: datetime
+    window_end: datetime
+    loaded_at: float
+    recurring_blocks: List[Tuple[int, Dict, datetime, datetime, datetime, datetime]] = field(default_factory=list)
+    days: Dict[date, DayIndex] = field(default_factory=dict)
+    appointment_days: Dict[int, List[date]] = field(default_factory=dict)
+
+
+class AvailabilityIndex:
+    """Índice por negócio de intervalos ocupados (agendamentos, bloqueios e recorrências)"""
+
+    def __init__(self, horizon_days: int = 60, max_age_seconds: float = 300.0):
+        self.horizon_days = horizon_days
+        self.max_age_seconds = max_age_seconds
+        self.businesses: Dict[int, BusinessAvailability] = {}
+        self.stats = {"loads": 0, "queries": 0, "updates": 0, "stale": 0}
+
+    async def load(self, db: AsyncSession, business_id: int) -> Optional[BusinessAvailability]:
+        """Carrega agendamentos e bloqueios do horizonte com uma consulta cada"""
+        business = (await db.execute(select(Business).where(Business.id == business_id))).scalar_one_or_none()
+        if not business:
+            self.businesses.pop(business_id, None)
+            return None
+
+        bot_config = (await db.execute(
+            select(BotConfiguration).where(BotConfiguration.business_id == business_id)
+        )).scalar_one_or_none()
+        slot_duration = bot_config.slot_duration_minutes if bot_config else 30
+        break_duration = bot_config.break_between_appointments_minutes if bot_config else 0
+
+        window_start = datetime.combine(date.today(), datetime.min.time())
+        window_end = window_start + timedelta(days=self.horizon_days)
+        state = BusinessAvailability(
+            business_id=business_id,
+            business_hours=business.business_hours or {},
+            step_minutes=(slot_duration or 30) + (break_duration or 0),
+            window_start=window_start,
+            window_end=window_end,
+            loaded_at=time.monotonic()
+        )
+
+        blocks = (await db.execute(
+            select(BlockedTime).where(
+                and_(
+                    BlockedTime.business_id == business_id,
+                    or_(
+                        and_(BlockedTime.start_time < window_end, BlockedTime.end_time > window_start),
+                        and_(BlockedTime.is_recurring == True,
+                             BlockedTime.start_date < window_end, BlockedTime.end_date >= window_start)
+                    )
+                )
+            )
+        )).scalars().all()
+        one_off_blocks = []
+        for block in blocks:
+            if block.is_recurring and block.recurrence_pattern:
+                state.recurring_blocks.append((
+                    block.id, block.recurrence_pattern,
+                    _as_naive(block.start_date), _as_naive(block.end_date),
+                    _as_naive(block.start_time), _as_naive(block.end_time)
+                ))
+            else:
+                one_off_blocks.append(block)
+
+        self.businesses[business_id] = state
+        for block in one_off_blocks:
+            self._add(state, ("block", block.id), _as_naive(block.start_time), _as_naive(block.end_time))
+
+        appointments = (await db.execute(
+            select(Appointment.id, Appointment.date_time, Appointment.end_time).where(
+                and_(
+                    Appointment.business_id == business_id,
+                    Appointment.status.in_(ACTIVE_STATUSES),
+                    Appointment.date_time < window_end,
+                    or_(Appointment.end_time > window_start, Appointment.date_time >= window_start)
+                )
+            )
+        )).all()
+        for appointment_id, start, end in appointments:
+            start = _as_naive(start)
+            state.appointment_days[appointment_id] = self._add(
+                state, ("appointment", appointment_id), start, _as_naive(end) or start
+            )
+
+        self.stats["loads"] += 1
+        logger.info(
+            f"📅 Índice de disponibilidade carregado: negócio {business_id}, "
+            f"{len(appointments)} agendamentos, {len(blocks)} bloqueios, {self.horizon_days} dias"
+        )
+        return state
+
+    async def ensure_loaded(self, db: AsyncSession, business_id: int) -> Optional[BusinessAvailability]:
+        """Recarrega se o negócio não está no índice ou se o estado expirou"""
+        state = self.businesses.get(business_id)
+        if state is None or time.monotonic() - state.loaded_at > self.max_age_seconds \
+                or state.window_start.date() < date.today():
+            state = await self.load(db, business_id)
+        return state
+
+    async def find_free_slots(self, db: AsyncSession, business_id: int, duration_minutes: int,
+                              after: datetime = None, count: int = 3) -> List[datetime]:
+        """
+        Próximos horários livres, conferidos no banco antes de retornar
+
+        Se outro worker ocupou um candidato, bloqueou o horário ou mudou o
+        funcionamento, o estado do negócio é recarregado e a busca refeita
+        """
+        await self.ensure_loaded(db, business_id)
+        after = after or datetime.now()
+        slots = self.first_free_slots(business_id, after, duration_minutes, count)
+        if slots and not await self._confirm(db, business_id, slots, duration_minutes):
+            self.stats["stale"] += 1
+            logger.info(f"📅 Índice de disponibilidade desatualizado para o negócio {business_id}; recarregando")
+            await self.load(db, business_id)
+            slots = self.first_free_slots(business_id, after, duration_minutes, count)
+        return slots
+
+    async def _confirm(self, db: AsyncSession, business_id: int, slots: List[datetime],
+                       duration_minutes: int) -> bool:
+        """Se o banco ainda concorda com os candidatos (uma consulta por tipo de dado)"""
+        # Coluna, não a entidade: o identity map da sessão poderia devolver um Business antigo
+        business_hours = (await db.execute(
+            select(Business.business_hours).where(Business.id == business_id)
+        )).scalar_one_or_none()
+        state = self.businesses.get(business_id)
+        if state is None or (business_hours or {}) != state.business_hours:
+            return False
+
+        scheduling = DynamicSchedulingService(db, business_id)
+
+        duration = timedelta(minutes=duration_minutes)
+        window_start, window_end = slots[0], slots[-1] + duration
+        busy = sorted(await scheduling._load_booked_intervals(window_start, window_end)
+                      + await scheduling._load_blocked_intervals(window_start, window_end))
+        bounds = [(slot, slot + duration) for slot in slots]
+        return not any(DynamicSchedulingService._sweep_overlaps(bounds, busy))
+
+    def first_free_slots(self, business_id: int, after: datetime, duration_minutes: int,
+                         count: int = 1, until: datetime = None) -> List[datetime]:
+        """
+        Primeiros horários livres na grade de slots do negócio
+
+        Args:
+            business_id: Negócio já carregado no índice
+            after: Não retornar horários antes deste instante
+            duration_minutes: Duração do serviço
+            count: Quantidade de horários
+            until: Limite da busca (padrão: fim do horizonte carregado)
+
+        Returns:
+            Inícios dos horários livres em ordem cronológica
+        """
+        state = self.businesses.get(business_id)
+        if state is None:
+            return []
+
+        self.stats["queries"] += 1
+        duration = timedelta(minutes=duration_minutes)
+        step = timedelta(minutes=state.step_minutes)
+        after = max(after, state.window_start)
+        until = min(until or state.window_end, state.window_end)
+
+        found: List[datetime] = []
+        day = after.date()
+        while len(found) < count and datetime.combine(day, datetime.min.time()) < until:
+            window = DynamicSchedulingService.opening_window(state.business_hours, day)
+            if window is not None:
+                open_at, close_at = window
+                found.extend(self._free_in_day(
+                    self._day(state, day), open_at, min(close_at, until), after, duration, step, count - len(found)
+                ))
+            day += timedelta(days=1)
+        return found
+
+    @staticmethod
+    def _free_in_day(day_index: DayIndex, open_at: datetime, close_at: datetime, after: datetime,
+                     duration: timedelta, step: timedelta, limit: int) -> List[datetime]:
+        """Percorre a grade pulando direto para o fim de cada intervalo ocupado (busca binária)"""
+        merged, starts = day_index.busy()
+
+        def next_grid(moment: datetime) -> datetime:
+            if moment <= open_at:
+                return open_at
+            steps = -((open_at - moment) // step)  # teto da divisão
+            return open_at + steps * step
+
+        found = []
+        candidate = next_grid(after)
+        while len(found) < limit and candidate + duration <= close_at:
+            candidate_end = candidate + duration
+            i = bisect_right(starts, candidate) - 1
+            if i >= 0 and merged[i][1] > candidate:
+                candidate = next_grid(merged[i][1])
+            elif i + 1 < len(merged) and merged[i + 1][0] < candidate_end:
+                candidate = next_grid(merged[i + 1][1])
+            else:
+                found.append(candidate)
+                candidate += step
+        return found
+
+    def upsert_appointment(self, appointment: Appointment):
+        """Atualiza o índice após criar, reagendar, confirmar ou cancelar um agendamento"""
+        state = self.businesses.get(appointment.business_id)
+        if state is None or appointment.id is None:
+            return
+
+        self.stats["updates"] += 1
+        self._remove_appointment(state, appointment.id)
+        if appointment.status in ACTIVE_STATUSES:
+            start = _as_naive(appointment.date_time)
+            state.appointment_days[appointment.id] = self._add(
+                state, ("appointment", appointment.id), start, _as_naive(appointment.end_time) or start
+            )
+
+    def remove_appointment(self, business_id: int, appointment_id: int):
+        state = self.businesses.get(business_id)
+        if state is not None:
+            self.stats["updates"] += 1
+            self._remove_appointment(state, appointment_id)
+
+    def invalidate(self, business_id: int = None):
+        """Descarta o estado (ex.: após alterar bloqueios ou horário de funcionamento)"""
+        if business_id is None:
+            self.businesses.clear()
+        else:
+            self.businesses.pop(business_id, None)
+
+    def _remove_appointment(self, state: BusinessAvailability, appointment_id: int):
+        for day in state.appointment_days.pop(appointment_id, []):
+            if day in state.days:
+                state.days[day].remove(("appointment", appointment_id))
+
+    def _add(self, state: BusinessAvailability, key: Tuple[str, int], start: datetime, end: datetime) -> List[date]:
+        """Registra um intervalo em cada dia que ele toca; retorna os dias"""
+        days = []
+        day = start.date()
+        while True:
+            day_start = datetime.combine(day, datetime.min.time())
+            day_end = day_start + timedelta(days=1)
+            self._day(state, day).add(key, (max(start, day_start), min(end, day_end)))
+            days.append(day)
+            if end <= day_end:
+                return days
+            day += timedelta(days=1)
+
+    def _day(self, state: BusinessAvailability, day: date) -> DayIndex:
+        day_index = state.days.get(day)
+        if day_index is None:
+            day_index = state.days[day] = DayIndex()
+            for block_id, pattern, start_date, end_date, start_time, end_time in state.recurring_blocks:
+                if _recurs_on(pattern, start_date, end_date, day):
+                    day_index.add(("recurring", block_id), (
+                        datetime.combine(day, start_time.time()),
+                        datetime.combine(day, end_time.time())
+                    ))
+        return day_index
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "businesses": {
+                business_id: {
+                    "days": len(state.days),
+                    "appointments": len(state.appointment_days),
+                    "recurring_blocks": len(state.recurring_blocks),
+                    "age_seconds": round(time.monotonic() - state.loaded_at, 1)
+                }
+                for business_id, state in self.businesses.items()
+            }
+        }
+
+
+_as_naive = DynamicSchedulingService._as_naive
+_recurs_on = DynamicSchedulingService.recurs_on
+
+
+# Instância global
+availability_index = AvailabilityIndex()
+
+
+# Alterações de bloqueio ou de horário de funcionamento descartam o estado
+# do negócio no commit (antes dele, outra sessão ainda leria o valor antigo)
+_INVALIDATING_MODELS = {BlockedTime: "business_id", BotConfiguration: "business_id", Business: "id"}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_businesses(session: Session, flush_context):
+    changed = {
+        getattr(obj, _INVALIDATING_MODELS[type(obj)])
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if type(obj) in _INVALIDATING_MODELS
+    }
+    if changed:
+        session.info.setdefault("availability_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_businesses(session: Session):
+    for business_id in session.info.pop("availability_changed", ()):
+        availability_index.invalidate(business_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_businesses(session: Session):
+    session.info.pop("availability_changed", None)
@@ -0,0 +1,110 @@
+"""
+Reserva atômica de horários
+Serializa "verificar disponibilidade + inserir" por negócio: no Postgres com
+advisory lock de transação (e a exclusion constraint appointments_no_overlap
+como última barreira); em outros bancos (SQLite nos testes) com lock em processo
+"""
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import and_, or_, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import Appointment
+
+logger = logging.getLogger(__name__)
+
+# Status que ocupam o horário (mesmo predicado da exclusion constraint)
+BOOKING_ACTIVE_STATUSES = ("pendente", "confirmado", "reagendado")
+
+# Primeiro argumento de pg_advisory_xact_lock(int, int) para não colidir com outros locks
+BOOKING_LOCK_NAMESPACE = 7301
+
+OVERLAP_CONSTRAINT = "appointments_no_overlap"
+
+# Duração assumida quando o serviço não informa (mesmo padrão de Service.duration_minutes)
+DEFAULT_DURATION_MINUTES = 60
+
+_local_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[int, asyncio.Lock]]" = \
+    weakref.WeakKeyDictionary()
+
+
+class SlotUnavailableError(Exception):
+    """O horário solicitado já está ocupado"""
+
+    def __init__(self, business_id: int, start: datetime):
+        self.business_id = business_id
+        self.start = start
+        super().__init__(f"Horário {start} já ocupado (negócio {business_id})")
+
+
+@asynccontextmanager
+async def booking_lock(db: AsyncSession, business_id: int):
+    """
+    Mantém a agenda do negócio travada até o fim do bloco
+
+    No Postgres o lock dura até o commit/rollback da transação; o commit deve
+    acontecer dentro do bloco para valer também no fallback em processo.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :business_id)"),
+            {"namespace": BOOKING_LOCK_NAMESPACE, "business_id": business_id}
+        )
+        yield
+        return
+
+    locks = _local_locks.setdefault(asyncio.get_running_loop(), {})
+    lock = locks.setdefault(business_id, asyncio.Lock())
+    async with lock:
+        yield
+
+
+def appointment_end(start: datetime, duration_minutes: Optional[int]) -> datetime:
+    """
+    Fim do agendamento a partir da duração do serviço
+
+    Nunca igual ao início: um intervalo vazio não se sobrepõe a nada e
+    escaparia da exclusion constraint
+    """
+    return start + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+
+
+async def find_overlapping_appointment(db: AsyncSession, business_id: int, start: datetime,
+                                       end: Optional[datetime],
+                                       exclude_id: Optional[int] = None) -> Optional[Appointment]:
+    """Agendamento ativo que colide com [start, end), se houver"""
+    if end is not None and end > start:
+        collides = and_(
+            Appointment.date_time < end,
+            or_(Appointment.end_time > start, Appointment.date_time >= start)
+        )
+    else:
+        # Sem duração: colide com quem ocupa o instante de início
+        collides = and_(
+            Appointment.date_time <= start,
+            or_(Appointment.end_time > start, Appointment.date_time == start)
+        )
+
+    query = select(Appointment).where(
+        Appointment.business_id == business_id,
+        Appointment.status.in_(BOOKING_ACTIVE_STATUSES),
+        collides
+    ).limit(1)
+    if exclude_id is not None:
+        query = query.where(Appointment.id != exclude_id)
+
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+def is_overlap_violation(error: IntegrityError) -> bool:
+    """IntegrityError causado pela exclusion constraint de sobreposição"""
+    orig = getattr(error, "orig", None)
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    return sqlstate == "23P01" or OVERLAP_CONSTRAINT in str(error)
@@ -9,7 +9,11 @@ from enum import Enum
 import re
 import asyncio
 from app.models.database import Service, Appointment, User, Business
+from app.services.booking_guard import (
+    SlotUnavailableError, appointment_end, booking_lock, find_overlapping_appointment, is_overlap_violation
+)
 from app.utils.logger import get_logger
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 logger = get_logger(__name__)
 from sqlalchemy import select, and_, or_
@@ -624,9 +628,14 @@ class BookingWorkflow:
         
         if parsed_time:
             booking.time = parsed_time
-            booking.step = BookingStep.COLLECTING_NAME
             booking.attempts = 0
-            
+
+            # Novo horário após conflito na confirmação: os dados do cliente já foram coletados
+            if booking.customer_email:
+                booking.step = BookingStep.CONFIRMING
+                return self._generate_confirmation_message(booking), self._get_confirmation_buttons()
+
+            booking.step = BookingStep.COLLECTING_NAME
             return self._generate_name_request(), None
         else:
             booking.errors.append("Horário não identificado")
@@ -808,29 +817,59 @@ Confirma este agendamento?"""
                     "booking_datetime": datetime.now().isoformat()
                 }
                 
-                # Criar o agendamento na database
-                appointment = Appointment(
-                    user_id=user.id,
-                    business_id=business_id,
-                    service_id=booking.service_id,
-                    date_time=appointment_datetime,
-                    status='confirmado',
-                    notes=f"Protocolo: {protocol}\nNome: {booking.customer_name}\nTelefone: {booking.customer_phone}\nEmail: {booking.customer_email}\nServiço: {booking.service_name}\nAgendado via WhatsApp Bot",
-                    customer_notes=f"Agendamento realizado via WhatsApp",
-                    confirmed_at=datetime.now(),
-                    confirmed_by='customer'
+                # Fim pelo serviço escolhido: sem end_time o horário não fica protegido
+                duration_minutes = await db.scalar(
+                    select(Service.duration_minutes).where(Service.id == booking.service_id)
                 )
+                end_time = appointment_end(appointment_datetime, duration_minutes)
                 
-                db.add(appointment)
-                await db.commit()
+                # Verificação e inserção atômicas: a agenda do negócio fica travada até o commit
+                async with booking_lock(db, business_id):
+                    if await find_overlapping_appointment(db, business_id, appointment_datetime, end_time):
+                        raise SlotUnavailableError(business_id, appointment_datetime)
+                    
+                    # Criar o agendamento na database
+                    appointment = Appointment(
+                        user_id=user.id,
+                        business_id=business_id,
+                        service_id=booking.service_id,
+                        date_time=appointment_datetime,
+                        end_time=end_time,
+                        status='confirmado',
+                        notes=f"Protocolo: {protocol}\nNome: {booking.customer_name}\nTelefone: {booking.customer_phone}\nEmail: {booking.customer_email}\nServiço: {booking.service_name}\nAgendado via WhatsApp Bot",
+                        customer_notes=f"Agendamento realizado via WhatsApp",
+                        confirmed_at=datetime.now(),
+                        confirmed_by='customer'
+                    )
+                    
+                    db.add(appointment)
+                    await db.commit()
                 await db.refresh(appointment)
                 
+                from app.services.availability_index import availability_index
+                availability_index.upsert_appointment(appointment)
+                
                 logger.info(f"✅ Appointment saved successfully: ID {appointment.id}, Protocol {protocol}")
                 
                 # Remover do cache ativo APENAS APÓS salvar com sucesso
                 del self.active_bookings[user_id]
                 
                 return self._generate_success_message_with_protocol(booking, protocol), None
+            
+            except (SlotUnavailableError, IntegrityError) as e:
+                await db.rollback()
+                if isinstance(e, IntegrityError) and not is_overlap_violation(e):
+                    logger.error(f"Erro ao salvar agendamento na database: {e}")
+                    return "❌ Erro ao confirmar agendamento. Tente novamente.", self._get_confirmation_buttons()
+                
+                # Horário tomado entre a escolha e a confirmação: pedir outro horário
+                logger.warning(f"Horário {booking.date} {booking.time} já ocupado para {user_id}")
+                booking.time = None
+                booking.step = BookingStep.COLLECTING_TIME
+                return (
+                    "😕 Esse horário acabou de ser reservado. " + self._generate_time_request(booking.date),
+                    self._get_time_buttons()
+                )
                     
             except Exception as e:
                 logger.error(f"Erro ao salvar agendamento na database: {e}")
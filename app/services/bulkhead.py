@@ -0,0 +1,178 @@
+"""
+Sistema de Bulkheads (isolamento de concorrência) para dependências externas
+Limita chamadas simultâneas por dependência (OpenAI, Meta, Postgres, Redis)
+com fila limitada e rejeição rápida quando a fila está cheia
+"""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict
+
+from app.config import settings
+from app.utils.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class BulkheadFullError(Exception):
+    """Bulkhead sem capacidade: fila cheia ou tempo de espera esgotado"""
+
+    def __init__(self, name: str, reason: str):
+        self.name = name
+        self.reason = reason
+        super().__init__(f"Bulkhead {name} rejeitou a chamada ({reason})")
+
+
+@dataclass
+class BulkheadConfig:
+    max_concurrent: int = 10
+    max_queue: int = 50
+    queue_timeout: float = 5.0  # segundos máximos esperando por uma vaga
+
+
+class Bulkhead:
+    """Semáforo assíncrono com fila limitada e contadores de uso"""
+
+    def __init__(self, name: str, config: BulkheadConfig):
+        self.name = name
+        self.config = config
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.rejected = 0
+        self.completed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Obtém uma vaga, aguardando na fila se necessário"""
+        if self._in_flight < self.config.max_concurrent and not self._waiters:
+            self._in_flight += 1
+            self._publish()
+            return
+
+        if len(self._waiters) >= self.config.max_queue:
+            self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, timeout=self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            # Idem: _drain pode ter entregue a vaga no mesmo tick do timeout
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            # A vaga pode ter sido repassada no mesmo instante do cancelamento
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            self._publish()
+
+    def release(self):
+        """Libera a vaga, repassando-a diretamente ao próximo da fila"""
+        self.completed += 1
+        self._in_flight = max(0, self._in_flight - 1)
+        self._drain()
+        self._publish()
+
+    def _drain(self):
+        """Entrega vagas livres aos primeiros da fila"""
+        while self._waiters and self._in_flight < self.config.max_concurrent:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Executa corrotina dentro do bulkhead"""
+        async with self:
+            return await func(*args, **kwargs)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning(
+            f"Bulkhead {self.name} rejeitou chamada ({reason}) - "
+            f"em execução: {self._in_flight}, na fila: {len(self._waiters)}"
+        )
+        metrics_collector.record_bulkhead_rejection(self.name, reason)
+        raise BulkheadFullError(self.name, reason)
+
+    def _publish(self):
+        metrics_collector.update_bulkhead(self.name, self._in_flight, len(self._waiters))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "max_concurrent": self.config.max_concurrent,
+            "max_queue": self.config.max_queue,
+            "queue_timeout": self.config.queue_timeout
+        }
+
+
+class BulkheadManager:
+    """Registro de bulkheads nomeados por dependência"""
+
+    # Padrões por dependência; sobrescritos por BULKHEAD_<NOME>_* nas configurações.
+    # A OpenAI não tem bulkhead fixo: usa o limite adaptativo (adaptive_limiter)
+    DEFAULTS = {
+        "whatsapp_api": BulkheadConfig(max_concurrent=20, max_queue=100, queue_timeout=5.0),
+        "database": BulkheadConfig(max_concurrent=15, max_queue=50, queue_timeout=5.0),
+        "database_read": BulkheadConfig(max_concurrent=15, max_queue=50, queue_timeout=5.0),
+        "redis": BulkheadConfig(max_concurrent=50, max_queue=100, queue_timeout=0.5),
+        "crewai": BulkheadConfig(max_concurrent=4, max_queue=20, queue_timeout=15.0),
+    }
+
+    def __init__(self):
+        self.bulkheads: Dict[str, Bulkhead] = {}
+
+    def get(self, name: str, config: BulkheadConfig = None) -> Bulkhead:
+        """Obtém ou cria o bulkhead de uma dependência"""
+        if name not in self.bulkheads:
+            self.bulkheads[name] = Bulkhead(name, config or self._load_config(name))
+        return self.bulkheads[name]
+
+    def _load_config(self, name: str) -> BulkheadConfig:
+        default = self.DEFAULTS.get(name, BulkheadConfig())
+        prefix = f"bulkhead_{name}"
+        return BulkheadConfig(
+            max_concurrent=getattr(settings, f"{prefix}_max_concurrent", None) or default.max_concurrent,
+            max_queue=getattr(settings, f"{prefix}_max_queue", None) or default.max_queue,
+            queue_timeout=getattr(settings, f"{prefix}_queue_timeout", None) or default.queue_timeout
+        )
+
+    def register(self, bulkhead: Bulkhead) -> Bulkhead:
+        """Registra um bulkhead criado externamente (ex.: limites adaptativos)"""
+        self.bulkheads[bulkhead.name] = bulkhead
+        return bulkhead
+
+    def get_all_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: bulkhead.get_stats() for name, bulkhead in self.bulkheads.items()}
+
+
+# Instância global
+bulkhead_manager = BulkheadManager()
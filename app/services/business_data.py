@@ -6,11 +6,86 @@ Busca informações reais da database usando asyncpg diretamente
 import asyncpg
 from typing import List, Dict, Optional
 from app.utils.logger import get_logger
+from app.utils.text_analyzer import text_analyzer
 import logging
 
 logger = get_logger(__name__)
 
 
+# Sinônimos e variações por nome de serviço (busca por sinônimo em find_service_by_name)
+# ⚠️ CORREÇÃO CRÍTICA: Mapear todos os termos problemáticos identificados
+SERVICE_SYNONYMS = {
+    # PROBLEMAS CRÍTICOS IDENTIFICADOS:
+    'limpeza de pele profunda': [
+        'limpeza', 'limpeza de pele', 'facial', 'limpeza facial', 
+        'limpeza profunda', 'pele', 'tratamento facial'
+    ],
+    'massagem relaxante': [
+        'massagem', 'massagem relaxante', 'relaxante', 'relax', 
+        'massoterapia', 'terapia', 'descontração'
+    ],
+    'massagem modeladora': [
+        'massagem modeladora', 'modeladora', 'modelar', 'redutora',
+        'massagem redutora', 'corporal'
+    ],
+    'radiofrequência': [
+        'radiofrequência', 'radiofrequencia', 'radio', 'rf', 
+        'radio frequência', 'radio-frequência'
+    ],
+    'hidrofacial diamante': [
+        'hidrofacial', 'hidro', 'facial diamante', 'diamante',
+        'microdermoabrasão', 'peeling', 'hidratação facial'
+    ],
+    'criolipólise': [
+        'criolipólise', 'criolipolise', 'cryo', 'congelamento', 
+        'gordura localizada', 'redução de medidas'
+    ],
+    'drenagem linfática': [
+        'drenagem', 'linfática', 'drenagem linfática', 'drenar',
+        'inchaço', 'retenção', 'detox'
+    ],
+    'corte feminino': [
+        'corte', 'corte feminino', 'cabelo', 'cortar cabelo',
+        'corte de cabelo', 'feminino', 'mulher'
+    ],
+    'escova progressiva': [
+        'escova', 'progressiva', 'alisamento', 'alisar',
+        'cabelo liso', 'tratamento capilar'
+    ],
+    'manicure completa': [
+        'manicure', 'manicure completa', 'unha', 'unhas',
+        'fazer unha', 'cuidar das unhas'
+    ],
+    'pedicure spa': [
+        'pedicure', 'pedi', 'spa', 'pés', 'unha do pé',
+        'cuidar dos pés', 'pedicure spa'
+    ],
+    'peeling químico': [
+        'peeling', 'químico', 'peeling químico', 'ácido',
+        'renovação', 'esfoliação'
+    ],
+    'depilação pernas completas': [
+        'depilação', 'pernas', 'perna', 'depilar',
+        'pelos', 'cera', 'laser'
+    ],
+    'depilação virilha completa': [
+        'virilha', 'íntima', 'bikini', 'região íntima',
+        'depilação íntima', 'brazilian'
+    ],
+    'pacote noiva': [
+        'noiva', 'casamento', 'pacote', 'dia especial',
+        'combo noiva', 'preparação'
+    ],
+    'day spa relax': [
+        'day spa', 'spa', 'relax', 'relaxamento',
+        'dia de spa', 'bem-estar', 'autocuidado'
+    ]
+}
+
+for _service_key, _synonyms in SERVICE_SYNONYMS.items():
+    text_analyzer.register_keywords(f"service.{_service_key}", _synonyms)
+
+
 class ServiceData:
     """Classe simples para representar dados de serviço"""
     def __init__(self, id: int, name: str, price: str, duration: int, description: str = ""):
@@ -279,89 +354,22 @@ class BusinessDataService:
                 logger.info(f"✅ Encontrado por palavra-chave: {service.name} (busca: {search_words})")
                 return service
         
-        # 🔍 FASE 4: Mapeamento INTELIGENTE de sinônimos e variações
-        # ⚠️ CORREÇÃO CRÍTICA: Mapear todos os termos problemáticos identificados
-        keywords_map = {
-            # PROBLEMAS CRÍTICOS IDENTIFICADOS:
-            'limpeza de pele profunda': [
-                'limpeza', 'limpeza de pele', 'facial', 'limpeza facial', 
-                'limpeza profunda', 'pele', 'tratamento facial'
-            ],
-            'massagem relaxante': [
-                'massagem', 'massagem relaxante', 'relaxante', 'relax', 
-                'massoterapia', 'terapia', 'descontração'
-            ],
-            'massagem modeladora': [
-                'massagem modeladora', 'modeladora', 'modelar', 'redutora',
-                'massagem redutora', 'corporal'
-            ],
-            'radiofrequência': [
-                'radiofrequência', 'radiofrequencia', 'radio', 'rf', 
-                'radio frequência', 'radio-frequência'
-            ],
-            'hidrofacial diamante': [
-                'hidrofacial', 'hidro', 'facial diamante', 'diamante',
-                'microdermoabrasão', 'peeling', 'hidratação facial'
-            ],
-            'criolipólise': [
-                'criolipólise', 'criolipolise', 'cryo', 'congelamento', 
-                'gordura localizada', 'redução de medidas'
-            ],
-            'drenagem linfática': [
-                'drenagem', 'linfática', 'drenagem linfática', 'drenar',
-                'inchaço', 'retenção', 'detox'
-            ],
-            'corte feminino': [
-                'corte', 'corte feminino', 'cabelo', 'cortar cabelo',
-                'corte de cabelo', 'feminino', 'mulher'
-            ],
-            'escova progressiva': [
-                'escova', 'progressiva', 'alisamento', 'alisar',
-                'cabelo liso', 'tratamento capilar'
-            ],
-            'manicure completa': [
-                'manicure', 'manicure completa', 'unha', 'unhas',
-                'fazer unha', 'cuidar das unhas'
-            ],
-            'pedicure spa': [
-                'pedicure', 'pedi', 'spa', 'pés', 'unha do pé',
-                'cuidar dos pés', 'pedicure spa'
-            ],
-            'peeling químico': [
-                'peeling', 'químico', 'peeling químico', 'ácido',
-                'renovação', 'esfoliação'
-            ],
-            'depilação pernas completas': [
-                'depilação', 'pernas', 'perna', 'depilar',
-                'pelos', 'cera', 'laser'
-            ],
-            'depilação virilha completa': [
-                'virilha', 'íntima', 'bikini', 'região íntima',
-                'depilação íntima', 'brazilian'
-            ],
-            'pacote noiva': [
-                'noiva', 'casamento', 'pacote', 'dia especial',
-                'combo noiva', 'preparação'
-            ],
-            'day spa relax': [
-                'day spa', 'spa', 'relax', 'relaxamento',
-                'dia de spa', 'bem-estar', 'autocuidado'
-            ]
-        }
+        # 🔍 FASE 4: Mapeamento INTELIGENTE de sinônimos e variações (SERVICE_SYNONYMS)
+        features = text_analyzer.analyze(service_name_clean)
         
         # Buscar por sinônimos para cada serviço disponível
         for service in services:
             service_key = service.name.lower()
             
             # Verificar se existe mapeamento para este serviço
-            service_keywords = keywords_map.get(service_key, [])
+            service_keywords = SERVICE_SYNONYMS.get(service_key, [])
             
             # Também adicionar palavras do próprio nome como keywords
             service_name_words = service.name.lower().split()
             all_keywords = service_keywords + service_name_words
             
             # Verificar se qualquer palavra da busca corresponde às keywords
-            if any(keyword in service_name_clean for keyword in all_keywords):
+            if features.has(f"service.{service_key}") or any(word in service_name_clean for word in service_name_words):
                 logger.info(f"✅ Encontrado por sinônimo: {service.name} (termo: '{service_name_clean}')")
                 return service
             
@@ -15,6 +15,7 @@ import redis
 from app.config import settings
 from app.utils.logger import get_logger
 from app.config.redis_config import redis_manager
+from app.services.bulkhead import bulkhead_manager, BulkheadFullError
 
 logger = get_logger(__name__)
 logger = logging.getLogger(__name__)
@@ -181,8 +182,9 @@ class CacheService:
         """Busca valor do cache (Redis ou memória)"""
         try:
             if self.redis:
-                # Usar Redis
-                return self.redis.get(key)
+                # Usar Redis (fora do event loop, limitado pelo bulkhead)
+                async with bulkhead_manager.get("redis"):
+                    return await asyncio.to_thread(self.redis.get, key)
             else:
                 # Usar cache em memória
                 if key in self.memory_cache:
@@ -195,6 +197,9 @@ class CacheService:
                         self.memory_cache.pop(key, None)
                         self.memory_cache_timestamps.pop(key, None)
                 return None
+        except BulkheadFullError:
+            # Redis saturado: tratar como cache miss em vez de esperar
+            return None
         except Exception as e:
             logger.error(f"Erro ao buscar cache: {e}")
             return None
@@ -203,8 +208,9 @@ class CacheService:
         """Armazena valor no cache (Redis ou memória)"""
         try:
             if self.redis:
-                # Usar Redis com TTL
-                self.redis.setex(key, ttl, value)
+                # Usar Redis com TTL (fora do event loop, limitado pelo bulkhead)
+                async with bulkhead_manager.get("redis"):
+                    await asyncio.to_thread(self.redis.setex, key, ttl, value)
             else:
                 # Usar cache em memória
                 self.memory_cache[key] = json.loads(value)
@@ -213,6 +219,9 @@ class CacheService:
                 # Limpar cache expirado periodicamente
                 self._cleanup_memory_cache()
                 
+        except BulkheadFullError:
+            # Redis saturado: descartar a escrita, o cache é opcional
+            self._update_metrics("errors")
         except Exception as e:
             logger.error(f"Erro ao armazenar cache: {e}")
     
@@ -14,6 +14,9 @@ from dataclasses import dataclass, field
 import re
 from collections import deque
 
+from app.services.flow_memory_store import FlowMemoryStore, create_flow_memory_store
+from app.utils.text_analyzer import text_analyzer
+
 logger = logging.getLogger(__name__)
 
 
@@ -84,6 +87,92 @@ class FlowDecision:
     agent_instructions: Dict[str, Any] = field(default_factory=dict)
 
 
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def memory_to_json(memory: ConversationMemory, history_window: int = 10) -> str:
+    """
+    Forma compacta da memória (chaves curtas; tópicos guardam só os campos
+    que mudam, o resto vem das definições do engine)
+    """
+    data = {
+        "s": memory.current_state.value,
+        "p": memory.previous_state.value if memory.previous_state else None,
+        "h": [
+            [entry["topic_id"], entry["state"].value, _timestamp(entry["timestamp"]), entry["message_preview"]]
+            for entry in list(memory.topic_history)[-history_window:]
+        ],
+        "t": {
+            topic_id: [topic.mentions, _timestamp(topic.last_mentioned), topic.resolved, topic.confidence]
+            + ([topic.context_data] if topic.context_data else [])
+            for topic_id, topic in memory.active_topics.items()
+        },
+        "c": memory.context_switches,
+        "b": _timestamp(memory.conversation_start),
+        "a": _timestamp(memory.last_activity)
+    }
+    if memory.user_preferences:
+        data["u"] = memory.user_preferences
+    if memory.pending_questions:
+        data["q"] = memory.pending_questions[-history_window:]
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def memory_from_json(
+    data: str,
+    topic_definitions: Dict[str, ConversationTopic],
+    history_window: int = 10
+) -> ConversationMemory:
+    """Inverso de memory_to_json; tópicos que não existem mais são ignorados"""
+    raw = json.loads(data)
+    active_topics = {}
+    for topic_id, values in raw["t"].items():
+        definition = topic_definitions.get(topic_id)
+        if definition is None:
+            continue
+        mentions, last_mentioned, resolved, confidence = values[:4]
+        active_topics[topic_id] = ConversationTopic(
+            topic_id=topic_id,
+            name=definition.name,
+            keywords=definition.keywords,
+            priority=definition.priority,
+            state=definition.state,
+            context_data=values[4] if len(values) > 4 else {},
+            mentions=mentions,
+            last_mentioned=_datetime(last_mentioned),
+            resolved=resolved,
+            confidence=confidence
+        )
+    return ConversationMemory(
+        topic_history=deque(
+            (
+                {
+                    "topic_id": topic_id,
+                    "state": ConversationState(state),
+                    "timestamp": _datetime(timestamp),
+                    "message_preview": preview
+                }
+                for topic_id, state, timestamp, preview in raw["h"]
+            ),
+            maxlen=history_window
+        ),
+        active_topics=active_topics,
+        current_state=ConversationState(raw["s"]),
+        previous_state=ConversationState(raw["p"]) if raw["p"] else None,
+        user_preferences=raw.get("u", {}),
+        pending_questions=raw.get("q", []),
+        context_switches=raw["c"],
+        conversation_start=_datetime(raw["b"]),
+        last_activity=_datetime(raw["a"])
+    )
+
+
+
 class ConversationFlowEngine:
     """Engine de fluxo conversacional não-linear"""
     
@@ -92,6 +181,11 @@ class ConversationFlowEngine:
         self.state_transitions = self._initialize_transitions()
         self.context_patterns = self._initialize_context_patterns()
         
+        for topic_id, topic in self.topic_definitions.items():
+            text_analyzer.register_keywords(f"flow.topic.{topic_id}", topic.keywords)
+        for pattern_type, patterns in self.context_patterns.items():
+            text_analyzer.register_keywords(f"flow.context.{pattern_type}", patterns)
+        
     def _initialize_topics(self) -> Dict[str, ConversationTopic]:
         """Inicializa definições de tópicos"""
         topics = {
@@ -323,18 +417,13 @@ class ConversationFlowEngine:
     
     def _detect_topics(self, message: str) -> List[ConversationTopic]:
         """Detecta tópicos mencionados na mensagem"""
-        message_lower = message.lower()
+        features = text_analyzer.analyze(message)
         detected_topics = []
         
         for topic_id, topic in self.topic_definitions.items():
-            confidence = 0.0
-            matches = 0
-            
             # Contar matches de palavras-chave
-            for keyword in topic.keywords:
-                if keyword in message_lower:
-                    matches += 1
-                    confidence += 0.1
+            matches = features.count(f"flow.topic.{topic_id}")
+            confidence = matches * 0.1
             
             # Ajustar confiança baseada no número de matches
             if matches > 0:
@@ -361,22 +450,21 @@ class ConversationFlowEngine:
     
     def _analyze_transition_type(self, message: str, memory: ConversationMemory) -> FlowTransition:
         """Analisa tipo de transição baseado na mensagem"""
-        message_lower = message.lower()
+        features = text_analyzer.analyze(message)
         
         # Verificar padrões de contexto
-        for pattern_type, patterns in self.context_patterns.items():
-            for pattern in patterns:
-                if pattern in message_lower:
-                    if pattern_type == "back_reference":
-                        return FlowTransition.BACK_REFERENCE
-                    elif pattern_type == "topic_change":
-                        return FlowTransition.TOPIC_CHANGE
-                    elif pattern_type == "interrupt":
-                        return FlowTransition.INTERRUPT
-                    elif pattern_type == "clarification":
-                        return FlowTransition.CLARIFICATION
-                    elif pattern_type == "multi_topic":
-                        return FlowTransition.MULTI_TOPIC
+        for pattern_type in self.context_patterns:
+            if features.has(f"flow.context.{pattern_type}"):
+                if pattern_type == "back_reference":
+                    return FlowTransition.BACK_REFERENCE
+                elif pattern_type == "topic_change":
+                    return FlowTransition.TOPIC_CHANGE
+                elif pattern_type == "interrupt":
+                    return FlowTransition.INTERRUPT
+                elif pattern_type == "clarification":
+                    return FlowTransition.CLARIFICATION
+                elif pattern_type == "multi_topic":
+                    return FlowTransition.MULTI_TOPIC
         
         # Se não detectou padrão específico, verificar se é progressão natural
         if len(memory.topic_history) > 0:
@@ -690,9 +778,30 @@ class ConversationFlowEngine:
 class ConversationFlowService:
     """Serviço de gerenciamento de fluxo conversacional"""
     
-    def __init__(self):
+    def __init__(self, store: FlowMemoryStore = None):
         self.engine = ConversationFlowEngine()
-        self.conversation_memories: Dict[str, ConversationMemory] = {}
+        if store is None:
+            store = create_flow_memory_store(self._encode_memory, self._decode_memory)
+        self.store = store
+        self.history_window = self.store.config.history_window
+    
+    def _encode_memory(self, memory: ConversationMemory) -> str:
+        return memory_to_json(memory, self.history_window)
+    
+    def _decode_memory(self, data: str) -> ConversationMemory:
+        return memory_from_json(data, self.engine.topic_definitions, self.history_window)
+    
+    def _new_memory(self) -> ConversationMemory:
+        return ConversationMemory(topic_history=deque(maxlen=self.history_window))
+    
+    @property
+    def conversation_memories(self) -> FlowMemoryStore:
+        """Compatibilidade: memórias ativas (in/get/items) vêm do store"""
+        return self.store
+    
+    async def prefetch_memory(self, user_phone: str):
+        """Carrega a memória da conversa do backend antes dos passos síncronos do fluxo"""
+        await self.store.prefetch(user_phone)
     
     def process_message_flow(
         self,
@@ -703,10 +812,7 @@ class ConversationFlowService:
         """Processa mensagem e retorna decisão de fluxo"""
         
         # Obter ou criar memória da conversa
-        if user_phone not in self.conversation_memories:
-            self.conversation_memories[user_phone] = ConversationMemory()
-        
-        memory = self.conversation_memories[user_phone]
+        memory = self.store.get_or_create(user_phone, self._new_memory)
         
         # Analisar fluxo
         decision = self.engine.analyze_conversation_flow(
@@ -721,6 +827,12 @@ class ConversationFlowService:
         if decision.transition_type != FlowTransition.NATURAL_PROGRESSION:
             memory.context_switches += 1
         
+        # Perguntas pendentes seguem a mesma janela do histórico de tópicos
+        if len(memory.pending_questions) > self.history_window:
+            del memory.pending_questions[:-self.history_window]
+        
+        self.store.save(user_phone, memory)
+        
         logger.info(f"Flow decision for {user_phone}: {decision.transition_type.value} → {decision.next_state.value}")
         
         return decision
@@ -728,11 +840,10 @@ class ConversationFlowService:
     def get_conversation_summary(self, user_phone: str) -> Dict[str, Any]:
         """Retorna resumo da conversa"""
         
-        if user_phone not in self.conversation_memories:
+        memory = self.store.get(user_phone)
+        if memory is None:
             return {"status": "no_conversation"}
         
-        memory = self.conversation_memories[user_phone]
-        
         return {
             "current_state": memory.current_state.value,
             "previous_state": memory.previous_state.value if memory.previous_state else None,
@@ -754,17 +865,16 @@ class ConversationFlowService:
     
     def reset_conversation(self, user_phone: str):
         """Reseta conversa para começar do zero"""
-        if user_phone in self.conversation_memories:
-            del self.conversation_memories[user_phone]
+        self.store.delete(user_phone)
         logger.info(f"Conversation reset for {user_phone}")
     
     def mark_topic_resolved(self, user_phone: str, topic_id: str):
         """Marca tópico como resolvido"""
-        if user_phone in self.conversation_memories:
-            memory = self.conversation_memories[user_phone]
-            if topic_id in memory.active_topics:
-                memory.active_topics[topic_id].resolved = True
-                logger.info(f"Topic {topic_id} marked as resolved for {user_phone}")
+        memory = self.store.get(user_phone)
+        if memory is not None and topic_id in memory.active_topics:
+            memory.active_topics[topic_id].resolved = True
+            self.store.save(user_phone, memory)
+            logger.info(f"Topic {topic_id} marked as resolved for {user_phone}")
 
 
 # Instância global do serviço
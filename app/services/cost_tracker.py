@@ -13,6 +13,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+from app.services.analytics_rollups import analytics_rollups
+
 logger = logging.getLogger(__name__)
 
 class OpenAICostTracker:
@@ -48,6 +50,9 @@ class OpenAICostTracker:
             "dall-e-2": {"images": 0, "calls": 0}
         }
         
+        # Custo extra de requisições hedged (já incluído nos totais acima)
+        self.hedge_usage = {"input": 0, "output": 0, "calls": 0, "cost_usd": 0.0}
+        
         # Configurações de limites
         self.daily_limit_usd = 10.0
         self.monthly_limit_usd = 100.0
@@ -124,6 +129,16 @@ class OpenAICostTracker:
                 self.monthly_usage[month][model]["output"] += output_tokens
                 self.monthly_usage[month][model]["calls"] += 1
                 
+                # Rollups por minuto/hora/dia lidos pelos dashboards
+                price = self.PRICES[model]
+                analytics_rollups.record("llm_input_tokens", input_tokens, dimension=model)
+                analytics_rollups.record("llm_output_tokens", output_tokens, dimension=model)
+                analytics_rollups.record(
+                    "llm_cost_usd",
+                    (input_tokens / 1000) * price["input"] + (output_tokens / 1000) * price["output"],
+                    dimension=model
+                )
+                
             elif model == "whisper":
                 # Whisper (áudio)
                 self.session_usage[model]["minutes"] += minutes
@@ -168,6 +183,17 @@ class OpenAICostTracker:
         except Exception as e:
             logger.error(f"❌ Erro ao registrar uso: {e}")
     
+    def track_hedge_usage(self, model: str, input_tokens: int = 0, output_tokens: int = 0):
+        """Registra o custo estimado de uma requisição duplicada por hedging"""
+        self.track_usage(model=model, input_tokens=input_tokens, output_tokens=output_tokens)
+        
+        prices = self.PRICES.get(model)
+        if isinstance(prices, dict):
+            self.hedge_usage["cost_usd"] += (input_tokens / 1000) * prices["input"] + (output_tokens / 1000) * prices["output"]
+        self.hedge_usage["input"] += input_tokens
+        self.hedge_usage["output"] += output_tokens
+        self.hedge_usage["calls"] += 1
+    
     def get_session_cost(self) -> float:
         """Calcula custo da sessão atual em USD"""
         total = 0.0
@@ -268,7 +294,8 @@ class OpenAICostTracker:
             "session": {
                 "cost_usd": session_cost,
                 "cost_brl": self.get_cost_in_brl(session_cost),
-                "usage": self.session_usage
+                "usage": self.session_usage,
+                "hedging": self.hedge_usage
             },
             "daily": {
                 "date": today,
@@ -318,6 +345,7 @@ class OpenAICostTracker:
             if isinstance(self.session_usage[model], dict):
                 for key in self.session_usage[model]:
                     self.session_usage[model][key] = 0
+        self.hedge_usage = {"input": 0, "output": 0, "calls": 0, "cost_usd": 0.0}
         logger.info("🔄 Contadores de sessão resetados")
     
     def get_cost_projection(self, days_ahead: int = 30) -> Dict:
@@ -10,6 +10,8 @@ import logging
 from enum import Enum
 
 from app.config import settings
+from app.services.bulkhead import BulkheadFullError
+from app.services.crew_pool import CrewTimeoutError, CrewWorkerPool
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -72,6 +74,77 @@ class AgentRole(Enum):
     SUPERVISOR = "supervisor"
 
 
+AGENT_CONFIGS: Dict[AgentRole, Dict[str, Any]] = {
+    # 1. Maria - Agente Recepcionista
+    AgentRole.RECEPTIONIST: {
+        "role": "Recepcionista Virtual",
+        "goal": "Recepcionar clientes com cordialidade e direcionar para o agente correto",
+        "backstory": """Você é Maria, uma recepcionista virtual experiente e cordial. 
+        Você é a primeira pessoa que os clientes encontram e é responsável por criar 
+        uma primeira impressão positiva. Você identifica a necessidade do cliente 
+        e direciona para o agente especializado apropriado.""",
+        "allow_delegation": True,
+        "llm_config": {
+            "model": "gpt-4o-mini",
+            "temperature": 0.7
+        }
+    },
+    # 2. Carlos - Agente Agendamento
+    AgentRole.SCHEDULER: {
+        "role": "Especialista em Agendamentos",
+        "goal": "Gerenciar agendamentos de forma eficiente e organizada",
+        "backstory": """Você é Carlos, um especialista em agendamentos altamente organizado. 
+        Você gerencia calendários, horários disponíveis e confirmações de agendamento. 
+        Você é meticuloso com datas e horários e sempre confirma os detalhes com os clientes.""",
+        "allow_delegation": False,
+        "llm_config": {
+            "model": "gpt-4o-mini",
+            "temperature": 0.3
+        }
+    },
+    # 3. Ana - Agente Vendas
+    AgentRole.SALES: {
+        "role": "Consultora de Vendas",
+        "goal": "Maximizar conversões através de consulta especializada",
+        "backstory": """Você é Ana, uma consultora de vendas experiente e persuasiva. 
+        Você entende as necessidades dos clientes, qualifica leads e apresenta 
+        soluções personalizadas. Você é focada em resultados mas sempre ética 
+        e centrada no cliente.""",
+        "allow_delegation": False,
+        "llm_config": {
+            "model": "gpt-4o-mini",
+            "temperature": 0.8
+        }
+    },
+    # 4. Roberto - Agente Suporte
+    AgentRole.SUPPORT: {
+        "role": "Especialista em Suporte Técnico",
+        "goal": "Resolver problemas técnicos e dúvidas dos clientes",
+        "backstory": """Você é Roberto, um especialista em suporte técnico paciente e conhecedor. 
+        Você resolve problemas complexos, explica soluções de forma clara e sempre 
+        acompanha para garantir que o problema foi resolvido completamente.""",
+        "allow_delegation": False,
+        "llm_config": {
+            "model": "gpt-4o-mini",
+            "temperature": 0.2
+        }
+    },
+    # 5. Patricia - Agente Supervisora
+    AgentRole.SUPERVISOR: {
+        "role": "Supervisora de Qualidade",
+        "goal": "Garantir qualidade e coordenar a equipe de agentes",
+        "backstory": """Você é Patricia, uma supervisora experiente que garante a 
+        qualidade do atendimento. Você coordena os outros agentes, resolve 
+        escalações e toma decisões estratégicas sobre o atendimento.""",
+        "allow_delegation": True,
+        "llm_config": {
+            "model": "gpt-4o-mini",
+            "temperature": 0.5
+        }
+    },
+}
+
+
 class WhatsAppAgentCrew:
     """Sistema de múltiplos agentes especializados para WhatsApp"""
     
@@ -85,6 +158,8 @@ class WhatsAppAgentCrew:
             "success_rate": 0.0
         }
         self._crewai_initialized = False
+        # kickoff() roda em threads, com um crew pronto por papel
+        self.pool = CrewWorkerPool(self._build_role_crew)
     
     def _ensure_crewai_loaded(self):
         """Garante que o CrewAI está carregado antes de usar"""
@@ -97,82 +172,31 @@ class WhatsAppAgentCrew:
     
     def _initialize_agents(self):
         """Inicializa todos os agentes especializados"""
-        
-        # 1. Maria - Agente Recepcionista
-        self.agents[AgentRole.RECEPTIONIST] = _Agent(
-            role="Recepcionista Virtual",
-            goal="Recepcionar clientes com cordialidade e direcionar para o agente correto",
-            backstory="""Você é Maria, uma recepcionista virtual experiente e cordial. 
-            Você é a primeira pessoa que os clientes encontram e é responsável por criar 
-            uma primeira impressão positiva. Você identifica a necessidade do cliente 
-            e direciona para o agente especializado apropriado.""",
-            verbose=settings.debug,  # Condicional ao debug
-            allow_delegation=True,
-            llm_config={
-                "model": "gpt-4o-mini",
-                "temperature": 0.7
-            }
-        )
-        
-        # 2. Carlos - Agente Agendamento
-        self.agents[AgentRole.SCHEDULER] = _Agent(
-            role="Especialista em Agendamentos",
-            goal="Gerenciar agendamentos de forma eficiente e organizada",
-            backstory="""Você é Carlos, um especialista em agendamentos altamente organizado. 
-            Você gerencia calendários, horários disponíveis e confirmações de agendamento. 
-            Você é meticuloso com datas e horários e sempre confirma os detalhes com os clientes.""",
-            verbose=settings.debug,  # Condicional ao debug
-            allow_delegation=False,
-            llm_config={
-                "model": "gpt-4o-mini",
-                "temperature": 0.3
-            }
-        )
-        
-        # 3. Ana - Agente Vendas
-        self.agents[AgentRole.SALES] = _Agent(
-            role="Consultora de Vendas",
-            goal="Maximizar conversões através de consulta especializada",
-            backstory="""Você é Ana, uma consultora de vendas experiente e persuasiva. 
-            Você entende as necessidades dos clientes, qualifica leads e apresenta 
-            soluções personalizadas. Você é focada em resultados mas sempre ética 
-            e centrada no cliente.""",
-            verbose=settings.debug,  # Condicional ao debug
-            allow_delegation=False,
-            llm_config={
-                "model": "gpt-4o-mini",
-                "temperature": 0.8
-            }
+        for role in AgentRole:
+            self.agents[role] = self._new_agent(role)
+    
+    def _new_agent(self, agent_role: AgentRole) -> Any:
+        """Cria uma instância nova do agente a partir da configuração do papel"""
+        return _Agent(verbose=settings.debug, **AGENT_CONFIGS[agent_role])
+    
+    def _build_role_crew(self, agent_role: AgentRole) -> Any:
+        """
+        Crew de um agente só, montado uma vez e reaproveitado: a descrição da
+        tarefa de cada mensagem entra pelos inputs do kickoff. Cada crew tem
+        o seu próprio Agent, já que o kickoff altera o estado do agente
+        (crew, executor) e crews do mesmo papel rodam em threads paralelas
+        """
+        agent = self._new_agent(agent_role)
+        task = _Task(
+            description="{task_description}",
+            expected_output="Resposta natural, contextual e adaptada ao fluxo da conversa",
+            agent=agent
         )
-        
-        # 4. Roberto - Agente Suporte
-        self.agents[AgentRole.SUPPORT] = _Agent(
-            role="Especialista em Suporte Técnico",
-            goal="Resolver problemas técnicos e dúvidas dos clientes",
-            backstory="""Você é Roberto, um especialista em suporte técnico paciente e conhecedor. 
-            Você resolve problemas complexos, explica soluções de forma clara e sempre 
-            acompanha para garantir que o problema foi resolvido completamente.""",
-            verbose=settings.debug,  # Condicional ao debug
-            allow_delegation=False,
-            llm_config={
-                "model": "gpt-4o-mini",  
-                "temperature": 0.2
-            }
-        )
-        
-        # 5. Patricia - Agente Supervisora
-        self.agents[AgentRole.SUPERVISOR] = _Agent(
-            role="Supervisora de Qualidade",
-            goal="Garantir qualidade e coordenar a equipe de agentes",
-            backstory="""Você é Patricia, uma supervisora experiente que garante a 
-            qualidade do atendimento. Você coordena os outros agentes, resolve 
-            escalações e toma decisões estratégicas sobre o atendimento.""",
-            verbose=settings.debug,  # Condicional ao debug
-            allow_delegation=True,
-            llm_config={
-                "model": "gpt-4o-mini",
-                "temperature": 0.5
-            }
+        return _Crew(
+            agents=[agent],
+            tasks=[task],
+            process=_Process.sequential,
+            verbose=False
         )
     
     def _initialize_crew(self):
@@ -212,7 +236,7 @@ class WhatsAppAgentCrew:
                 "estimated_value": 0.0
             }
     
-    def process_message(self, message: str, user_phone: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def process_message(self, message: str, user_phone: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Processa mensagem usando fluxo não-linear e agente apropriado"""
         start_time = datetime.now()
         
@@ -225,12 +249,13 @@ class WhatsAppAgentCrew:
             from app.services.conversation_flow import conversation_flow_service
             
             # 1. Analisar fluxo conversacional não-linear
+            await conversation_flow_service.prefetch_memory(user_phone)
             flow_decision = conversation_flow_service.process_message_flow(
                 message, user_phone, context
             )
             
             # 2. Calcular lead score
-            lead_score = lead_scoring_service.score_lead(
+            lead_score = await lead_scoring_service.score_lead(
                 message=message,
                 phone=user_phone,
                 customer_data=context.get("customer_data") if context else None,
@@ -243,14 +268,14 @@ class WhatsAppAgentCrew:
             # 4. Seleção de agente baseada em fluxo e score
             selected_agent = self._select_agent_with_flow(intent, lead_score, flow_decision)
             
-            # 5. Criação da tarefa com contexto completo
-            task = self._create_task_with_flow(
+            # 5. Descrição da tarefa com contexto completo
+            task_description = self._create_task_with_flow(
                 message, user_phone, selected_agent, intent, context, 
                 lead_score, flow_decision
             )
             
-            # 6. Execução da tarefa
-            result = self._execute_task(task, selected_agent)
+            # 6. Execução da tarefa (fora do event loop)
+            result = await self._execute_task(task_description, selected_agent)
             
             # 7. Atualização de métricas
             end_time = datetime.now()
@@ -402,8 +427,8 @@ class WhatsAppAgentCrew:
         return intent_to_agent.get(intent, AgentRole.RECEPTIONIST)
 
     def _create_task_with_flow(self, message: str, user_phone: str, agent_role: AgentRole, intent: str, 
-                              context: Dict[str, Any] = None, lead_score: Any = None, flow_decision: Any = None) -> Any:
-        """Cria tarefa considerando fluxo conversacional não-linear"""
+                              context: Dict[str, Any] = None, lead_score: Any = None, flow_decision: Any = None) -> str:
+        """Descrição da tarefa considerando fluxo conversacional não-linear"""
         from app.services.conversation_flow import ConversationState, FlowTransition
         
         # Informações do lead score
@@ -552,11 +577,7 @@ class WhatsAppAgentCrew:
             """
         }
         
-        return _Task(
-            description=task_descriptions[agent_role],
-            expected_output="Resposta natural, contextual e adaptada ao fluxo da conversa",
-            agent=self.agents[agent_role]
-        )
+        return task_descriptions[agent_role]
     
     def _get_flow_instructions(self, flow_decision: Any) -> str:
         """Retorna instruções específicas baseadas no fluxo"""
@@ -625,20 +646,16 @@ class WhatsAppAgentCrew:
             - Ofereça valor através de informações
             """
 
-    def _execute_task(self, task: Any, agent_role: AgentRole) -> str:
-        """Executa a tarefa usando o agente selecionado"""
+    async def _execute_task(self, task_description: str, agent_role: AgentRole) -> str:
+        """Executa a tarefa no crew do agente selecionado, no pool de threads"""
         try:
-            # Cria um crew temporário apenas com o agente necessário
-            temp_crew = _Crew(
-                agents=[self.agents[agent_role]],
-                tasks=[task],
-                process=_Process.sequential,
-                verbose=False
-            )
-            
-            result = temp_crew.kickoff()
-            return str(result)
+            return await self.pool.run(agent_role, {"task_description": task_description})
             
+        except BulkheadFullError:
+            logger.warning(f"Pool do CrewAI saturado; {agent_role.value} não executou")
+            return "Estamos com muitas conversas agora. Já já te respondo com calma!"
+        except CrewTimeoutError:
+            return f"Desculpe, o agente {agent_role.value} está demorando. Tentarei te ajudar de outra forma."
         except Exception as e:
             logger.error(f"Erro na execução da tarefa com {agent_role.value}: {str(e)}")
             return f"Desculpe, houve um problema com o agente {agent_role.value}. Tentarei te ajudar de outra forma."
@@ -691,7 +708,7 @@ class WhatsAppAgentCrew:
             self._ensure_crewai_loaded()
             
             # Converter para formato esperado pelo process_message
-            result = self.process_message(
+            result = await self.process_message(
                 message=user_message,
                 user_phone=user_id,
                 context=context_data
@@ -729,6 +746,7 @@ class WhatsAppAgentCrew:
                 "status": "active",
                 "performance": performance,
                 "agents": agents_info,
+                "worker_pool": self.pool.get_stats(),
                 "crewai_loaded": self._crewai_initialized,
                 "total_agents": len(self.agents)
             }
@@ -777,8 +795,13 @@ class WhatsAppCrewManager:
         """Retorna o erro de inicialização, se houver"""
         return self._crew_error
     
+    def shutdown(self):
+        """Encerra o pool de threads do crew, se chegou a ser criado"""
+        if self._crew_instance is not None:
+            self._crew_instance.pool.shutdown()
+    
     # Métodos de compatibilidade para usar como se fosse o crew diretamente
-    def process_message(self, message: str, user_phone: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def process_message(self, message: str, user_phone: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Compatibilidade: process_message"""
         crew = self.get_crew()
         if crew is None:
@@ -790,7 +813,7 @@ class WhatsAppCrewManager:
                 "status": "fallback",
                 "error": "CrewAI não disponível"
             }
-        return crew.process_message(message, user_phone, context)
+        return await crew.process_message(message, user_phone, context)
     
     async def process_complex_request(self, user_message: str, agent_role: AgentRole, user_id: str, context_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """Compatibilidade: process_complex_request"""
@@ -0,0 +1,148 @@
+"""
+Execução do CrewAI fora do event loop
+O kickoff() do CrewAI é síncrono e leva segundos; rodando no event loop ele
+trava todos os outros webhooks do worker. Aqui cada execução vai para um pool
+limitado de threads, atrás do bulkhead "crewai" (fila limitada, rejeição
+rápida e métricas de saturação), e os crews são montados uma vez por papel e
+reaproveitados entre mensagens
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from app.config import settings
+from app.services.bulkhead import Bulkhead, bulkhead_manager
+
+logger = logging.getLogger(__name__)
+
+
+class CrewTimeoutError(Exception):
+    """Execução do crew passou do tempo limite"""
+
+
+# Observador das execuções disparadas pela tarefa atual (ver observe_runs)
+_run_observer: contextvars.ContextVar[Optional[Callable[[Future], None]]] = contextvars.ContextVar(
+    "crew_run_observer", default=None
+)
+
+
+@contextmanager
+def observe_runs(observer: Callable[[Future], None]):
+    """
+    Recebe o Future de cada kickoff submetido dentro do bloco. Como a thread
+    não pode ser interrompida, cancelar quem esperava não encerra o trabalho;
+    o Future diz quando ele realmente terminou
+    """
+    token = _run_observer.set(observer)
+    try:
+        yield
+    finally:
+        _run_observer.reset(token)
+
+
+class CrewWorkerPool:
+    """Pool de threads para kickoff() com crews reaproveitados por papel"""
+
+    def __init__(self, build_crew: Callable[[Hashable], Any], bulkhead: Bulkhead = None,
+                 task_timeout: float = None):
+        self.build_crew = build_crew
+        self.bulkhead = bulkhead or bulkhead_manager.get("crewai")
+        self.task_timeout = task_timeout or getattr(settings, "crewai_task_timeout", None) or 60.0
+        self._idle: Dict[Hashable, List[Any]] = defaultdict(list)  # papel -> crews livres
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {"completed": 0, "failed": 0, "timeouts": 0, "cancelled": 0, "crews_built": 0}
+
+    @property
+    def max_workers(self) -> int:
+        return self.bulkhead.config.max_concurrent
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # Uma thread por vaga do bulkhead: nada fica esperando dentro do executor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crewai")
+        return self._executor
+
+    async def run(self, role: Hashable, inputs: Dict[str, Any], timeout: float = None) -> str:
+        """
+        Executa o crew do papel com os inputs sem bloquear o event loop.
+        Levanta BulkheadFullError com o pool saturado e CrewTimeoutError após o
+        tempo limite; a thread não pode ser interrompida, então a vaga só é
+        liberada quando o kickoff realmente termina
+        """
+        await self.bulkhead.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(self._kickoff, role, inputs)
+        except Exception:
+            self.bulkhead.release()
+            raise
+        future.add_done_callback(lambda f: self._release_from_thread(loop, f))
+        observer = _run_observer.get()
+        if observer is not None:
+            observer(future)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.task_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"⏱️ Crew {getattr(role, 'value', role)} excedeu {timeout or self.task_timeout:.0f}s")
+            raise CrewTimeoutError(f"Crew {getattr(role, 'value', role)} excedeu o tempo limite")
+        except asyncio.CancelledError:
+            # Quem esperava desistiu; se ainda não começou, não roda mais
+            self.stats["cancelled"] += 1
+            future.cancel()
+            raise
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop, future: Future):
+        try:
+            loop.call_soon_threadsafe(self._finished, future)
+        except RuntimeError:
+            # Event loop já encerrado (shutdown)
+            pass
+
+    def _finished(self, future: Future):
+        """No event loop: contabiliza e libera a vaga do bulkhead"""
+        if not future.cancelled():
+            self.stats["failed" if future.exception() is not None else "completed"] += 1
+        self.bulkhead.release()
+
+    def _kickoff(self, role: Hashable, inputs: Dict[str, Any]) -> str:
+        crew = self._checkout(role)
+        try:
+            return str(crew.kickoff(inputs=inputs))
+        finally:
+            with self._lock:
+                self._idle[role].append(crew)
+
+    def _checkout(self, role: Hashable) -> Any:
+        """Crew livre do papel; monta um novo só se todos estiverem em uso"""
+        with self._lock:
+            if self._idle[role]:
+                return self._idle[role].pop()
+            self.stats["crews_built"] += 1
+        return self.build_crew(role)
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        bulkhead = self.bulkhead.get_stats()
+        return {
+            **self.stats,
+            "running": bulkhead["in_flight"],
+            "queued": bulkhead["queued"],
+            "rejected": bulkhead["rejected"],
+            "max_workers": self.max_workers,
+            "saturation": bulkhead["in_flight"] / self.max_workers,
+            "task_timeout": self.task_timeout,
+            "idle_crews": {getattr(role, "value", role): len(crews) for role, crews in self._idle.items()}
+        }
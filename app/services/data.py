@@ -1,18 +1,36 @@
 """
 Serviços de dados para operações no banco
 """
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, desc, func
-from sqlalchemy.orm import selectinload
-from app.models.database import User, Conversation, Message, Appointment, MetaLog, Business, Service
+from sqlalchemy import select, update, delete, desc, func, tuple_
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.database import (
+    User, Conversation, Message, Appointment, MetaLog, Business, Service, AnalyticsRollup,
+    OPEN_CONVERSATION_STATUSES
+)
+from app.services.availability_index import availability_index
+from app.services.booking_guard import (
+    SlotUnavailableError, appointment_end, booking_lock, find_overlapping_appointment, is_overlap_violation
+)
+from app.services.identity_cache import attach_snapshot, identity_cache
+from app.services.unit_of_work import after_commit, commit_or_flush
+from app.utils.pagination import decode_cursor, encode_cursor
 from app.utils.logger import get_logger
 import logging
 logger = get_logger(__name__)
 
 logger = logging.getLogger(__name__)
 
+# Caracteres da prévia da última mensagem nas listagens
+PREVIEW_LENGTH = 120
+
+# Dialetos com INSERT ... ON CONFLICT ... RETURNING
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 
 class UserService:
     """Serviço para operações com usuários"""
@@ -32,22 +50,48 @@ class UserService:
         Returns:
             Instância do usuário
         """
-        # Buscar usuário existente
+        snapshot = identity_cache.get_user(wa_id)
+        if snapshot:
+            return await attach_snapshot(db, User, snapshot)
+
+        dialect = db.get_bind().dialect.name
+        if dialect in _UPSERT_DIALECTS:
+            # Um único round trip: insere ou devolve a linha existente (DO UPDATE
+            # no-op para que o RETURNING traga o usuário já cadastrado)
+            stmt = _UPSERT_DIALECTS[dialect](User).values(wa_id=wa_id, nome=nome, telefone=telefone)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.wa_id],
+                set_={"wa_id": stmt.excluded.wa_id}
+            ).returning(User).execution_options(populate_existing=True)
+            user = (await db.scalars(stmt)).one()
+            await commit_or_flush(db)
+        else:
+            user = await UserService._select_or_insert_user(db, wa_id, nome, telefone)
+
+        after_commit(db, lambda: identity_cache.put_user(user))
+        return user
+
+    @staticmethod
+    async def _select_or_insert_user(db: AsyncSession, wa_id: str,
+                                     nome: str = None, telefone: str = None) -> User:
+        """Fallback sem ON CONFLICT: busca, insere e, se perder a corrida, busca de novo"""
         result = await db.execute(select(User).where(User.wa_id == wa_id))
         user = result.scalar_one_or_none()
-        
-        if not user:
-            # Criar novo usuário
-            user = User(
-                wa_id=wa_id,
-                nome=nome,
-                telefone=telefone
-            )
-            db.add(user)
-            await db.commit()
-            await db.refresh(user)
-            logger.info(f"Novo usuário criado: {wa_id}")
-        
+        if user:
+            return user
+
+        user = User(wa_id=wa_id, nome=nome, telefone=telefone)
+        try:
+            # Savepoint: perder a corrida não desfaz o resto da unidade de trabalho
+            async with db.begin_nested():
+                db.add(user)
+        except IntegrityError:
+            result = await db.execute(select(User).where(User.wa_id == wa_id))
+            return result.scalar_one()
+
+        await commit_or_flush(db)
+        await db.refresh(user)
+        logger.info(f"Novo usuário criado: {wa_id}")
         return user
     
     @staticmethod
@@ -57,6 +101,7 @@ class UserService:
             update(User).where(User.id == user_id).values(**kwargs)
         )
         await db.commit()
+        identity_cache.forget_user(user_id)
         
         result = await db.execute(select(User).where(User.id == user_id))
         return result.scalar_one()
@@ -77,27 +122,51 @@ class ConversationService:
         Returns:
             Instância da conversa
         """
-        # Buscar conversa ativa
-        result = await db.execute(
+        snapshot = identity_cache.get_conversation(user_id)
+        if snapshot:
+            return await attach_snapshot(db, Conversation, snapshot)
+
+        dialect = db.get_bind().dialect.name
+        if dialect in _UPSERT_DIALECTS:
+            # Índice único parcial uq_conversations_user_open garante uma só
+            # conversa aberta por usuário; o conflito devolve a existente
+            stmt = _UPSERT_DIALECTS[dialect](Conversation).values(user_id=user_id, status="active")
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Conversation.user_id],
+                index_where=Conversation.status.in_(OPEN_CONVERSATION_STATUSES),
+                set_={"user_id": stmt.excluded.user_id}
+            ).returning(Conversation).execution_options(populate_existing=True)
+            conversation = (await db.scalars(stmt)).one()
+            await commit_or_flush(db)
+        else:
+            conversation = await ConversationService._select_or_insert_conversation(db, user_id)
+
+        after_commit(db, lambda: identity_cache.put_conversation(conversation))
+        return conversation
+
+    @staticmethod
+    async def _select_or_insert_conversation(db: AsyncSession, user_id: int) -> Conversation:
+        """Fallback sem ON CONFLICT: busca a conversa aberta mais recente ou cria"""
+        query = (
             select(Conversation)
             .where(Conversation.user_id == user_id)
-            .where(Conversation.status.in_(["active", "human"]))
+            .where(Conversation.status.in_(OPEN_CONVERSATION_STATUSES))
             .order_by(desc(Conversation.created_at))
+            .limit(1)
         )
-        conversation = result.first()
+        conversation = (await db.execute(query)).scalars().first()
         if conversation:
-            conversation = conversation[0]  # Extrair o objeto da tupla
-        
-        if not conversation:
-            # Criar nova conversa
-            conversation = Conversation(
-                user_id=user_id,
-                status="active"
-            )
-            db.add(conversation)
-            await db.commit()
-            await db.refresh(conversation)
-        
+            return conversation
+
+        conversation = Conversation(user_id=user_id, status="active")
+        try:
+            async with db.begin_nested():
+                db.add(conversation)
+        except IntegrityError:
+            return (await db.execute(query)).scalars().one()
+
+        await commit_or_flush(db)
+        await db.refresh(conversation)
         return conversation
     
     @staticmethod
@@ -110,6 +179,7 @@ class ConversationService:
             .values(status=status, last_message_at=datetime.utcnow())
         )
         await db.commit()
+        identity_cache.forget_conversation(conversation_id)
         
         result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
         return result.scalar_one()
@@ -127,34 +197,107 @@ class ConversationService:
         Returns:
             Lista de conversas com informações do usuário
         """
-        result = await db.execute(
-            select(Conversation, User)
-            .join(User)
-            .options(selectinload(Conversation.messages))
-            .order_by(desc(Conversation.last_message_at))
-            .limit(limit)
-        )
+        page = await ConversationService.get_conversations_page(db, limit=limit)
+        return page["items"]
+    
+    @staticmethod
+    async def get_conversations_page(db: AsyncSession, limit: int = 50,
+                                     cursor: str = None) -> Dict:
+        """
+        Página de conversas por keyset em (last_message_at, id), mais recentes primeiro
+        
+        Conversas sem last_message_at vêm por último, por id decrescente. As
+        duas faixas são consultas separadas, cada uma seguindo o próprio
+        índice; a cauda sem data só é lida quando a faixa com data acaba.
+        Só as colunas exibidas são lidas; contagens e prévia da última mensagem
+        vêm de subconsultas correlacionadas, então o custo depende do tamanho
+        da página e não do histórico
         
-        conversations = []
-        for conversation, user in result.all():
-            # Contar mensagens não lidas (simulado - em produção seria mais complexo)
-            unread_count = len([m for m in conversation.messages if m.direction == "in"])
+        Args:
+            db: Sessão do banco
+            limit: Conversas por página
+            cursor: next_cursor da página anterior
+            
+        Returns:
+            {"items": [...], "next_cursor": str | None}
             
-            conversations.append({
-                "id": conversation.id,
+        Raises:
+            ValueError: cursor inválido
+        """
+        message_count = (
+            select(func.count()).where(Message.conversation_id == Conversation.id)
+            .correlate(Conversation).scalar_subquery()
+        )
+        unread_count = (
+            select(func.count()).where(Message.conversation_id == Conversation.id, Message.direction == "in")
+            .correlate(Conversation).scalar_subquery()
+        )
+        latest = (
+            select(Message.id).where(Message.conversation_id == Conversation.id)
+            .order_by(desc(Message.created_at), desc(Message.id)).limit(1)
+            .correlate(Conversation).scalar_subquery()
+        )
+        latest_message = aliased(Message)
+        
+        query = (
+            select(
+                Conversation.id, Conversation.status, Conversation.last_message_at,
+                User.id.label("user_id"), User.nome, User.telefone, User.wa_id,
+                message_count.label("message_count"), unread_count.label("unread_count"),
+                func.substr(latest_message.content, 1, PREVIEW_LENGTH).label("preview"),
+                latest_message.direction.label("preview_direction")
+            )
+            .join(User, Conversation.user_id == User.id)
+            .outerjoin(latest_message, latest_message.id == latest)
+        )
+        
+        after = decode_cursor(cursor, ((datetime, type(None)), int))
+        rows = []
+        if after is None or after[0] is not None:
+            # ix_conversations_last_message_at_id (last_message_at DESC, id DESC)
+            dated = (
+                query.where(Conversation.last_message_at.is_not(None))
+                .order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+                .limit(limit + 1)
+            )
+            if after:
+                dated = dated.where(tuple_(Conversation.last_message_at, Conversation.id) < tuple_(*after))
+            rows = (await db.execute(dated)).all()
+        
+        if len(rows) <= limit:
+            # ix_conversations_undated_id (id DESC WHERE last_message_at IS NULL)
+            undated = (
+                query.where(Conversation.last_message_at.is_(None))
+                .order_by(Conversation.id.desc())
+                .limit(limit + 1 - len(rows))
+            )
+            if after and after[0] is None:
+                undated = undated.where(Conversation.id < after[1])
+            rows += (await db.execute(undated)).all()
+        items = [
+            {
+                "id": row.id,
                 "user": {
-                    "id": user.id,
-                    "nome": user.nome or user.wa_id,
-                    "telefone": user.telefone,
-                    "wa_id": user.wa_id
+                    "id": row.user_id,
+                    "nome": row.nome or row.wa_id,
+                    "telefone": row.telefone,
+                    "wa_id": row.wa_id
                 },
-                "status": conversation.status,
-                "last_message_at": conversation.last_message_at,
-                "unread_count": unread_count,
-                "message_count": len(conversation.messages)
-            })
-        
-        return conversations
+                "status": row.status,
+                "last_message_at": row.last_message_at,
+                "last_message": {"preview": row.preview, "direction": row.preview_direction},
+                # Simulado: mensagens recebidas (em produção seria por leitura)
+                "unread_count": row.unread_count,
+                "message_count": row.message_count
+            }
+            for row in rows[:limit]
+        ]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last.last_message_at, last.id])
+        return {"items": items, "next_cursor": next_cursor}
 
 
 class MessageService:
@@ -198,16 +341,15 @@ class MessageService:
         )
         
         db.add(message)
-        await db.commit()
-        await db.refresh(message)
         
-        # Atualizar timestamp da conversa
+        # Atualizar timestamp da conversa no servidor, na mesma transação da mensagem
         await db.execute(
             update(Conversation)
             .where(Conversation.id == conversation_id)
-            .values(last_message_at=datetime.utcnow())
+            .values(last_message_at=func.now())
+            .execution_options(synchronize_session=False)
         )
-        await db.commit()
+        await commit_or_flush(db)
         
         return message
     
@@ -259,6 +401,9 @@ class AppointmentService:
             
         Returns:
             Instância do agendamento
+            
+        Raises:
+            SlotUnavailableError: Horário já ocupado por outro agendamento ativo
         """
         try:
             # Obter ou criar business padrão
@@ -332,33 +477,50 @@ class AppointmentService:
                 date_time = date_time.replace(hour=14, minute=0, second=0, microsecond=0)
             
             # Calcular end_time baseado na duração do serviço
-            end_time = date_time
+            duration_minutes = None
             if service_id:
                 service_result = await db.execute(select(Service).where(Service.id == service_id))
                 service_obj = service_result.scalar_one_or_none()
-                if service_obj and service_obj.duration_minutes:
-                    from datetime import timedelta
-                    end_time = date_time + timedelta(minutes=service_obj.duration_minutes)
-            
-            # Criar agendamento
-            appointment = Appointment(
-                user_id=user_id,
-                business_id=business.id,
-                service_id=service_id,
-                date_time=date_time,
-                end_time=end_time,
-                status=status,
-                notes=notes,
-                created_at=datetime.now()
-            )
+                if service_obj:
+                    duration_minutes = service_obj.duration_minutes
+            end_time = appointment_end(date_time, duration_minutes)
             
-            db.add(appointment)
-            await db.commit()
+            # Verificação e inserção atômicas: a agenda do negócio fica travada até o commit
+            async with booking_lock(db, business.id):
+                if await find_overlapping_appointment(db, business.id, date_time, end_time):
+                    raise SlotUnavailableError(business.id, date_time)
+                
+                # Criar agendamento
+                appointment = Appointment(
+                    user_id=user_id,
+                    business_id=business.id,
+                    service_id=service_id,
+                    date_time=date_time,
+                    end_time=end_time,
+                    status=status,
+                    notes=notes,
+                    created_at=datetime.now()
+                )
+                
+                db.add(appointment)
+                await db.commit()
             await db.refresh(appointment)
+            availability_index.upsert_appointment(appointment)
             
             logger.info(f"Agendamento criado: ID={appointment.id}, User={user_id}, Service={service_id}, DateTime={date_time}")
             return appointment
             
+        except SlotUnavailableError:
+            await db.rollback()
+            logger.warning(f"Agendamento recusado: {date_time} já ocupado")
+            raise
+        except IntegrityError as e:
+            await db.rollback()
+            if is_overlap_violation(e):
+                # Exclusion constraint do banco barrou a sobreposição
+                raise SlotUnavailableError(business.id, date_time) from e
+            logger.error(f"Erro ao criar agendamento: {e}")
+            raise
         except Exception as e:
             logger.error(f"Erro ao criar agendamento: {e}")
             await db.rollback()
@@ -389,6 +551,7 @@ class AppointmentService:
             )
             await db.commit()
             await db.refresh(appointment)
+            availability_index.upsert_appointment(appointment)
         
         return appointment
     
@@ -468,6 +631,7 @@ class AppointmentService:
                 )
                 await db.commit()
                 await db.refresh(appointment)
+                availability_index.upsert_appointment(appointment)
                 logger.info(f"Agendamento {appointment_id} cancelado por {cancelled_by}: {reason}")
                 return appointment
             else:
@@ -492,6 +656,9 @@ class AppointmentService:
             
         Returns:
             Agendamento reagendado ou None se não encontrado
+            
+        Raises:
+            SlotUnavailableError: Novo horário já ocupado por outro agendamento ativo
         """
         try:
             result = await db.execute(
@@ -505,27 +672,36 @@ class AppointmentService:
                 appointment, service = appointment_service
                 
                 # Calcular novo end_time
-                from datetime import timedelta
-                new_end_time = new_date_time + timedelta(minutes=service.duration_minutes)
+                new_end_time = appointment_end(new_date_time, service.duration_minutes)
                 
-                await db.execute(
-                    update(Appointment)
-                    .where(Appointment.id == appointment_id)
-                    .values(
-                        date_time=new_date_time,
-                        end_time=new_end_time,
-                        status="reagendado",
-                        updated_at=datetime.now()
+                async with booking_lock(db, appointment.business_id):
+                    if await find_overlapping_appointment(db, appointment.business_id, new_date_time,
+                                                          new_end_time, exclude_id=appointment_id):
+                        raise SlotUnavailableError(appointment.business_id, new_date_time)
+                    
+                    await db.execute(
+                        update(Appointment)
+                        .where(Appointment.id == appointment_id)
+                        .values(
+                            date_time=new_date_time,
+                            end_time=new_end_time,
+                            status="reagendado",
+                            updated_at=datetime.now()
+                        )
                     )
-                )
-                await db.commit()
+                    await db.commit()
                 await db.refresh(appointment)
+                availability_index.upsert_appointment(appointment)
                 logger.info(f"Agendamento {appointment_id} reagendado para {new_date_time}")
                 return appointment
             else:
                 logger.warning(f"Agendamento {appointment_id} não encontrado para reagendamento")
                 return None
                 
+        except SlotUnavailableError:
+            await db.rollback()
+            logger.warning(f"Reagendamento {appointment_id} recusado: {new_date_time} já ocupado")
+            raise
         except Exception as e:
             logger.error(f"Erro ao reagendar agendamento {appointment_id}: {e}")
             await db.rollback()
@@ -573,7 +749,7 @@ class AppointmentService:
     @staticmethod
     async def get_all_appointments(db: AsyncSession, limit: int = 100) -> List[Dict]:
         """
-        Obtém todos os agendamentos para dashboard
+        Obtém os agendamentos mais recentes para dashboard (primeira página do keyset)
         
         Args:
             db: Sessão do banco
@@ -582,38 +758,87 @@ class AppointmentService:
         Returns:
             Lista de agendamentos com informações do usuário e serviço
         """
-        result = await db.execute(
-            select(Appointment, User, Service)
+        page = await AppointmentService.get_appointments_page(db, limit=limit, newest_first=True)
+        return page["items"]
+
+
+    @staticmethod
+    async def get_appointments_page(db: AsyncSession, limit: int = 50, cursor: str = None,
+                                    status: str = None, start: datetime = None,
+                                    newest_first: bool = False) -> Dict:
+        """
+        Página de agendamentos por keyset em (date_time, id), em ordem cronológica
+        
+        Args:
+            db: Sessão do banco
+            limit: Agendamentos por página
+            cursor: next_cursor da página anterior
+            status: Filtrar por status
+            start: Apenas agendamentos a partir desta data/hora
+            newest_first: Ordem decrescente (mesmo índice, lido de trás para frente)
+            
+        Returns:
+            {"items": [...], "next_cursor": str | None}
+            
+        Raises:
+            ValueError: cursor inválido
+        """
+        query = (
+            select(
+                Appointment.id, Appointment.date_time, Appointment.end_time, Appointment.status,
+                Appointment.notes, Appointment.price_at_booking, Appointment.created_at,
+                User.id.label("user_id"), User.nome, User.telefone, User.wa_id,
+                Service.id.label("service_id"), Service.name.label("service_name"),
+                Service.price, Service.duration_minutes
+            )
             .join(User, Appointment.user_id == User.id)
             .join(Service, Appointment.service_id == Service.id)
-            .order_by(desc(Appointment.created_at))
-            .limit(limit)
+            .limit(limit + 1)
         )
-        
-        appointments = []
-        for appointment, user, service in result.all():
-            appointments.append({
-                "id": appointment.id,
+        if newest_first:
+            query = query.order_by(Appointment.date_time.desc(), Appointment.id.desc())
+        else:
+            query = query.order_by(Appointment.date_time, Appointment.id)
+        if status:
+            query = query.where(Appointment.status == status)
+        if start:
+            query = query.where(Appointment.date_time >= start)
+        
+        after = decode_cursor(cursor, (datetime, int))
+        if after:
+            key = tuple_(Appointment.date_time, Appointment.id)
+            query = query.where(key < tuple_(*after) if newest_first else key > tuple_(*after))
+        
+        rows = (await db.execute(query)).all()
+        items = [
+            {
+                "id": row.id,
                 "user": {
-                    "id": user.id,
-                    "nome": user.nome or user.wa_id,
-                    "telefone": user.telefone
+                    "id": row.user_id,
+                    "nome": row.nome or row.wa_id,
+                    "telefone": row.telefone
                 },
                 "service": {
-                    "id": service.id,
-                    "name": service.name,
-                    "price": service.price,
-                    "duration": service.duration_minutes
+                    "id": row.service_id,
+                    "name": row.service_name,
+                    "price": row.price,
+                    "duration": row.duration_minutes
                 },
-                "date_time": appointment.date_time,
-                "end_time": appointment.end_time,
-                "status": appointment.status,
-                "notes": appointment.notes,
-                "price_at_booking": appointment.price_at_booking,
-                "created_at": appointment.created_at
-            })
-        
-        return appointments
+                "date_time": row.date_time,
+                "end_time": row.end_time,
+                "status": row.status,
+                "notes": row.notes,
+                "price_at_booking": row.price_at_booking,
+                "created_at": row.created_at
+            }
+            for row in rows[:limit]
+        ]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last.date_time, last.id])
+        return {"items": items, "next_cursor": next_cursor}
 
 
 class MetricsService:
@@ -627,35 +852,46 @@ class MetricsService:
         Returns:
             Dicionário com métricas
         """
-        # Total de usuários
-        total_users = await db.scalar(select(func.count(User.id)))
-        
-        # Total de conversas
-        total_conversations = await db.scalar(select(func.count(Conversation.id)))
-        
-        # Total de mensagens hoje
-        today = datetime.utcnow().date()
-        messages_today = await db.scalar(
-            select(func.count(Message.id))
-            .where(func.date(Message.created_at) == today)
+        # Intervalo semiaberto [hoje, amanhã) em UTC, como os buckets diários
+        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow_start = today_start + timedelta(days=1)
+        
+        # Séries (mensagens, conversas iniciadas) vêm dos rollups diários
+        # (analytics_rollups), atualizados pelo compactador; contagens por
+        # status atual e total de usuários não têm rollup (são estado, não
+        # eventos) e continuam nas tabelas, pelos índices de status
+        def rollup_total(*metrics, since=None):
+            query = (
+                select(func.coalesce(func.sum(AnalyticsRollup.value), 0))
+                .where(AnalyticsRollup.granularity == "day", AnalyticsRollup.metric.in_(metrics))
+            )
+            if since is not None:
+                query = query.where(AnalyticsRollup.bucket_start >= since, AnalyticsRollup.bucket_start < tomorrow_start)
+            return query.scalar_subquery()
+        
+        users = select(func.count()).select_from(User).scalar_subquery()
+        conversations = rollup_total("conversations_started")
+        messages_today_query = rollup_total("messages_in", "messages_out", since=today_start)
+        human = (
+            select(func.count()).select_from(Conversation)
+            .where(Conversation.status == "human")
+            .scalar_subquery()
         )
-        
-        # Agendamentos pendentes
-        pending_appointments = await db.scalar(
-            select(func.count(Appointment.id))
+        pending = (
+            select(func.count()).select_from(Appointment)
             .where(Appointment.status == "pendente")
+            .scalar_subquery()
         )
         
-        # Conversas que precisam de atenção humana
-        human_conversations = await db.scalar(
-            select(func.count(Conversation.id))
-            .where(Conversation.status == "human")
-        )
+        row = (await db.execute(
+            select(users, conversations, messages_today_query, pending, human)
+        )).one()
+        total_users, total_conversations, messages_today, pending_appointments, human_conversations = row
         
         return {
             "total_users": total_users or 0,
-            "total_conversations": total_conversations or 0,
-            "messages_today": messages_today or 0,
+            "total_conversations": int(total_conversations or 0),
+            "messages_today": int(messages_today or 0),
             "pending_appointments": pending_appointments or 0,
             "human_conversations": human_conversations or 0
         }
@@ -149,7 +149,7 @@ class DatabaseOptimizationService:
                             2
                         ) as conversion_rate
                     FROM conversations c
-                    WHERE DATE(c.created_at) BETWEEN start_date AND end_date
+                    WHERE c.created_at >= start_date AND c.created_at < end_date + 1
                     GROUP BY DATE(c.created_at)
                     ORDER BY date_period DESC;
                 END;
@@ -206,11 +206,13 @@ class DatabaseOptimizationService:
                              (SELECT pg_database_size(current_database()) / 1024.0 / 1024.0)::NUMERIC,
                              'MB', NOW()),
                             ('total_messages_today',
-                             (SELECT count(*) FROM messages WHERE DATE(created_at) = CURRENT_DATE)::NUMERIC,
+                             (SELECT count(*) FROM messages
+                              WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1)::NUMERIC,
                              'messages', NOW()),
                             ('avg_response_time_ms',
                              (SELECT COALESCE(AVG(EXTRACT(EPOCH FROM (updated_at - created_at)) * 1000), 0)
-                              FROM conversations WHERE DATE(created_at) = CURRENT_DATE)::NUMERIC,
+                              FROM conversations
+                              WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1)::NUMERIC,
                              'milliseconds', NOW()),
                             ('cache_hit_ratio',
                              (SELECT ROUND(
@@ -20,6 +20,7 @@ import json
 from app.config import settings
 from app.utils.logger import get_logger
 from app.services.cache_service import CacheService, CacheType
+from app.services.partition_manager import partition_manager
 logger = get_logger(__name__)
 
 logger = logging.getLogger(__name__)
@@ -288,22 +289,23 @@ class DatabaseOptimizer:
         )
     
     async def get_available_slots_cached(self, date: str, business_id: int = 1) -> List[Dict]:
-        """Busca slots disponíveis com cache"""
-        cache_key = f"available_slots_{date}_{business_id}"
-        
-        query = """
-            SELECT slot_time, is_available
-            FROM available_slots
-            WHERE date = :date AND business_id = :business_id AND is_available = true
-            ORDER BY slot_time
         """
+        Slots disponíveis do dia, calculados a partir do banco
+
+        Não passa pelo cache de queries nem pelo índice de disponibilidade
+        (por processo): um slot ocupado por outro worker não pode ser oferecido
+        """
+        from app.services.dynamic_scheduling import DynamicSchedulingService
         
-        return await self.execute_cached_query(
-            query,
-            {"date": date, "business_id": business_id},
-            cache_key,
-            self.cache_ttl["appointment_slots"]
-        )
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+        async with self.get_optimized_session() as session:
+            slots = await DynamicSchedulingService(session, business_id).get_available_slots(day)
+        
+        return [
+            {"slot_time": slot["datetime"], "is_available": True}
+            for slot in slots
+            if slot["available"]
+        ]
     
     async def invalidate_user_cache(self, wa_id: str):
         """Invalida cache específico do usuário"""
@@ -439,6 +441,12 @@ class DatabaseOptimizer:
         ]
         
         async with self.get_optimized_session() as session:
+            # Com meta_logs particionada, a retenção é feita pelo partition_manager
+            # (detach + arquivo), sem DELETE linha a linha
+            if session.bind.dialect.name == "postgresql" and \
+                    await partition_manager.is_partitioned(session, "meta_logs"):
+                cleanup_queries.pop()
+            
             for query in cleanup_queries:
                 try:
                     result = await session.execute(text(query))
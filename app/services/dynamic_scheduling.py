@@ -2,18 +2,28 @@
 Serviço dinâmico para gerenciamento de horários e agendamentos
 """
 from typing import List, Dict, Optional, Tuple
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta, time, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_
+from sqlalchemy.exc import IntegrityError
 from app.models.database import (
     Business, Service, Appointment, BlockedTime, 
     AvailableSlot, BotConfiguration
 )
 from app.utils.logger import get_logger
+from app.services.booking_guard import (
+    BOOKING_ACTIVE_STATUSES, appointment_end, booking_lock, find_overlapping_appointment, is_overlap_violation
+)
 import json
 
 logger = get_logger(__name__)
 
+# Dias aceitos em recurrence_pattern (inglês ou português)
+RECURRENCE_WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+    "segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6,
+}
+
 
 class DynamicSchedulingService:
     """Serviço para gerenciamento dinâmico de horários e agendamentos"""
@@ -78,64 +88,243 @@ class DynamicSchedulingService:
     
     async def get_available_slots(self, date: datetime.date, service_id: Optional[int] = None) -> List[Dict]:
         """Obter slots disponíveis para uma data específica"""
+        slots_by_date = await self.get_available_slots_for_range(date, date, service_id)
+        return slots_by_date.get(date, [])
+    
+    async def get_available_slots_for_range(self, start_date: datetime.date, end_date: datetime.date,
+                                            service_id: Optional[int] = None) -> Dict[datetime.date, List[Dict]]:
+        """
+        Obter slots de um intervalo de datas (ex.: a semana inteira)
+        
+        Agendamentos e bloqueios do período são carregados com uma consulta
+        cada; a disponibilidade é calculada em memória por varredura
+        """
         business = await self.get_business_info()
         bot_config = await self.get_bot_config()
         
         if not business:
-            return []
+            return {}
         
         # Configurações padrão
         slot_duration = bot_config.slot_duration_minutes if bot_config else 30
         break_duration = bot_config.break_between_appointments_minutes if bot_config else 0
         
+        # Gerar a grade de slots de cada dia
+        grid = {}
+        day = start_date
+        while day <= end_date:
+            grid[day] = self._build_day_grid(business, day, slot_duration, break_duration)
+            day += timedelta(days=1)
+        
+        all_slots = [slot for day_slots in grid.values() for slot in day_slots]
+        if not all_slots:
+            return grid
+        
+        window_start = all_slots[0]["datetime"]
+        window_end = all_slots[-1]["datetime"] + timedelta(minutes=slot_duration)
+        booked_intervals, blocked_intervals = await self._load_busy_intervals(start_date, end_date,
+                                                                              window_start, window_end)
+        
+        bounds = [(slot["datetime"], slot["datetime"] + timedelta(minutes=slot_duration)) for slot in all_slots]
+        booked = self._sweep_overlaps(bounds, booked_intervals)
+        blocked = self._sweep_overlaps(bounds, blocked_intervals)
+        
+        now = datetime.now()
+        for slot, is_booked, is_blocked in zip(all_slots, booked, blocked):
+            # Verificar se está no passado
+            if slot["datetime"] < now:
+                slot["available"] = False
+                slot["reason"] = "past"
+            
+            # Verificar agendamentos existentes
+            elif is_booked:
+                slot["available"] = False
+                slot["reason"] = "booked"
+            
+            # Verificar horários bloqueados
+            elif is_blocked:
+                slot["available"] = False
+                slot["reason"] = "blocked"
+        
+        return grid
+    
+    async def find_next_free_slots(self, service_id: Optional[int] = None, after: datetime = None,
+                                   count: int = 3) -> List[datetime]:
+        """
+        Próximos horários livres para o serviço (ex.: "próximo horário para massagem")
+        
+        Usa o índice de disponibilidade em memória em vez de consultar dia a dia
+        """
+        from app.services.availability_index import availability_index
+        
+        duration = None
+        if service_id:
+            result = await self.db_session.execute(
+                select(Service.duration_minutes).where(
+                    Service.id == service_id,
+                    Service.business_id == self.business_id
+                )
+            )
+            duration = result.scalar_one_or_none()
+        
+        return await availability_index.find_free_slots(
+            self.db_session, self.business_id, duration or 30, after=after, count=count
+        )
+    
+    @staticmethod
+    def opening_window(business_hours: Optional[Dict], date: datetime.date) -> Optional[Tuple[datetime, datetime]]:
+        """Abertura e fechamento do negócio no dia, ou None se fechado"""
         # Obter horários de funcionamento do dia
         weekday_names = ["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"]
-        weekday = date.weekday()
-        day_name = weekday_names[weekday]
+        day_name = weekday_names[date.weekday()]
         
-        day_hours = business.business_hours.get(day_name, {})
+        day_hours = (business_hours or {}).get(day_name, {})
         if day_hours.get("closed", False):
-            return []
+            return None
         
         try:
             open_time = datetime.strptime(day_hours.get("open", "09:00"), "%H:%M").time()
             close_time = datetime.strptime(day_hours.get("close", "18:00"), "%H:%M").time()
         except ValueError:
+            return None
+        
+        return datetime.combine(date, open_time), datetime.combine(date, close_time)
+    
+    @classmethod
+    def _build_day_grid(cls, business: Business, date: datetime.date, slot_duration: int,
+                        break_duration: int) -> List[Dict]:
+        """Gerar os slots de um dia a partir do horário de funcionamento"""
+        window = cls.opening_window(business.business_hours, date)
+        if window is None:
             return []
         
-        # Gerar slots
         slots = []
-        current_time = datetime.combine(date, open_time)
-        end_time = datetime.combine(date, close_time)
+        current_time, end_time = window
         
         while current_time + timedelta(minutes=slot_duration) <= end_time:
-            slot_info = {
+            slots.append({
                 "datetime": current_time,
                 "time_str": current_time.strftime("%H:%M"),
                 "available": True,
                 "reason": None
-            }
-            
-            # Verificar se está no passado
-            if current_time < datetime.now():
-                slot_info["available"] = False
-                slot_info["reason"] = "past"
-            
-            # Verificar agendamentos existentes
-            elif await self._is_slot_booked(current_time, slot_duration):
-                slot_info["available"] = False
-                slot_info["reason"] = "booked"
-            
-            # Verificar horários bloqueados
-            elif await self._is_slot_blocked(current_time, slot_duration):
-                slot_info["available"] = False
-                slot_info["reason"] = "blocked"
-            
-            slots.append(slot_info)
+            })
             current_time += timedelta(minutes=slot_duration + break_duration)
         
         return slots
     
+    async def _load_busy_intervals(self, start_date: datetime.date, end_date: datetime.date, window_start: datetime,
+                                   window_end: datetime) -> Tuple[List[Tuple[datetime, datetime]],
+                                                                  List[Tuple[datetime, datetime]]]:
+        """
+        Agendamentos e bloqueios da janela, lidos do banco (fonte da verdade)
+        
+        O índice de disponibilidade é por processo e pode não ter as escritas
+        de outros workers; aqui ele não é usado
+        """
+        return (await self._load_booked_intervals(window_start, window_end),
+                await self._load_blocked_intervals(window_start, window_end))
+    
+    async def _load_booked_intervals(self, window_start: datetime,
+                                     window_end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Agendamentos ativos que tocam a janela, em uma única consulta"""
+        result = await self.db_session.execute(
+            select(Appointment.date_time, Appointment.end_time).where(
+                and_(
+                    Appointment.business_id == self.business_id,
+                    Appointment.status.in_(BOOKING_ACTIVE_STATUSES),
+                    Appointment.date_time < window_end,
+                    or_(
+                        Appointment.end_time > window_start,
+                        Appointment.date_time >= window_start
+                    )
+                )
+            ).order_by(Appointment.date_time)
+        )
+        # Sem end_time o agendamento ocupa apenas o instante de início
+        return [
+            (self._as_naive(start), self._as_naive(end or start))
+            for start, end in result.all()
+        ]
+    
+    async def _load_blocked_intervals(self, window_start: datetime,
+                                      window_end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Bloqueios pontuais e recorrentes que tocam a janela, em uma única consulta"""
+        result = await self.db_session.execute(
+            select(
+                BlockedTime.start_time, BlockedTime.end_time, BlockedTime.is_recurring,
+                BlockedTime.recurrence_pattern, BlockedTime.start_date, BlockedTime.end_date
+            ).where(
+                and_(
+                    BlockedTime.business_id == self.business_id,
+                    or_(
+                        and_(BlockedTime.start_time < window_end, BlockedTime.end_time > window_start),
+                        and_(BlockedTime.is_recurring == True,
+                             BlockedTime.start_date < window_end, BlockedTime.end_date >= window_start)
+                    )
+                )
+            )
+        )
+        
+        intervals = []
+        for start, end, is_recurring, pattern, start_date, end_date in result.all():
+            start, end = self._as_naive(start), self._as_naive(end)
+            if not (is_recurring and pattern):
+                intervals.append((start, end))
+                continue
+            # Recorrência: o mesmo horário em cada dia da janela em que o padrão vale
+            day = window_start.date()
+            while day <= window_end.date():
+                if self.recurs_on(pattern, self._as_naive(start_date), self._as_naive(end_date), day):
+                    day_start, day_end = datetime.combine(day, start.time()), datetime.combine(day, end.time())
+                    if day_start < window_end and day_end > window_start:
+                        intervals.append((day_start, day_end))
+                day += timedelta(days=1)
+        return sorted(intervals)
+    
+    @staticmethod
+    def recurs_on(pattern: Dict, start_date: datetime, end_date: datetime, day: datetime.date) -> bool:
+        """Avalia recurrence_pattern ({"type": "daily"} ou {"type": "weekly", "days": [...]})"""
+        if day < start_date.date() or day > end_date.date():
+            return False
+        recurrence = pattern.get("type", "weekly")
+        if recurrence == "daily":
+            return True
+        if recurrence == "weekly":
+            weekdays = {RECURRENCE_WEEKDAYS.get(str(name).lower()) for name in pattern.get("days", [])}
+            return day.weekday() in weekdays
+        return False
+    
+    @staticmethod
+    def _as_naive(value: datetime) -> datetime:
+        """Normaliza datetimes com timezone para UTC sem tzinfo, como a grade de slots"""
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    
+    @staticmethod
+    def _sweep_overlaps(slots: List[Tuple[datetime, datetime]],
+                        intervals: List[Tuple[datetime, datetime]]) -> List[bool]:
+        """
+        Marca quais slots colidem com algum intervalo, em O(slots + intervalos)
+        
+        Slots e intervalos devem estar ordenados pelo início. Um intervalo
+        colide com o slot [início, fim) se começa antes do fim do slot e
+        termina depois do início (ou começa no próprio slot). Como o conjunto
+        de intervalos que começam antes do fim do slot só cresce, basta
+        acompanhar o maior fim e o maior início desse prefixo.
+        """
+        flags = []
+        index = 0
+        max_start = max_end = None
+        for slot_start, slot_end in slots:
+            while index < len(intervals) and intervals[index][0] < slot_end:
+                start, end = intervals[index]
+                max_start = start if max_start is None else max(max_start, start)
+                max_end = end if max_end is None else max(max_end, end)
+                index += 1
+            flags.append(max_end is not None and (max_end > slot_start or max_start >= slot_start))
+        return flags
+    
     async def _is_slot_booked(self, slot_datetime: datetime, duration_minutes: int) -> bool:
         """Verificar se um slot está ocupado"""
         slot_end = slot_datetime + timedelta(minutes=duration_minutes)
@@ -144,7 +333,7 @@ class DynamicSchedulingService:
             select(Appointment).where(
                 and_(
                     Appointment.business_id == self.business_id,
-                    Appointment.status.in_(["pendente", "confirmado"]),
+                    Appointment.status.in_(BOOKING_ACTIVE_STATUSES),
                     or_(
                         # Agendamento começa durante o slot
                         and_(
@@ -166,7 +355,7 @@ class DynamicSchedulingService:
             )
         )
         
-        return result.scalar_one_or_none() is not None
+        return result.scalars().first() is not None
     
     async def _is_slot_blocked(self, slot_datetime: datetime, duration_minutes: int) -> bool:
         """Verificar se um slot está bloqueado"""
@@ -190,7 +379,7 @@ class DynamicSchedulingService:
             )
         )
         
-        return result.scalar_one_or_none() is not None
+        return result.scalars().first() is not None
     
     async def create_appointment(self, user_id: int, service_id: int, 
                                appointment_datetime: datetime, notes: str = None) -> Tuple[bool, str, Optional[Appointment]]:
@@ -212,12 +401,6 @@ class DynamicSchedulingService:
         if not await self.is_business_open(appointment_datetime):
             return False, "Horário fora do funcionamento", None
         
-        if await self._is_slot_booked(appointment_datetime, service.duration_minutes):
-            return False, "Horário já ocupado", None
-        
-        if await self._is_slot_blocked(appointment_datetime, service.duration_minutes):
-            return False, "Horário bloqueado", None
-        
         # Verificar antecedência mínima
         bot_config = await self.get_bot_config()
         min_advance_hours = bot_config.min_advance_booking_hours if bot_config else 2
@@ -225,20 +408,42 @@ class DynamicSchedulingService:
         if appointment_datetime < datetime.now() + timedelta(hours=min_advance_hours):
             return False, f"Agendamento deve ser feito com pelo menos {min_advance_hours} horas de antecedência", None
         
-        # Criar agendamento
-        appointment = Appointment(
-            user_id=user_id,
-            business_id=self.business_id,
-            service_id=service_id,
-            date_time=appointment_datetime,
-            end_time=appointment_datetime + timedelta(minutes=service.duration_minutes),
-            status="pendente" if not (bot_config and bot_config.auto_confirm_bookings) else "confirmado",
-            notes=notes,
-            price_at_booking=service.price
-        )
+        end_time = appointment_end(appointment_datetime, service.duration_minutes)
         
-        self.db_session.add(appointment)
-        await self.db_session.commit()
+        # Verificação e inserção atômicas: a agenda do negócio fica travada até o commit
+        async with booking_lock(self.db_session, self.business_id):
+            # rollback encerra a transação e libera o lock nas recusas
+            if await find_overlapping_appointment(self.db_session, self.business_id, appointment_datetime, end_time):
+                await self.db_session.rollback()
+                return False, "Horário já ocupado", None
+            
+            if await self._is_slot_blocked(appointment_datetime, service.duration_minutes):
+                await self.db_session.rollback()
+                return False, "Horário bloqueado", None
+            
+            # Criar agendamento
+            appointment = Appointment(
+                user_id=user_id,
+                business_id=self.business_id,
+                service_id=service_id,
+                date_time=appointment_datetime,
+                end_time=end_time,
+                status="pendente" if not (bot_config and bot_config.auto_confirm_bookings) else "confirmado",
+                notes=notes,
+                price_at_booking=service.price
+            )
+            
+            self.db_session.add(appointment)
+            try:
+                await self.db_session.commit()
+            except IntegrityError as e:
+                await self.db_session.rollback()
+                if is_overlap_violation(e):
+                    return False, "Horário já ocupado", None
+                raise
+        
+        from app.services.availability_index import availability_index
+        availability_index.upsert_appointment(appointment)
         
         return True, "Agendamento criado com sucesso", appointment
     
@@ -285,6 +490,9 @@ class DynamicSchedulingService:
         
         await self.db_session.commit()
         
+        from app.services.availability_index import availability_index
+        availability_index.upsert_appointment(appointment)
+        
         return True, "Agendamento cancelado com sucesso"
     
     async def get_business_hours_formatted(self) -> str:
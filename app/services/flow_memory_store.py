@@ -0,0 +1,287 @@
+"""
+Armazenamento da memória do fluxo conversacional (ConversationMemory por telefone)
+Em memória: LRU limitado com expiração por inatividade. Com Redis: o LRU
+local vira cache, as alterações são gravadas em lote (write-behind, SETEX com
+o mesmo TTL) e os demais workers enxergam o estado serializado. O fluxo é
+síncrono, então a leitura do Redis acontece antes dele, em prefetch()
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "flow_memory:"
+
+
+@dataclass
+class FlowMemoryStoreConfig:
+    idle_ttl: float = 1800.0          # Conversa sem mensagens por mais que isso é descartada
+    max_local: int = 10000            # Memórias mantidas no processo
+    history_window: int = 10          # Itens de topic_history/pending_questions por conversa
+    backend: str = "memory"           # "memory" ou "redis"
+    redis_url: Optional[str] = None
+    flush_interval: float = 0.5       # Write-behind para o Redis (segundos)
+    local_ttl: float = 5.0            # Cópia local sem alteração é relida do Redis após isso
+
+
+class FlowMemoryStore:
+    """Memórias por telefone em LRU com TTL de inatividade"""
+
+    def __init__(self, encode: Callable[[Any], str], decode: Callable[[str], Any],
+                 config: FlowMemoryStoreConfig = None, clock: Callable[[], float] = time.monotonic):
+        self.config = config or FlowMemoryStoreConfig()
+        self.encode = encode
+        self.decode = decode
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()  # telefone -> (memória, último acesso)
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, phone: str) -> bool:
+        return self.get(phone) is not None
+
+    def get(self, phone: str) -> Optional[Any]:
+        now = self.clock()
+        self._evict(now)
+        entry = self._entries.get(phone)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._touch(phone, entry[0], now)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def get_or_create(self, phone: str, factory: Callable[[], Any]) -> Any:
+        memory = self.get(phone)
+        if memory is None:
+            memory = factory()
+            self._touch(phone, memory, self.clock())
+        return memory
+
+    def save(self, phone: str, memory: Any):
+        """Registra a memória alterada (no backend em memória só renova o acesso)"""
+        now = self.clock()
+        self._touch(phone, memory, now)
+        self._evict(now)
+
+    def delete(self, phone: str):
+        self._entries.pop(phone, None)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Memórias ativas neste processo"""
+        self._evict(self.clock())
+        return ((phone, entry[0]) for phone, entry in list(self._entries.items()))
+
+    def _touch(self, phone: str, memory: Any, now: float):
+        self._entries[phone] = (memory, now)
+        self._entries.move_to_end(phone)
+
+    def _evict(self, now: float):
+        """Remove do início do LRU (menos recente) o que expirou ou excede o limite"""
+        entries = self._entries
+        deadline = now - self.config.idle_ttl
+        while entries:
+            phone, (_, touched_at) = next(iter(entries.items()))
+            if touched_at < deadline:
+                self.stats["expired"] += 1
+            elif len(entries) > self.config.max_local:
+                self.stats["evicted"] += 1
+            else:
+                break
+            entries.popitem(last=False)
+
+    async def prefetch(self, phone: str):
+        """Carrega a memória do backend antes do passo síncrono (nada a fazer em memória)"""
+
+    # Ciclo de vida: nada a fazer sem backend externo
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def flush(self) -> int:
+        return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "backend": "memory", "local": len(self._entries)}
+
+
+class RedisFlowMemoryStore(FlowMemoryStore):
+    """
+    LRU local + Redis. get() nunca acessa a rede: quem chama o fluxo faz
+    await prefetch(telefone) antes, que relê pelo cliente assíncrono a cópia
+    ausente ou mais velha que local_ttl; as gravações acumulam por telefone
+    e saem em pipeline no event loop
+    """
+
+    def __init__(self, encode: Callable[[Any], str], decode: Callable[[str], Any],
+                 config: FlowMemoryStoreConfig = None, clock: Callable[[], float] = time.monotonic,
+                 async_client=None):
+        super().__init__(encode, decode, config, clock)
+        self._async_client = async_client
+        self._loaded_at: Dict[str, float] = {}
+        self._dirty: Dict[str, Any] = {}        # telefone -> memória (None = remover)
+        self._task: Optional[asyncio.Task] = None
+        self.stats.update({"redis_loads": 0, "written": 0, "deleted": 0, "redis_errors": 0})
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import redis.asyncio as aioredis
+            self._async_client = aioredis.from_url(
+                self.config.redis_url, socket_timeout=2, socket_connect_timeout=2
+            )
+        return self._async_client
+
+    def get(self, phone: str) -> Optional[Any]:
+        if phone in self._dirty:
+            # Alteração local ainda não gravada é a versão mais nova
+            memory = self._dirty[phone]
+            if memory is not None:
+                self._touch(phone, memory, self.clock())
+                self.stats["hits"] += 1
+            return memory
+        return super().get(phone)
+
+    async def prefetch(self, phone: str):
+        """Relê do Redis a memória ausente ou velha; em erro, o fluxo segue com a cópia local"""
+        if phone in self._dirty:
+            return
+        now = self.clock()
+        if phone in self._entries and now - self._loaded_at.get(phone, now) < self.config.local_ttl:
+            return
+
+        try:
+            data = await self.async_client.get(_KEY_PREFIX + phone)
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"⚠️ Redis indisponível para memória do fluxo ({phone}): {e}")
+            return
+
+        if phone in self._dirty:
+            return  # Alterada localmente durante a leitura
+        self.stats["redis_loads"] += 1
+        now = self.clock()
+        if data is None:
+            self._entries.pop(phone, None)
+            self._loaded_at.pop(phone, None)
+            return
+        self._touch(phone, self.decode(data), now)
+        self._loaded_at[phone] = now
+        self._evict(now)
+
+    def save(self, phone: str, memory: Any):
+        super().save(phone, memory)
+        self._loaded_at[phone] = self.clock()
+        self._dirty[phone] = memory
+        self._ensure_started()
+
+    def delete(self, phone: str):
+        super().delete(phone)
+        self._loaded_at.pop(phone, None)
+        self._dirty[phone] = None
+        self._ensure_started()
+
+    def _evict(self, now: float):
+        super()._evict(now)
+        if len(self._loaded_at) > 2 * len(self._entries) + 1000:
+            self._loaded_at = {phone: self._loaded_at[phone] for phone in self._entries if phone in self._loaded_at}
+
+    async def flush(self) -> int:
+        """Grava as memórias alteradas desde o último lote (SETEX com o TTL de inatividade)"""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        ttl = max(1, int(self.config.idle_ttl))
+
+        try:
+            pipe = self.async_client.pipeline(transaction=False)
+            for phone, memory in dirty.items():
+                if memory is None:
+                    pipe.delete(_KEY_PREFIX + phone)
+                else:
+                    pipe.setex(_KEY_PREFIX + phone, ttl, self.encode(memory))
+            await pipe.execute()
+        except Exception as e:
+            # Só volta para a fila o que não foi alterado de novo nesse meio tempo
+            for phone, memory in dirty.items():
+                self._dirty.setdefault(phone, memory)
+            self.stats["redis_errors"] += 1
+            logger.error(f"❌ Erro ao gravar {len(dirty)} memórias do fluxo no Redis: {e}")
+            return 0
+
+        deleted = sum(1 for memory in dirty.values() if memory is None)
+        self.stats["deleted"] += deleted
+        self.stats["written"] += len(dirty) - deleted
+        return len(dirty)
+
+    def start(self):
+        """Inicia o write-behind no event loop atual"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🧠 Memória do fluxo no Redis (TTL {self.config.idle_ttl:.0f}s, "
+                    f"gravação a cada {self.config.flush_interval}s)")
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sem event loop: as alterações ficam pendentes até o próximo start/flush
+        self.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config.flush_interval)
+            await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **super().get_stats(),
+            "backend": "redis",
+            "pending": len(self._dirty),
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+def _load_config() -> FlowMemoryStoreConfig:
+    config = FlowMemoryStoreConfig()
+    config.idle_ttl = getattr(settings, "flow_memory_ttl", None) or config.idle_ttl
+    config.max_local = getattr(settings, "flow_memory_max_local", None) or config.max_local
+    config.history_window = getattr(settings, "flow_history_window", None) or config.history_window
+    config.backend = getattr(settings, "flow_memory_backend", None) or config.backend
+    config.redis_url = getattr(settings, "redis_url", None)
+    if config.backend == "redis" and not (getattr(settings, "redis_enabled", False) and config.redis_url):
+        logger.warning("⚠️ flow_memory_backend=redis sem Redis habilitado; usando memória local")
+        config.backend = "memory"
+    return config
+
+
+def create_flow_memory_store(encode: Callable[[Any], str], decode: Callable[[str], Any],
+                             config: FlowMemoryStoreConfig = None) -> FlowMemoryStore:
+    """Store conforme a configuração (backend "redis" ou memória local)"""
+    config = config or _load_config()
+    if config.backend == "redis":
+        return RedisFlowMemoryStore(encode, decode, config)
+    return FlowMemoryStore(encode, decode, config)
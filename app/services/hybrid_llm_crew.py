@@ -3,12 +3,17 @@ Serviço Híbrido LLM + CrewAI Multi-Agentes
 Combina o melhor dos dois mundos para máxima eficiência
 """
 import asyncio
-from typing import Dict, Any, Optional, List
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 import logging
 
 from .llm_advanced import advanced_llm_service, LLMResponse, ConversationState
+from .llm_degradation import DegradationLevel
 from .crew_agents import whatsapp_crew, AgentRole
+from .crew_pool import observe_runs
 from .lead_scoring import lead_scoring_service, LeadCategory
 from app.config import settings
 from app.utils.logger import get_logger
@@ -17,6 +22,49 @@ logger = get_logger(__name__)
 logger = logging.getLogger(__name__)
 
 
+class _CrewThreadWork:
+    """
+    Tempo real das threads de kickoff disparadas por um caminho CrewAI.
+    Se o caminho foi descartado e a thread ainda roda quando o turno termina,
+    o restante é contabilizado como desperdício quando ela de fato acaba
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, on_late_work):
+        self.loop = loop
+        self.on_late_work = on_late_work
+        self.runs: List[List[Optional[float]]] = []  # [submetida, terminada]
+        self._lock = threading.Lock()
+        self._settled_at: Optional[float] = None
+        self._wasted = False
+    
+    def observe(self, future: Future):
+        run = [time.monotonic(), None]
+        with self._lock:
+            self.runs.append(run)
+        future.add_done_callback(lambda _: self._done(run))
+    
+    def _done(self, run: List[Optional[float]]):
+        # Chamado na thread do pool
+        with self._lock:
+            run[1] = time.monotonic()
+            late = run[1] - max(run[0], self._settled_at) if self._settled_at is not None else None
+            wasted = self._wasted
+        if late is not None and wasted:
+            try:
+                self.loop.call_soon_threadsafe(self.on_late_work, late)
+            except RuntimeError:
+                pass  # Event loop já encerrado
+    
+    def settle(self, wasted: bool) -> Tuple[float, int]:
+        """Fecha a conta no fim do turno: (segundos até agora, threads ainda rodando)"""
+        with self._lock:
+            self._settled_at = now = time.monotonic()
+            self._wasted = wasted
+            seconds = sum((end or now) - begin for begin, end in self.runs)
+            running = sum(1 for _, end in self.runs if end is None)
+        return seconds, running
+
+
 class HybridLLMCrewService:
     """
     Serviço híbrido que combina:
@@ -24,10 +72,22 @@ class HybridLLMCrewService:
     - CrewAI: Para tarefas especializadas e complexas
     """
     
-    def __init__(self):
+    def __init__(self, speculation_mode: str = None, quality_threshold: float = None):
         self.llm_service = advanced_llm_service
         self.crew_service = whatsapp_crew
         
+        # Execução especulativa dos turnos híbridos
+        if speculation_mode is None:
+            speculation_mode = getattr(settings, "hybrid_speculation_mode", None) or "both"
+        if quality_threshold is None:
+            quality_threshold = getattr(settings, "hybrid_quality_threshold", None)
+        self.speculation_mode = speculation_mode
+        self.quality_threshold = 60.0 if quality_threshold is None else quality_threshold
+        self.speculation_stats = {
+            "turns": 0, "gate_passed": 0, "gate_failed": 0, "cancelled": 0,
+            "work_seconds": 0.0, "wasted_seconds": 0.0
+        }
+        
         # Configurações de decisão
         self.crew_activation_rules = {
             "high_value_customer": 80,  # Lead score > 80 vai para crew
@@ -72,7 +132,7 @@ class HybridLLMCrewService:
             )
             
             # 2. DECISÃO: LLM vs CREW vs HÍBRIDO
-            processing_strategy = self._decide_strategy(
+            processing_strategy = await self._decide_strategy(
                 message, user_id, initial_analysis
             )
             
@@ -190,12 +250,12 @@ class HybridLLMCrewService:
             logger.warning(f"Erro na conversão do lead score: {e}")
             return 50.0  # Default médio
     
-    def _decide_strategy(self, message: str, user_id: str, context: Dict[str, Any]) -> str:
+    async def _decide_strategy(self, message: str, user_id: str, context: Dict[str, Any]) -> str:
         """Decide qual estratégia usar baseada na mensagem e contexto"""
         
         try:
             # 1. Calcular Lead Score primeiro - com validação simplificada
-            lead_score = lead_scoring_service.score_lead(
+            lead_score = await lead_scoring_service.score_lead(
                 message=message,
                 phone=user_id,
                 customer_data=context.get("customer_data", {}),
@@ -301,6 +361,9 @@ class HybridLLMCrewService:
             user_id, conversation_id, message, message_type
         )
         
+        return self._llm_result(llm_response)
+    
+    def _llm_result(self, llm_response: LLMResponse) -> Dict[str, Any]:
         return {
             "success": True,
             "response": llm_response.text,
@@ -312,6 +375,37 @@ class HybridLLMCrewService:
             "agent_used": "llm_advanced"
         }
     
+    async def _fast_path(
+        self, 
+        user_id: str, 
+        conversation_id: str, 
+        message: str, 
+        message_type: str,
+        analysis: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Caminho rápido do turno híbrido: a análise inicial já processou a
+        mensagem no LLM, então a resposta dela é reaproveitada
+        """
+        llm_response = analysis.get("llm_response")
+        if llm_response is None:
+            llm_response = await self.llm_service.process_message(
+                user_id, conversation_id, message, message_type
+            )
+        result = self._llm_result(llm_response)
+        if not self._has_llm_answer(llm_response):
+            # A escada não respondeu: a mensagem de retorno não passa no portão
+            result["success"] = False
+        return result
+    
+    @staticmethod
+    def _has_llm_answer(llm_response: Optional[LLMResponse]) -> bool:
+        """Falso se o LLM não respondeu ou a escada só devolveu a mensagem de retorno (adiado/indisponível)"""
+        if llm_response is None:
+            return False
+        level = (llm_response.metadata or {}).get("degradation_level")
+        return level not in (DegradationLevel.DEFERRED.value, DegradationLevel.UNAVAILABLE.value)
+    
     async def _process_with_crew_only(
         self, 
         user_id: str, 
@@ -327,7 +421,7 @@ class HybridLLMCrewService:
             "timestamp": datetime.now().isoformat()
         }
         
-        crew_result = self.crew_service.process_message(
+        crew_result = await self.crew_service.process_message(
             message, user_id, conversation_context
         )
         
@@ -364,35 +458,21 @@ class HybridLLMCrewService:
     ) -> Dict[str, Any]:
         """
         Processamento híbrido que combina LLM + CrewAI
-        LLM para velocidade, Crew para especialização
+        LLM para velocidade, Crew para especialização. Os dois caminhos rodam
+        em paralelo; conforme speculation_mode:
+        - race: a primeira resposta aprovada no portão de qualidade vence
+        - fast-with-fallback: vale o LLM se aprovado; senão espera o CrewAI
+        - both: espera os dois e escolhe a melhor resposta
+        O caminho descartado é cancelado assim que há resposta aprovada; se a
+        resposta da análise inicial já passa no portão, race e
+        fast-with-fallback nem disparam o CrewAI
         """
         
         try:
-            # Executar ambos em paralelo para comparar
-            llm_task = self._process_with_llm_only(
-                user_id, conversation_id, message, message_type
-            )
-            
-            crew_task = self._process_with_crew_only(
-                user_id, message, analysis
-            )
-            
-            # Aguardar ambos com timeout
-            llm_result, crew_result = await asyncio.gather(
-                llm_task, crew_task, return_exceptions=True
+            return await self._run_speculative(
+                user_id, conversation_id, message, message_type, analysis
             )
             
-            # Decidir qual resposta usar
-            final_result = self._choose_best_response(llm_result, crew_result, analysis)
-            
-            final_result["hybrid_comparison"] = {
-                "llm_available": not isinstance(llm_result, Exception),
-                "crew_available": not isinstance(crew_result, Exception),
-                "chosen_source": final_result.get("chosen_source", "unknown")
-            }
-            
-            return final_result
-            
         except Exception as e:
             logger.error(f"Erro no processamento híbrido: {e}")
             
@@ -401,6 +481,140 @@ class HybridLLMCrewService:
                 user_id, conversation_id, message, message_type
             )
     
+    async def _run_speculative(
+        self, 
+        user_id: str, 
+        conversation_id: str, 
+        message: str, 
+        message_type: str,
+        analysis: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        mode = self.speculation_mode
+        started = time.monotonic()
+        tasks: Dict[str, asyncio.Task] = {}
+        sources: Dict[asyncio.Task, str] = {}
+        finished: Dict[str, float] = {}  # Fim de cada caminho, concluído ou cancelado
+        pending = set()
+        crew_threads = _CrewThreadWork(asyncio.get_running_loop(), self._record_late_crew_work)
+        
+        def launch(source: str):
+            if source == "llm":
+                coro = self._fast_path(user_id, conversation_id, message, message_type, analysis)
+            else:
+                coro = self._crew_path(user_id, message, analysis, crew_threads)
+            task = asyncio.create_task(coro)
+            task.add_done_callback(lambda _: finished.setdefault(source, time.monotonic()))
+            tasks[source] = task
+            sources[task] = source
+            pending.add(task)
+        
+        # Com a resposta da análise inicial em mãos, race e fast-with-fallback
+        # só disparam o CrewAI se ela for reprovada: o kickoff ocupa uma thread
+        # do pool que não pode ser interrompida. Sem resposta do LLM (inclusive
+        # turno adiado/indisponível) o CrewAI parte junto
+        launch("llm")
+        if mode == "both" or not self._has_llm_answer(analysis.get("llm_response")):
+            launch("crew")
+        
+        results: Dict[str, Any] = {}
+        quality: Dict[str, float] = {}
+        gate: Dict[str, bool] = {}
+        winner = None
+        cancelled: List[str] = []
+        
+        try:
+            while pending and winner is None:
+                # fast-with-fallback só olha o CrewAI depois do veredito do LLM
+                watched = {tasks["llm"]} if mode == "fast-with-fallback" and tasks["llm"] in pending else pending
+                done, _ = await asyncio.wait(watched, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    source = sources[task]
+                    results[source] = task.exception() or task.result()
+                    gate[source], quality[source] = self._quality_gate(results[source], source)
+                    if gate[source] and mode != "both" and winner is None:
+                        winner = source
+                    elif source == "llm" and "crew" not in tasks:
+                        launch("crew")
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                    cancelled.append(sources[task])
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        if winner is not None:
+            final_result = results[winner]
+            final_result["chosen_source"] = f"{winner}_passed_gate"
+            final_result["quality_scores"] = quality
+        else:
+            final_result = self._choose_best_response(results["llm"], results["crew"], analysis)
+            winner = final_result.get("chosen_source", "llm").split("_")[0]
+        
+        work = {source: finished[source] - started for source in tasks}
+        crew_running = 0
+        if "crew" in tasks and crew_threads.runs:
+            # Trabalho real do CrewAI é o tempo das threads de kickoff, não o da tarefa cancelada
+            work["crew"], crew_running = crew_threads.settle(wasted="crew" != winner)
+        wasted_ratio = self._record_speculation(
+            gate_passed=any(gate.values()),
+            work=work, used=winner, cancelled=len(cancelled)
+        )
+        
+        final_result["hybrid_comparison"] = {
+            "mode": mode,
+            "llm_available": "llm" in results and not isinstance(results["llm"], Exception),
+            "crew_available": "crew" in results and not isinstance(results["crew"], Exception),
+            "crew_started": "crew" in tasks,
+            "chosen_source": final_result.get("chosen_source", "unknown"),
+            "quality_gate": gate,
+            "quality_scores": quality,
+            "quality_threshold": self.quality_threshold,
+            "cancelled": cancelled,
+            "crew_threads_running": crew_running,
+            "wasted_work_ratio": wasted_ratio
+        }
+        
+        return final_result
+    
+    async def _crew_path(
+        self, 
+        user_id: str, 
+        message: str, 
+        analysis: Dict[str, Any],
+        crew_threads: _CrewThreadWork
+    ) -> Dict[str, Any]:
+        """Caminho CrewAI da especulação, registrando as threads de kickoff que ele dispara"""
+        with observe_runs(crew_threads.observe):
+            return await self._process_with_crew_only(user_id, message, analysis)
+    
+    def _record_late_crew_work(self, seconds: float):
+        """Thread de kickoff descartada que só terminou depois do turno"""
+        self.speculation_stats["work_seconds"] += seconds
+        self.speculation_stats["wasted_seconds"] += seconds
+    
+    def _quality_gate(self, result: Any, source: str) -> Tuple[bool, float]:
+        """Aprova a resposta se teve sucesso e nota >= quality_threshold"""
+        if isinstance(result, BaseException) or not result.get("success", False):
+            return False, 0.0
+        score = self._calculate_response_quality(result, source)
+        return score >= self.quality_threshold, score
+    
+    def _record_speculation(self, gate_passed: bool, work: Dict[str, float], used: str, cancelled: int) -> float:
+        """Registra o veredito do portão e o trabalho descartado; retorna a fração desperdiçada do turno"""
+        total = sum(work.values())
+        wasted = total - work.get(used, 0.0)
+        
+        stats = self.speculation_stats
+        stats["turns"] += 1
+        stats["gate_passed" if gate_passed else "gate_failed"] += 1
+        stats["cancelled"] += cancelled
+        stats["work_seconds"] += total
+        stats["wasted_seconds"] += wasted
+        
+        return wasted / total if total > 0 else 0.0
+    
     def _choose_best_response(
         self, 
         llm_result: Dict[str, Any], 
@@ -533,9 +747,19 @@ class HybridLLMCrewService:
             "crew_analytics": crew_analytics,
             "llm_analytics": llm_analytics,
             "activation_rules": self.crew_activation_rules,
+            "speculation": self.get_speculation_stats(),
             "recommendations": self._generate_optimization_recommendations()
         }
     
+    def get_speculation_stats(self) -> Dict[str, Any]:
+        stats = self.speculation_stats
+        return {
+            **stats,
+            "mode": self.speculation_mode,
+            "quality_threshold": self.quality_threshold,
+            "wasted_work_ratio": stats["wasted_seconds"] / stats["work_seconds"] if stats["work_seconds"] else 0.0
+        }
+    
     def _generate_optimization_recommendations(self) -> List[str]:
         """Gera recomendações de otimização baseado nas métricas"""
         
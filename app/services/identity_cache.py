@@ -0,0 +1,122 @@
+"""
+Cache em processo de identidades quentes do webhook
+wa_id -> usuário e usuário -> conversa aberta, guardados como snapshot das
+colunas para serem reanexados à sessão sem consulta ao banco
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Type
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.config import settings
+from app.models.database import Conversation, User
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IdentityCacheConfig:
+    max_entries: int = 10000
+    user_ttl: float = 3600.0
+    conversation_ttl: float = 30.0  # status pode ser alterado por outro processo (ex.: dashboard)
+
+
+class _LRU:
+    """Mapa LRU limitado com TTL por entrada"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.items: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        entry = self.items.get(key)
+        if entry is None:
+            return None
+        snapshot, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return snapshot
+
+    def put(self, key, snapshot: Dict[str, Any]):
+        self.items[key] = (snapshot, time.monotonic() + self.ttl)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_entries:
+            self.items.popitem(last=False)
+
+    def pop(self, key):
+        self.items.pop(key, None)
+
+
+class IdentityCache:
+    """Usuários por wa_id e conversa aberta por usuário"""
+
+    def __init__(self, config: IdentityCacheConfig = None):
+        self.config = config or IdentityCacheConfig()
+        self.users = _LRU(self.config.max_entries, self.config.user_ttl)
+        self.conversations = _LRU(self.config.max_entries, self.config.conversation_ttl)
+        self.stats = {"user_hits": 0, "user_misses": 0, "conversation_hits": 0, "conversation_misses": 0}
+
+    def get_user(self, wa_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.users.get(wa_id)
+        self.stats["user_hits" if snapshot else "user_misses"] += 1
+        return snapshot
+
+    def put_user(self, user: User):
+        self.users.put(user.wa_id, _snapshot(user))
+
+    def forget_user(self, user_id: int):
+        for wa_id, (snapshot, _) in list(self.users.items.items()):
+            if snapshot["id"] == user_id:
+                self.users.pop(wa_id)
+
+    def get_conversation(self, user_id: int) -> Optional[Dict[str, Any]]:
+        snapshot = self.conversations.get(user_id)
+        self.stats["conversation_hits" if snapshot else "conversation_misses"] += 1
+        return snapshot
+
+    def put_conversation(self, conversation: Conversation):
+        self.conversations.put(conversation.user_id, _snapshot(conversation))
+
+    def forget_conversation(self, conversation_id: int):
+        for user_id, (snapshot, _) in list(self.conversations.items.items()):
+            if snapshot["id"] == conversation_id:
+                self.conversations.pop(user_id)
+
+    def clear(self):
+        self.users.items.clear()
+        self.conversations.items.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "users": len(self.users.items), "conversations": len(self.conversations.items)}
+
+
+def _snapshot(instance) -> Dict[str, Any]:
+    return {attr.key: getattr(instance, attr.key) for attr in inspect(type(instance)).column_attrs}
+
+
+async def attach_snapshot(db: AsyncSession, model: Type, snapshot: Dict[str, Any]):
+    """Reanexa um snapshot à sessão como objeto persistente, sem SQL"""
+    instance = model(**snapshot)
+    make_transient_to_detached(instance)
+    return await db.merge(instance, load=False)
+
+
+def _load_config() -> IdentityCacheConfig:
+    config = IdentityCacheConfig()
+    config.max_entries = getattr(settings, "identity_cache_max_entries", None) or config.max_entries
+    ttl = getattr(settings, "conversation_cache_ttl", None)
+    if ttl is not None:
+        config.conversation_ttl = ttl
+    return config
+
+
+# Instância global
+identity_cache = IdentityCache(_load_config())
@@ -6,14 +6,23 @@ Sistema de Handoff Inteligente
 Gerencia quando e como transferir conversas para atendimento humano
 """
 import json
-import re
 from datetime import datetime, time
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 import logging
 
+from app.utils.text_analyzer import text_analyzer
+
 logger = logging.getLogger(__name__)
 
+# Mensagens de frustração no histórico recente (escalação comportamental)
+FRUSTRATION_PATTERNS = [
+    r"\b(não entendi|não funcionou|ainda não|continua|mesmo problema)\b",
+    r"\b(help|ajuda|socorro|desisto)\b",
+    r"\b(falar com|quero uma pessoa|atendente humano)\b"
+]
+text_analyzer.register_patterns("handoff.frustration", FRUSTRATION_PATTERNS)
+
 class HandoffReason(Enum):
     """Razões para handoff"""
     COMPLAINT = "complaint"
@@ -40,6 +49,10 @@ class IntelligentHandoffService:
         self.config = self._load_handoff_config(config_path)
         self.conversation_metrics = {}
         
+        # Regras compiladas uma vez; avaliadas sobre a mensagem já normalizada
+        for rule in self.config["handoff_rules"]:
+            text_analyzer.register_patterns(f"handoff.{rule['name']}", rule["trigger_patterns"])
+        
     def _load_handoff_config(self, config_path: str = None) -> Dict:
         """Carrega configuração de handoff"""
         default_config = {
@@ -159,42 +172,41 @@ class IntelligentHandoffService:
             Tuple (should_handoff, reason, handoff_config)
         """
         try:
-            # Normalizar mensagem
-            message_lower = message.lower()
+            features = text_analyzer.analyze(message)
             
             # Verificar padrões de handoff
             for rule in self.config["handoff_rules"]:
-                for pattern in rule["trigger_patterns"]:
-                    if re.search(pattern, message_lower):
-                        logger.info(f"🎯 Handoff detectado: {rule['name']} para usuário {user_id}")
-                        
-                        # Determinar nível de escalação
-                        escalation_level = rule["escalation_level"]
-                        escalation_config = self.config["escalation_paths"][escalation_level]
-                        
-                        # Verificar se está no horário de atendimento
-                        # DESABILITADO PARA TESTES - sempre considerar horário comercial
-                        import os
-                        testing_mode = os.getenv('TESTING_MODE', 'false').lower() == 'true'
-                        is_business_hour = testing_mode or self._is_business_hours(escalation_config["available_hours"])
-                        
-                        if not is_business_hour:
-                            return await self._handle_outside_hours(user_id)
-                        
-                        handoff_config = {
-                            "rule_name": rule["name"],
-                            "priority": rule["priority"],
-                            "escalation_level": escalation_level,
-                            "auto_escalate": rule["auto_escalate"],
-                            "message": rule["message"],
-                            "department": escalation_config["department"],
-                            "triggered_pattern": pattern
-                        }
-                        
-                        # Registrar métricas
-                        self._track_handoff_metrics(user_id, rule["name"])
-                        
-                        return True, HandoffReason(rule["name"]), handoff_config
+                pattern = text_analyzer.match_pattern(features, f"handoff.{rule['name']}")
+                if pattern:
+                    logger.info(f"🎯 Handoff detectado: {rule['name']} para usuário {user_id}")
+                    
+                    # Determinar nível de escalação
+                    escalation_level = rule["escalation_level"]
+                    escalation_config = self.config["escalation_paths"][escalation_level]
+                    
+                    # Verificar se está no horário de atendimento
+                    # DESABILITADO PARA TESTES - sempre considerar horário comercial
+                    import os
+                    testing_mode = os.getenv('TESTING_MODE', 'false').lower() == 'true'
+                    is_business_hour = testing_mode or self._is_business_hours(escalation_config["available_hours"])
+                    
+                    if not is_business_hour:
+                        return await self._handle_outside_hours(user_id)
+                    
+                    handoff_config = {
+                        "rule_name": rule["name"],
+                        "priority": rule["priority"],
+                        "escalation_level": escalation_level,
+                        "auto_escalate": rule["auto_escalate"],
+                        "message": rule["message"],
+                        "department": escalation_config["department"],
+                        "triggered_pattern": pattern
+                    }
+                    
+                    # Registrar métricas
+                    self._track_handoff_metrics(user_id, rule["name"])
+                    
+                    return True, HandoffReason(rule["name"]), handoff_config
             
             # Verificar escalações baseadas em comportamento
             behavioral_handoff = await self._check_behavioral_triggers(user_id, message, conversation_history)
@@ -222,20 +234,12 @@ class IntelligentHandoffService:
         recent_messages = conversation_history[-5:] if len(conversation_history) >= 5 else conversation_history
         
         # Contar mensagens de frustração
-        frustration_patterns = [
-            r"\b(não entendi|não funcionou|ainda não|continua|mesmo problema)\b",
-            r"\b(help|ajuda|socorro|desisto)\b",
-            r"\b(falar com|quero uma pessoa|atendente humano)\b"
-        ]
-        
         frustration_count = 0
         for msg in recent_messages:
             if msg.get("sender") == "user":
-                msg_text = msg.get("content", "").lower()
-                for pattern in frustration_patterns:
-                    if re.search(pattern, msg_text):
-                        frustration_count += 1
-                        break
+                features = text_analyzer.analyze(msg.get("content", ""))
+                if text_analyzer.match_pattern(features, "handoff.frustration"):
+                    frustration_count += 1
         
         # Se múltiplas frustrações, escalar
         if frustration_count >= 2:
@@ -10,9 +10,12 @@ from datetime import datetime, timedelta
 from enum import Enum
 import json
 import logging
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field, fields
 import re
 
+from app.services.lead_store import LeadProfileUnavailable, LeadStore, lead_store
+from app.utils.text_analyzer import text_analyzer
+
 logger = logging.getLogger(__name__)
 
 
@@ -75,6 +78,24 @@ class CustomerProfile:
     total_appointments: int = 0
 
 
+def profile_to_dict(profile: CustomerProfile) -> Dict[str, Any]:
+    """Perfil serializável em JSON (coluna lead_scores.profile)"""
+    data = asdict(profile)
+    data["last_interaction"] = profile.last_interaction.isoformat() if profile.last_interaction else None
+    data["interaction_history"] = [interaction.value for interaction in profile.interaction_history]
+    return data
+
+
+def profile_from_dict(data: Dict[str, Any]) -> CustomerProfile:
+    """Inverso de profile_to_dict; campos desconhecidos são ignorados"""
+    known = {f.name for f in fields(CustomerProfile)}
+    values = {key: value for key, value in data.items() if key in known}
+    if values.get("last_interaction"):
+        values["last_interaction"] = datetime.fromisoformat(values["last_interaction"])
+    values["interaction_history"] = [InteractionType(value) for value in values.get("interaction_history", [])]
+    return CustomerProfile(**values)
+
+
 class LeadScoringEngine:
     """Engine principal de Lead Scoring"""
     
@@ -123,6 +144,24 @@ class LeadScoringEngine:
             "eu decido", "sou o responsável", "minha empresa", "nossa equipe",
             "posso autorizar", "tenho autonomia", "sou o dono"
         ]
+        
+        self.service_terms = ["corte", "barba", "sobrancelha", "massagem"]
+        self.near_timeline = ["hoje", "amanhã", "esta semana"]
+        self.later_timeline = ["próxima semana", "mês que vem"]
+        self.budget_terms = ["orçamento", "quanto"]
+        
+        # Todos os conjuntos rodam numa única passada do analisador compartilhado
+        for name, keywords in {
+            "lead.urgency": self.urgency_keywords,
+            "lead.price": self.price_keywords,
+            "lead.buying": self.buying_signals,
+            "lead.authority": self.decision_authority,
+            "lead.service": self.service_terms,
+            "lead.timeline_near": self.near_timeline,
+            "lead.timeline_later": self.later_timeline,
+            "lead.budget": self.budget_terms,
+        }.items():
+            text_analyzer.register_keywords(name, keywords)
 
     def calculate_lead_score(
         self, 
@@ -182,28 +221,25 @@ class LeadScoringEngine:
 
     def _analyze_message_behavior(self, message: str) -> Dict[str, float]:
         """Analisa comportamento na mensagem atual"""
-        message_lower = message.lower()
+        features = text_analyzer.analyze(message)
         factors = {}
         
         # Indicadores de urgência
-        urgency_count = sum(1 for keyword in self.urgency_keywords if keyword in message_lower)
-        factors["urgency_indicators"] = min(10, urgency_count * 3)
+        factors["urgency_indicators"] = min(10, features.count("lead.urgency") * 3)
         
         # Sensibilidade a preço
-        price_count = sum(1 for keyword in self.price_keywords if keyword in message_lower)
-        factors["price_sensitivity"] = min(8, price_count * 2.5)
+        factors["price_sensitivity"] = min(8, features.count("lead.price") * 2.5)
         
         # Especificidade do serviço
         service_specificity = 0
-        if any(word in message_lower for word in ["corte", "barba", "sobrancelha", "massagem"]):
+        if features.has("lead.service"):
             service_specificity += 3
         if len(message.split()) > 10:  # mensagem detalhada
             service_specificity += 2
         factors["service_specificity"] = min(7, service_specificity)
         
         # Autoridade de decisão
-        authority_count = sum(1 for phrase in self.decision_authority if phrase in message_lower)
-        factors["decision_authority"] = min(5, authority_count * 2)
+        factors["decision_authority"] = min(5, features.count("lead.authority") * 2)
         
         return factors
 
@@ -295,24 +331,23 @@ class LeadScoringEngine:
 
     def _analyze_buying_intention(self, message: str, profile: CustomerProfile) -> Dict[str, float]:
         """Analisa intenção de compra"""
-        message_lower = message.lower()
+        features = text_analyzer.analyze(message)
         factors = {}
         
         # Sinais de compra
-        buying_count = sum(1 for signal in self.buying_signals if signal in message_lower)
-        factors["buying_signals"] = min(4, buying_count * 1.5)
+        factors["buying_signals"] = min(4, features.count("lead.buying") * 1.5)
         
         # Urgência temporal
         timeline_score = 0
-        if any(word in message_lower for word in ["hoje", "amanhã", "esta semana"]):
+        if features.has("lead.timeline_near"):
             timeline_score = 3
-        elif any(word in message_lower for word in ["próxima semana", "mês que vem"]):
+        elif features.has("lead.timeline_later"):
             timeline_score = 1
         factors["timeline_urgency"] = timeline_score
         
         # Indicadores de orçamento
         budget_score = 0
-        if "orçamento" in message_lower or "quanto" in message_lower:
+        if features.has("lead.budget"):
             budget_score = 2
         factors["budget_indicators"] = budget_score
         
@@ -485,11 +520,23 @@ class LeadScoringEngine:
 class LeadScoringService:
     """Serviço de Lead Scoring integrado ao WhatsApp Agent"""
     
-    def __init__(self):
+    def __init__(self, store: LeadStore = None):
         self.engine = LeadScoringEngine()
-        self.lead_database = {}  # Cache de leads em memória
+        # Perfis quentes em memória, índice de todos os leads e gravação no banco
+        self.store = store or lead_store
+        self.store.index.add_categories(category.value for category in LeadCategory)
+        
+        # Tipo de interação: o primeiro conjunto encontrado define o tipo
+        self.interaction_keywords = [
+            (InteractionType.PRICE_INQUIRY, ["preço", "quanto", "valor"]),
+            (InteractionType.APPOINTMENT_REQUEST, ["agendar", "marcar", "horário"]),
+            (InteractionType.COMPLAINT, ["problema", "reclamação", "insatisfeito"]),
+            (InteractionType.FIRST_CONTACT, ["olá", "oi"]),
+        ]
+        for interaction_type, keywords in self.interaction_keywords:
+            text_analyzer.register_keywords(f"lead.interaction.{interaction_type.value}", keywords)
         
-    def score_lead(
+    async def score_lead(
         self, 
         message: str, 
         phone: str, 
@@ -499,7 +546,13 @@ class LeadScoringService:
         """Interface principal para scoring de leads"""
         
         # Criar ou atualizar perfil do cliente
-        profile = self._get_or_create_profile(phone, customer_data)
+        try:
+            profile = await self._get_or_create_profile(phone, customer_data)
+            persist = True
+        except LeadProfileUnavailable:
+            # Perfil gravado ilegível agora: pontua com um perfil provisório sem gravá-lo por cima
+            profile = self._new_profile(phone, customer_data)
+            persist = False
         
         # Atualizar perfil com nova interação
         self._update_profile_with_interaction(profile, message)
@@ -507,25 +560,37 @@ class LeadScoringService:
         # Calcular score
         lead_score = self.engine.calculate_lead_score(message, profile, context)
         
-        # Salvar no cache
-        self.lead_database[phone] = {
-            "profile": profile,
-            "last_score": lead_score,
-            "last_updated": datetime.now()
-        }
+        # Salvar no conjunto quente, atualizar agregados e enfileirar gravação
+        if persist:
+            self.store.put(phone, profile, lead_score, profile_to_dict(profile))
+        else:
+            logger.warning(f"Lead {phone} pontuado sem o perfil gravado; score não salvo")
         
         # Log do resultado
         logger.info(f"Lead scored: {phone} - Score: {lead_score.total_score} - Category: {lead_score.category.value}")
         
         return lead_score
     
-    def _get_or_create_profile(self, phone: str, customer_data: Dict[str, Any] = None) -> CustomerProfile:
+    async def _get_or_create_profile(self, phone: str, customer_data: Dict[str, Any] = None) -> CustomerProfile:
         """Obtém ou cria perfil do cliente"""
         
-        if phone in self.lead_database:
-            return self.lead_database[phone]["profile"]
+        entry = self.store.get(phone)
+        if entry is not None:
+            return entry["profile"]
+        
+        stored = await self.store.load_profile(phone)
+        
+        # Outra mensagem do mesmo lead pode ter sido pontuada durante a leitura
+        entry = self.store.get(phone)
+        if entry is not None:
+            return entry["profile"]
+        if stored is not None:
+            return profile_from_dict(stored)
         
-        # Criar novo perfil
+        return self._new_profile(phone, customer_data)
+    
+    def _new_profile(self, phone: str, customer_data: Dict[str, Any] = None) -> CustomerProfile:
+        """Perfil de um lead novo, com os dados do cliente informados"""
         profile = CustomerProfile(phone=phone)
         
         if customer_data:
@@ -547,64 +612,40 @@ class LeadScoringService:
         profile.last_interaction = datetime.now()
         
         # Detectar tipo de interação
-        message_lower = message.lower()
-        
-        if any(word in message_lower for word in ["preço", "quanto", "valor"]):
-            profile.interaction_history.append(InteractionType.PRICE_INQUIRY)
-        elif any(word in message_lower for word in ["agendar", "marcar", "horário"]):
-            profile.interaction_history.append(InteractionType.APPOINTMENT_REQUEST)
-        elif any(word in message_lower for word in ["problema", "reclamação", "insatisfeito"]):
-            profile.interaction_history.append(InteractionType.COMPLAINT)
-        elif "olá" in message_lower or "oi" in message_lower:
-            profile.interaction_history.append(InteractionType.FIRST_CONTACT)
-        else:
-            profile.interaction_history.append(InteractionType.SERVICE_INQUIRY)
+        features = text_analyzer.analyze(message)
+        interaction = next(
+            (interaction_type for interaction_type, _ in self.interaction_keywords
+             if features.has(f"lead.interaction.{interaction_type.value}")),
+            InteractionType.SERVICE_INQUIRY
+        )
+        profile.interaction_history.append(interaction)
         
         # Manter apenas últimas 10 interações
         profile.interaction_history = profile.interaction_history[-10:]
     
+    @property
+    def lead_database(self) -> Dict[str, Dict[str, Any]]:
+        """Leads do conjunto quente (compatibilidade)"""
+        return self.store.hot
+    
     def get_lead_analytics(self) -> Dict[str, Any]:
-        """Retorna analytics dos leads"""
-        if not self.lead_database:
-            return {"total_leads": 0}
-        
-        scores = [data["last_score"].total_score for data in self.lead_database.values()]
-        categories = [data["last_score"].category.value for data in self.lead_database.values()]
-        
-        category_counts = {}
-        for category in LeadCategory:
-            category_counts[category.value] = categories.count(category.value)
-        
-        return {
-            "total_leads": len(self.lead_database),
-            "average_score": sum(scores) / len(scores) if scores else 0,
-            "highest_score": max(scores) if scores else 0,
-            "lowest_score": min(scores) if scores else 0,
-            "category_distribution": category_counts,
-            "hot_leads": len([s for s in scores if s >= 61]),
-            "qualified_leads": len([s for s in scores if s >= 81]),
-            "opportunities": len([s for s in scores if s >= 96])
-        }
+        """Retorna analytics dos leads (agregados mantidos a cada score_lead)"""
+        return self.store.index.analytics()
     
     def get_top_leads(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Retorna top leads por score"""
-        leads = []
-        
-        for phone, data in self.lead_database.items():
-            leads.append({
-                "phone": phone,
-                "score": data["last_score"].total_score,
-                "category": data["last_score"].category.value,
-                "priority": data["last_score"].priority_level,
-                "estimated_value": data["last_score"].estimated_value,
-                "conversion_probability": data["last_score"].conversion_probability,
-                "last_updated": data["last_updated"].isoformat()
-            })
-        
-        # Ordenar por score descendente
-        leads.sort(key=lambda x: x["score"], reverse=True)
-        
-        return leads[:limit]
+        """Retorna top leads por score (do ranking mantido a cada score_lead)"""
+        return [
+            {
+                "phone": summary.phone,
+                "score": summary.score,
+                "category": summary.category,
+                "priority": summary.priority_level,
+                "estimated_value": summary.estimated_value,
+                "conversion_probability": summary.conversion_probability,
+                "last_updated": summary.last_updated.isoformat()
+            }
+            for summary in self.store.index.top(limit)
+        ]
 
 
 # Instância global do serviço
@@ -0,0 +1,351 @@
+"""
+Armazenamento dos leads pontuados (tabela lead_scores)
+Os perfis mais recentes ficam num conjunto quente limitado (LRU); os demais
+são lidos do banco sob demanda. Cada score_lead atualiza um índice com o
+resumo de todos os leads: histograma por categoria, soma para a média,
+contadores por faixa e um ranking ordenado, de modo que analytics e top-N não
+percorrem os leads. As gravações vão em lote em segundo plano (upsert por
+telefone) e as alterações feitas por outros workers são lidas periodicamente
+"""
+import asyncio
+import bisect
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config import settings
+from app.models.database import LeadRecord
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Faixas contadas pelo analytics (score mínimo)
+SCORE_THRESHOLDS = {"hot_leads": 61, "qualified_leads": 81, "opportunities": 96}
+
+# Margem na leitura incremental para transações que gravaram com horário anterior
+_REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class LeadProfileUnavailable(Exception):
+    """Perfil gravado existe mas não pôde ser lido; não deve ser sobrescrito"""
+
+
+@dataclass
+class LeadStoreConfig:
+    hot_set_size: int = 5000
+    flush_interval: float = 2.0
+    refresh_interval: float = 30.0
+
+
+class LeadSummary(NamedTuple):
+    """O que analytics e top-N precisam de cada lead"""
+    phone: str
+    score: float
+    category: str
+    priority_level: int
+    estimated_value: float
+    conversion_probability: float
+    last_updated: datetime
+
+
+class LeadIndex:
+    """Resumo de todos os leads com agregados mantidos a cada alteração"""
+
+    def __init__(self, categories: Iterable[str]):
+        self.summaries: Dict[str, LeadSummary] = {}
+        self._ranking: List[Tuple[float, str]] = []  # (score, phone) em ordem crescente
+        self.score_sum = 0.0
+        self.category_counts = {category: 0 for category in categories}
+        self.threshold_counts = {name: 0 for name in SCORE_THRESHOLDS}
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def __contains__(self, phone: str) -> bool:
+        return phone in self.summaries
+
+    def add_categories(self, categories: Iterable[str]):
+        """Categorias que aparecem no histograma mesmo sem leads"""
+        for category in categories:
+            self.category_counts.setdefault(category, 0)
+
+    def put(self, summary: LeadSummary):
+        previous = self.summaries.get(summary.phone)
+        if previous is not None:
+            self._apply(previous, -1)
+            del self._ranking[bisect.bisect_left(self._ranking, (previous.score, previous.phone))]
+        self.summaries[summary.phone] = summary
+        self._apply(summary, 1)
+        bisect.insort(self._ranking, (summary.score, summary.phone))
+
+    def _apply(self, summary: LeadSummary, sign: int):
+        self.score_sum += sign * summary.score
+        self.category_counts[summary.category] = self.category_counts.get(summary.category, 0) + sign
+        for name, minimum in SCORE_THRESHOLDS.items():
+            if summary.score >= minimum:
+                self.threshold_counts[name] += sign
+
+    def top(self, limit: int) -> List[LeadSummary]:
+        """Maiores scores primeiro (empate: telefone em ordem decrescente)"""
+        if limit <= 0:
+            return []
+        return [self.summaries[phone] for _, phone in reversed(self._ranking[-limit:])]
+
+    def analytics(self) -> Dict[str, Any]:
+        if not self.summaries:
+            return {"total_leads": 0}
+        return {
+            "total_leads": len(self.summaries),
+            "average_score": self.score_sum / len(self.summaries),
+            "highest_score": self._ranking[-1][0],
+            "lowest_score": self._ranking[0][0],
+            "category_distribution": dict(self.category_counts),
+            **self.threshold_counts
+        }
+
+
+class LeadStore:
+    """Conjunto quente de perfis + índice de leads + gravação em lote no banco"""
+
+    def __init__(self, config: LeadStoreConfig = None, categories: Iterable[str] = (),
+                 session_factory: Callable = None):
+        self.config = config or LeadStoreConfig()
+        self.session_factory = session_factory
+        self.hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.index = LeadIndex(categories)
+        self._pending: Dict[str, Dict[str, Any]] = {}  # telefone -> linha ainda não gravada
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"hot_hits": 0, "pending_hits": 0, "db_loads": 0, "load_errors": 0, "evictions": 0,
+                      "written": 0, "flush_errors": 0, "refreshed": 0}
+
+    def _session(self):
+        if self.session_factory is not None:
+            return self.session_factory()
+        from app.database import AsyncSessionLocal
+        return AsyncSessionLocal()
+
+    # ------------------------------------------------------------------
+    # Leitura e escrita
+    # ------------------------------------------------------------------
+
+    def get(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Entrada do conjunto quente ({profile, last_score, last_updated}) ou None"""
+        entry = self.hot.get(phone)
+        if entry is not None:
+            self.hot.move_to_end(phone)
+            self.stats["hot_hits"] += 1
+        return entry
+
+    async def load_profile(self, phone: str) -> Optional[Dict[str, Any]]:
+        """
+        Perfil serializado de um lead fora do conjunto quente, ou None se o
+        lead é novo. Só consulta o banco para telefones que o índice conhece;
+        levanta LeadProfileUnavailable se a leitura falhar, para que um perfil
+        em branco não seja gravado por cima do existente
+        """
+        row = self._pending.get(phone)
+        if row is not None:
+            self.stats["pending_hits"] += 1
+            return row["profile"]
+        if phone not in self.index:
+            return None
+
+        try:
+            async with self._session() as db:
+                profile = (await db.execute(
+                    select(LeadRecord.profile).where(LeadRecord.phone == phone)
+                )).scalar()
+        except Exception as e:
+            self.stats["load_errors"] += 1
+            logger.error(f"❌ Erro ao carregar perfil do lead {phone}: {e}")
+            raise LeadProfileUnavailable(phone) from e
+        self.stats["db_loads"] += 1
+        return profile
+
+    def put(self, phone: str, profile: Any, lead_score: Any, profile_data: Dict[str, Any],
+            updated_at: datetime = None) -> LeadSummary:
+        """Registra o novo score: conjunto quente, índice e fila de gravação"""
+        updated_at = updated_at or datetime.now()
+        self.hot[phone] = {"profile": profile, "last_score": lead_score, "last_updated": updated_at}
+        self.hot.move_to_end(phone)
+        while len(self.hot) > self.config.hot_set_size:
+            self.hot.popitem(last=False)
+            self.stats["evictions"] += 1
+
+        summary = LeadSummary(
+            phone=phone,
+            score=lead_score.total_score,
+            category=lead_score.category.value,
+            priority_level=lead_score.priority_level,
+            estimated_value=lead_score.estimated_value,
+            conversion_probability=lead_score.conversion_probability,
+            last_updated=updated_at
+        )
+        self.index.put(summary)
+        self._pending[phone] = {
+            "phone": phone,
+            "score": summary.score,
+            "category": summary.category,
+            "priority_level": summary.priority_level,
+            "estimated_value": summary.estimated_value,
+            "conversion_probability": summary.conversion_probability,
+            "profile": profile_data,
+            "scored_at": updated_at
+        }
+        self._ensure_started()
+        return summary
+
+    # ------------------------------------------------------------------
+    # Banco
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Grava os leads pendentes (upsert por telefone)"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = list(pending.values())
+
+        try:
+            async with self._session() as db:
+                dialect = db.get_bind().dialect.name
+                if dialect in _UPSERT_DIALECTS:
+                    stmt = _UPSERT_DIALECTS[dialect](LeadRecord)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["phone"],
+                        set_={
+                            **{column: stmt.excluded[column] for column in rows[0] if column != "phone"},
+                            "updated_at": func.now()
+                        }
+                    )
+                    await db.execute(stmt, rows)
+                else:
+                    for row in rows:
+                        existing = (await db.execute(
+                            select(LeadRecord).where(LeadRecord.phone == row["phone"])
+                        )).scalars().first()
+                        if existing:
+                            for column, value in row.items():
+                                setattr(existing, column, value)
+                        else:
+                            db.add(LeadRecord(**row))
+                await db.commit()
+        except Exception as e:
+            # Só volta para a fila o que não foi pontuado de novo nesse meio tempo
+            for phone, row in pending.items():
+                self._pending.setdefault(phone, row)
+            self.stats["flush_errors"] += 1
+            logger.error(f"❌ Erro ao gravar {len(rows)} leads: {e}")
+            return 0
+
+        self.stats["written"] += len(rows)
+        return len(rows)
+
+    async def refresh(self) -> int:
+        """
+        Aplica ao índice os leads gravados desde a última leitura (na primeira
+        chamada, todos). Perfis quentes alterados por outro worker saem do
+        conjunto quente e são relidos no próximo acesso
+        """
+        query = select(
+            LeadRecord.phone, LeadRecord.score, LeadRecord.category, LeadRecord.priority_level,
+            LeadRecord.estimated_value, LeadRecord.conversion_probability, LeadRecord.scored_at,
+            LeadRecord.updated_at
+        )
+        if self._watermark is not None:
+            query = query.where(LeadRecord.updated_at >= self._watermark - _REFRESH_OVERLAP)
+
+        try:
+            async with self._session() as db:
+                rows = (await db.execute(query)).all()
+        except Exception as e:
+            logger.error(f"❌ Erro ao ler leads alterados: {e}")
+            return 0
+
+        changed = 0
+        for phone, score, category, priority, value, probability, scored_at, updated_at in rows:
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+            if phone in self._pending:
+                continue  # A versão local ainda não gravada é a mais nova
+            summary = LeadSummary(phone, score, category, priority, value, probability, scored_at)
+            current = self.index.summaries.get(phone)
+            if current is not None and current[1:3] == summary[1:3]:
+                continue
+            self.index.put(summary)
+            self.hot.pop(phone, None)
+            changed += 1
+
+        self.stats["refreshed"] += changed
+        return changed
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Inicia gravação e leitura incremental periódicas no event loop atual"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"🎯 Lead store iniciado (conjunto quente={self.config.hot_set_size}, "
+            f"gravação a cada {self.config.flush_interval}s)"
+        )
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sem event loop: os leads ficam pendentes até o próximo start/flush
+        self.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_refresh = loop.time()
+        while True:
+            await self.flush()
+            if loop.time() >= next_refresh:
+                await self.refresh()
+                next_refresh = loop.time() + self.config.refresh_interval
+            await asyncio.sleep(self.config.flush_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "leads": len(self.index),
+            "hot": len(self.hot),
+            "pending": len(self._pending),
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+def _load_config() -> LeadStoreConfig:
+    config = LeadStoreConfig()
+    config.hot_set_size = getattr(settings, "lead_hot_set_size", None) or config.hot_set_size
+    config.flush_interval = getattr(settings, "lead_flush_interval", None) or config.flush_interval
+    config.refresh_interval = getattr(settings, "lead_refresh_interval", None) or config.refresh_interval
+    return config
+
+
+# Instância global
+lead_store = LeadStore(_load_config())
@@ -20,6 +20,10 @@ from app.utils.dynamic_prompts import get_dynamic_llm_system_prompt, get_dynamic
 from .retry_handler import retry_handler
 from .alert_manager import alert_llm_service_error
 from .cost_tracker import cost_tracker
+from .adaptive_limiter import openai_concurrency_limiter
+from .llm_hedging import openai_hedger
+from .llm_degradation import DegradationLadder, DegradationLevel, DeferredTurn
+from .llm_context_store import BoundedDict, LLMContextStore, create_llm_context_store
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +77,46 @@ class ConversationContext:
     updated_at: datetime = field(default_factory=datetime.now)
 
 
+def context_to_json(context: ConversationContext) -> str:
+    """Contexto serializado para ser guardado fora da memória (Redis)"""
+    intent = context.current_intent
+    return json.dumps({
+        "user_id": context.user_id,
+        "conversation_id": context.conversation_id,
+        "state": context.state.value,
+        "intent": [intent.type.value, intent.confidence, intent.entities,
+                   intent.requires_data, intent.next_questions] if intent else None,
+        "collected_data": context.collected_data,
+        "message_history": context.message_history,
+        "metadata": context.metadata,
+        "created_at": context.created_at.isoformat(),
+        "updated_at": context.updated_at.isoformat()
+    }, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def context_from_json(data: str) -> ConversationContext:
+    """Inverso de context_to_json"""
+    raw = json.loads(data)
+    intent = raw["intent"]
+    return ConversationContext(
+        user_id=raw["user_id"],
+        conversation_id=raw["conversation_id"],
+        state=ConversationState(raw["state"]),
+        current_intent=Intent(
+            type=IntentType(intent[0]),
+            confidence=intent[1],
+            entities=intent[2],
+            requires_data=intent[3],
+            next_questions=intent[4]
+        ) if intent else None,
+        collected_data=raw["collected_data"],
+        message_history=raw["message_history"],
+        metadata=raw["metadata"],
+        created_at=datetime.fromisoformat(raw["created_at"]),
+        updated_at=datetime.fromisoformat(raw["updated_at"])
+    )
+
+
 @dataclass
 class LLMResponse:
     """Resposta estruturada do LLM"""
@@ -206,7 +250,9 @@ class IntentDetector:
             
             response = await asyncio.wait_for(
                 retry_handler.execute_with_retry(
-                    self.client.chat.completions.create,
+                    openai_concurrency_limiter.wrap(
+                        openai_hedger.wrap("intent_detection", self.client.chat.completions.create)
+                    ),
                     "openai_intent_detection",
                     model="gpt-3.5-turbo",
                     messages=messages,
@@ -255,27 +301,50 @@ class IntentDetector:
 class ConversationStateManager:
     """Gerencia estados da conversa"""
     
-    def __init__(self):
-        self.contexts: Dict[str, ConversationContext] = {}
+    def __init__(self, store: LLMContextStore = None):
+        if store is None:
+            store = create_llm_context_store(context_to_json, context_from_json)
+        self.store = store
+    
+    @property
+    def contexts(self) -> LLMContextStore:
+        """Contextos residentes em memória"""
+        return self.store
     
     def get_context(self, user_id: str, conversation_id: str) -> ConversationContext:
-        """Obtém ou cria contexto da conversa"""
+        """Obtém ou cria contexto da conversa (sem reidratar do Redis; ver load_context)"""
         key = f"{user_id}_{conversation_id}"
         
-        if key not in self.contexts:
-            self.contexts[key] = ConversationContext(
+        context = self.store.get(key)
+        if context is None:
+            context = ConversationContext(
                 user_id=user_id,
                 conversation_id=conversation_id,
                 state=ConversationState.INITIAL
             )
+            self.store.put(key, context)
         
-        return self.contexts[key]
+        return context
+    
+    async def load_context(self, user_id: str, conversation_id: str) -> ConversationContext:
+        """Obtém contexto da conversa, trazendo de volta do Redis o que saiu da memória"""
+        context = await self.store.load(f"{user_id}_{conversation_id}")
+        if context is not None:
+            return context
+        return self.get_context(user_id, conversation_id)
     
     def update_context(self, context: ConversationContext):
         """Atualiza contexto da conversa"""
         key = f"{context.user_id}_{context.conversation_id}"
         context.updated_at = datetime.now()
-        self.contexts[key] = context
+        self.store.put(key, context)
+    
+    def clear_context(self, user_id: str, conversation_id: str) -> bool:
+        """Remove o contexto da memória e do Redis"""
+        key = f"{user_id}_{conversation_id}"
+        resident = key in self.store
+        self.store.pop(key)
+        return resident
     
     def transition_state(self, context: ConversationContext, new_state: ConversationState):
         """Transição de estado com validação"""
@@ -314,7 +383,9 @@ class DataCollector:
             
             response = await asyncio.wait_for(
                 retry_handler.execute_with_retry(
-                    self.client.chat.completions.create,
+                    openai_concurrency_limiter.wrap(
+                        openai_hedger.wrap("data_extraction", self.client.chat.completions.create)
+                    ),
                     "openai_response_generation",
                     model="gpt-3.5-turbo",
                     messages=messages,
@@ -385,8 +456,17 @@ class ResponseGenerator:
         self.client = llm_client
     
     async def generate_response(self, context: ConversationContext, 
-                              user_message: str) -> LLMResponse:
-        """Gera resposta baseada no contexto com dados reais da database"""
+                              user_message: str, max_tokens: int = 500,
+                              history_limit: int = 10) -> LLMResponse:
+        """
+        Gera resposta baseada no contexto com dados reais da database
+        
+        Args:
+            context: Contexto da conversa
+            user_message: Mensagem do usuário
+            max_tokens: Limite de tokens da resposta (reduzido em modo degradado)
+            history_limit: Quantidade de mensagens do histórico enviadas ao LLM
+        """
         try:
             # Determinar dados faltantes
             required_data = context.current_intent.requires_data if context.current_intent else []
@@ -424,7 +504,7 @@ class ResponseGenerator:
             ]
             
             # Adicionar histórico recente
-            for msg in context.message_history[-10:]:  # Últimas 10 mensagens
+            for msg in context.message_history[-history_limit:]:  # Últimas N mensagens
                 messages.append({
                     "role": msg["role"], 
                     "content": msg["content"]
@@ -434,12 +514,12 @@ class ResponseGenerator:
             
             response = await asyncio.wait_for(
                 retry_handler.execute_with_retry(
-                    self.client.chat.completions.create,
+                    openai_concurrency_limiter.wrap(self.client.chat.completions.create),
                     "openai_function_call",
                     model="gpt-3.5-turbo",
                     messages=messages,
                     temperature=0.2,  # Baixa temperatura para seguir formatação
-                    max_tokens=500
+                    max_tokens=max_tokens
                 ),
                 timeout=30.0  # 15 segundos máximo
             )
@@ -548,6 +628,7 @@ class FunctionCallHandler:
         """Manipula criação de agendamento"""
         try:
             from app.services.data import AppointmentService
+            from app.services.booking_guard import SlotUnavailableError
             from app.database import get_db
             from datetime import datetime
             
@@ -595,6 +676,13 @@ class FunctionCallHandler:
                             "message": f"✅ Agendamento criado com sucesso! ID: {appointment.id} - {service} para {appointment_datetime.strftime('%d/%m/%Y às %H:%M')}"
                         }
                         
+                    except SlotUnavailableError as slot_error:
+                        return {
+                            "success": False,
+                            "error": str(slot_error),
+                            "message": "❌ Esse horário acabou de ser reservado. Quer que eu sugira outro horário disponível?"
+                        }
+                        
                     except Exception as date_error:
                         return {
                             "success": False,
@@ -729,14 +817,16 @@ class AdvancedLLMService:
         self.response_generator = ResponseGenerator(self.client)
         self.function_handler = FunctionCallHandler()
         self.analyzer = ConversationAnalyzer()
+        self.degradation_ladder = DegradationLadder()
         
         # Sistema de plugins (será importado dinamicamente para evitar dependência circular)
         self.plugin_manager = None
         self._init_plugins()
         
-        # Cache para otimização
-        self.response_cache: Dict[str, LLMResponse] = {}
-        self.intent_cache: Dict[str, Intent] = {}
+        # Cache para otimização (limitados)
+        cache_size = self.state_manager.store.config.cache_size
+        self.response_cache: Dict[str, LLMResponse] = BoundedDict(cache_size)
+        self.intent_cache: Dict[str, Intent] = BoundedDict(cache_size)
         
         # Flag para controle de cleanup automático
         self._cleanup_task = None
@@ -749,37 +839,219 @@ class AdvancedLLMService:
         self.plugin_manager = None
     
     def _ensure_cleanup_started(self):
-        """Inicia cleanup automático se ainda não foi iniciado"""
+        """Inicia o tique de expiração de contextos se ainda não foi iniciado"""
         if self._start_cleanup_on_first_use and self._cleanup_task is None:
             try:
-                self._cleanup_task = asyncio.create_task(self._auto_cleanup_loop())
+                self._cleanup_task = self.state_manager.store.start()
                 self._start_cleanup_on_first_use = False
-                logger.info("Cleanup automático de contextos LLM iniciado")
             except RuntimeError:
                 # Não há loop rodando, cleanup será manual
                 logger.warning("Cleanup automático não pôde ser iniciado (sem loop assíncrono)")
                 self._start_cleanup_on_first_use = False
     
     async def process_message(self, user_id: str, conversation_id: str, 
-                            message: str, message_type: str = "text") -> LLMResponse:
+                            message: str, message_type: str = "text",
+                            allow_defer: bool = False) -> LLMResponse:
         """
         Processa mensagem de forma estruturada e contextual
         
+        Usa a escada de degradação: geração completa, geração reduzida,
+        resposta de cache/template e, em último caso, adia o turno.
+        
         Args:
             user_id: ID do usuário
             conversation_id: ID da conversa
             message: Conteúdo da mensagem
             message_type: Tipo (text, audio, image, etc.)
+            allow_defer: Enfileira o turno para o worker responder depois pelo
+                WhatsApp. Só o webhook usa; os demais chamadores recebem uma
+                resposta "unavailable" e decidem o que fazer
         
         Returns:
             Resposta estruturada com ações e contexto
         """
+        steps = {
+            DegradationLevel.FULL: lambda: self._full_step(
+                user_id, conversation_id, message, message_type
+            ),
+            DegradationLevel.REDUCED: lambda: self._reduced_step(
+                user_id, conversation_id, message, message_type
+            ),
+            DegradationLevel.TEMPLATE: lambda: self._template_step(
+                user_id, conversation_id, message
+            ),
+        }
+        turn = DeferredTurn(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message=message,
+            message_type=message_type
+        )
+        
+        response = await self.degradation_ladder.run(steps, turn, defer=allow_defer)
+        if response is None and allow_defer:
+            return LLMResponse(
+                text=DegradationLadder.DEFERRED_MESSAGE,
+                confidence=0.0,
+                metadata={"degradation_level": DegradationLevel.DEFERRED.value}
+            )
+        if response is None:
+            return LLMResponse(
+                text=DegradationLadder.UNAVAILABLE_MESSAGE,
+                confidence=0.0,
+                metadata={"degradation_level": DegradationLevel.UNAVAILABLE.value, "error": "llm_unavailable"}
+            )
+        return response
+    
+    async def _full_step(self, user_id: str, conversation_id: str,
+                         message: str, message_type: str) -> Optional[LLMResponse]:
+        """Degrau 1: pipeline completo (intenção, extração e geração)"""
+        response = await self._process_message_full(user_id, conversation_id, message, message_type)
+        if response is None or "error" in response.metadata:
+            return None
+        response.metadata["degradation_level"] = DegradationLevel.FULL.value
+        return response
+    
+    async def _reduced_step(self, user_id: str, conversation_id: str,
+                            message: str, message_type: str) -> Optional[LLMResponse]:
+        """Degrau 2: só geração, com menos tokens e histórico curto"""
+        context = await self.state_manager.load_context(user_id, conversation_id)
+        
+        # O degrau completo pode ter sido interrompido antes de registrar a mensagem
+        last = context.message_history[-1] if context.message_history else {}
+        if last.get("role") != "user" or last.get("content") != message:
+            context.message_history.append({
+                "role": "user",
+                "content": message,
+                "timestamp": datetime.now().isoformat(),
+                "type": message_type
+            })
+        
+        response = await self.response_generator.generate_response(
+            context, message,
+            max_tokens=self.degradation_ladder.config.reduced_max_tokens,
+            history_limit=self.degradation_ladder.config.reduced_history
+        )
+        if response is None or "error" in response.metadata:
+            return None
+        
+        response.metadata["degradation_level"] = DegradationLevel.REDUCED.value
+        self._record_assistant_reply(context, response.text)
+        return response
+    
+    async def _template_step(self, user_id: str, conversation_id: str,
+                             message: str) -> Optional[LLMResponse]:
+        """Degrau 3: resposta em cache ou template com dados do negócio"""
+        from app.services.cache_service import cache_service
+        
+        text = await cache_service.get_cached_response(message=message, user_id=user_id)
+        source = "cache"
+        if not text:
+            text = await self.degradation_ladder.templates.respond(message)
+            source = "template"
+        if not text:
+            return None
+        
+        context = await self.state_manager.load_context(user_id, conversation_id)
+        self._record_assistant_reply(context, text)
+        return LLMResponse(
+            text=text,
+            confidence=0.6,
+            metadata={"degradation_level": DegradationLevel.TEMPLATE.value, "source": source}
+        )
+    
+    def _record_assistant_reply(self, context: ConversationContext, text: str):
+        """Registra resposta de um degrau degradado no histórico"""
+        context.message_history.append({
+            "role": "assistant",
+            "content": text,
+            "timestamp": datetime.now().isoformat(),
+            "intent": context.current_intent.type.value if context.current_intent else None,
+            "state": context.state.value
+        })
+        self.state_manager.update_context(context)
+    
+    async def process_deferred_turns(self, limit: int = 50) -> List[Tuple[DeferredTurn, LLMResponse]]:
+        """
+        Reprocessa turnos adiados pelo pipeline completo
+        
+        Returns:
+            Pares (turno, resposta) para o chamador enviar ao usuário
+        """
+        async def handle(turn: DeferredTurn):
+            response = await self._full_step(
+                turn.user_id, turn.conversation_id, turn.message, turn.message_type
+            )
+            if response is None:
+                raise RuntimeError("LLM ainda indisponível")
+            return turn, response
+        
+        return await self.degradation_ladder.process_deferred(handle, limit=limit)
+    
+    def start_deferred_worker(self):
+        """Inicia o reprocessamento em segundo plano dos turnos adiados"""
+        self.degradation_ladder.start(self._deliver_deferred_turn)
+    
+    async def _deliver_deferred_turn(self, turn: DeferredTurn) -> LLMResponse:
+        """Gera a resposta de um turno adiado e a envia ao usuário pelo WhatsApp"""
+        from app.services.whatsapp import whatsapp_service
+        from app.utils.whatsapp_sanitizer import sanitize_message
+        
+        response = await self._full_step(
+            turn.user_id, turn.conversation_id, turn.message, turn.message_type
+        )
+        if response is None:
+            raise RuntimeError("LLM ainda indisponível")
+        
+        text = sanitize_message(response.text, "text")
+        result = await whatsapp_service.send_text_message(turn.user_id, text)
+        if result.get("error"):
+            raise RuntimeError(f"Envio falhou: {result['error']}")
+        
+        await self._store_deferred_reply(turn, text)
+        logger.info(f"✅ Resposta do turno adiado enviada para {turn.user_id}")
+        return response
+    
+    async def _store_deferred_reply(self, turn: DeferredTurn, text: str):
+        """Registra a resposta enviada no histórico de mensagens da conversa"""
+        from sqlalchemy import select
+        from app.database import AsyncSessionLocal
+        from app.services.data import MessageService
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                user_id = await db.scalar(
+                    select(Conversation.user_id).where(Conversation.id == int(turn.conversation_id))
+                )
+                if user_id is None:
+                    return
+                await MessageService.create_message(
+                    db=db,
+                    user_id=user_id,
+                    conversation_id=int(turn.conversation_id),
+                    direction="out",
+                    content=text,
+                    message_type="text",
+                    metadata={
+                        "processing_system": "advanced_llm",
+                        "degradation_level": DegradationLevel.DEFERRED.value,
+                        "deferred_seconds": (datetime.now() - turn.queued_at).total_seconds(),
+                        "sanitized": True
+                    }
+                )
+        except Exception as e:
+            # A mensagem já foi enviada: não reprocessar o turno por falha no histórico
+            logger.error(f"Erro ao registrar resposta adiada de {turn.user_id}: {e}")
+    
+    async def _process_message_full(self, user_id: str, conversation_id: str,
+                                    message: str, message_type: str = "text") -> LLMResponse:
+        """Pipeline completo de processamento (degrau FULL da escada de degradação)"""
         try:
             # Iniciar cleanup automático na primeira execução
             self._ensure_cleanup_started()
             
             # Obter contexto da conversa
-            context = self.state_manager.get_context(user_id, conversation_id)
+            context = await self.state_manager.load_context(user_id, conversation_id)
             
             # PRÉ-PROCESSAMENTO COM PLUGINS
             processed_message = message
@@ -793,14 +1065,16 @@ class AdvancedLLMService:
                     if result.success and result.data:
                         processed_message = result.data
             
-            # Adicionar mensagem ao histórico
-            context.message_history.append({
-                "role": "user",
-                "content": processed_message,
-                "timestamp": datetime.now().isoformat(),
-                "type": message_type,
-                "original_content": message if processed_message != message else None
-            })
+            # Adicionar mensagem ao histórico (reprocessamento de turno adiado já a registrou)
+            last = context.message_history[-1] if context.message_history else {}
+            if last.get("role") != "user" or last.get("content") != processed_message:
+                context.message_history.append({
+                    "role": "user",
+                    "content": processed_message,
+                    "timestamp": datetime.now().isoformat(),
+                    "type": message_type,
+                    "original_content": message if processed_message != message else None
+                })
             
             # ENRIQUECIMENTO DE CONTEXTO COM PLUGINS
             if self.plugin_manager:
@@ -993,7 +1267,7 @@ class AdvancedLLMService:
                 with open(temp_path, 'rb') as audio_file:
                     response = await asyncio.wait_for(
                         retry_handler.execute_with_retry(
-                            self.client.audio.transcriptions.create,
+                            openai_concurrency_limiter.wrap(self.client.audio.transcriptions.create),
                             "openai_whisper",
                             model="whisper-1",
                             file=audio_file,
@@ -1040,25 +1314,16 @@ class AdvancedLLMService:
     
     def clear_conversation_context(self, user_id: str, conversation_id: str):
         """Limpa contexto de uma conversa específica"""
-        key = f"{user_id}_{conversation_id}"
-        if key in self.state_manager.contexts:
-            del self.state_manager.contexts[key]
+        if self.state_manager.clear_context(user_id, conversation_id):
             logger.info(f"Contexto da conversa {conversation_id} limpo para usuário {user_id}")
     
     async def cleanup_old_contexts(self, max_age_hours: int = 24):
-        """Remove contextos antigos para economizar memória"""
+        """Tira da memória contextos ociosos há mais de max_age_hours"""
         cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
         
-        # Limpar contextos do state_manager (que usa contexts!)
-        old_contexts = []
-        if self.state_manager.contexts:
-            old_contexts = [
-                key for key, ctx in self.state_manager.contexts.items()
-                if ctx.updated_at < cutoff_time
-            ]
-            
-            for key in old_contexts:
-                del self.state_manager.contexts[key]
+        # Contextos ociosos saem pela cabeça do LRU (e vão para o Redis, se habilitado)
+        expired_contexts = self.state_manager.store.expire(max_idle=max_age_hours * 3600)
+        await self.state_manager.store.flush()
         
         # Limpar cache local de respostas e intenções
         cache_cleaned = 0
@@ -1083,18 +1348,9 @@ class AdvancedLLMService:
             del self.intent_cache[key]
             cache_cleaned += 1
         
-        total_cleaned = len(old_contexts) + cache_cleaned
+        total_cleaned = expired_contexts + cache_cleaned
         if total_cleaned > 0:
-            logger.info(f"Limpeza de memória: {len(old_contexts)} contextos + {cache_cleaned} caches removidos")
-    
-    async def _auto_cleanup_loop(self):
-        """Loop de limpeza automática de contextos"""
-        while True:
-            try:
-                await asyncio.sleep(600)  # 10 minutos
-                await self.cleanup_old_contexts(max_age_hours=2)
-            except Exception as e:
-                logger.error(f"Erro na limpeza automática de contextos LLM: {e}")
+            logger.info(f"Limpeza de memória: {expired_contexts} contextos + {cache_cleaned} caches removidos")
     
     # === MÉTODOS DE GERENCIAMENTO DE PLUGINS ===
     
@@ -1128,6 +1384,9 @@ class AdvancedLLMService:
             "system_metrics": {
                 "cache_size": len(self.response_cache),
                 "active_contexts": len(self.state_manager.contexts),
+                "context_store": self.state_manager.store.get_stats(),
+                "degradation": self.degradation_ladder.get_stats(),
+                "hedging": openai_hedger.get_stats(),
                 "plugin_system": self.get_plugin_stats()
             }
         }
@@ -1143,14 +1402,10 @@ class AdvancedLLMService:
     async def optimize_performance(self):
         """Otimiza performance do sistema"""
         # Limpar cache antigo
-        if len(self.response_cache) > 1000:
-            # Manter apenas os 500 mais recentes
-            sorted_cache = sorted(
-                self.response_cache.items(), 
-                key=lambda x: x[1].metadata.get('timestamp', ''),
-                reverse=True
-            )
-            self.response_cache = dict(sorted_cache[:500])
+        if len(self.response_cache) > 500:
+            # Manter apenas os 500 mais recentes (o cache já está em ordem de escrita)
+            while len(self.response_cache) > 500:
+                self.response_cache.popitem(last=False)
             logger.info("Cache de respostas otimizado")
         
         # Limpar contextos antigos
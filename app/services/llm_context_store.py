@@ -0,0 +1,268 @@
+"""
+Contextos de conversa do AdvancedLLMService
+Os contextos ativos ficam num LRU limitado. Um tique periódico retira os
+ociosos pela cabeça do LRU: como a ordem do LRU é a do último acesso, ela já
+é a ordem de expiração e o tique só toca no que expirou, sem varrer todos os
+contextos. Contextos retirados (por capacidade ou ociosidade) vão para o
+Redis e voltam na próxima mensagem da conversa
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "llm_context:"
+
+
+@dataclass
+class LLMContextStoreConfig:
+    max_resident: int = 5000
+    idle_ttl: float = 1800.0      # Sem mensagens por mais que isso: sai da memória
+    tick_interval: float = 30.0
+    spill_ttl: int = 7200         # Tempo no Redis antes de ser descartado
+    redis_url: Optional[str] = None  # Sem Redis, contextos retirados são descartados
+    cache_size: int = 1000        # response_cache / intent_cache
+
+
+class BoundedDict(OrderedDict):
+    """dict que descarta as entradas escritas há mais tempo ao passar de maxsize"""
+
+    def __init__(self, maxsize: int, *args, **kwargs):
+        self.maxsize = maxsize
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class LLMContextStore:
+    """LRU de contextos residentes + fila de contextos a gravar no Redis"""
+
+    def __init__(self, encode: Callable[[Any], str], decode: Callable[[str], Any],
+                 config: LLMContextStoreConfig = None, clock: Callable[[], float] = time.monotonic,
+                 redis_client=None):
+        self.config = config or LLMContextStoreConfig()
+        self.encode = encode
+        self.decode = decode
+        self.clock = clock
+        self._redis = redis_client
+        self._resident: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()  # chave -> (contexto, último acesso)
+        self._spill_queue: Dict[str, Any] = {}  # chave -> contexto retirado (None = remover do Redis)
+        self._flushing: Dict[str, Any] = {}     # lote sendo gravado agora
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "rehydrated": 0, "misses": 0, "evicted_capacity": 0, "evicted_idle": 0,
+                      "spilled": 0, "dropped": 0, "spill_errors": 0}
+
+    @property
+    def spill_enabled(self) -> bool:
+        return self._redis is not None or bool(self.config.redis_url)
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.config.redis_url, socket_timeout=2, socket_connect_timeout=2)
+        return self._redis
+
+    def __len__(self) -> int:
+        return len(self._resident)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._resident
+
+    def values(self) -> Iterator[Any]:
+        """Contextos residentes"""
+        return (entry[0] for entry in list(self._resident.values()))
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((key, entry[0]) for key, entry in list(self._resident.items()))
+
+    # ------------------------------------------------------------------
+    # Acesso
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        """Contexto residente, ou retirado e ainda não gravado; não consulta o Redis"""
+        entry = self._resident.get(key)
+        if entry is not None:
+            self.put(key, entry[0])
+            self.stats["hits"] += 1
+            return entry[0]
+        context = self._spill_queue.get(key)
+        if context is not None:
+            del self._spill_queue[key]
+        else:
+            context = self._flushing.get(key)
+            if context is not None:
+                # A cópia que está indo para o Redis fica obsoleta; remove no próximo tique
+                self._spill_queue[key] = None
+        if context is not None:
+            self.put(key, context)
+            self.stats["rehydrated"] += 1
+        return context
+
+    async def load(self, key: str) -> Optional[Any]:
+        """Como get, mas traz de volta do Redis o contexto retirado anteriormente"""
+        context = self.get(key)
+        if context is not None or not self.spill_enabled or key in self._spill_queue:
+            return context
+
+        try:
+            data = await self.redis.getdel(_KEY_PREFIX + key)
+        except Exception as e:
+            self.stats["spill_errors"] += 1
+            logger.warning(f"⚠️ Erro ao reidratar contexto {key} do Redis: {e}")
+            return None
+
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        context = self.decode(data)
+        self.put(key, context)
+        self.stats["rehydrated"] += 1
+        return context
+
+    def put(self, key: str, context: Any):
+        self._resident[key] = (context, self.clock())
+        self._resident.move_to_end(key)
+        while len(self._resident) > self.config.max_resident:
+            evicted_key, (evicted, _) = self._resident.popitem(last=False)
+            self._spill(evicted_key, evicted)
+            self.stats["evicted_capacity"] += 1
+
+    def pop(self, key: str):
+        """Remove o contexto da memória e, se estiver lá, do Redis"""
+        self._resident.pop(key, None)
+        if self.spill_enabled:
+            self._spill_queue[key] = None
+        else:
+            self._spill_queue.pop(key, None)
+
+    def expire(self, max_idle: float = None) -> int:
+        """Retira os contextos ociosos (a partir da cabeça do LRU)"""
+        deadline = self.clock() - (self.config.idle_ttl if max_idle is None else max_idle)
+        expired = 0
+        while self._resident:
+            key, (context, touched_at) = next(iter(self._resident.items()))
+            if touched_at >= deadline:
+                break
+            del self._resident[key]
+            self._spill(key, context)
+            expired += 1
+        self.stats["evicted_idle"] += expired
+        return expired
+
+    def _spill(self, key: str, context: Any):
+        if not self.spill_enabled:
+            self.stats["dropped"] += 1
+            return
+        self._spill_queue[key] = context
+        # Com o Redis fora do ar a fila não pode crescer sem limite
+        while len(self._spill_queue) > self.config.max_resident:
+            self._spill_queue.pop(next(iter(self._spill_queue)))
+            self.stats["dropped"] += 1
+
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Grava no Redis os contextos retirados desde o último tique"""
+        if not self._spill_queue:
+            return 0
+        queue, self._spill_queue = self._spill_queue, {}
+        self._flushing = queue
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, context in queue.items():
+                if context is None:
+                    pipe.delete(_KEY_PREFIX + key)
+                else:
+                    pipe.setex(_KEY_PREFIX + key, self.config.spill_ttl, self.encode(context))
+            await pipe.execute()
+        except Exception as e:
+            # Contextos reidratados nesse meio tempo já estão residentes de novo
+            for key, context in queue.items():
+                if key not in self._resident:
+                    self._spill_queue.setdefault(key, context)
+            self.stats["spill_errors"] += 1
+            logger.error(f"❌ Erro ao gravar {len(queue)} contextos LLM no Redis: {e}")
+            return 0
+        finally:
+            self._flushing = {}
+
+        self.stats["spilled"] += sum(1 for context in queue.values() if context is not None)
+        return len(queue)
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> asyncio.Task:
+        """Inicia o tique de expiração no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"🧠 Contextos LLM: até {self.config.max_resident} residentes, ociosos por "
+                f"{self.config.idle_ttl:.0f}s {'vão para o Redis' if self.spill_enabled else 'são descartados'}"
+            )
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.spill_enabled:
+            # Encerramento: os residentes também vão para o Redis
+            for key, context in self.items():
+                self._spill_queue.setdefault(key, context)
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config.tick_interval)
+            try:
+                self.expire()
+                if self.spill_enabled:
+                    await self.flush()
+            except Exception as e:
+                logger.error(f"Erro no tique de expiração de contextos LLM: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "resident": len(self._resident),
+            "max_resident": self.config.max_resident,
+            "spill_pending": len(self._spill_queue),
+            "spill": "redis" if self.spill_enabled else "none"
+        }
+
+
+def _load_config() -> LLMContextStoreConfig:
+    config = LLMContextStoreConfig()
+    config.max_resident = getattr(settings, "llm_context_max_resident", None) or config.max_resident
+    config.idle_ttl = getattr(settings, "llm_context_idle_ttl", None) or config.idle_ttl
+    config.spill_ttl = getattr(settings, "llm_context_spill_ttl", None) or config.spill_ttl
+    if getattr(settings, "redis_enabled", False):
+        config.redis_url = getattr(settings, "redis_url", None)
+    return config
+
+
+def create_llm_context_store(encode: Callable[[Any], str], decode: Callable[[str], Any],
+                             config: LLMContextStoreConfig = None) -> LLMContextStore:
+    """Store com a configuração do ambiente (spill para o Redis se habilitado)"""
+    return LLMContextStore(encode, decode, config or _load_config())
@@ -0,0 +1,260 @@
+"""
+Escada de degradação do caminho LLM
+Quando a OpenAI está lenta ou indisponível, desce gradualmente de geração
+completa para geração reduzida, respostas de template com dados do negócio
+e, por fim, uma mensagem de retorno com o turno enfileirado para depois
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.config import settings
+from app.utils.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class DegradationLevel(Enum):
+    """Degraus da escada, do mais completo ao mais barato"""
+    FULL = "full"
+    REDUCED = "reduced"
+    TEMPLATE = "template"
+    DEFERRED = "deferred"
+    UNAVAILABLE = "unavailable"  # nenhum degrau respondeu e o chamador não adia turnos
+
+
+@dataclass
+class DegradationConfig:
+    slo_seconds: float = 12.0        # orçamento total do turno
+    full_timeout: float = 8.0
+    reduced_timeout: float = 4.0
+    template_timeout: float = 2.0
+    reduced_max_tokens: int = 150
+    reduced_history: int = 4
+    max_deferred: int = 1000
+    drain_interval: float = 30.0     # intervalo entre reprocessamentos da fila
+    drain_batch: int = 50
+    max_attempts: int = 5            # tentativas de reprocessamento antes de descartar
+
+
+@dataclass
+class DeferredTurn:
+    """Turno que não pôde ser respondido e será reprocessado depois"""
+    user_id: str
+    conversation_id: str
+    message: str
+    message_type: str = "text"
+    queued_at: datetime = field(default_factory=datetime.now)
+    attempts: int = 0
+
+
+class TemplateResponder:
+    """Respostas prontas com dados do BusinessDataService (horários, preços, endereço)"""
+
+    TOPICS = {
+        "hours": ["horário", "horario", "abre", "fecha", "funcionamento", "aberto"],
+        "prices": ["preço", "preco", "valor", "quanto custa", "serviços", "servicos", "tabela"],
+        "address": ["endereço", "endereco", "onde fica", "localização", "localizacao", "como chegar"],
+    }
+
+    def match_topic(self, message: str) -> Optional[str]:
+        text = message.lower()
+        for topic, keywords in self.TOPICS.items():
+            if any(keyword in text for keyword in keywords):
+                return topic
+        return None
+
+    async def respond(self, message: str) -> Optional[str]:
+        topic = self.match_topic(message)
+        if topic is None:
+            return None
+
+        from app.services.business_data import business_data_service
+        if topic == "hours":
+            return await business_data_service.get_business_hours_formatted_text()
+        if topic == "prices":
+            return await business_data_service.get_services_formatted_text(message)
+        return await business_data_service.get_company_info_formatted_text()
+
+
+class DegradationLadder:
+    """Executa os degraus com timeouts por etapa dentro do SLO do turno"""
+
+    DEFERRED_MESSAGE = (
+        "Recebemos sua mensagem! 🙏 Estamos com alta demanda no momento e "
+        "retornaremos em breve com a resposta."
+    )
+
+    UNAVAILABLE_MESSAGE = (
+        "Desculpe, não consegui responder agora. 🙏 "
+        "Pode tentar novamente em alguns instantes?"
+    )
+
+    def __init__(self, config: DegradationConfig = None):
+        self.config = config or DegradationConfig(
+            slo_seconds=getattr(settings, "llm_slo_seconds", None) or DegradationConfig.slo_seconds,
+            drain_interval=getattr(settings, "llm_deferred_drain_interval", None) or DegradationConfig.drain_interval
+        )
+        self.templates = TemplateResponder()
+        # Sem maxlen: o limite é aplicado em _defer para contabilizar o descarte
+        self.deferred_turns: Deque[DeferredTurn] = deque()
+        self.metrics: Dict[str, Dict[str, int]] = {
+            level.value: {"success": 0, "timeout": 0, "failed": 0, "skipped": 0}
+            for level in DegradationLevel
+        }
+        self.metrics[DegradationLevel.DEFERRED.value].update({"replayed": 0, "dropped": 0})
+        self._handler: Optional[Callable[[DeferredTurn], Awaitable[Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def run(self, steps: Dict[DegradationLevel, Callable[[], Awaitable[Any]]],
+                  turn: DeferredTurn, defer: bool = True) -> Any:
+        """
+        Executa os degraus em ordem até um deles produzir resposta válida
+
+        Args:
+            steps: Corrotinas por degrau; retornam a resposta ou None quando
+                   não conseguem responder. O timeout do degrau é aplicado aqui:
+                   ao estourar, a tarefa é cancelada e libera o limitador
+            turn: Turno atual, enfileirado se todos os degraus falharem
+            defer: Se False, o turno não é enfileirado (o chamador não entrega
+                   respostas tardias)
+
+        Returns:
+            Resposta do primeiro degrau bem-sucedido, ou None se nenhum respondeu
+        """
+        deadline = time.monotonic() + self.config.slo_seconds
+        step_timeouts = {
+            DegradationLevel.FULL: self.config.full_timeout,
+            DegradationLevel.REDUCED: self.config.reduced_timeout,
+            DegradationLevel.TEMPLATE: self.config.template_timeout,
+        }
+
+        for level, step_timeout in step_timeouts.items():
+            step = steps.get(level)
+            remaining = deadline - time.monotonic()
+            if step is None or remaining <= 0:
+                self._record(level, "skipped", 0.0)
+                continue
+
+            timeout = min(step_timeout, remaining)
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(step(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self._record(level, "timeout", time.monotonic() - start)
+                logger.warning(f"Degrau {level.value} excedeu {timeout:.1f}s para {turn.user_id}")
+                continue
+            except Exception as e:
+                self._record(level, "failed", time.monotonic() - start)
+                logger.warning(f"Degrau {level.value} falhou para {turn.user_id}: {e}")
+                continue
+
+            if result is None:
+                self._record(level, "failed", time.monotonic() - start)
+                continue
+
+            self._record(level, "success", time.monotonic() - start)
+            return result
+
+        if defer:
+            self._defer(turn)
+        else:
+            self._record(DegradationLevel.UNAVAILABLE, "success", 0.0)
+            logger.warning(f"Nenhum degrau respondeu para {turn.user_id}; turno não adiado")
+        return None
+
+    def _defer(self, turn: DeferredTurn):
+        """Enfileira o turno; com a fila cheia o mais antigo é descartado"""
+        if len(self.deferred_turns) >= self.config.max_deferred:
+            self._drop(self.deferred_turns.popleft(), "fila de adiados cheia")
+        self.deferred_turns.append(turn)
+        self._record(DegradationLevel.DEFERRED, "success", 0.0)
+        logger.warning(f"Turno de {turn.user_id} adiado ({len(self.deferred_turns)} na fila)")
+
+    def _drop(self, turn: DeferredTurn, reason: str):
+        self._record(DegradationLevel.DEFERRED, "dropped", 0.0)
+        logger.error(
+            f"❌ Turno adiado de {turn.user_id} (conversa {turn.conversation_id}, "
+            f"{turn.queued_at:%H:%M:%S}) descartado sem resposta: {reason}"
+        )
+
+    async def process_deferred(self, handler: Callable[[DeferredTurn], Awaitable[Any]],
+                               limit: int = 50) -> List[Any]:
+        """
+        Reprocessa turnos adiados na ordem de chegada
+
+        Na primeira falha o turno volta para o início da fila e o lote para
+        (o LLM provavelmente ainda está indisponível); após max_attempts
+        tentativas o turno é descartado e registrado
+        """
+        results = []
+        for _ in range(min(limit, len(self.deferred_turns))):
+            turn = self.deferred_turns.popleft()
+            try:
+                results.append(await handler(turn))
+            except Exception as e:
+                turn.attempts += 1
+                logger.error(
+                    f"Falha ao reprocessar turno adiado de {turn.user_id} "
+                    f"(tentativa {turn.attempts}/{self.config.max_attempts}): {e}"
+                )
+                if turn.attempts >= self.config.max_attempts:
+                    self._drop(turn, f"{turn.attempts} tentativas sem sucesso")
+                    continue
+                self.deferred_turns.appendleft(turn)
+                break
+            self._record(DegradationLevel.DEFERRED, "replayed", 0.0)
+        return results
+
+    def start(self, handler: Callable[[DeferredTurn], Awaitable[Any]]):
+        """Inicia o reprocessamento periódico da fila com o handler que responde ao usuário"""
+        self._handler = handler
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"⏳ Reprocessamento de turnos adiados iniciado (intervalo={self.config.drain_interval}s)")
+
+    async def stop(self):
+        """Para o reprocessamento; turnos que ainda estão na fila são registrados como perdidos"""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self.deferred_turns:
+            self._drop(self.deferred_turns.popleft(), "aplicação encerrada")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.config.drain_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping or not self.deferred_turns:
+                continue
+            try:
+                await self.process_deferred(self._handler, limit=self.config.drain_batch)
+            except Exception as e:
+                logger.error(f"Erro no reprocessamento de turnos adiados: {e}")
+
+    def _record(self, level: DegradationLevel, outcome: str, duration: float):
+        self.metrics[level.value][outcome] += 1
+        metrics_collector.record_degradation_step(level.value, outcome, duration)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "steps": self.metrics,
+            "deferred_queue": len(self.deferred_turns),
+            "deferred_worker": self._task is not None and not self._task.done(),
+            "slo_seconds": self.config.slo_seconds
+        }
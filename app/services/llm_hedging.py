@@ -0,0 +1,214 @@
+"""
+Hedging de requisições idempotentes à OpenAI
+Se a requisição principal passar do percentil configurado de latência,
+dispara uma cópia idêntica; a primeira resposta vence e a outra é cancelada
+
+O hedger roda dentro do limite de concorrência (limiter.wrap(hedger.wrap(...))):
+o atraso mede só a chamada ao provedor, e a cópia ocupa uma vaga própria do
+limiter, sendo dispensada quando já há chamadas na fila
+"""
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.config import settings
+from app.utils.metrics import metrics_collector
+from .adaptive_limiter import openai_concurrency_limiter
+from .bulkhead import Bulkhead
+from .cost_tracker import cost_tracker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HedgingConfig:
+    enabled: bool = False
+    percentile: float = 95.0      # atraso do hedge = percentil da latência observada
+    min_delay: float = 0.5        # nunca disparar hedge antes disso (segundos)
+    min_samples: int = 20         # amostras necessárias antes de hedgear
+    window: int = 500             # amostras de latência mantidas por operação
+    budget_ratio: float = 0.1     # no máximo ~10% de requisições extras
+    budget_burst: float = 10.0    # hedges acumuláveis para picos
+
+
+class LatencyTracker:
+    """Janela de latências recentes com percentil em cache"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._sorted = None
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self._sorted = None
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        index = min(len(self._sorted) - 1, int(len(self._sorted) * p / 100))
+        return self._sorted[index]
+
+
+class HedgeBudget:
+    """Orçamento de hedges: cada requisição principal rende budget_ratio de crédito"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class RequestHedger:
+    """Executa chamadas idempotentes com hedge baseado em percentil de latência"""
+
+    def __init__(self, config: HedgingConfig, limiter: Bulkhead = None):
+        self.config = config
+        self.limiter = limiter
+        self.trackers: Dict[str, LatencyTracker] = {}
+        self.budget = HedgeBudget(config.budget_ratio, config.budget_burst)
+        self.stats = {
+            "requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0, "limiter_busy": 0
+        }
+
+    def wrap(self, operation: str, func: Callable) -> Callable:
+        """Retorna versão de func com hedging para a operação informada"""
+        return functools.partial(self.execute, operation, func)
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """Atraso antes do hedge, ou None se ainda não há amostras suficientes"""
+        tracker = self.trackers.get(operation)
+        if tracker is None or len(tracker.samples) < self.config.min_samples:
+            return None
+        return max(self.config.min_delay, tracker.percentile(self.config.percentile))
+
+    async def execute(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        tracker = self.trackers.setdefault(operation, LatencyTracker(self.config.window))
+        self.stats["requests"] += 1
+        self.budget.deposit()
+
+        start = time.monotonic()
+        delay = self.hedge_delay(operation) if self.config.enabled else None
+        if delay is None:
+            result = await func(*args, **kwargs)
+            tracker.record(time.monotonic() - start)
+            return result
+
+        # Cancelamento do chamador (ou erro) não pode deixar requisições órfãs
+        # segurando vaga no limitador: o finally cancela o que sobrou
+        primary = asyncio.ensure_future(func(*args, **kwargs))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                tracker.record(time.monotonic() - start)
+                return primary.result()
+
+            # Sem vaga livre no limiter o provedor já está saturado: hedge só somaria carga
+            skip = "limiter_busy" if self._limiter_busy() else None
+            if skip is None and not self.budget.try_spend():
+                skip = "budget_exhausted"
+            if skip is not None:
+                self.stats[skip] += 1
+                metrics_collector.record_hedged_request(operation, skip)
+                result = await primary
+                tracker.record(time.monotonic() - start)
+                return result
+
+            self.stats["hedged"] += 1
+            hedge = asyncio.ensure_future(self._hedge_call(func, *args, **kwargs))
+            winner = await self._first_success(primary, hedge)
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        # Sempre a latência da principal: se a cópia venceu, o tempo decorrido é um
+        # limite inferior (censurado, acima do atraso). A latência da cópia puxaria
+        # o percentil para baixo e anteciparia os próximos hedges
+        tracker.record(time.monotonic() - start)
+        hedge_won = winner is hedge
+        if hedge_won:
+            self.stats["hedge_wins"] += 1
+        metrics_collector.record_hedged_request(operation, "hedge_won" if hedge_won else "primary_won")
+
+        result = winner.result()
+        self._track_extra_cost(result, kwargs)
+        return result
+
+    def _limiter_busy(self) -> bool:
+        limiter = self.limiter
+        if limiter is None:
+            return False
+        return limiter.queued > 0 or limiter.in_flight >= limiter.config.max_concurrent
+
+    async def _hedge_call(self, func: Callable, *args, **kwargs) -> Any:
+        """Cópia do hedge em vaga própria do limiter (sem virar amostra de RTT)"""
+        if self.limiter is None:
+            return await func(*args, **kwargs)
+        async with self.limiter:
+            return await func(*args, **kwargs)
+
+    @staticmethod
+    async def _first_success(*tasks: asyncio.Future) -> asyncio.Future:
+        """Primeira tarefa concluída com sucesso; se todas falharem, a última falha"""
+        pending = set(tasks)
+        last = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if not task.cancelled() and task.exception() is None:
+                    return task
+        return last
+
+    @staticmethod
+    def _track_extra_cost(result: Any, kwargs: Dict[str, Any]):
+        """
+        Contabiliza a requisição perdedora; como foi cancelada, usa o consumo
+        da vencedora como estimativa (limite superior do custo extra)
+        """
+        usage = getattr(result, "usage", None)
+        if usage is None:
+            return
+        cost_tracker.track_hedge_usage(
+            model=kwargs.get("model", "gpt-3.5-turbo"),
+            input_tokens=usage.prompt_tokens,
+            output_tokens=usage.completion_tokens
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.config.enabled,
+            "budget_tokens": round(self.budget.tokens, 2),
+            "delays": {op: self.hedge_delay(op) for op in self.trackers}
+        }
+
+
+def _load_config() -> HedgingConfig:
+    config = HedgingConfig()
+    config.enabled = bool(getattr(settings, "openai_hedging_enabled", False))
+    config.percentile = getattr(settings, "openai_hedging_percentile", None) or config.percentile
+    budget_ratio = getattr(settings, "openai_hedging_budget_ratio", None)
+    if budget_ratio is not None:
+        config.budget_ratio = budget_ratio  # 0 desliga os hedges extras
+    return config
+
+
+# Instância global para chamadas idempotentes (intenção e extração de dados)
+openai_hedger = RequestHedger(_load_config(), limiter=openai_concurrency_limiter)
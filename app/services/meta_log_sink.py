@@ -0,0 +1,257 @@
+"""
+Gravação assíncrona e em lote dos logs de auditoria da Meta API (meta_logs)
+Webhook e WhatsAppService apenas enfileiram os registros; uma tarefa de fundo
+grava em INSERTs multi-linha por tamanho de lote ou intervalo
+"""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+
+from app.config import settings
+from app.models.database import MetaLog
+from app.utils.metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+# Falhas de conexão/disponibilidade: o lote inteiro volta para o buffer.
+# Qualquer outro erro (payload não serializável, dado inválido) é do registro
+TRANSIENT_ERRORS = (OSError, asyncio.TimeoutError, OperationalError, InterfaceError, DisconnectionError)
+
+
+class OverflowPolicy(Enum):
+    """O que fazer quando o buffer está cheio"""
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+
+@dataclass
+class MetaLogSinkConfig:
+    batch_size: int = 200
+    flush_interval: float = 1.0
+    max_buffer: int = 10000
+    overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+
+
+class MetaLogSink:
+    """Buffer limitado de MetaLog com flush em lote em segundo plano"""
+
+    def __init__(self, config: MetaLogSinkConfig = None, session_factory: Callable = None):
+        self.config = config or MetaLogSinkConfig()
+        self.session_factory = session_factory
+        self.buffer: Deque[Dict[str, Any]] = deque()
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "flushes": 0,
+                      "dead_lettered": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    def log(self, direction: str, endpoint: str = None, method: str = None,
+            status_code: int = None, headers: Dict = None, payload: Dict = None,
+            response: Dict = None) -> bool:
+        """
+        Enfileira um registro de auditoria sem acessar o banco
+
+        Returns:
+            False se o registro foi descartado pela política de overflow
+        """
+        if len(self.buffer) >= self.config.max_buffer:
+            self._drop(1)
+            if self.config.overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return False
+            self.buffer.popleft()
+
+        self.buffer.append({
+            "direction": direction,
+            "endpoint": endpoint,
+            "method": method,
+            "status_code": status_code,
+            "headers": headers,
+            "payload": payload,
+            "response": response,
+            # Horário do evento, não do flush
+            "created_at": datetime.now(timezone.utc),
+        })
+        self.stats["enqueued"] += 1
+
+        self._ensure_started()
+        if len(self.buffer) >= self.config.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        """Inicia a tarefa de flush no event loop atual"""
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"📝 MetaLog sink iniciado (lote={self.config.batch_size}, "
+            f"intervalo={self.config.flush_interval}s, buffer={self.config.max_buffer})"
+        )
+
+    async def stop(self):
+        """Para a tarefa de fundo e grava o que restou no buffer"""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"📝 MetaLog sink encerrado: {self.stats}")
+
+    def _ensure_started(self):
+        if self._stopping or (self._task is not None and not self._task.done()):
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sem event loop: o registro fica no buffer até o próximo start/flush
+        self.start()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.config.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Grava o buffer em lotes
+
+        Em falha de conexão os registros voltam para o buffer; se o banco
+        recusa o lote, ele é dividido ao meio até isolar os registros
+        inválidos, que são descartados sem travar os demais
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        written = 0
+        async with self._flush_lock:
+            while self.buffer:
+                batch = [self.buffer.popleft() for _ in range(min(self.config.batch_size, len(self.buffer)))]
+                error = await self._write(batch)
+                if error is None:
+                    written += len(batch)
+                    continue
+                if _is_transient(error):
+                    self._requeue(batch)
+                    break
+                isolated, interrupted = await self._write_isolating(batch, error)
+                written += isolated
+                if interrupted:
+                    break
+
+        if written:
+            metrics_collector.record_meta_log("written", written, buffered=len(self.buffer))
+        return written
+
+    async def _write_isolating(self, batch: List[Dict[str, Any]], error: Exception) -> Tuple[int, bool]:
+        """
+        Bisseção de um lote recusado: O(k log n) escritas para k registros ruins
+
+        Returns:
+            (registros gravados, se parou por falha de conexão)
+        """
+        written = 0
+        pending = [batch]  # Pilha: o topo é o próximo pedaço, na ordem original
+        while pending:
+            part = pending.pop()
+            if error is None:
+                error = await self._write(part)
+            if error is None:
+                written += len(part)
+            elif _is_transient(error):
+                self._requeue([record for rest in [part, *reversed(pending)] for record in rest])
+                return written, True
+            elif len(part) == 1:
+                self._dead_letter(part[0], error)
+            else:
+                half = len(part) // 2
+                pending.extend((part[half:], part[:half]))
+            error = None
+        return written, False
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> Optional[Exception]:
+        """Grava um lote; retorna o erro em caso de falha"""
+        session_factory = self.session_factory
+        if session_factory is None:
+            from app.database import AsyncSessionLocal
+            session_factory = AsyncSessionLocal
+
+        try:
+            async with session_factory() as session:
+                # executemany do SQLAlchemy 2.0 vira INSERT ... VALUES multi-linha
+                await session.execute(insert(MetaLog), batch)
+                await session.commit()
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+            return None
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            metrics_collector.record_meta_log("failed", len(batch))
+            logger.error(f"❌ Erro ao gravar lote de {len(batch)} meta_logs: {e}")
+            return e
+
+    def _dead_letter(self, record: Dict[str, Any], error: Exception):
+        """Descarta um registro que o banco recusa (o payload não é logado)"""
+        self.stats["dead_lettered"] += 1
+        metrics_collector.record_meta_log("dead_lettered", 1, buffered=len(self.buffer))
+        logger.error(
+            f"🗑️ meta_log descartado após recusa do banco: direction={record.get('direction')} "
+            f"endpoint={record.get('endpoint')} status={record.get('status_code')} "
+            f"created_at={record.get('created_at')} erro={type(error).__name__}: {str(error)[:200]}"
+        )
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        """Devolve o lote ao início do buffer, respeitando o limite de memória"""
+        space = self.config.max_buffer - len(self.buffer)
+        keep = batch[-space:] if space > 0 else []
+        if len(keep) < len(batch):
+            self._drop(len(batch) - len(keep))
+        self.buffer.extendleft(reversed(keep))
+
+    def _drop(self, count: int):
+        self.stats["dropped"] += count
+        metrics_collector.record_meta_log("dropped", count, buffered=len(self.buffer))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "buffered": len(self.buffer),
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+def _is_transient(error: Exception) -> bool:
+    return isinstance(error, TRANSIENT_ERRORS) or (
+        isinstance(error, DBAPIError) and error.connection_invalidated
+    )
+
+
+def _load_config() -> MetaLogSinkConfig:
+    config = MetaLogSinkConfig()
+    config.batch_size = getattr(settings, "meta_log_batch_size", None) or config.batch_size
+    config.flush_interval = getattr(settings, "meta_log_flush_interval", None) or config.flush_interval
+    config.max_buffer = getattr(settings, "meta_log_max_buffer", None) or config.max_buffer
+    policy = getattr(settings, "meta_log_overflow_policy", None)
+    if policy:
+        config.overflow_policy = OverflowPolicy(policy)
+    return config
+
+
+# Instância global
+meta_log_sink = MetaLogSink(_load_config())
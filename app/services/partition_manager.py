@@ -0,0 +1,321 @@
+"""
+Manutenção das partições mensais de messages e meta_logs (Postgres)
+Cria partições futuras (trazendo as linhas do mês que caíram na partição
+default) e, passada a retenção, desanexa as antigas, exporta as
+linhas para JSONL comprimido (gzip) e remove a tabela. As leituras continuam na
+tabela pai, então os serviços de dados não mudam
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Linhas por leitura/escrita ao exportar uma partição
+ARCHIVE_CHUNK_SIZE = 1000
+
+
+@dataclass
+class PartitionConfig:
+    enabled: bool = True
+    months_ahead: int = 3
+    # Meses mantidos no banco por tabela (mês corrente incluso)
+    retention_months: Dict[str, int] = field(default_factory=lambda: {"messages": 12, "meta_logs": 3})
+    archive_dir: str = "archives/partitions"
+    interval_hours: float = 24.0
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def parse_partition_month(table: str, name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})(\d{{2}})", name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def month_filter(month: date) -> str:
+    """Mesmos limites (literais) usados em FOR VALUES da partição do mês"""
+    return f"created_at >= '{month.isoformat()}' AND created_at < '{add_months(month, 1).isoformat()}'"
+
+
+def create_partition_statements(table: str, month: date, drain_default: bool) -> List[str]:
+    """
+    SQL para criar a partição do mês. Com linhas do mês na partição default o
+    Postgres recusa o CREATE, então ela é desanexada, as linhas passam para a
+    nova partição e a default volta a ser anexada
+    """
+    name = partition_name(table, month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    create = (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+              f"FOR VALUES FROM ('{start}') TO ('{end}')")
+    if not drain_default:
+        return [create]
+
+    default = default_partition_name(table)
+    return [
+        f"ALTER TABLE {table} DETACH PARTITION {default}",
+        create,
+        f"INSERT INTO {name} SELECT * FROM {default} WHERE {month_filter(month)}",
+        f"DELETE FROM {default} WHERE {month_filter(month)}",
+        f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT",
+    ]
+
+
+def expired_partitions(table: str, names: Iterable[str], today: date, retention_months: int) -> List[str]:
+    """Partições mensais cujo mês inteiro ficou fora da janela de retenção"""
+    cutoff = add_months(month_start(today), -(retention_months - 1))
+    expired = []
+    for name in names:
+        month = parse_partition_month(table, name)
+        if month is not None and month < cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+class ArchiveWriter:
+    """Grava linhas como JSONL gzip em arquivo temporário; close() renomeia e calcula o sha256"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_path = path.with_suffix(path.suffix + ".tmp")
+        self.rows = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+
+    def write(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self._fh.write(json.dumps(row, default=str, ensure_ascii=False))
+            self._fh.write("\n")
+            self.rows += 1
+
+    def close(self) -> Dict[str, Any]:
+        self._fh.close()
+        os.replace(self.tmp_path, self.path)
+
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(block)
+        return {"path": str(self.path), "rows": self.rows, "sha256": digest.hexdigest()}
+
+    def abort(self):
+        self._fh.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def write_archive(path: Path, chunks: Iterable[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    writer = ArchiveWriter(path)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def iter_archive(path: Path) -> Iterator[Dict[str, Any]]:
+    """Lê de volta as linhas de uma partição arquivada"""
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+class PartitionManager:
+    """Job de manutenção das tabelas particionadas por mês"""
+
+    TABLES = ("messages", "meta_logs")
+
+    def __init__(self, config: PartitionConfig = None, engine_factory: Callable = None):
+        self.config = config or PartitionConfig()
+        self.engine_factory = engine_factory
+        self.stats = {"runs": 0, "created": 0, "archived": 0, "archived_rows": 0, "errors": 0, "last_run": None}
+        self._task: Optional[asyncio.Task] = None
+
+    def _engine(self):
+        if self.engine_factory is not None:
+            return self.engine_factory()
+        from app.database import engine
+        return engine
+
+    async def is_partitioned(self, conn, table: str) -> bool:
+        result = await conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                 "WHERE c.relname = :table"),
+            {"table": table}
+        )
+        return result.first() is not None
+
+    async def _attached_partitions(self, conn, table: str) -> List[str]:
+        result = await conn.execute(
+            text("SELECT c.relname FROM pg_inherits i "
+                 "JOIN pg_class c ON c.oid = i.inhrelid "
+                 "JOIN pg_class p ON p.oid = i.inhparent "
+                 "WHERE p.relname = :table"),
+            {"table": table}
+        )
+        return [row[0] for row in result]
+
+    async def _detached_partitions(self, conn, table: str) -> List[str]:
+        """Partições já desanexadas cujo arquivamento não terminou (execução anterior falhou)"""
+        result = await conn.execute(
+            text("SELECT relname FROM pg_class "
+                 "WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern"),
+            {"pattern": f"{table}\\_p%"}
+        )
+        return [row[0] for row in result if parse_partition_month(table, row[0])]
+
+    async def _default_has_rows(self, conn, table: str, month: date) -> bool:
+        result = await conn.execute(text(
+            f"SELECT 1 FROM {default_partition_name(table)} WHERE {month_filter(month)} LIMIT 1"
+        ))
+        return result.first() is not None
+
+    async def ensure_future_partitions(self, conn, table: str, today: date) -> List[str]:
+        existing = set(await self._attached_partitions(conn, table))
+        has_default = default_partition_name(table) in existing
+        created = []
+        start = month_start(today)
+        for offset in range(self.config.months_ahead + 1):
+            month = add_months(start, offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            drain = has_default and await self._default_has_rows(conn, table, month)
+            for statement in create_partition_statements(table, month, drain):
+                await conn.execute(text(statement))
+            if drain:
+                logger.info(f"🗂️ Linhas de {name} movidas da partição default")
+            created.append(name)
+        return created
+
+    async def archive_partition(self, engine, table: str, name: str) -> Dict[str, Any]:
+        """Exporta uma partição desanexada para o arquivo e remove a tabela"""
+        path = Path(self.config.archive_dir) / table / f"{name}.jsonl.gz"
+
+        writer = await asyncio.to_thread(ArchiveWriter, path)
+        try:
+            async with engine.connect() as conn:
+                result = await conn.stream(text(f"SELECT * FROM {name} ORDER BY id"))
+                async for partition in result.mappings().partitions(ARCHIVE_CHUNK_SIZE):
+                    await asyncio.to_thread(writer.write, [dict(row) for row in partition])
+        except Exception:
+            await asyncio.to_thread(writer.abort)
+            raise
+        info = await asyncio.to_thread(writer.close)
+
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"📦 Partição {name} arquivada em {info['path']} ({info['rows']} linhas)")
+        return info
+
+    async def run_maintenance(self, today: date = None) -> Dict[str, Any]:
+        """Cria partições futuras e arquiva as expiradas de cada tabela"""
+        today = today or datetime.now(timezone.utc).date()
+        engine = self._engine()
+        report: Dict[str, Any] = {}
+        if engine.dialect.name != "postgresql":
+            return report
+
+        for table in self.TABLES:
+            table_report = {"created": [], "archived": []}
+            report[table] = table_report
+            try:
+                async with engine.begin() as conn:
+                    if not await self.is_partitioned(conn, table):
+                        logger.warning(f"⚠️ {table} não é particionada; aplique a migração de particionamento")
+                        continue
+                    table_report["created"] = await self.ensure_future_partitions(conn, table, today)
+                    attached = await self._attached_partitions(conn, table)
+                    expired = expired_partitions(
+                        table, attached, today, self.config.retention_months.get(table, 12)
+                    )
+                    for name in expired:
+                        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    pending = await self._detached_partitions(conn, table)
+
+                for name in pending:
+                    info = await self.archive_partition(engine, table, name)
+                    table_report["archived"].append(info)
+                    self.stats["archived_rows"] += info["rows"]
+            except Exception as e:
+                self.stats["errors"] += 1
+                table_report["error"] = str(e)
+                logger.error(f"❌ Erro na manutenção de partições de {table}: {e}")
+
+            self.stats["created"] += len(table_report["created"])
+            self.stats["archived"] += len(table_report["archived"])
+
+        self.stats["runs"] += 1
+        self.stats["last_run"] = datetime.now(timezone.utc).isoformat()
+        return report
+
+    def start(self):
+        """Agenda a manutenção periódica no event loop atual"""
+        if not self.config.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🗂️ Manutenção de partições agendada a cada {self.config.interval_hours}h")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.run_maintenance()
+            await asyncio.sleep(self.config.interval_hours * 3600)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "running": self._task is not None and not self._task.done()}
+
+
+def _load_config() -> PartitionConfig:
+    config = PartitionConfig()
+    enabled = getattr(settings, "partition_maintenance_enabled", None)
+    if enabled is not None:
+        config.enabled = enabled
+    config.months_ahead = getattr(settings, "partition_months_ahead", None) or config.months_ahead
+    config.retention_months = {
+        "messages": getattr(settings, "messages_retention_months", None) or config.retention_months["messages"],
+        "meta_logs": getattr(settings, "meta_logs_retention_months", None) or config.retention_months["meta_logs"],
+    }
+    config.archive_dir = getattr(settings, "partition_archive_dir", None) or config.archive_dir
+    return config
+
+
+# Instância global
+partition_manager = PartitionManager(_load_config())
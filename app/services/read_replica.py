@@ -0,0 +1,165 @@
+"""
+Roteamento de leituras para a réplica do banco
+Consultas de analytics, dashboard e listagens usam a réplica (pool próprio)
+enquanto o atraso de replicação estiver dentro do limite configurado; se a
+réplica estiver atrasada, indisponível ou não configurada, a leitura volta
+para o primário
+"""
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Atraso em segundos; 0 quando a réplica já aplicou todo o WAL recebido
+# (sem escrita nova o replay_timestamp envelhece sem haver atraso real)
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+@dataclass
+class ReplicaConfig:
+    max_staleness: float = 5.0     # atraso máximo aceito (segundos)
+    check_interval: float = 10.0   # reavaliação do atraso/saúde (segundos)
+
+
+def _load_config() -> ReplicaConfig:
+    default = ReplicaConfig()
+    return ReplicaConfig(
+        max_staleness=getattr(settings, "read_replica_max_staleness", None) or default.max_staleness,
+        check_interval=getattr(settings, "read_replica_check_interval", None) or default.check_interval
+    )
+
+
+def _lag_from(connection_or_session, dialect_name: str):
+    """Executa a sonda de atraso (retorna o resultado, síncrono ou awaitable)"""
+    if dialect_name == "postgresql":
+        return connection_or_session.execute(POSTGRES_LAG_SQL)
+    # Outros dialetos (ex.: duas bases SQLite em testes locais) não expõem atraso
+    return None
+
+
+class ReadReplicaRouter:
+    """Escolhe entre réplica e primário para sessões somente leitura"""
+
+    def __init__(self, primary_factory: Callable, replica_factory: Callable = None,
+                 config: ReplicaConfig = None, sync_primary=None, sync_replica=None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.primary_factory = primary_factory
+        self.replica_factory = replica_factory
+        self.sync_primary = sync_primary
+        self.sync_replica = sync_replica
+        self.config = config or _load_config()
+        self.clock = clock
+        self.healthy = replica_factory is not None
+        self.last_lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._sync_healthy = sync_replica is not None
+        self._sync_checked_at: Optional[float] = None
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "fallbacks": 0, "replica_errors": 0}
+
+    @property
+    def has_replica(self) -> bool:
+        return self.replica_factory is not None
+
+    def _due(self, checked_at: Optional[float]) -> bool:
+        return checked_at is None or self.clock() - checked_at >= self.config.check_interval
+
+    def _evaluate(self, lag: float) -> bool:
+        self.last_lag = lag
+        if lag > self.config.max_staleness:
+            logger.warning(f"⚠️ Réplica atrasada {lag:.1f}s (máx {self.config.max_staleness}s); lendo do primário")
+            return False
+        return True
+
+    def _mark_failed(self, error: Exception):
+        self.healthy = False
+        self.last_error = str(error)
+        self.stats["replica_errors"] += 1
+        logger.warning(f"⚠️ Réplica indisponível, lendo do primário: {error}")
+
+    async def measure_lag(self) -> float:
+        """Atraso atual da réplica em segundos"""
+        async with self.replica_factory() as session:
+            pending = _lag_from(session, session.bind.dialect.name)
+            if pending is None:
+                await session.execute(text("SELECT 1"))
+                return 0.0
+            return float((await pending).scalar() or 0)
+
+    async def use_replica(self) -> bool:
+        """Indica se a próxima leitura deve ir para a réplica (reavaliado a cada check_interval)"""
+        if not self.has_replica:
+            return False
+        if self._due(self._checked_at):
+            self._checked_at = self.clock()
+            try:
+                self.healthy = self._evaluate(await self.measure_lag())
+                self.last_error = None
+            except (OperationalError, DBAPIError, OSError) as e:
+                self._mark_failed(e)
+        if not self.healthy:
+            self.stats["fallbacks"] += 1
+        return self.healthy
+
+    @asynccontextmanager
+    async def session(self, use_replica: bool = None):
+        """
+        Sessão somente leitura (réplica ou primário)
+
+        Erros de conexão na réplica a marcam como indisponível até a próxima
+        verificação, de modo que as leituras seguintes vão para o primário
+        """
+        if use_replica is None:
+            use_replica = await self.use_replica()
+        if not use_replica:
+            self.stats["primary_reads"] += 1
+            async with self.primary_factory() as session:
+                yield session
+            return
+
+        self.stats["replica_reads"] += 1
+        async with self.replica_factory() as session:
+            try:
+                yield session
+            except (OperationalError, OSError) as e:
+                self._mark_failed(e)
+                raise
+
+    def sync_engine(self):
+        """Engine síncrono para leituras (dashboard), com a mesma política de atraso"""
+        if self.sync_replica is None:
+            return self.sync_primary
+        if self._due(self._sync_checked_at):
+            self._sync_checked_at = self.clock()
+            try:
+                with self.sync_replica.connect() as conn:
+                    result = _lag_from(conn, self.sync_replica.dialect.name)
+                    lag = float(result.scalar() or 0) if result is not None else 0.0
+                self._sync_healthy = self._evaluate(lag)
+            except (OperationalError, DBAPIError, OSError) as e:
+                self._sync_healthy = False
+                self._mark_failed(e)
+        return self.sync_replica if self._sync_healthy else self.sync_primary
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.has_replica,
+            "healthy": self.healthy if self.has_replica else None,
+            "last_lag_seconds": self.last_lag,
+            "max_staleness": self.config.max_staleness,
+            "last_error": self.last_error,
+            **self.stats
+        }
@@ -8,8 +8,9 @@ Gerenciamento distribuído com Redis e fallback em memória
 import json
 import asyncio
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, Callable
 from dataclasses import dataclass, field, asdict
 from enum import Enum
 import logging
@@ -22,6 +23,33 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+_STATE_KEY_PREFIX = "conversation_state:"
+# Índice secundário: user_id -> instante em que a conversa ativa expira
+_ACTIVE_INDEX_KEY = "conversation_index:active"
+# Chaves por MGET/SCAN em cada ida ao Redis
+_BATCH_SIZE = 500
+# Tentativas de gravar um turno antes de cair para "última gravação vence"
+_COMMIT_ATTEMPTS = 3
+
+# Grava o estado só se a versão no Redis ainda for a lida no início do turno,
+# atualizando o índice de ativas na mesma ida (ARGV[5] vazio = inativa)
+_SAVE_IF_VERSION_LUA = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local version = cjson.decode(current)['version'] or 0
+    if version ~= tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SETEX', KEYS[1], ARGV[2], ARGV[3])
+if ARGV[5] ~= '' then
+    redis.call('ZADD', KEYS[2], ARGV[5], ARGV[4])
+else
+    redis.call('ZREM', KEYS[2], ARGV[4])
+end
+return 1
+"""
+
 
 class ConversationStatus(Enum):
     """Estados possíveis da conversa"""
@@ -114,6 +142,7 @@ class ConversationState:
     strategy_history: List[str] = field(default_factory=list)
     total_messages: int = 0
     session_id: Optional[str] = None
+    version: int = 0  # Incrementada a cada gravação
     
     def add_message(self, message: ConversationMessage):
         """Adiciona mensagem ao histórico"""
@@ -160,7 +189,8 @@ class ConversationState:
             "max_messages": self.max_messages,
             "strategy_history": self.strategy_history,
             "total_messages": self.total_messages,
-            "session_id": self.session_id
+            "session_id": self.session_id,
+            "version": self.version
         }
         return json.dumps(data, ensure_ascii=False)
     
@@ -187,10 +217,82 @@ class ConversationState:
             max_messages=data.get("max_messages", 100),
             strategy_history=data.get("strategy_history", []),
             total_messages=data.get("total_messages", 0),
-            session_id=data.get("session_id")
+            session_id=data.get("session_id"),
+            version=data.get("version", 0)
         )
 
 
+class ConversationSession:
+    """
+    Estado de um turno da conversa: lido uma vez, alterado em memória e
+    gravado uma vez no fim. As alterações ficam registradas para serem
+    reaplicadas se outro worker gravar o mesmo estado durante o turno
+    """
+
+    def __init__(self, user_id: str, state: ConversationState):
+        self.user_id = user_id
+        self.state = state
+        self.version = state.version  # A gravação exige que o Redis ainda esteja nesta versão
+        self._changes: List[Callable[[ConversationState], None]] = []
+
+    @property
+    def changed(self) -> bool:
+        return bool(self._changes)
+
+    def apply(self, change: Callable[[ConversationState], None]):
+        """Aplica a alteração ao estado do turno e a registra"""
+        change(self.state)
+        self._changes.append(change)
+
+    def rebase(self, state: ConversationState):
+        """Reaplica as alterações do turno sobre o estado gravado por outro worker"""
+        self.state = state
+        self.version = state.version
+        for change in self._changes:
+            change(state)
+
+    def set_phone(self, phone: str):
+        """Primeira mensagem: registra o telefone e ativa a conversa"""
+        def change(state: ConversationState):
+            if not state.phone and phone:
+                state.phone = phone
+                state.status = ConversationStatus.ACTIVE
+        self.apply(change)
+
+    def set_status(self, status: ConversationStatus):
+        def change(state: ConversationState):
+            state.status = status
+        self.apply(change)
+
+    def add_message(self, message: ConversationMessage):
+        def change(state: ConversationState):
+            state.add_message(message)
+            if state.status == ConversationStatus.INACTIVE:
+                state.status = ConversationStatus.ACTIVE
+        self.apply(change)
+
+    def record_strategy(self, strategy_name: str):
+        def change(state: ConversationState):
+            state.strategy_history.append(strategy_name)
+        self.apply(change)
+
+    def start_booking_flow(self) -> BookingContext:
+        def change(state: ConversationState):
+            state.status = ConversationStatus.BOOKING_FLOW
+            state.booking_context = BookingContext()
+        self.apply(change)
+        return self.state.booking_context
+
+    def update_booking_context(self, **kwargs):
+        def change(state: ConversationState):
+            if not state.booking_context:
+                state.booking_context = BookingContext()
+            for key, value in kwargs.items():
+                if hasattr(state.booking_context, key):
+                    setattr(state.booking_context, key, value)
+        self.apply(change)
+
+
 class ConversationStateManager:
     """
     Gerenciador avançado de estado de conversação
@@ -216,12 +318,18 @@ class ConversationStateManager:
             "loads": 0,
             "saves": 0,
             "errors": 0,
-            "cleanups": 0
+            "cleanups": 0,
+            "redis_hits": 0,
+            "redis_misses": 0,
+            "memory_hits": 0,
+            "memory_misses": 0,
+            "conflicts": 0
         }
         
         # Não criar task aqui - será criado quando necessário
         self._init_task = None
         self._initialized = False
+        self._save_script = None
     
     async def _init_redis(self):
         """Inicializa conexão Redis"""
@@ -252,6 +360,7 @@ class ConversationStateManager:
             # Inicia limpeza automática apenas se estiver em um event loop
             try:
                 asyncio.create_task(self._cleanup_expired_states())
+                asyncio.create_task(self.rebuild_active_index())
             except RuntimeError:
                 logger.warning("Event loop não disponível para cleanup automático")
             
@@ -267,7 +376,16 @@ class ConversationStateManager:
     
     def _get_state_key(self, user_id: str) -> str:
         """Gera chave para estado no Redis"""
-        return f"conversation_state:{user_id}"
+        return f"{_STATE_KEY_PREFIX}{user_id}"
+    
+    @staticmethod
+    def _is_active(state: ConversationState) -> bool:
+        return not state.is_expired() and state.status in (ConversationStatus.ACTIVE, ConversationStatus.BOOKING_FLOW)
+    
+    @staticmethod
+    def _expires_at(state: ConversationState) -> float:
+        """Score no índice de conversas ativas"""
+        return state.last_activity.timestamp() + state.timeout_minutes * 60
     
     async def get_state(self, user_id: str) -> ConversationState:
         """
@@ -333,14 +451,21 @@ class ConversationStateManager:
         try:
             ttl = ttl or self.default_ttl
             state.last_activity = datetime.now()
+            state.version += 1
             
-            # Salva no Redis
+            # Salva no Redis (estado + índice de ativas na mesma ida)
             if self.redis_available and self.redis_client:
                 try:
                     key = self._get_state_key(user_id)
                     json_data = state.to_json()
                     
-                    await self.redis_client.setex(key, ttl, json_data)
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.setex(key, ttl, json_data)
+                    if self._is_active(state):
+                        pipe.zadd(_ACTIVE_INDEX_KEY, {user_id: self._expires_at(state)})
+                    else:
+                        pipe.zrem(_ACTIVE_INDEX_KEY, user_id)
+                    await pipe.execute()
                     logger.debug(f"Estado salvo no Redis: {user_id}")
                     
                 except Exception as e:
@@ -362,8 +487,10 @@ class ConversationStateManager:
         try:
             # Remove do Redis
             if self.redis_available and self.redis_client:
-                key = self._get_state_key(user_id)
-                await self.redis_client.delete(key)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.delete(self._get_state_key(user_id))
+                pipe.zrem(_ACTIVE_INDEX_KEY, user_id)
+                await pipe.execute()
             
             # Remove da memória
             self.memory_cache.pop(user_id, None)
@@ -374,13 +501,78 @@ class ConversationStateManager:
             logger.error(f"Erro ao remover estado: {e}")
             self.stats["errors"] += 1
     
+    @asynccontextmanager
+    async def session(self, user_id: str):
+        """
+        Turno da conversa: um get_state no início e uma gravação no fim, só se
+        houve alteração. Grava também quando o turno falha no meio, para não
+        perder a mensagem do usuário já registrada
+        """
+        session = ConversationSession(user_id, await self.get_state(user_id))
+        try:
+            yield session
+        finally:
+            if session.changed:
+                await self.commit(session)
+    
+    async def commit(self, session: ConversationSession, ttl: Optional[int] = None) -> bool:
+        """
+        Grava o estado do turno se ninguém o gravou desde a leitura (versão);
+        em conflito recarrega, reaplica as alterações do turno e tenta de novo
+        """
+        await self._ensure_initialized()
+        ttl = ttl or self.default_ttl
+        
+        try:
+            for _ in range(_COMMIT_ATTEMPTS):
+                if await self._save_if_version(session, ttl):
+                    return True
+                self.stats["conflicts"] += 1
+                session.rebase(await self._reload_state(session.user_id))
+            logger.warning(f"Estado de {session.user_id} disputado por outros workers; gravando por cima")
+        except Exception as e:
+            logger.error(f"Erro ao gravar turno no Redis: {e}")
+            self.stats["errors"] += 1
+        
+        await self.save_state(session.user_id, session.state, ttl)
+        return False
+    
+    async def _save_if_version(self, session: ConversationSession, ttl: int) -> bool:
+        state = session.state
+        state.last_activity = datetime.now()
+        state.version = session.version + 1
+        
+        if self.redis_available and self.redis_client:
+            if self._save_script is None:
+                self._save_script = self.redis_client.register_script(_SAVE_IF_VERSION_LUA)
+            score = self._expires_at(state) if self._is_active(state) else ""
+            saved = await self._save_script(
+                keys=[self._get_state_key(session.user_id), _ACTIVE_INDEX_KEY],
+                args=[session.version, ttl, state.to_json(), session.user_id, score]
+            )
+            if not saved:
+                return False
+        
+        self.memory_cache[session.user_id] = state
+        self.stats["saves"] += 1
+        return True
+    
+    async def _reload_state(self, user_id: str) -> ConversationState:
+        """Estado gravado por outro worker (direto do Redis, sem o cache local)"""
+        data = await self.redis_client.get(self._get_state_key(user_id))
+        if not data:
+            return ConversationState(user_id=user_id, phone="")
+        state = ConversationState.from_json(data)
+        if state.is_expired():
+            # Recomeça a conversa, mas sobre a versão que está no Redis
+            state = ConversationState(user_id=user_id, phone="", version=state.version)
+        return state
+    
     async def update_status(self, user_id: str, status: ConversationStatus):
         """Atualiza apenas o status da conversa"""
         try:
-            state = await self.get_state(user_id)
-            state.status = status
-            state.last_activity = datetime.now()
-            await self.save_state(user_id, state)
+            async with self.session(user_id) as session:
+                session.set_status(status)
             
         except Exception as e:
             logger.error(f"Erro ao atualizar status: {e}")
@@ -389,19 +581,8 @@ class ConversationStateManager:
     async def add_message(self, user_id: str, message: ConversationMessage):
         """Adiciona mensagem ao histórico"""
         try:
-            state = await self.get_state(user_id)
-            
-            # Se é a primeira mensagem, configura phone
-            if not state.phone and hasattr(message, 'phone'):
-                state.phone = getattr(message, 'phone', '')
-            
-            state.add_message(message)
-            
-            # Atualiza status baseado no conteúdo
-            if state.status == ConversationStatus.INACTIVE:
-                state.status = ConversationStatus.ACTIVE
-            
-            await self.save_state(user_id, state)
+            async with self.session(user_id) as session:
+                session.add_message(message)
             
         except Exception as e:
             logger.error(f"Erro ao adicionar mensagem: {e}")
@@ -420,12 +601,9 @@ class ConversationStateManager:
     async def start_booking_flow(self, user_id: str) -> BookingContext:
         """Inicia fluxo de agendamento"""
         try:
-            state = await self.get_state(user_id)
-            state.status = ConversationStatus.BOOKING_FLOW
-            state.booking_context = BookingContext()
-            
-            await self.save_state(user_id, state)
-            return state.booking_context
+            async with self.session(user_id) as session:
+                session.start_booking_flow()
+            return session.state.booking_context
             
         except Exception as e:
             logger.error(f"Erro ao iniciar booking: {e}")
@@ -434,21 +612,51 @@ class ConversationStateManager:
     async def update_booking_context(self, user_id: str, **kwargs):
         """Atualiza contexto de agendamento"""
         try:
-            state = await self.get_state(user_id)
-            
-            if not state.booking_context:
-                state.booking_context = BookingContext()
-            
-            # Atualiza campos
-            for key, value in kwargs.items():
-                if hasattr(state.booking_context, key):
-                    setattr(state.booking_context, key, value)
-            
-            await self.save_state(user_id, state)
+            async with self.session(user_id) as session:
+                session.update_booking_context(**kwargs)
             
         except Exception as e:
             logger.error(f"Erro ao atualizar booking context: {e}")
     
+    async def get_states(self, user_ids: List[str]) -> Dict[str, ConversationState]:
+        """
+        Estados de vários usuários com um MGET por lote (mesma prioridade de
+        get_state: Redis > cache em memória > novo estado)
+        """
+        await self._ensure_initialized()
+        states: Dict[str, ConversationState] = {}
+        
+        if self.redis_available and self.redis_client:
+            try:
+                for i in range(0, len(user_ids), _BATCH_SIZE):
+                    batch = user_ids[i:i + _BATCH_SIZE]
+                    values = await self.redis_client.mget([self._get_state_key(user_id) for user_id in batch])
+                    for user_id, data in zip(batch, values):
+                        if data:
+                            state = ConversationState.from_json(data)
+                            if not state.is_expired():
+                                states[user_id] = state
+                                self.memory_cache[user_id] = state
+                                self.stats["redis_hits"] += 1
+                                continue
+                        self.stats["redis_misses"] += 1
+            except Exception as e:
+                logger.error(f"Erro ao ler estados em lote no Redis: {e}")
+                self.stats["errors"] += 1
+        
+        for user_id in user_ids:
+            if user_id in states:
+                continue
+            state = self.memory_cache.get(user_id)
+            if state is not None and not state.is_expired():
+                self.stats["memory_hits"] += 1
+                states[user_id] = state
+            else:
+                self.stats["memory_misses"] += 1
+                states[user_id] = ConversationState(user_id=user_id, phone="")
+        
+        return states
+    
     async def get_active_conversations(self) -> List[str]:
         """Lista conversas ativas"""
         active = []
@@ -456,21 +664,20 @@ class ConversationStateManager:
         try:
             # Verifica cache em memória
             for user_id, state in self.memory_cache.items():
-                if not state.is_expired() and state.status in [ConversationStatus.ACTIVE, ConversationStatus.BOOKING_FLOW]:
+                if self._is_active(state):
                     active.append(user_id)
             
-            # Se Redis disponível, verifica lá também
+            # Se Redis disponível, consulta o índice de ativas (sem varrer as chaves)
             if self.redis_available and self.redis_client:
                 try:
-                    keys = await self.redis_client.keys("conversation_state:*")
-                    for key in keys:
-                        user_id = key.split(":")[-1]
-                        if user_id not in active:  # Evita duplicatas
-                            data = await self.redis_client.get(key)
-                            if data:
-                                state = ConversationState.from_json(data)
-                                if not state.is_expired() and state.status in [ConversationStatus.ACTIVE, ConversationStatus.BOOKING_FLOW]:
-                                    active.append(user_id)
+                    now = time.time()
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.zremrangebyscore(_ACTIVE_INDEX_KEY, "-inf", now)
+                    pipe.zrangebyscore(_ACTIVE_INDEX_KEY, now, "+inf")
+                    _, indexed = await pipe.execute()
+                    
+                    seen = set(active)
+                    active.extend(user_id for user_id in indexed if user_id not in seen)
                 except Exception as e:
                     logger.error(f"Erro ao listar conversas ativas no Redis: {e}")
             
@@ -480,8 +687,57 @@ class ConversationStateManager:
             logger.error(f"Erro ao obter conversas ativas: {e}")
             return []
     
+    async def rebuild_active_index(self) -> int:
+        """
+        Reconstrói o índice de ativas a partir das chaves de estado (SCAN +
+        MGET por lote, sem bloquear o Redis) e aplica TTL em chaves antigas
+        gravadas sem expiração. Roda uma vez na conexão
+        """
+        if not (self.redis_available and self.redis_client):
+            return 0
+        
+        indexed = 0
+        try:
+            batch = []
+            async for key in self.redis_client.scan_iter(match=f"{_STATE_KEY_PREFIX}*", count=_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= _BATCH_SIZE:
+                    indexed += await self._index_batch(batch)
+                    batch = []
+            if batch:
+                indexed += await self._index_batch(batch)
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir índice de conversas ativas: {e}")
+            self.stats["errors"] += 1
+        
+        if indexed:
+            logger.info(f"Índice de conversas ativas reconstruído: {indexed} conversas")
+        return indexed
+    
+    async def _index_batch(self, keys: List[str]) -> int:
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.mget(keys)
+        for key in keys:
+            pipe.ttl(key)
+        values, *ttls = await pipe.execute()
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        active = {}
+        for key, data, ttl in zip(keys, values, ttls):
+            if not data:
+                continue
+            if ttl == -1:  # Gravado sem expiração
+                pipe.expire(key, self.default_ttl)
+            state = ConversationState.from_json(data)
+            if self._is_active(state):
+                active[key[len(_STATE_KEY_PREFIX):]] = self._expires_at(state)
+        if active:
+            pipe.zadd(_ACTIVE_INDEX_KEY, active)
+        await pipe.execute()
+        return len(active)
+    
     async def _cleanup_expired_states(self):
-        """Limpeza automática de estados expirados"""
+        """Limpeza automática: cache em memória e índice (as chaves expiram pelo TTL do Redis)"""
         while True:
             try:
                 await asyncio.sleep(300)  # Executa a cada 5 minutos
@@ -498,19 +754,10 @@ class ConversationStateManager:
                     del self.memory_cache[key]
                     cleaned += 1
                 
-                # Redis TTL automático já remove, mas vamos verificar
+                # Entradas vencidas do índice de ativas
                 if self.redis_available and self.redis_client:
                     try:
-                        keys = await self.redis_client.keys("conversation_state:*")
-                        for key in keys:
-                            ttl = await self.redis_client.ttl(key)
-                            if ttl == -1:  # Sem TTL
-                                data = await self.redis_client.get(key)
-                                if data:
-                                    state = ConversationState.from_json(data)
-                                    if state.is_expired():
-                                        await self.redis_client.delete(key)
-                                        cleaned += 1
+                        cleaned += await self.redis_client.zremrangebyscore(_ACTIVE_INDEX_KEY, "-inf", time.time())
                     except Exception as e:
                         logger.error(f"Erro na limpeza Redis: {e}")
                 
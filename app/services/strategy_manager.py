@@ -21,7 +21,7 @@ from .lead_scoring import LeadScoringService
 from .cache_service import cache_service
 from .metrics_service import metrics_service
 from .state_manager import (
-    state_manager, ConversationMessage, MessageRole, ConversationStatus
+    get_state_manager, ConversationMessage, MessageRole, ConversationSession, ConversationStateManager
 )
 
 logger = logging.getLogger(__name__)
@@ -38,7 +38,7 @@ class StrategyManager:
     - Extensibilidade para novas estratégias
     """
     
-    def __init__(self):
+    def __init__(self, state_manager: Optional[ConversationStateManager] = None):
         # Inicializar estratégias disponíveis
         self.strategies: Dict[str, BaseStrategy] = {
             'simple': SimpleLLMStrategy(),
@@ -59,6 +59,9 @@ class StrategyManager:
         # Lead scoring service
         self.lead_scoring = LeadScoringService()
         
+        # Estado das conversas (criado no primeiro uso)
+        self._state_manager = state_manager
+        
         # Métricas e estatísticas
         self.metrics = {
             "total_requests": 0,
@@ -79,6 +82,12 @@ class StrategyManager:
         
         logger.info(f"StrategyManager inicializado com {len(self.strategies)} estratégias")
     
+    @property
+    def state_manager(self) -> ConversationStateManager:
+        if self._state_manager is None:
+            self._state_manager = get_state_manager()
+        return self._state_manager
+    
     async def process(self, message: str, user_id: str, phone: str) -> StrategyResponse:
         """
         Processa mensagem usando a melhor estratégia disponível
@@ -96,131 +105,9 @@ class StrategyManager:
             )
             
             # === GESTÃO DE ESTADO ===
-            # Obtém estado da conversa
-            conversation_state = await state_manager.get_state(user_id)
-            
-            # Se primeira mensagem, configura telefone
-            if not conversation_state.phone and phone:
-                conversation_state.phone = phone
-                conversation_state.status = ConversationStatus.ACTIVE
-            
-            # Adiciona mensagem do usuário ao histórico
-            await state_manager.add_message(
-                user_id,
-                ConversationMessage(
-                    role=MessageRole.USER,
-                    content=message,
-                    timestamp=datetime.now(),
-                    metadata={"phone": phone}
-                )
-            )
-            
-            # Constrói contexto da mensagem com histórico
-            with self.metrics_service.track_component_performance("context_building"):
-                context = await self._build_context_with_state(message, user_id, phone, conversation_state)
-            
-            # Seleciona estratégia apropriada
-            with self.metrics_service.track_component_performance("strategy_selection"):
-                selected = self.selector.select_strategy(context, list(self.strategies.values()))
-            
-            if not selected:
-                # Fallback se nenhuma estratégia disponível
-                self.metrics["failed_requests"] += 1
-                self.metrics_service.track_message(
-                    direction="outbound",
-                    message_type="text", 
-                    status="error"
-                )
-                self.metrics_service.track_error(
-                    error_type="no_strategy_available",
-                    component="strategy_manager"
-                )
-                
-                return StrategyResponse(
-                    success=False,
-                    response="Desculpe, ocorreu um erro interno. Tente novamente em alguns instantes.",
-                    strategy_used="fallback",
-                    processing_time=time.time() - start_time
-                )
-            
-            strategy = selected
-            strategy_name = strategy.name
-            
-            # Track seleção de estratégia
-            self.metrics_service.track_strategy_selection(
-                strategy=strategy_name,
-                reason="context_based_selection",
-                success=True
-            )
-            
-            # Executa estratégia selecionada com tracking de tempo
-            with self.metrics_service.track_response_time(
-                strategy=strategy_name,
-                complexity="normal",  # TODO: detectar complexidade
-                cache_hit=False  # TODO: detectar cache hit
-            ):
-                result = await strategy.execute(context)
-            
-            # Registra métricas de sucesso
-            self.metrics["successful_requests"] += 1
-            response_time = time.time() - start_time
-            self.metrics["response_times"].append(response_time)
-            
-            # Track métricas detalhadas
-            self.metrics_service.track_message(
-                direction="outbound",
-                message_type="text",
-                status="success" if result.success else "error",
-                strategy=strategy_name,
-                user_type=context.user_context.get("customer_value", "standard")
-            )
-            
-            # Atualiza uso de estratégias
-            if strategy_name not in self.metrics["strategy_usage"]:
-                self.metrics["strategy_usage"][strategy_name] = 0
-            self.metrics["strategy_usage"][strategy_name] += 1
-            
-            # === SALVAR RESPOSTA NO ESTADO ===
-            # Adiciona resposta do assistant ao histórico
-            if result.success and result.response:
-                await state_manager.add_message(
-                    user_id,
-                    ConversationMessage(
-                        role=MessageRole.ASSISTANT,
-                        content=result.response,
-                        timestamp=datetime.now(),
-                        metadata={
-                            "strategy_used": strategy_name,
-                            "processing_time": response_time,
-                            "confidence": result.confidence if hasattr(result, 'confidence') else 0.8
-                        }
-                    )
-                )
-                
-                # Atualiza estratégias usadas no estado
-                conversation_state = await state_manager.get_state(user_id)
-                conversation_state.strategy_history.append(strategy_name)
-                
-                # Se é uma resposta de agendamento, atualiza contexto de booking
-                message_lower = message.lower()
-                response_lower = result.response.lower()
-                if any(word in message_lower for word in ["agendar", "marcar", "horário"]) or \
-                   any(word in response_lower for word in ["agendar", "agendamento", "horário"]):
-                    if not conversation_state.booking_context:
-                        await state_manager.start_booking_flow(user_id)
-                    
-                    # Análise da resposta para determinar próximo step
-                    if "confirmar" in response_lower:
-                        await state_manager.update_booking_context(user_id, step="confirmation")
-                    elif "serviço" in response_lower:
-                        await state_manager.update_booking_context(user_id, step="service_selection")
-                    elif "horário" in response_lower or "data" in response_lower:
-                        await state_manager.update_booking_context(user_id, step="datetime")
-                
-                # Salva estado atualizado
-                await state_manager.save_state(user_id, conversation_state)
-            
-            return result
+            # Estado lido uma vez no início do turno e gravado uma vez no fim
+            async with self.state_manager.session(user_id) as session:
+                return await self._process_turn(message, user_id, phone, session, start_time)
             
         except Exception as e:
             # Registra erro
@@ -246,6 +133,126 @@ class StrategyManager:
                 metadata={"error": str(e)}
             )
     
+    async def _process_turn(self, message: str, user_id: str, phone: str,
+                            session: ConversationSession, start_time: float) -> StrategyResponse:
+        """Um turno da conversa sobre o estado da sessão (sem idas ao Redis)"""
+        # Se primeira mensagem, configura telefone
+        session.set_phone(phone)
+        
+        # Adiciona mensagem do usuário ao histórico
+        session.add_message(
+            ConversationMessage(
+                role=MessageRole.USER,
+                content=message,
+                timestamp=datetime.now(),
+                metadata={"phone": phone}
+            )
+        )
+        
+        # Constrói contexto da mensagem com histórico
+        with self.metrics_service.track_component_performance("context_building"):
+            context = await self._build_context_with_state(message, user_id, phone, session.state)
+        
+        # Seleciona estratégia apropriada
+        with self.metrics_service.track_component_performance("strategy_selection"):
+            selected = self.selector.select_strategy(context, list(self.strategies.values()))
+        
+        if not selected:
+            # Fallback se nenhuma estratégia disponível
+            self.metrics["failed_requests"] += 1
+            self.metrics_service.track_message(
+                direction="outbound",
+                message_type="text", 
+                status="error"
+            )
+            self.metrics_service.track_error(
+                error_type="no_strategy_available",
+                component="strategy_manager"
+            )
+            
+            return StrategyResponse(
+                success=False,
+                response="Desculpe, ocorreu um erro interno. Tente novamente em alguns instantes.",
+                strategy_used="fallback",
+                processing_time=time.time() - start_time
+            )
+        
+        strategy = selected
+        strategy_name = strategy.name
+        
+        # Track seleção de estratégia
+        self.metrics_service.track_strategy_selection(
+            strategy=strategy_name,
+            reason="context_based_selection",
+            success=True
+        )
+        
+        # Executa estratégia selecionada com tracking de tempo
+        with self.metrics_service.track_response_time(
+            strategy=strategy_name,
+            complexity="normal",  # TODO: detectar complexidade
+            cache_hit=False  # TODO: detectar cache hit
+        ):
+            result = await strategy.execute(context)
+        
+        # Registra métricas de sucesso
+        self.metrics["successful_requests"] += 1
+        response_time = time.time() - start_time
+        self.metrics["response_times"].append(response_time)
+        
+        # Track métricas detalhadas
+        self.metrics_service.track_message(
+            direction="outbound",
+            message_type="text",
+            status="success" if result.success else "error",
+            strategy=strategy_name,
+            user_type=context.customer_value
+        )
+        
+        # Atualiza uso de estratégias
+        if strategy_name not in self.metrics["strategy_usage"]:
+            self.metrics["strategy_usage"][strategy_name] = 0
+        self.metrics["strategy_usage"][strategy_name] += 1
+        
+        # === SALVAR RESPOSTA NO ESTADO ===
+        # Adiciona resposta do assistant ao histórico
+        if result.success and result.response:
+            session.add_message(
+                ConversationMessage(
+                    role=MessageRole.ASSISTANT,
+                    content=result.response,
+                    timestamp=datetime.now(),
+                    metadata={
+                        "strategy_used": strategy_name,
+                        "processing_time": response_time,
+                        "confidence": result.confidence if hasattr(result, 'confidence') else 0.8
+                    }
+                )
+            )
+            
+            # Atualiza estratégias usadas no estado
+            session.record_strategy(strategy_name)
+            
+            # Se é uma resposta de agendamento, atualiza contexto de booking
+            message_lower = message.lower()
+            response_lower = result.response.lower()
+            if any(word in message_lower for word in ["agendar", "marcar", "horário"]) or \
+               any(word in response_lower for word in ["agendar", "agendamento", "horário"]):
+                if not session.state.booking_context:
+                    session.start_booking_flow()
+                
+                # Análise da resposta para determinar próximo step
+                if "confirmar" in response_lower:
+                    session.update_booking_context(step="confirmation")
+                elif "serviço" in response_lower:
+                    session.update_booking_context(step="service_selection")
+                elif "horário" in response_lower or "data" in response_lower:
+                    session.update_booking_context(step="datetime")
+            
+            # O estado é gravado uma vez, ao sair da sessão em process()
+        
+        return result
+    
     async def _build_context(self, message: str, user_id: str, phone: str) -> MessageContext:
         """
         Constrói contexto completo da mensagem
@@ -0,0 +1,68 @@
+"""
+Unidade de trabalho por mensagem recebida
+Agrupa as escritas de uma etapa do webhook (usuário, conversa, mensagem) em
+uma única transação; os serviços de dados fazem flush em vez de commit
+enquanto a unidade estiver aberta na sessão
+"""
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Chaves em AsyncSession.info
+_ACTIVE_KEY = "unit_of_work"
+_CALLBACKS_KEY = "unit_of_work_after_commit"
+
+
+def in_unit_of_work(db: AsyncSession) -> bool:
+    return bool(db.info.get(_ACTIVE_KEY))
+
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession):
+    """
+    Abre uma unidade de trabalho na sessão: um commit ao sair, rollback em erro
+
+    Unidades aninhadas se juntam à externa. Não mantenha a unidade aberta durante
+    chamadas externas lentas (LLM, WhatsApp): os locks de linha duram até o commit.
+    """
+    if in_unit_of_work(db):
+        yield db
+        return
+
+    db.info[_ACTIVE_KEY] = True
+    db.info[_CALLBACKS_KEY] = []
+    try:
+        yield db
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    else:
+        for callback in db.info[_CALLBACKS_KEY]:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Erro em callback pós-commit da unidade de trabalho: {e}")
+    finally:
+        db.info.pop(_ACTIVE_KEY, None)
+        db.info.pop(_CALLBACKS_KEY, None)
+
+
+async def commit_or_flush(db: AsyncSession):
+    """Commit fora de uma unidade de trabalho; dentro dela, apenas flush"""
+    if in_unit_of_work(db):
+        await db.flush()
+    else:
+        await db.commit()
+
+
+def after_commit(db: AsyncSession, callback: Callable[[], None]):
+    """Executa callback quando os dados estiverem efetivados (já ou no commit da unidade)"""
+    if in_unit_of_work(db):
+        db.info[_CALLBACKS_KEY].append(callback)
+    else:
+        callback()
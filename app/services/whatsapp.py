@@ -6,11 +6,11 @@ import httpx
 from typing import Dict, List, Optional, Any
 from app.config import settings
 from app.utils.logger import get_logger
-from app.models.database import MetaLog
 logger = get_logger(__name__)
-from app.database import AsyncSessionLocal
+from app.services.meta_log_sink import meta_log_sink
 from app.services.retry_handler import retry_handler, CircuitBreakerConfig
 from app.services.whatsapp_security import whatsapp_security
+from app.services.bulkhead import bulkhead_manager, BulkheadFullError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,18 +40,15 @@ class WhatsAppService:
                           response: Dict = None, status_code: int = None):
         """Registra logs das requisições para a Meta API"""
         try:
-            async with AsyncSessionLocal() as session:
-                log_entry = MetaLog(
-                    direction="out",
-                    endpoint=endpoint,
-                    method=method,
-                    status_code=status_code,
-                    headers=self.headers,
-                    payload=payload,
-                    response=response
-                )
-                session.add(log_entry)
-                await session.commit()
+            meta_log_sink.log(
+                direction="out",
+                endpoint=endpoint,
+                method=method,
+                status_code=status_code,
+                headers=self.headers,
+                payload=payload,
+                response=response
+            )
         except Exception as e:
             logger.error(f"Erro ao salvar log: {e}")
     
@@ -95,11 +92,12 @@ class WhatsAppService:
         """
         try:
             # Usar o novo serviço de segurança com retry robusto
-            result = await whatsapp_security.send_message(
-                phone_number=to,
-                message=message,
-                message_type="text"
-            )
+            async with bulkhead_manager.get("whatsapp_api"):
+                result = await whatsapp_security.send_message(
+                    phone_number=to,
+                    message=message,
+                    message_type="text"
+                )
             
             if result:
                 logger.info(f"✅ Mensagem enviada para {to}")
@@ -150,15 +148,16 @@ class WhatsAppService:
         }
         
         try:
-            result = await retry_handler.execute_with_retry(
-                func=self._make_api_request,
-                service_name="whatsapp_api",
-                max_retries=3,
-                base_delay=2.0,
-                circuit_breaker_config=self.circuit_breaker_config,
-                endpoint=endpoint,
-                payload=payload
-            )
+            async with bulkhead_manager.get("whatsapp_api"):
+                result = await retry_handler.execute_with_retry(
+                    func=self._make_api_request,
+                    service_name="whatsapp_api",
+                    max_retries=3,
+                    base_delay=2.0,
+                    circuit_breaker_config=self.circuit_breaker_config,
+                    endpoint=endpoint,
+                    payload=payload
+                )
             
             logger.info(f"Botões interativos enviados para {to}")
             return result
@@ -180,6 +179,15 @@ class WhatsAppService:
         # Primeiro, obter a URL da mídia
         endpoint = f"{self.base_url}/{media_id}"
         
+        try:
+            async with bulkhead_manager.get("whatsapp_api"):
+                return await self._download_media(endpoint, media_id)
+        except BulkheadFullError as e:
+            logger.error(f"Download da mídia {media_id} rejeitado: {e}")
+            return None
+    
+    async def _download_media(self, endpoint: str, media_id: str) -> Optional[bytes]:
+        """Executa o download da mídia em duas etapas (URL e arquivo)"""
         async with httpx.AsyncClient() as client:
             try:
                 # Obter URL da mídia
@@ -123,6 +123,77 @@ cache_operations_total = Counter(
     registry=registry
 )
 
+# Bulkhead Metrics
+bulkhead_in_flight = Gauge(
+    'bulkhead_in_flight',
+    'Calls currently executing inside each bulkhead',
+    ['bulkhead'],
+    registry=registry
+)
+
+bulkhead_queued = Gauge(
+    'bulkhead_queued',
+    'Calls waiting for a bulkhead slot',
+    ['bulkhead'],
+    registry=registry
+)
+
+bulkhead_rejected_total = Counter(
+    'bulkhead_rejected_total',
+    'Total calls rejected by bulkheads',
+    ['bulkhead', 'reason'],
+    registry=registry
+)
+
+adaptive_concurrency_limit = Gauge(
+    'adaptive_concurrency_limit',
+    'Current adaptive concurrency limit',
+    ['limiter'],
+    registry=registry
+)
+
+adaptive_concurrency_rtt_seconds = Gauge(
+    'adaptive_concurrency_rtt_seconds',
+    'Short-window RTT observed by the adaptive limiter',
+    ['limiter'],
+    registry=registry
+)
+
+# LLM Degradation Metrics
+llm_degradation_steps_total = Counter(
+    'llm_degradation_steps_total',
+    'LLM degradation ladder step outcomes',
+    ['level', 'outcome'],
+    registry=registry
+)
+
+llm_degradation_step_duration_seconds = Histogram(
+    'llm_degradation_step_duration_seconds',
+    'Duration of each LLM degradation ladder step',
+    ['level'],
+    registry=registry
+)
+
+meta_log_records_total = Counter(
+    'meta_log_records_total',
+    'Audit log (meta_logs) records by outcome',
+    ['outcome'],
+    registry=registry
+)
+
+meta_log_buffer_size = Gauge(
+    'meta_log_buffer_size',
+    'Audit log records waiting to be flushed',
+    registry=registry
+)
+
+llm_hedged_requests_total = Counter(
+    'llm_hedged_requests_total',
+    'Hedged OpenAI requests by outcome',
+    ['operation', 'outcome'],
+    registry=registry
+)
+
 # Application Info
 app_info = Info(
     'whatsapp_agent_info',
@@ -221,6 +292,54 @@ class MetricsCollector:
         except Exception as e:
             logger.error(f"Error recording cache metrics: {e}")
     
+    def update_bulkhead(self, name: str, in_flight: int, queued: int):
+        """Update bulkhead occupancy gauges"""
+        try:
+            bulkhead_in_flight.labels(bulkhead=name).set(in_flight)
+            bulkhead_queued.labels(bulkhead=name).set(queued)
+        except Exception as e:
+            logger.error(f"Error updating bulkhead metrics: {e}")
+    
+    def record_bulkhead_rejection(self, name: str, reason: str):
+        """Record calls rejected by a bulkhead"""
+        try:
+            bulkhead_rejected_total.labels(bulkhead=name, reason=reason).inc()
+        except Exception as e:
+            logger.error(f"Error recording bulkhead metrics: {e}")
+    
+    def update_adaptive_limit(self, name: str, limit: float, rtt: float):
+        """Update adaptive concurrency limit gauges"""
+        try:
+            adaptive_concurrency_limit.labels(limiter=name).set(limit)
+            adaptive_concurrency_rtt_seconds.labels(limiter=name).set(rtt)
+        except Exception as e:
+            logger.error(f"Error updating adaptive limit metrics: {e}")
+    
+    def record_degradation_step(self, level: str, outcome: str, duration: float):
+        """Record LLM degradation ladder step outcome"""
+        try:
+            llm_degradation_steps_total.labels(level=level, outcome=outcome).inc()
+            if outcome not in ("skipped", "replayed", "dropped"):
+                llm_degradation_step_duration_seconds.labels(level=level).observe(duration)
+        except Exception as e:
+            logger.error(f"Error recording degradation metrics: {e}")
+    
+    def record_meta_log(self, outcome: str, count: int = 1, buffered: int = None):
+        """Record audit log sink outcome (written, dropped, failed, dead_lettered)"""
+        try:
+            meta_log_records_total.labels(outcome=outcome).inc(count)
+            if buffered is not None:
+                meta_log_buffer_size.set(buffered)
+        except Exception as e:
+            logger.error(f"Error recording audit log metrics: {e}")
+    
+    def record_hedged_request(self, operation: str, outcome: str):
+        """Record hedged request outcome"""
+        try:
+            llm_hedged_requests_total.labels(operation=operation, outcome=outcome).inc()
+        except Exception as e:
+            logger.error(f"Error recording hedging metrics: {e}")
+    
     def update_database_connections(self, active: int, idle: int):
         """Update database connection counts"""
         try:
@@ -0,0 +1,52 @@
+"""
+Cursores opacos para paginação por keyset
+O cursor guarda os valores da chave de ordenação do último item da página
+(ex.: (last_message_at, id)); a próxima página começa logo depois dele
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Serializa a chave do último item em um token url-safe"""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: Optional[str], types: Sequence[Any]) -> Optional[Tuple[Any, ...]]:
+    """
+    Decodifica um cursor gerado por encode_cursor
+
+    Args:
+        token: Cursor recebido do cliente
+        types: Tipo esperado de cada campo, como em isinstance (ex.: (datetime, int)
+               ou ((datetime, type(None)), int) para um campo que aceita None)
+
+    Raises:
+        ValueError: token malformado, com outro número de campos ou valores de outro tipo
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError("Cursor inválido")
+        values = tuple(
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) and "dt" in value else value
+            for value in payload
+        )
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursor inválido") from e
+
+    for value, expected in zip(values, types):
+        # bool é subclasse de int, mas nunca é chave de paginação
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError("Cursor inválido")
+    return values
@@ -0,0 +1,56 @@
+"""
+Proveniência do conteúdo sanitizado no pipeline do webhook
+SanitizedText é um str que registra quais verificações já rodaram sobre ele
+(e o veredito de segurança); TrustedPayload marca o payload que já passou por
+sanitize_whatsapp_payload. As etapas seguintes consultam a marca e pulam o
+trabalho repetido. Qualquer transformação do texto (fatiar, concatenar,
+formatar) devolve um str comum, sem marca, e as verificações voltam a rodar
+"""
+from typing import Dict, FrozenSet, Iterable, Optional
+
+# Verificações registradas
+CHECK_PAYLOAD = "payload"              # sanitize_whatsapp_payload
+CHECK_MESSAGE = "message"              # sanitize_message_content (qualquer tipo)
+CHECK_MESSAGE_TEXT = "message.text"    # ... com as regras de mensagem de texto
+CHECK_MESSAGE_MEDIA = "message.media"  # ... com as regras de legenda de mídia
+CHECK_SECURITY = "security"            # spam/phishing (validate_security)
+CHECK_SQL = "sql"                      # RobustValidator.sanitize_sql_input
+
+
+class SanitizedText(str):
+    """Texto com as verificações já aplicadas a ele"""
+
+    checks: FrozenSet[str]
+    security: Optional[Dict[str, bool]]
+
+    def __new__(cls, value: str, checks: Iterable[str] = (), security: Optional[Dict[str, bool]] = None):
+        text = super().__new__(cls, value)
+        previous = value.checks if isinstance(value, SanitizedText) else frozenset()
+        text.checks = previous | frozenset(checks)
+        text.security = security if security is not None else getattr(value, "security", None)
+        return text
+
+    def has(self, *checks: str) -> bool:
+        return all(check in self.checks for check in checks)
+
+    def mark(self, *checks: str, security: Optional[Dict[str, bool]] = None) -> "SanitizedText":
+        """Cópia com mais verificações registradas"""
+        return SanitizedText(self, checks, security)
+
+    def __reduce__(self):
+        return SanitizedText, (str(self), self.checks, self.security)
+
+
+def checks_of(value) -> FrozenSet[str]:
+    """Verificações já registradas em value (vazio para str comum)"""
+    return value.checks if isinstance(value, SanitizedText) else frozenset()
+
+
+def has_checks(value, *checks: str) -> bool:
+    return isinstance(value, SanitizedText) and value.has(*checks)
+
+
+class TrustedPayload(dict):
+    """Payload do webhook já sanitizado; sanitizar de novo devolve o próprio objeto"""
+
+    checks = frozenset({CHECK_PAYLOAD})
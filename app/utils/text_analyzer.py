@@ -0,0 +1,285 @@
+"""
+Análise de texto compartilhada das mensagens recebidas
+Normaliza a mensagem uma única vez (minúsculas, sem acentos) e roda todos os
+conjuntos de palavras-chave registrados (fluxo, lead scoring, handoff,
+serviços) numa única regex compilada em forma de trie. Os conjuntos de regex
+(handoff, spam, phishing) são compilados uma vez e pré-filtrados pelos seus
+literais obrigatórios, que entram na mesma passada. O resultado é um
+TextFeatures, memoizado por mensagem, lido por todos os consumidores
+"""
+import logging
+import re
+import threading
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _build_fold_table() -> Dict[int, str]:
+    table = {}
+    for code in range(0xC0, 0x250):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if base and base != char:
+            table[code] = base
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Não É" -> "nao e")"""
+    return text.lower().translate(_FOLD_TABLE)
+
+
+def _expand(items, limit: int = 64) -> Optional[List[str]]:
+    """Todos os textos de uma sequência de literais/alternâncias (ou None)"""
+    texts = [""]
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            texts = [text + chr(value) for text in texts]
+            continue
+        if op is sre_parse.SUBPATTERN:
+            options = _expand(value[-1], limit)
+        elif op is sre_parse.BRANCH:
+            options = []
+            for branch in value[1]:
+                expanded = _expand(branch, limit)
+                if expanded is None:
+                    return None
+                options += expanded
+        else:
+            return None
+        if options is None or len(texts) * len(options) > limit:
+            return None
+        texts = [text + option for text in texts for option in options]
+    return texts
+
+
+def required_literals(pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """
+    Literais dos quais ao menos um aparece em todo texto que casa com a regex
+    (ex.: r"\\b(cancelar|reembolso)\\b" -> ["cancelar", "reembolso"]), ou None
+
+    Usados como pré-filtro: a regex só é executada se um deles estiver no texto
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+
+    candidates: List[List[str]] = []
+    run: List[str] = []
+
+    def close_run():
+        if run:
+            candidates.append(["".join(run)])
+            run.clear()
+
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        close_run()
+        if op is sre_parse.SUBPATTERN or op is sre_parse.BRANCH:
+            expanded = _expand([(op, value)])
+            if expanded and all(expanded):
+                candidates.append(expanded)
+    close_run()
+
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda literals: min(len(literal) for literal in literals))
+    return [literal.lower() for literal in best] if min(len(literal) for literal in best) >= 2 else None
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Alternância em forma de trie: prefixos comuns fatorados e, em cada ponto,
+    o ramo mais longo tentado primeiro (a regex encontra a palavra mais longa)
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+@dataclass
+class TextFeatures:
+    """Resultado da análise de uma mensagem"""
+    text: str
+    lower: str
+    folded: str
+    keywords: Dict[str, FrozenSet[str]] = field(default_factory=dict)
+    _patterns: Dict[str, Optional[str]] = field(default_factory=dict, repr=False)
+
+    def hits(self, name: str) -> FrozenSet[str]:
+        """Palavras-chave (como registradas) do conjunto encontradas na mensagem"""
+        return self.keywords.get(name, frozenset())
+
+    def count(self, name: str) -> int:
+        return len(self.keywords.get(name, ()))
+
+    def has(self, name: str) -> bool:
+        return name in self.keywords
+
+    @property
+    def words(self) -> List[str]:
+        return self.folded.split()
+
+
+class TextAnalyzer:
+    """Registro de conjuntos de palavras-chave/regex e análise memoizada por mensagem"""
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._keyword_sets: Dict[str, Tuple[str, ...]] = {}
+        self._pattern_sets: Dict[str, List[Tuple[str, Pattern, Optional[str]]]] = {}
+        self._matcher: Optional[Pattern] = None
+        # chave normalizada -> [(conjunto, palavra registrada)] dela e das chaves que são prefixo dela
+        self._owners: Dict[str, List[Tuple[str, str]]] = {}
+        self._cache: "OrderedDict[str, TextFeatures]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"analyzed": 0, "cache_hits": 0, "rebuilds": 0}
+
+    # ------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------
+
+    def register_keywords(self, name: str, keywords: Iterable[str]):
+        """Registra (ou substitui) um conjunto de palavras-chave; casamento por substring"""
+        keywords = tuple(keyword for keyword in keywords if keyword)
+        with self._lock:
+            if self._keyword_sets.get(name) == keywords:
+                return
+            self._keyword_sets[name] = keywords
+            self._matcher = None
+            self._cache.clear()
+
+    def register_patterns(self, name: str, patterns: Iterable[str], flags: int = 0):
+        """
+        Registra (ou substitui) um conjunto de regex, aplicadas sobre o texto normalizado
+
+        Os padrões devem estar em minúsculas; só os acentos são removidos deles
+        (lower() alteraria classes como \\S e \\B). Os literais obrigatórios de
+        cada padrão entram na passada única de palavras-chave, e a regex só roda
+        nas mensagens que os contêm
+        """
+        entries = []
+        prefilters = {}
+        for index, pattern in enumerate(patterns):
+            source = pattern.translate(_FOLD_TABLE)
+            literals = required_literals(source, flags)
+            key = f"{name}#{index}" if literals else None
+            if key:
+                prefilters[key] = tuple(literals)
+            entries.append((pattern, re.compile(source, flags), key))
+
+        with self._lock:
+            for key in [key for key in self._keyword_sets if key.startswith(f"{name}#")]:
+                del self._keyword_sets[key]
+            self._keyword_sets.update(prefilters)
+            self._pattern_sets[name] = entries
+            self._matcher = None
+            self._cache.clear()
+
+    def _build_matcher(self):
+        folded_to_owners: Dict[str, List[Tuple[str, str]]] = {}
+        for name, keywords in self._keyword_sets.items():
+            for keyword in keywords:
+                folded_to_owners.setdefault(fold(keyword), []).append((name, keyword))
+
+        # A regex só devolve a chave mais longa em cada posição; as mais curtas
+        # que começam na mesma posição são prefixos dela
+        owners = {}
+        for key in folded_to_owners:
+            owners[key] = [
+                owner
+                for prefix, prefix_owners in folded_to_owners.items() if key.startswith(prefix)
+                for owner in prefix_owners
+            ]
+        self._owners = owners
+        self._matcher = re.compile(f"(?=({_trie_pattern(folded_to_owners)}))") if owners else None
+        self.stats["rebuilds"] += 1
+
+    # ------------------------------------------------------------------
+    # Análise
+    # ------------------------------------------------------------------
+
+    def analyze(self, text: str) -> TextFeatures:
+        """Analisa a mensagem (resultado memoizado para as próximas chamadas com o mesmo texto)"""
+        text = text or ""
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self.stats["cache_hits"] += 1
+                return cached
+            if self._matcher is None and self._keyword_sets:
+                self._build_matcher()
+            matcher, owners = self._matcher, self._owners
+
+        lower = text.lower()
+        folded = lower.translate(_FOLD_TABLE)
+        found: Dict[str, set] = {}
+        if matcher is not None:
+            for match in matcher.finditer(folded):
+                for name, keyword in owners[match.group(1)]:
+                    found.setdefault(name, set()).add(keyword)
+
+        features = TextFeatures(
+            text=text,
+            lower=lower,
+            folded=folded,
+            keywords={name: frozenset(keywords) for name, keywords in found.items()}
+        )
+        with self._lock:
+            self.stats["analyzed"] += 1
+            self._cache[text] = features
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return features
+
+    def match_pattern(self, features: TextFeatures, name: str) -> Optional[str]:
+        """Primeira regex do conjunto (na ordem registrada) que casa; memoizado no TextFeatures"""
+        if name not in features._patterns:
+            matched = None
+            for pattern, compiled, prefilter in self._pattern_sets.get(name, ()):
+                if prefilter and prefilter not in features.keywords:
+                    continue
+                if compiled.search(features.folded):
+                    matched = pattern
+                    break
+            features._patterns[name] = matched
+        return features._patterns[name]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "keyword_sets": len([name for name in self._keyword_sets if "#" not in name]),
+            "pattern_sets": len(self._pattern_sets),
+            "cached": len(self._cache)
+        }
+
+
+# Instância global
+text_analyzer = TextAnalyzer()
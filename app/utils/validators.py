@@ -11,6 +11,8 @@ from typing import Tuple, Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta
 from sqlalchemy import text
 
+from app.utils.provenance import CHECK_SQL, SanitizedText, has_checks
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -226,9 +228,16 @@ class RobustValidator:
     
     @staticmethod
     def sanitize_sql_input(value: Any) -> str:
-        """Sanitizar entrada para prevenir SQL injection"""
+        """
+        Sanitizar entrada para prevenir SQL injection
+
+        O resultado é um SanitizedText; um valor já sanitizado aqui é devolvido
+        como está (escapar de novo duplicaria as aspas)
+        """
         if value is None:
             return ""
+        if has_checks(value, CHECK_SQL):
+            return value
         
         # Converter para string e escapar caracteres perigosos
         str_value = str(value)
@@ -248,7 +257,7 @@ class RobustValidator:
             str_value = str_value[:1000]
             logger.warning(f"⚠️ Entrada truncada para 1000 caracteres")
         
-        return str_value.strip()
+        return SanitizedText(str_value.strip(), (CHECK_SQL,))
 
 class DatabaseValidator:
     """Validador para operações de banco de dados"""
@@ -296,8 +305,12 @@ class DatabaseValidator:
         return query
     
     @staticmethod
-    def safe_execute_query(engine, query: str, params: Dict[str, Any] = None):
-        """Executar query de forma segura com validação"""
+    def safe_execute_query(engine, query: str, params: Dict[str, Any] = None, fetch: str = "auto"):
+        """
+        Executar query de forma segura com validação
+
+        fetch: "auto" (escalar se houver COUNT, senão todas as linhas), "scalar" ou "all"
+        """
         try:
             # Validar query
             validated_query = DatabaseValidator.validate_sql_query(query)
@@ -314,7 +327,7 @@ class DatabaseValidator:
                 # Retornar dados ao invés do cursor para evitar erro de cursor fechado
                 try:
                     # Primeiro tentar scalar para queries simples como COUNT
-                    if 'COUNT(' in validated_query.upper():
+                    if fetch == "scalar" or (fetch == "auto" and 'COUNT(' in validated_query.upper()):
                         scalar_value = result.scalar()
                         logger.info("✅ Query executada com sucesso")
                         return scalar_value
@@ -13,16 +13,74 @@ Versão: 1.0.0
 """
 
 import re
-import json
-import html
 import logging
 from typing import Dict, Any, List, Optional, Union, Tuple
 from datetime import datetime
 from urllib.parse import unquote, quote
 from pathlib import Path
 
+from app.utils.provenance import (
+    CHECK_MESSAGE, CHECK_MESSAGE_MEDIA, CHECK_MESSAGE_TEXT, CHECK_SECURITY,
+    SanitizedText, TrustedPayload, has_checks
+)
+from app.utils.text_analyzer import required_literals, text_analyzer
+
 logger = logging.getLogger(__name__)
 
+# Campos de texto livre do webhook (digitados pelo usuário ou vindos da Meta);
+# os demais (ids, timestamps, wa_id, type, status...) são estruturados
+WHATSAPP_FREE_TEXT_FIELDS = frozenset({
+    'body', 'caption', 'filename', 'title', 'description', 'text', 'name',
+    'formatted_name', 'first_name', 'last_name', 'middle_name', 'address',
+    'street', 'city', 'state', 'country', 'company', 'department', 'payload',
+    'emoji', 'message', 'details'
+})
+
+# Remoção de caracteres de controle + escape HTML (html.escape) numa única passada
+_HTML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+_CONTROL_AND_HTML = str.maketrans({
+    **{code: None for code in [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F]},
+    **_HTML_ESCAPE
+})
+_NEEDS_ESCAPE = re.compile(r'[&<>"\']')
+_NEEDS_CONTROL_OR_ESCAPE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F&<>"\']')
+# Valor estruturado que nenhuma das etapas acima alteraria
+_PLAIN_VALUE = re.compile(r'[\w.:+=/@ \-]*', re.ASCII)
+_UNSAFE_KEY_CHARS = re.compile(r'[^\w\-_.]')
+_KEY_CACHE: Dict[str, str] = {}
+_KEY_CACHE_SIZE = 1024
+_MAX_VALUE_LENGTH = 10000
+
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+_UNCLOSED_TAG_PATTERN = re.compile(r'<[^<]*$')
+_XSS_PATTERNS = [
+    r'javascript\s*:',
+    r'vbscript\s*:',
+    r'data\s*:',
+    r'on\w+\s*=',
+    r'eval\s*\(',
+    r'expression\s*\(',
+    r'script\b',
+    r'iframe\b',
+    r'object\b',
+    r'embed\b',
+    r'form\b',
+    r'input\b',
+]
+# Caracteres não ASCII que o IGNORECASE casa com letras ASCII (İ, ı, ſ, K)
+_IGNORECASE_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+
+def _fold_ignorecase(text: str) -> str:
+    """Texto em que os literais de uma regex IGNORECASE aparecem em minúsculas"""
+    return text.lower() if text.isascii() else text.translate(_IGNORECASE_FOLD).lower()
+
+
+def _removal_passes(patterns: List[str]) -> List[Tuple[re.Pattern, Optional[List[str]]]]:
+    """Regex compiladas (IGNORECASE) com os literais sem os quais não podem casar"""
+    return [(re.compile(pattern, re.IGNORECASE), required_literals(pattern)) for pattern in patterns]
+
+
 class WhatsAppSanitizer:
     """
     Classe principal para sanitização robusta de dados do WhatsApp
@@ -64,6 +122,19 @@ class WhatsAppSanitizer:
         'media_size': 16 * 1024 * 1024     # 16MB
     }
     
+    # Regex pré-compiladas (antes recompiladas a partir de strings a cada chamada)
+    _XSS_PASSES = _removal_passes(_XSS_PATTERNS + [re.escape(pattern) for pattern in DANGEROUS_CHARS['xss']])
+    _SAFE_TEXT_PATTERN = re.compile(PATTERNS['safe_text'])
+    _UNSAFE_TEXT_CHARS = re.compile(r'[^\w\s\u00C0-\u024F\u1E00-\u1EFF\U0001F000-\U0001F9FF\U00002000-\U000027BF\U0000FE00-\U0000FE0F.,!?:;\-_@#$%&*()\[\]{}="\'\/\\+\n\r\t•]')
+    _HORIZONTAL_SPACES = re.compile(r'[^\S\n]+')
+    _EXTRA_NEWLINES = re.compile(r'\n{3,}')
+    
+    # Verificações que sanitize_message_content registra, por tipo de mensagem
+    MESSAGE_CHECKS = {
+        'text': (CHECK_MESSAGE, CHECK_MESSAGE_TEXT),
+        **{media: (CHECK_MESSAGE, CHECK_MESSAGE_MEDIA) for media in ['image', 'document', 'audio', 'video']}
+    }
+    
     @classmethod
     def sanitize_whatsapp_payload(cls, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -73,11 +144,15 @@ class WhatsAppSanitizer:
             payload: Payload bruto recebido do WhatsApp
             
         Returns:
-            Dict[str, Any]: Payload sanitizado
+            Dict[str, Any]: Payload sanitizado (TrustedPayload; um TrustedPayload
+            recebido é devolvido sem nova sanitização)
             
         Raises:
             ValueError: Se payload for inválido ou malicioso
         """
+        if isinstance(payload, TrustedPayload):
+            return payload
+        
         try:
             logger.debug("🧹 Iniciando sanitização de payload WhatsApp")
             
@@ -85,13 +160,8 @@ class WhatsAppSanitizer:
             if not isinstance(payload, dict):
                 raise ValueError("Payload deve ser um dicionário")
             
-            # Verificar tamanho do payload
-            payload_str = json.dumps(payload)
-            if len(payload_str) > cls.LIMITS['payload_size']:
-                raise ValueError(f"Payload muito grande: {len(payload_str)} bytes")
-            
-            # Sanitizar recursivamente
-            sanitized = cls._sanitize_dict_recursive(payload)
+            # Sanitizar numa única passada, contabilizando o tamanho durante o percurso
+            sanitized = TrustedPayload(cls._sanitize_tree(payload, cls.LIMITS['payload_size']))
             
             # Validações específicas do WhatsApp
             cls._validate_whatsapp_structure(sanitized)
@@ -113,12 +183,17 @@ class WhatsAppSanitizer:
             message_type: Tipo da mensagem (text, image, document, etc.)
             
         Returns:
-            str: Conteúdo sanitizado
+            str: Conteúdo sanitizado (SanitizedText; conteúdo que já passou por
+            esta sanitização para o mesmo tipo é devolvido como está)
         """
         try:
             if not content or not isinstance(content, str):
                 return ""
             
+            checks = cls.MESSAGE_CHECKS.get(message_type, (CHECK_MESSAGE,))
+            if has_checks(content, *checks):
+                return content
+            
             # Verificar tamanho
             max_length = cls.LIMITS.get('text_message', 4096)
             if len(content) > max_length:
@@ -138,7 +213,7 @@ class WhatsAppSanitizer:
             # 🔥 CORREÇÃO: Usar sanitização que preserva formatação
             sanitized = cls._normalize_whitespace_preserve_formatting(sanitized)
             
-            return sanitized
+            return SanitizedText(sanitized, checks) if sanitized else ""
             
         except Exception as e:
             logger.error(f"❌ Erro na sanitização do conteúdo: {e}")
@@ -318,50 +393,54 @@ class WhatsAppSanitizer:
             return False
     
     @classmethod
-    def _sanitize_dict_recursive(cls, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Sanitiza dicionário recursivamente"""
-        sanitized = {}
+    def _sanitize_tree(cls, payload: Dict[str, Any], max_size: int) -> Dict[str, Any]:
+        """
+        Sanitiza o payload recursivamente numa única passada
         
-        for key, value in data.items():
-            # Sanitizar chave
-            safe_key = cls._sanitize_string_key(key)
-            
+        O tamanho aproximado do JSON serializado é somado durante o percurso, e
+        o payload é rejeitado assim que passa de max_size (sem json.dumps).
+        Strings dos campos de WHATSAPP_FREE_TEXT_FIELDS são sempre escapadas;
+        as dos campos estruturados só quando contêm algo a escapar
+        """
+        remaining = max_size
+        too_large = f"Payload muito grande: mais de {max_size} bytes"
+        key_cache = _KEY_CACHE
+        is_plain = _PLAIN_VALUE.fullmatch
+        sanitize_key = cls._sanitize_string_key
+        sanitize_value = cls._sanitize_string_value
+        
+        def walk(value: Any, free_text: bool) -> Any:
+            nonlocal remaining
+            if isinstance(value, str):
+                remaining -= len(value) + 2
+                if remaining < 0:
+                    raise ValueError(too_large)
+                # Campo estruturado sem nada a escapar passa direto
+                if free_text or len(value) > _MAX_VALUE_LENGTH or not is_plain(value):
+                    value = sanitize_value(value)
+                return value
             if isinstance(value, dict):
-                sanitized[safe_key] = cls._sanitize_dict_recursive(value)
-            elif isinstance(value, list):
-                sanitized[safe_key] = cls._sanitize_list_recursive(value)
-            elif isinstance(value, str):
-                sanitized[safe_key] = cls._sanitize_string_value(value)
-            elif isinstance(value, (int, float, bool)):
-                sanitized[safe_key] = value
-            elif value is None:
-                sanitized[safe_key] = None
-            else:
-                # Converter outros tipos para string e sanitizar
-                sanitized[safe_key] = cls._sanitize_string_value(str(value))
-        
-        return sanitized
-    
-    @classmethod
-    def _sanitize_list_recursive(cls, data: List[Any]) -> List[Any]:
-        """Sanitiza lista recursivamente"""
-        sanitized = []
-        
-        for item in data:
-            if isinstance(item, dict):
-                sanitized.append(cls._sanitize_dict_recursive(item))
-            elif isinstance(item, list):
-                sanitized.append(cls._sanitize_list_recursive(item))
-            elif isinstance(item, str):
-                sanitized.append(cls._sanitize_string_value(item))
-            elif isinstance(item, (int, float, bool)):
-                sanitized.append(item)
-            elif item is None:
-                sanitized.append(None)
-            else:
-                sanitized.append(cls._sanitize_string_value(str(item)))
-        
-        return sanitized
+                remaining -= 2
+                sanitized = {}
+                for key, item in value.items():
+                    if not isinstance(key, str):
+                        key = str(key)
+                    remaining -= len(key) + 4
+                    if remaining < 0:
+                        raise ValueError(too_large)
+                    sanitized[key_cache.get(key) or sanitize_key(key)] = walk(item, key in WHATSAPP_FREE_TEXT_FIELDS)
+                return sanitized
+            if isinstance(value, (list, tuple)):
+                remaining -= 2
+                return [walk(item, free_text) for item in value]
+            if value is None or isinstance(value, (bool, int, float)):
+                remaining -= len(str(value))
+                if remaining < 0:
+                    raise ValueError(too_large)
+                return value
+            raise ValueError(f"Tipo não serializável em JSON: {type(value).__name__}")
+        
+        return walk(payload, False)
     
     @classmethod
     def _sanitize_string_key(cls, key: str) -> str:
@@ -369,14 +448,16 @@ class WhatsAppSanitizer:
         if not isinstance(key, str):
             key = str(key)
         
-        # Remover caracteres perigosos de chaves
-        key = re.sub(r'[^\w\-_.]', '', key)
+        cached = _KEY_CACHE.get(key)
+        if cached is not None:
+            return cached
         
-        # Limitar tamanho
-        if len(key) > 100:
-            key = key[:100]
+        # Remover caracteres perigosos de chaves e limitar tamanho
+        safe_key = _UNSAFE_KEY_CHARS.sub('', key)[:100] or "unknown_key"
         
-        return key if key else "unknown_key"
+        if len(_KEY_CACHE) < _KEY_CACHE_SIZE:
+            _KEY_CACHE[key] = safe_key
+        return safe_key
     
     @classmethod
     def _sanitize_string_value(cls, value: str) -> str:
@@ -385,15 +466,12 @@ class WhatsAppSanitizer:
             value = str(value)
         
         # Limitar tamanho
-        if len(value) > 10000:  # Limite geral para valores
-            value = value[:10000]
-        
-        # Remover caracteres de controle perigosos
-        value = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', value)
-        
-        # HTML escape básico
-        value = html.escape(value, quote=True)
+        if len(value) > _MAX_VALUE_LENGTH:  # Limite geral para valores
+            value = value[:_MAX_VALUE_LENGTH]
         
+        # Remover caracteres de controle perigosos e aplicar HTML escape básico
+        if _NEEDS_CONTROL_OR_ESCAPE.search(value):
+            value = value.translate(_CONTROL_AND_HTML)
         return value
     
     @classmethod
@@ -421,38 +499,29 @@ class WhatsAppSanitizer:
             return ""
         
         # Remover todas as tags HTML/XML de forma mais robusta
-        # Remove tags completas primeiro
-        content = re.sub(r'<[^>]*>', '', content)
-        
-        # Remove tentativas de abertura de tags sem fechamento
-        content = re.sub(r'<[^<]*$', '', content)
+        # Remove tags completas primeiro e depois tentativas de abertura sem fechamento
+        if '<' in content:
+            content = _TAG_PATTERN.sub('', content)
+            content = _UNCLOSED_TAG_PATTERN.sub('', content)
         
         # Remove padrões de SQL injection
         for pattern in cls.DANGEROUS_CHARS['sql_injection']:
             content = content.replace(pattern, '')
         
-        # Remover padrões de XSS mais robustamente
-        xss_patterns = [
-            r'javascript\s*:',
-            r'vbscript\s*:',
-            r'data\s*:',
-            r'on\w+\s*=',
-            r'eval\s*\(',
-            r'expression\s*\(',
-            r'script\b',
-            r'iframe\b',
-            r'object\b',
-            r'embed\b',
-            r'form\b',
-            r'input\b',
-        ]
-        
-        for pattern in xss_patterns:
-            content = re.sub(pattern, '', content, flags=re.IGNORECASE)
-        
-        # Remover padrões originais de XSS também
-        for pattern in cls.DANGEROUS_CHARS['xss']:
-            content = re.sub(re.escape(pattern), '', content, flags=re.IGNORECASE)
+        # Remover padrões de XSS (os padrões robustos e depois os originais), na
+        # mesma ordem de antes; cada regex só roda se seus literais estão no texto
+        folded = _fold_ignorecase(content)
+        for compiled, literals in cls._XSS_PASSES:
+            if literals is not None:
+                for literal in literals:
+                    if literal in folded:
+                        break
+                else:
+                    continue
+            stripped = compiled.sub('', content)
+            if stripped != content:
+                content = stripped
+                folded = _fold_ignorecase(content)
         
         # Remover padrões de command injection
         for pattern in cls.DANGEROUS_CHARS['command_injection']:
@@ -463,11 +532,8 @@ class WhatsAppSanitizer:
             content = content.replace(pattern, '')
         
         # Escapar caracteres HTML restantes
-        content = content.replace('&', '&amp;')
-        content = content.replace('<', '&lt;')
-        content = content.replace('>', '&gt;')
-        content = content.replace('"', '&quot;')
-        content = content.replace("'", '&#x27;')
+        if _NEEDS_ESCAPE.search(content):
+            content = content.translate(_HTML_ESCAPE)
         
         return content
     
@@ -478,9 +544,9 @@ class WhatsAppSanitizer:
             return ""
         
         # Validar caracteres permitidos
-        if not re.match(cls.PATTERNS['safe_text'], text):
+        if not cls._SAFE_TEXT_PATTERN.match(text):
             # Remover caracteres não permitidos (mantendo emojis)
-            text = re.sub(r'[^\w\s\u00C0-\u024F\u1E00-\u1EFF\U0001F000-\U0001F9FF\U00002000-\U000027BF\U0000FE00-\U0000FE0F.,!?:;\-_@#$%&*()\[\]{}="\'\/\\+\n\r\t•]', '', text)
+            text = cls._UNSAFE_TEXT_CHARS.sub('', text)
         
         # Limitar tamanho
         if len(text) > cls.LIMITS['text_message']:
@@ -591,10 +657,10 @@ class WhatsAppSanitizer:
             return ""
         
         # Substituir múltiplos espaços por um único (exceto quebras de linha)
-        text = re.sub(r'[^\S\n]+', ' ', text)
+        text = cls._HORIZONTAL_SPACES.sub(' ', text)
         
         # Limitar quebras de linha consecutivas para máximo 2
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = cls._EXTRA_NEWLINES.sub('\n\n', text)
         
         # 🔥 CRÍTICO: NÃO usar strip() que remove quebras importantes
         # Apenas remover espaços no início e fim de cada linha
@@ -605,6 +671,49 @@ class WhatsAppSanitizer:
         return text
 
 
+# Padrões de spam mais abrangentes
+SPAM_PATTERNS = [
+    r'http[s]?://bit\.ly',           # Links encurtados
+    r'telegram\.me',                 # Links Telegram
+    r'whatsapp\.com/join',           # Links de grupo
+    r'\b(free|gratis|gratuito).*(money|dinheiro|cash|premio)\b',
+    r'\b(urgent|urgente).*(action|acao|click|now|agora)\b',
+    r'\b(limited time|tempo limitado|oferta limitada)\b',
+    r'\b(click here|clique aqui|acesse|visit)\b',
+    r'\b(verify account|verificar conta|confirm|confirme)\b',
+    r'\b(winner|ganhador|premio|won|ganhou)\b',
+    r'\b(congratulations|parabens|selected|selecionado)\b',
+    r'\b(lottery|loteria|promo|promocao)\b',
+    r'\bmulti.?level.?marketing\b',
+    r'\bpyramid.?scheme\b',
+    r'\bget.?rich.?quick\b',
+    r'\bmake.?money.?(fast|easy|facil)\b',
+    r'\b(guaranteed|garantido).*(profit|lucro|income)\b',
+    r'\b(investment|investimento).*(risk.?free|sem.?risco)\b',
+    r'\b(earn|ganhe).*(from.?home|de.?casa)\b',
+    r'\b(no.?experience|sem.?experiencia).*(required|necessaria)\b',
+    r'\b(double|triple).*(money|dinheiro)\b'
+]
+
+PHISHING_PATTERNS = [
+    r'verify.*account',
+    r'suspended.*account',
+    r'click.*link.*verify',
+    r'urgent.*security',
+    r'bank.*verification',
+    r'paypal.*confirm',
+    r'amazon.*security',
+    r'microsoft.*verify'
+]
+
+text_analyzer.register_patterns("security.spam", SPAM_PATTERNS, re.IGNORECASE)
+text_analyzer.register_patterns("security.phishing", PHISHING_PATTERNS)
+
+EMOJI_PATTERN = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]')
+REPEATED_CHAR_PATTERN = re.compile(r'(.)\1{10,}')
+URL_PATTERN = re.compile(r'http[s]?://|www\.')
+
+
 class WhatsAppSecurityValidator:
     """
     Validador de segurança específico para dados WhatsApp
@@ -616,43 +725,17 @@ class WhatsAppSecurityValidator:
         if not content:
             return False
         
-        # Padrões de spam mais abrangentes
-        spam_patterns = [
-            r'http[s]?://bit\.ly',           # Links encurtados
-            r'telegram\.me',                 # Links Telegram
-            r'whatsapp\.com/join',           # Links de grupo
-            r'\b(free|gratis|gratuito).*(money|dinheiro|cash|premio)\b',
-            r'\b(urgent|urgente).*(action|acao|click|now|agora)\b',
-            r'\b(limited time|tempo limitado|oferta limitada)\b',
-            r'\b(click here|clique aqui|acesse|visit)\b',
-            r'\b(verify account|verificar conta|confirm|confirme)\b',
-            r'\b(winner|ganhador|premio|won|ganhou)\b',
-            r'\b(congratulations|parabens|selected|selecionado)\b',
-            r'\b(lottery|loteria|promo|promocao)\b',
-            r'\bmulti.?level.?marketing\b',
-            r'\bpyramid.?scheme\b',
-            r'\bget.?rich.?quick\b',
-            r'\bmake.?money.?(fast|easy|facil)\b',
-            r'\b(guaranteed|garantido).*(profit|lucro|income)\b',
-            r'\b(investment|investimento).*(risk.?free|sem.?risco)\b',
-            r'\b(earn|ganhe).*(from.?home|de.?casa)\b',
-            r'\b(no.?experience|sem.?experiencia).*(required|necessaria)\b',
-            r'\b(double|triple).*(money|dinheiro)\b'
-        ]
-        
-        content_lower = content.lower()
-        
-        for pattern in spam_patterns:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                return True
+        features = text_analyzer.analyze(content)
+        if text_analyzer.match_pattern(features, "security.spam"):
+            return True
         
         # Verificar excesso de emojis
-        emoji_count = len(re.findall(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]', content))
+        emoji_count = len(EMOJI_PATTERN.findall(content))
         if emoji_count > len(content) * 0.3:  # Mais de 30% emojis
             return True
         
         # Verificar repetições excessivas
-        if re.search(r'(.)\1{10,}', content):  # Mesmo caractere 10+ vezes
+        if REPEATED_CHAR_PATTERN.search(content):  # Mesmo caractere 10+ vezes
             return True
         
         # Verifica excesso de maiúsculas (mais de 70% do texto)
@@ -668,22 +751,9 @@ class WhatsAppSecurityValidator:
             return True
         
         # Verifica URLs suspeitas múltiplas
-        url_count = len(re.findall(r'http[s]?://|www\.', content_lower))
-        if url_count > 2:
-            return True
-        
-        return False
-        
-        # Verifica excesso de caracteres especiais (!?.)
-        special_count = content.count('!') + content.count('?') + content.count('.')
-        if special_count > 5:
-            return True
-        
-        # Verifica URLs suspeitas múltiplas
-        url_count = len(re.findall(r'http[s]?://|www\.', content_lower))
+        url_count = len(URL_PATTERN.findall(features.lower))
         if url_count > 2:
             return True
-            return True
         
         return False
     
@@ -693,24 +763,8 @@ class WhatsAppSecurityValidator:
         if not content:
             return False
         
-        phishing_patterns = [
-            r'verify.*account',
-            r'suspended.*account',
-            r'click.*link.*verify',
-            r'urgent.*security',
-            r'bank.*verification',
-            r'paypal.*confirm',
-            r'amazon.*security',
-            r'microsoft.*verify'
-        ]
-        
-        content_lower = content.lower()
-        
-        for pattern in phishing_patterns:
-            if re.search(pattern, content_lower):
-                return True
-        
-        return False
+        features = text_analyzer.analyze(content)
+        return text_analyzer.match_pattern(features, "security.phishing") is not None
     
     @staticmethod
     def is_potential_malware(filename: str, mime_type: str) -> bool:
@@ -763,10 +817,23 @@ def sanitize_phone(phone: str) -> str:
     return whatsapp_sanitizer.sanitize_phone_number(phone)
 
 def validate_security(content: str, filename: str = None, mime_type: str = None) -> Dict[str, bool]:
-    """Função de conveniência para validar segurança"""
+    """
+    Função de conveniência para validar segurança
+
+    O veredito de spam/phishing de um SanitizedText fica registrado nele e
+    não é recalculado nas próximas validações do mesmo texto
+    """
+    verdict = content.security if has_checks(content, CHECK_SECURITY) else None
+    if verdict is None:
+        verdict = {
+            'is_spam': security_validator.is_potential_spam(content),
+            'is_phishing': security_validator.is_potential_phishing(content)
+        }
+        if isinstance(content, SanitizedText):
+            content.security = verdict
+            content.checks = content.checks | {CHECK_SECURITY}
     return {
-        'is_spam': security_validator.is_potential_spam(content),
-        'is_phishing': security_validator.is_potential_phishing(content),
+        **verdict,
         'is_malware': security_validator.is_potential_malware(filename or "", mime_type or "")
     }
 
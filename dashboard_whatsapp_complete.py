@@ -91,9 +91,10 @@ def get_database_connection():
     try:
         # Primeiro tentar importar do caminho da aplicação
         sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from app.database import sync_engine
+        from app.database import read_router
+        # Dashboard só lê: réplica quando configurada e em dia, senão o primário
         print("✅ Conexão com banco estabelecida via app.database")
-        return sync_engine
+        return read_router.sync_engine()
     except ImportError as ie:
         print(f"⚠️ Erro ao importar app.database: {ie}")
         try:
@@ -125,7 +126,7 @@ def get_database_connection():
         print(f"❌ Erro geral na conexão: {e}")
         return None
 
-def safe_execute_query(query: str, params: dict = None):
+def safe_execute_query(query: str, params: dict = None, fetch: str = "auto"):
     """Executar query de forma segura com validação robusta"""
     engine = get_database_connection()
     if not engine:
@@ -133,7 +134,7 @@ def safe_execute_query(query: str, params: dict = None):
     
     try:
         # Usar o validador de banco de dados
-        return DatabaseValidator.safe_execute_query(engine, query, params)
+        return DatabaseValidator.safe_execute_query(engine, query, params, fetch=fetch)
     except ValidationError:
         raise
     except Exception as e:
@@ -254,40 +255,25 @@ def validate_pagination_params(page: int, per_page: int) -> tuple:
 def load_overview_data():
     """Carregar dados para visão geral com validação robusta"""
     try:
-        # Queries seguras para métricas básicas
-        queries = {
-            'users': "SELECT COUNT(*) FROM users",
-            'messages': "SELECT COUNT(*) FROM messages", 
-            'conversations': "SELECT COUNT(*) FROM conversations",
-            'appointments': "SELECT COUNT(*) FROM appointments",
-            'services': "SELECT COUNT(*) FROM services",
-            'blocked_times': "SELECT COUNT(*) FROM blocked_times"
-        }
-        
-        metrics = {}
-        
-        # Executar queries de forma segura
-        for metric, query in queries.items():
-            try:
-                result = safe_execute_query(query)
-                # safe_execute_query agora retorna scalar value diretamente para COUNT
-                metrics[metric] = result if isinstance(result, (int, float)) else 0
-            except (ValidationError, Exception) as e:
-                print(f"⚠️ Erro ao carregar métrica {metric}: {e}")
-                metrics[metric] = 0
-        
-        # Queries complexas com validação
-        complex_queries = {
+        # Um agregado por tabela: os totais de mensagens, conversas e agendamentos
+        # saem dos próprios GROUP BY, sem COUNT(*) separado para cada tabela
+        # Mensagens vêm dos rollups diários (analytics_rollups), não da tabela bruta;
+        # conv_status/app_status são o status atual (estado, não eventos), sem
+        # rollup equivalente: continuam nas tabelas, agrupados pelo índice de status
+        grouped_queries = {
             'msg_direction': """
-                SELECT direction, COUNT(*) as count 
-                FROM messages 
-                GROUP BY direction
+                SELECT CASE metric WHEN 'messages_in' THEN 'in' ELSE 'out' END AS direction,
+                       CAST(SUM(value) AS INTEGER) as count
+                FROM analytics_rollups
+                WHERE granularity = 'day' AND metric IN ('messages_in', 'messages_out')
+                GROUP BY metric
             """,
             'msg_recent': """
-                SELECT DATE(created_at) as date, COUNT(*) as count
-                FROM messages 
-                WHERE created_at >= NOW() - INTERVAL '7 days'
-                GROUP BY DATE(created_at)
+                SELECT CAST(bucket_start AT TIME ZONE 'UTC' AS DATE) as date, CAST(SUM(value) AS INTEGER) as count
+                FROM analytics_rollups
+                WHERE granularity = 'day' AND metric IN ('messages_in', 'messages_out')
+                  AND bucket_start > NOW() - INTERVAL '7 days'
+                GROUP BY 1
                 ORDER BY date
             """,
             'conv_status': """
@@ -304,15 +290,32 @@ def load_overview_data():
         
         results = {}
         
-        for key, query in complex_queries.items():
+        for key, query in grouped_queries.items():
             try:
-                result = safe_execute_query(query)
-                # safe_execute_query agora retorna lista de dados diretamente
+                result = safe_execute_query(query, fetch="all")
                 results[key] = result if isinstance(result, list) else []
             except (ValidationError, Exception) as e:
                 print(f"⚠️ Erro ao carregar dados {key}: {e}")
                 results[key] = []
         
+        # Tabelas restantes em uma única consulta
+        metrics = {'users': 0, 'services': 0, 'blocked_times': 0}
+        try:
+            rows = safe_execute_query("""
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS users,
+                    (SELECT COUNT(*) FROM services) AS services,
+                    (SELECT COUNT(*) FROM blocked_times) AS blocked_times
+            """, fetch="all")
+            if rows:
+                metrics.update(zip(('users', 'services', 'blocked_times'), rows[0]))
+        except (ValidationError, Exception) as e:
+            print(f"⚠️ Erro ao carregar métricas básicas: {e}")
+        
+        metrics['messages'] = sum(count for _, count in results['msg_direction'])
+        metrics['conversations'] = sum(count for _, count in results['conv_status'])
+        metrics['appointments'] = sum(count for _, count in results['app_status'])
+        
         print(f"✅ Dados carregados com segurança: {metrics}")
         
         return {
@@ -5088,33 +5091,30 @@ def update_realtime_metrics(n_intervals, current_page):
                 
                 # Métricas básicas atualizadas
                 try:
-                    metrics['users'] = conn.execute(text("SELECT COUNT(*) FROM users")).fetchone()[0]
-                    metrics['messages'] = conn.execute(text("SELECT COUNT(*) FROM messages")).fetchone()[0]
-                    metrics['conversations'] = conn.execute(text("SELECT COUNT(*) FROM conversations")).fetchone()[0]
-                    metrics['appointments'] = conn.execute(text("SELECT COUNT(*) FROM appointments")).fetchone()[0]
-                    metrics['services'] = conn.execute(text("SELECT COUNT(*) FROM services")).fetchone()[0]
-                    metrics['blocked_times'] = conn.execute(text("SELECT COUNT(*) FROM blocked_times")).fetchone()[0]
+                    # Um agregado por tabela; "hoje" como intervalo semiaberto para usar os índices
+                    today = "created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + INTERVAL '1 day'"
+                    
+                    metrics['users'], metrics['new_users_today'] = conn.execute(text(f"""
+                        SELECT COUNT(*), COUNT(*) FILTER (WHERE {today}) FROM users
+                    """)).fetchone()
                     
-                    # Métricas em tempo real adicionais
-                    metrics['messages_today'] = conn.execute(text("""
-                        SELECT COUNT(*) FROM messages 
-                        WHERE DATE(created_at) = CURRENT_DATE
-                    """)).fetchone()[0]
+                    metrics['messages'], metrics['messages_today'] = conn.execute(text(f"""
+                        SELECT COUNT(*), COUNT(*) FILTER (WHERE {today}) FROM messages
+                    """)).fetchone()
                     
-                    metrics['conversations_active'] = conn.execute(text("""
-                        SELECT COUNT(*) FROM conversations 
-                        WHERE status = 'ativa'
-                    """)).fetchone()[0]
+                    metrics['conversations'], metrics['conversations_active'] = conn.execute(text("""
+                        SELECT COUNT(*), COUNT(*) FILTER (WHERE status = 'ativa') FROM conversations
+                    """)).fetchone()
                     
-                    metrics['appointments_today'] = conn.execute(text("""
-                        SELECT COUNT(*) FROM appointments 
-                        WHERE DATE(date_time) = CURRENT_DATE
-                    """)).fetchone()[0]
+                    metrics['appointments'], metrics['appointments_today'] = conn.execute(text("""
+                        SELECT COUNT(*), COUNT(*) FILTER (
+                            WHERE date_time >= CURRENT_DATE AND date_time < CURRENT_DATE + INTERVAL '1 day'
+                        ) FROM appointments
+                    """)).fetchone()
                     
-                    metrics['new_users_today'] = conn.execute(text("""
-                        SELECT COUNT(*) FROM users 
-                        WHERE DATE(created_at) = CURRENT_DATE
-                    """)).fetchone()[0]
+                    metrics['services'], metrics['blocked_times'] = conn.execute(text("""
+                        SELECT (SELECT COUNT(*) FROM services), (SELECT COUNT(*) FROM blocked_times)
+                    """)).fetchone()
                     
                     print(f"📊 Métricas em tempo real atualizadas: {metrics}")
                     
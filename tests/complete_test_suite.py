@@ -780,9 +780,10 @@ class ComprehensiveTestSuite:
             # Criar agendamento
             appointment_datetime = datetime.now() + timedelta(days=1)
             cursor.execute("""
-                INSERT INTO appointments (user_id, business_id, service_id, date_time, status, notes)
-                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
-            """, (user_id, business_id, service_id, appointment_datetime, "scheduled", "Test appointment"))
+                INSERT INTO appointments (user_id, business_id, service_id, date_time, end_time, status, notes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
+            """, (user_id, business_id, service_id, appointment_datetime,
+                  appointment_datetime + timedelta(minutes=60), "scheduled", "Test appointment"))
             
             appointment_id = cursor.fetchone()[0]
             self.db_connection.commit()
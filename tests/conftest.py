@@ -0,0 +1,63 @@
+"""
+🧪 Fixtures compartilhadas dos testes de serviços
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.services.identity_cache import identity_cache
+
+
+@dataclass
+class TemporaryDatabase:
+    """Banco de teste com o schema criado e contadores opcionais"""
+    engine: AsyncEngine
+    session_factory: sessionmaker
+    statements: List[str] = field(default_factory=list)  # SQL emitido (count_statements=True)
+    commits: List[int] = field(default_factory=list)     # commits efetivos (count_commits=True)
+
+    def session(self) -> AsyncSession:
+        return self.session_factory()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Fábrica de bancos temporários: async with database("nome.db") as db
+
+    Por padrão usa um SQLite em tmp_path; url aponta para outro banco (ex.:
+    Postgres real), cujas tabelas são recriadas. Argumentos extras vão para
+    create_async_engine. O cache de identidade do processo é limpo ao abrir e
+    ao fechar, pois guarda ids de linhas do banco anterior.
+    """
+
+    @asynccontextmanager
+    async def open_database(name: str = "test.db", url: str = None, count_statements: bool = False,
+                            count_commits: bool = False, **engine_kwargs):
+        engine = create_async_engine(url or f"sqlite+aiosqlite:///{tmp_path / name}", **engine_kwargs)
+        async with engine.begin() as conn:
+            if url is not None:
+                await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        db = TemporaryDatabase(engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+        if count_statements:
+            event.listen(engine.sync_engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: db.statements.append(statement))
+        if count_commits:
+            event.listen(engine.sync_engine, "commit", lambda conn: db.commits.append(1))
+        identity_cache.clear()
+        try:
+            yield db
+        finally:
+            identity_cache.clear()
+            await engine.dispose()
+
+    return open_database
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do limite de concorrência adaptativo da OpenAI
+
+O teste de carga roda em tempo virtual: um servidor OpenAI simulado cuja
+latência cresce com a concorrência e que responde 429 acima da capacidade,
+com relógio determinístico. A integração com o client real da OpenAI usa
+httpx.MockTransport.
+"""
+
+import asyncio
+import heapq
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.services import adaptive_limiter
+from app.services.adaptive_limiter import AdaptiveLimiter, AdaptiveLimitConfig
+
+FAKE_CAPACITY = 12
+BASE_LATENCY = 0.01
+
+
+class VirtualClock:
+    """Relógio determinístico: o tempo só avança quando todos os clientes estão bloqueados"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self._seq = 0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.timers, (self.now + delay, self._seq, future))
+        self._seq += 1
+        await future
+
+    def advance(self):
+        self.now, _, future = heapq.heappop(self.timers)
+        future.set_result(None)
+
+
+class ProviderRateLimited(Exception):
+    status_code = 429
+
+
+class SimulatedOpenAI:
+    """OpenAI simulada: latência proporcional à concorrência, 429 acima da capacidade"""
+
+    def __init__(self, clock: VirtualClock, capacity: int = FAKE_CAPACITY):
+        self.clock = clock
+        self.capacity = capacity
+        self.concurrent = 0
+        self.peak = 0
+        self.ok = 0
+        self.throttled = 0
+
+    async def create(self, **kwargs):
+        self.concurrent += 1
+        self.peak = max(self.peak, self.concurrent)
+        try:
+            if self.concurrent > self.capacity:
+                self.throttled += 1
+                await self.clock.sleep(BASE_LATENCY)
+                raise ProviderRateLimited("Rate limit")
+            await self.clock.sleep(BASE_LATENCY * (1 + self.concurrent / 2))
+            self.ok += 1
+        finally:
+            self.concurrent -= 1
+
+
+async def _run_load(create, clock: VirtualClock, limiter: AdaptiveLimiter = None,
+                    total: int = 300, clients: int = 40):
+    """Clientes em laço fechado; retorna o limite após cada chamada"""
+    remaining = [total]
+    finished = [0]
+    limits = []
+
+    async def worker():
+        while remaining[0]:
+            remaining[0] -= 1
+            try:
+                await create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "oi"}])
+            except ProviderRateLimited:
+                pass
+            if limiter is not None:
+                limits.append(limiter.limit)
+        finished[0] += 1
+
+    def blocked() -> int:
+        return len(clock.timers) + (limiter.queued if limiter is not None else 0) + finished[0]
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(clients)]
+    while finished[0] < clients:
+        while blocked() < clients:
+            await asyncio.sleep(0)
+        if clock.timers:
+            clock.advance()
+    await asyncio.gather(*workers)
+    return limits
+
+
+@pytest.mark.parametrize("algorithm,max_throttled", [("gradient", 100), ("aimd", 130)])
+async def test_limiter_converges_to_provider_capacity(monkeypatch, algorithm, max_throttled):
+    """Sob carga, o limite oscila em torno da capacidade e os 429 caem de 288 para ~100"""
+    unlimited_clock = VirtualClock()
+    unlimited = SimulatedOpenAI(unlimited_clock)
+    await _run_load(unlimited.create, unlimited_clock)
+
+    clock = VirtualClock()
+    monkeypatch.setattr(adaptive_limiter, "time", SimpleNamespace(monotonic=clock.monotonic))
+    limited = SimulatedOpenAI(clock)
+    limiter = AdaptiveLimiter("test_openai", AdaptiveLimitConfig(
+        algorithm=algorithm, initial_limit=4, min_limit=1, max_limit=40,
+        max_queue=100, queue_timeout=30.0
+    ))
+    limits = await _run_load(limiter.wrap(limited.create), clock, limiter)
+
+    assert unlimited.throttled == 288 and unlimited.ok == 12
+    assert limited.throttled <= max_throttled
+    assert limited.ok + limited.throttled == 300
+
+    # Regime com os 40 clientes ativos: nem preso no limite inicial, nem fugindo para o máximo
+    steady = limits[100:250]
+    assert FAKE_CAPACITY * 0.4 <= min(steady)  # recuo multiplicativo após rajadas de 429
+    assert max(steady) <= FAKE_CAPACITY * 1.5
+    assert FAKE_CAPACITY * 0.85 <= sum(steady) / len(steady) <= FAKE_CAPACITY * 1.15
+    assert limited.peak <= int(max(limits))
+    assert limiter.in_flight == 0 and limiter.queued == 0
+
+
+async def test_openai_rate_limit_errors_back_off_the_limit():
+    """429 do client real da OpenAI conta como sobrecarga"""
+    async def handle(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, json={"error": {"message": "Rate limit", "type": "rate_limit"}})
+
+    client = openai.AsyncOpenAI(
+        api_key="sk-test",
+        base_url="http://fake-openai.local/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    )
+    limiter = AdaptiveLimiter("test_openai", AdaptiveLimitConfig(initial_limit=10))
+
+    with pytest.raises(openai.RateLimitError):
+        await limiter.call(client.chat.completions.create, model="gpt-3.5-turbo",
+                           messages=[{"role": "user", "content": json.dumps({"text": "oi"})}])
+
+    assert limiter.drops == 1
+    assert limiter.limit == pytest.approx(9.0)
+    assert limiter.in_flight == 0
+
+
+def test_aimd_increases_when_saturated_and_backs_off_on_drop():
+    limiter = AdaptiveLimiter("test", AdaptiveLimitConfig(algorithm="aimd", initial_limit=10))
+
+    limiter.on_sample(rtt=0.1, in_flight=10, dropped=False)
+    assert limiter.limit == 11
+
+    limiter.on_sample(rtt=0.1, in_flight=1, dropped=False)
+    assert limiter.limit == 11  # sem demanda, não cresce
+
+    limiter.on_sample(rtt=0.1, in_flight=11, dropped=True)
+    assert limiter.limit == pytest.approx(9.9)
+    assert limiter.config.max_concurrent == 9
+
+
+def test_gradient_shrinks_when_latency_grows():
+    limiter = AdaptiveLimiter("test", AdaptiveLimitConfig(algorithm="gradient", initial_limit=20))
+
+    for _ in range(50):
+        limiter.on_sample(rtt=0.1, in_flight=20, dropped=False)
+    grown = limiter.limit
+
+    for _ in range(30):
+        limiter.on_sample(rtt=1.0, in_flight=int(limiter.limit), dropped=False)
+
+    assert limiter.limit < grown
+
+
+async def test_non_overload_errors_are_not_samples():
+    limiter = AdaptiveLimiter("test", AdaptiveLimitConfig(initial_limit=5))
+
+    async def bad_request():
+        raise ValueError("payload inválido")
+
+    with pytest.raises(ValueError):
+        await limiter.call(bad_request)
+
+    assert limiter.samples == 0
+    assert limiter.in_flight == 0
+
+
+async def test_calls_cut_off_by_wait_for_count_as_drops():
+    """Chamada lenta cancelada por wait_for vira amostra de sobrecarga com o RTT decorrido"""
+    limiter = AdaptiveLimiter("test", AdaptiveLimitConfig(initial_limit=10))
+    samples = []
+    on_sample = limiter.on_sample
+
+    def record(rtt, in_flight, dropped):
+        samples.append((rtt, dropped))
+        on_sample(rtt, in_flight, dropped)
+
+    limiter.on_sample = record
+
+    async def slow_provider(**kwargs):
+        await asyncio.sleep(10)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(limiter.call(slow_provider, model="gpt-3.5-turbo"), timeout=0.05)
+
+    assert len(samples) == 1
+    rtt, dropped = samples[0]
+    assert dropped is True
+    assert rtt >= 0.04
+    assert limiter.drops == 1
+    assert limiter.limit == pytest.approx(9.0)
+    assert limiter.in_flight == 0
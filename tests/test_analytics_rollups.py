@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes dos rollups de analytics (compactação, caminho de escrita e verificação)
+"""
+
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from app.models.database import AnalyticsRollup, Appointment, Business, Conversation, Message, Service, User
+from app.services.analytics_rollups import AnalyticsRollupService, RollupConfig, truncate
+
+NOW = datetime(2026, 10, 18, 15, 30, 20, tzinfo=timezone.utc)
+
+
+@asynccontextmanager
+async def _rollups(database):
+    async with database("rollups.db") as test_db:
+        await _seed(test_db.session_factory)
+        yield AnalyticsRollupService(RollupConfig(), session_factory=test_db.session_factory)
+
+
+async def _seed(factory):
+    async with factory() as db:
+        db.add(Business(id=1, name="Studio"))
+        db.add(Service(id=1, business_id=1, name="Corte", duration_minutes=30, price="R$ 50,00"))
+        db.add(User(id=1, wa_id="5511966660001"))
+        db.add_all([
+            Conversation(id=1, user_id=1, status="closed", created_at=NOW - timedelta(days=1, hours=2)),
+            Conversation(id=2, user_id=1, status="active", created_at=NOW - timedelta(minutes=5)),
+        ])
+        db.add_all([
+            Message(user_id=1, conversation_id=1, direction="in", created_at=NOW - timedelta(days=1, hours=2)),
+            Message(user_id=1, conversation_id=2, direction="in", created_at=NOW - timedelta(minutes=5)),
+            Message(user_id=1, conversation_id=2, direction="out", created_at=NOW - timedelta(minutes=5)),
+            Message(user_id=1, conversation_id=2, direction="in", created_at=NOW - timedelta(minutes=1)),
+        ])
+        db.add(Appointment(user_id=1, business_id=1, service_id=1, date_time=NOW + timedelta(days=2),
+                           end_time=NOW + timedelta(days=2, minutes=30), status="confirmado", created_at=NOW - timedelta(hours=3),
+                           confirmed_at=NOW - timedelta(hours=1)))
+        await db.commit()
+
+
+async def test_compaction_builds_minute_hour_and_day_buckets(database):
+    async with _rollups(database) as rollups:
+        assert await rollups.compact(until=NOW) > 0
+
+        day = truncate(NOW, "day")
+        totals = await rollups.get_totals(["messages_in", "messages_out", "conversations_started"], day, NOW)
+        assert totals == {"messages_in": 2, "messages_out": 1, "conversations_started": 1}
+
+        hourly = await rollups.get_series(["messages_in"], "hour", day, NOW)
+        assert [(row["bucket_start"], row["value"]) for row in hourly] == [(truncate(NOW, "hour").isoformat(), 2)]
+
+        daily = await rollups.get_series(["appointments"], "day", day, NOW)
+        assert sorted((row["dimension"], row["value"]) for row in daily) == [("confirmed", 1), ("created", 1)]
+
+        yesterday = await rollups.get_totals(["messages_in"], day - timedelta(days=1), day)
+        assert yesterday == {"messages_in": 1}
+
+
+async def test_compaction_is_idempotent_and_consistent(database):
+    async with _rollups(database) as rollups:
+        assert await rollups.compact(until=NOW) > 0
+        assert await rollups.compact(until=NOW) == 0  # Nada mudou desde a marca d'água
+
+        report = await rollups.check_consistency(NOW - timedelta(days=1), NOW)
+        assert report["consistent"], report["mismatches"]
+
+
+async def test_first_run_backfills_history_and_later_runs_are_incremental(database):
+    async with _rollups(database) as rollups:
+        async with rollups._session() as db:
+            db.add(Message(user_id=1, conversation_id=1, direction="out", created_at=NOW - timedelta(days=30)))
+            await db.commit()
+
+        await rollups.compact(until=NOW)
+        assert rollups.stats["backfilled_days"] == 31
+        old_day = truncate(NOW - timedelta(days=30), "day")
+        assert await rollups.get_totals(["messages_out"], old_day, old_day + timedelta(days=1)) == {"messages_out": 1}
+        # Fora da retenção só ficam horas e dias
+        assert await rollups.get_series(["messages_out"], "minute", old_day, old_day + timedelta(days=1)) == []
+
+        later = NOW + timedelta(minutes=2)
+        async with rollups._session() as db:
+            db.add(Message(user_id=1, conversation_id=2, direction="in", created_at=NOW + timedelta(minutes=1)))
+            await db.commit()
+        assert await rollups.compact(until=later) == 3  # minuto, hora e dia do novo evento
+        assert rollups.stats["backfilled_days"] == 31
+
+        day = truncate(NOW, "day")
+        assert await rollups.get_totals(["messages_in"], day, later) == {"messages_in": 3}
+        report = await rollups.check_consistency(NOW - timedelta(days=30), later)
+        assert report["consistent"], report["mismatches"]
+
+
+async def test_old_minute_buckets_are_pruned(database):
+    async with _rollups(database) as rollups:
+        rollups.record("llm_input_tokens", 10, dimension="gpt-4o-mini", at=NOW - timedelta(days=10))
+        await rollups.flush()
+        await rollups.compact(until=NOW)
+
+        start = NOW - timedelta(days=11)
+        assert await rollups.get_series(["llm_input_tokens"], "minute", start, NOW) == []
+        assert await rollups.get_totals(["llm_input_tokens"], truncate(start, "day"), NOW) == {"llm_input_tokens": 10}
+        assert rollups.stats["pruned_rows"] == 1
+
+
+async def test_consistency_checker_reports_drift(database):
+    async with _rollups(database) as rollups:
+        await rollups.compact(until=NOW)
+        async with rollups._session() as db:
+            await db.execute(
+                update(AnalyticsRollup)
+                .where(AnalyticsRollup.metric == "messages_in", AnalyticsRollup.granularity == "day")
+                .values(value=AnalyticsRollup.value + 5)
+            )
+            await db.commit()
+
+        report = await rollups.check_consistency(NOW - timedelta(days=1), NOW)
+
+        assert not report["consistent"]
+        assert {(m["metric"], m["granularity"]) for m in report["mismatches"]} == {("messages_in", "day")}
+
+
+async def test_write_path_accumulates_llm_usage(database):
+    async with _rollups(database) as rollups:
+        rollups.record("llm_input_tokens", 100, dimension="gpt-4o-mini", at=NOW)
+        rollups.record("llm_input_tokens", 50, dimension="gpt-4o-mini", at=NOW + timedelta(seconds=10))
+        await rollups.flush()
+        rollups.record("llm_input_tokens", 25, dimension="gpt-4o-mini", at=NOW + timedelta(minutes=10))
+        await rollups.flush()
+
+        # A compactação não apaga as métricas do caminho de escrita
+        await rollups.compact(until=NOW)
+
+        minutes = await rollups.get_series(["llm_input_tokens"], "minute", truncate(NOW, "hour"), NOW + timedelta(hours=1))
+        assert [row["value"] for row in minutes] == [150, 25]
+        totals = await rollups.get_totals(["llm_input_tokens"], truncate(NOW, "day"), NOW + timedelta(hours=1))
+        assert totals == {"llm_input_tokens": 175}
+        assert rollups.pending == {}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do índice de disponibilidade em memória (próximos horários livres)
+"""
+
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from app.models.database import Appointment, BlockedTime, Business, Service
+from app.services.availability_index import AvailabilityIndex
+from app.services.data import AppointmentService
+from app.services.dynamic_scheduling import DynamicSchedulingService
+
+OPEN_ALL_WEEK = {
+    day: {"open": "09:00", "close": "19:00", "closed": False}
+    for day in ["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"]
+}
+DAY = date.today() + timedelta(days=5)
+
+
+def _at(hhmm: str, day: date = DAY) -> datetime:
+    return datetime.combine(day, datetime.strptime(hhmm, "%H:%M").time())
+
+
+@asynccontextmanager
+async def _studio(database, business_hours=OPEN_ALL_WEEK):
+    async with database("availability.db", count_statements=True) as test_db:
+        async with test_db.session_factory() as session:
+            session.add(Business(id=1, name="Studio", business_hours=business_hours))
+            session.add(Service(id=1, business_id=1, name="Massagem", duration_minutes=60))
+            await session.commit()
+            test_db.statements.clear()
+            yield session, test_db.statements
+
+
+def _appointment(start: str, end: str, status: str = "confirmado", day: date = DAY) -> Appointment:
+    return Appointment(user_id=1, business_id=1, service_id=1, status=status,
+                       date_time=_at(start, day), end_time=_at(end, day))
+
+
+async def test_first_free_slots_skip_busy_intervals(database):
+    async with _studio(database) as (db, _):
+        db.add_all([
+            _appointment("09:00", "10:00"),
+            _appointment("10:30", "11:00"),
+            _appointment("11:00", "11:30", status="cancelado"),
+            BlockedTime(business_id=1, start_date=_at("00:00"), end_date=_at("23:59"),
+                        start_time=_at("12:00"), end_time=_at("13:00")),
+        ])
+        await db.commit()
+
+        index = AvailabilityIndex()
+        await index.load(db, 1)
+
+        assert index.first_free_slots(1, _at("08:00"), 30, count=3) == [_at("10:00"), _at("11:00"), _at("11:30")]
+        # 60 minutos não cabem entre 10:00 e 10:30 nem entre 11:30 e 12:00
+        assert index.first_free_slots(1, _at("08:00"), 60, count=2) == [_at("11:00"), _at("13:00")]
+        # Fora da grade: arredonda para o próximo slot
+        assert index.first_free_slots(1, _at("13:10"), 30) == [_at("13:30")]
+
+
+async def test_search_continues_on_next_open_day(database):
+    hours = dict(OPEN_ALL_WEEK)
+    next_day = DAY + timedelta(days=1)
+    hours[["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"][next_day.weekday()]] = {"closed": True}
+
+    async with _studio(database, hours) as (db, _):
+        index = AvailabilityIndex()
+        await index.load(db, 1)
+
+        slots = index.first_free_slots(1, _at("18:00"), 60, count=2)
+
+        assert slots == [_at("18:00"), _at("09:00", DAY + timedelta(days=2))]
+
+
+async def test_recurring_blocks_apply_on_matching_weekdays(database):
+    weekday = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"][DAY.weekday()]
+    async with _studio(database) as (db, _):
+        db.add(BlockedTime(
+            business_id=1, start_date=_at("00:00", date.today()), end_date=_at("00:00", DAY + timedelta(days=30)),
+            start_time=_at("09:00", date.today()), end_time=_at("12:00", date.today()),
+            is_recurring=True, recurrence_pattern={"type": "weekly", "days": [weekday]}
+        ))
+        await db.commit()
+
+        index = AvailabilityIndex()
+        await index.load(db, 1)
+
+        assert index.first_free_slots(1, _at("08:00"), 30) == [_at("12:00")]
+        assert index.first_free_slots(1, _at("08:00", DAY + timedelta(days=1)), 30) == [_at("09:00", DAY + timedelta(days=1))]
+        assert index.first_free_slots(1, _at("08:00", DAY + timedelta(days=7)), 30) == [_at("12:00", DAY + timedelta(days=7))]
+
+
+async def test_create_cancel_and_reschedule_update_index_without_reload(database):
+    async with _studio(database) as (db, queries):
+        from app.services import availability_index as module
+        index = module.availability_index
+        index.invalidate()
+        await index.load(db, 1)
+
+        appointment = await AppointmentService.create_appointment(db, user_id=1, service_id=1, date_time=_at("09:00"))
+        assert index.first_free_slots(1, _at("08:00"), 30) == [_at("10:00")]
+
+        await AppointmentService.reschedule_appointment(db, appointment.id, _at("10:00"))
+        assert index.first_free_slots(1, _at("08:00"), 30, count=3) == [_at("09:00"), _at("09:30"), _at("11:00")]
+
+        await AppointmentService.cancel_appointment(db, appointment.id)
+        assert index.first_free_slots(1, _at("08:00"), 30, count=3) == [_at("09:00"), _at("09:30"), _at("10:00")]
+
+        loads = index.stats["loads"]
+        slots = await DynamicSchedulingService(db).find_next_free_slots(service_id=1, after=_at("08:00"), count=1)
+        assert slots == [_at("09:00")]
+        assert index.stats["loads"] == loads and index.stats["stale"] == 0
+        index.invalidate()
+
+
+async def test_candidates_taken_by_another_worker_trigger_reload(database):
+    async with _studio(database) as (db, _):
+        index = AvailabilityIndex()
+        await index.load(db, 1)
+
+        # Escrita de outro worker: não passa pelo índice deste processo
+        await db.execute(insert(Appointment), [{
+            "user_id": 1, "business_id": 1, "service_id": 1, "status": "confirmado",
+            "date_time": _at("09:00"), "end_time": _at("10:00"),
+        }])
+        await db.commit()
+        assert index.first_free_slots(1, _at("08:00"), 30) == [_at("09:00")]
+
+        slots = await index.find_free_slots(db, 1, 30, after=_at("08:00"), count=2)
+
+        assert slots == [_at("10:00"), _at("10:30")]
+        assert index.stats["stale"] == 1 and index.stats["loads"] == 2
+
+        # Funcionamento alterado por outro worker também invalida a dica
+        await db.execute(update(Business).where(Business.id == 1).values(business_hours={
+            **OPEN_ALL_WEEK, **{name: {"open": "14:00", "close": "19:00", "closed": False} for name in OPEN_ALL_WEEK}
+        }))
+        await db.commit()
+        slots = await index.find_free_slots(db, 1, 30, after=_at("08:00"), count=1)
+        assert slots == [_at("14:00")]
+        assert index.stats["stale"] == 2
+
+
+@pytest.mark.load
+async def test_benchmark_next_free_slot_search(database):
+    async with _studio(database) as (db, _):
+        # Agenda quase cheia por 30 dias: só o último slot de cada dia fica livre
+        for offset in range(1, 31):
+            day = date.today() + timedelta(days=offset)
+            db.add(_appointment("09:00", "18:30", day=day))
+        await db.commit()
+
+        index = AvailabilityIndex()
+        await index.load(db, 1)
+        after = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+
+        runs = 500
+        started = time.perf_counter()
+        for _ in range(runs):
+            slots = index.first_free_slots(1, after, 30, count=5)
+        per_query = (time.perf_counter() - started) / runs
+
+        assert [slot.time() for slot in slots] == [_at("18:30").time()] * 5
+        assert per_query < 0.005
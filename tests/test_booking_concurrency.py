@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+🧪 Teste de estresse: centenas de reservas simultâneas no mesmo horário
+
+Roda em SQLite (lock em processo do booking_guard). Com TEST_POSTGRES_URL
+definido, repete contra Postgres com advisory lock + exclusion constraint.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager, nullcontext
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.database import Appointment, Business, Service, User
+from app.services import data as data_module
+from app.services.booking_guard import SlotUnavailableError
+from app.services.booking_workflow import BookingData, BookingStep, BookingWorkflow
+from app.services.data import AppointmentService
+from app.services.dynamic_scheduling import DynamicSchedulingService
+
+CONCURRENT_BOOKINGS = 200
+SLOT = datetime.combine(date.today() + timedelta(days=3), time(10, 0))
+OPEN_ALL_WEEK = {
+    day: {"open": "09:00", "close": "19:00", "closed": False}
+    for day in ["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"]
+}
+
+
+def _wa_id(user_id: int) -> str:
+    return f"55119999{user_id:05d}"
+
+
+@asynccontextmanager
+async def _studio(database, url: str = None):
+    if url is not None:
+        engine_kwargs = dict(url=url, pool_size=20, max_overflow=CONCURRENT_BOOKINGS)
+    else:
+        engine_kwargs = dict(connect_args={"timeout": 30})
+    async with database("booking.db", **engine_kwargs) as test_db:
+        factory = test_db.session_factory
+        async with factory() as session:
+            session.add(Business(id=1, name="Studio", business_hours=OPEN_ALL_WEEK))
+            session.add(Service(id=1, business_id=1, name="Corte", duration_minutes=30, price="R$ 50,00"))
+            session.add_all([User(id=i, wa_id=_wa_id(i)) for i in range(1, CONCURRENT_BOOKINGS + 1)])
+            await session.commit()
+        yield factory
+
+
+async def _count_active(factory) -> int:
+    async with factory() as session:
+        return await session.scalar(
+            select(func.count()).select_from(Appointment).where(Appointment.status.in_(["pendente", "confirmado"]))
+        )
+
+
+async def _book_with_appointment_service(factory, user_id: int) -> bool:
+    async with factory() as db:
+        try:
+            await AppointmentService.create_appointment(db, user_id=user_id, service_id=1, date_time=SLOT)
+            return True
+        except SlotUnavailableError:
+            return False
+
+
+async def _book_with_dynamic_scheduling(factory, user_id: int) -> bool:
+    async with factory() as db:
+        success, _, _ = await DynamicSchedulingService(db).create_appointment(user_id, 1, SLOT)
+        return success
+
+
+async def _book_with_booking_workflow(factory, user_id: int) -> bool:
+    """Confirmação do fluxo conversacional do WhatsApp (BookingWorkflow)"""
+    workflow = BookingWorkflow()
+    wa_id = _wa_id(user_id)
+    workflow.active_bookings[wa_id] = BookingData(
+        service_id=1, service_name="Corte", date=SLOT.date(), time=SLOT.strftime("%H:%M"),
+        customer_name=f"Cliente {user_id}", customer_phone=wa_id, customer_email=f"cliente{user_id}@example.com",
+        step=BookingStep.CONFIRMING
+    )
+    try:
+        async with factory() as db:
+            await workflow.process_booking_step(wa_id, "sim", db)
+        # Sucesso encerra o fluxo; conflito volta para a escolha de horário
+        return wa_id not in workflow.active_bookings
+    finally:
+        workflow.stop_cleanup_task()
+
+
+async def _stress(factory, book) -> int:
+    results = await asyncio.gather(*(book(factory, user_id) for user_id in range(1, CONCURRENT_BOOKINGS + 1)))
+    return sum(results)
+
+
+@pytest.mark.load
+@pytest.mark.parametrize("book", [
+    _book_with_appointment_service, _book_with_dynamic_scheduling, _book_with_booking_workflow
+])
+async def test_only_one_concurrent_booking_wins(database, book):
+    async with _studio(database) as factory:
+        assert await _stress(factory, book) == 1
+        assert await _count_active(factory) == 1
+
+
+@pytest.mark.load
+async def test_without_booking_lock_the_race_double_books(database, monkeypatch):
+    """Controle: sem o lock, verificar-e-inserir concorrente reserva o mesmo horário várias vezes"""
+    monkeypatch.setattr(data_module, "booking_lock", lambda db, business_id: nullcontext())
+
+    async with _studio(database) as factory:
+        assert await _stress(factory, _book_with_appointment_service) > 1
+
+
+@pytest.mark.load
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL não definido")
+async def test_postgres_exclusion_constraint_rejects_overlap_without_lock(database, monkeypatch):
+    """Mesmo sem o advisory lock, a exclusion constraint barra a sobreposição"""
+    monkeypatch.setattr(data_module, "booking_lock", lambda db, business_id: nullcontext())
+
+    async with _studio(database, os.environ["TEST_POSTGRES_URL"]) as factory:
+        assert await _stress(factory, _book_with_appointment_service) == 1
+        assert await _count_active(factory) == 1
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes dos Bulkheads de concorrência por dependência
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.bulkhead import Bulkhead, BulkheadConfig, BulkheadFullError, BulkheadManager
+
+
+async def test_limits_concurrency_and_queues():
+    """Nunca executa mais que max_concurrent chamadas ao mesmo tempo"""
+    bulkhead = Bulkhead("test", BulkheadConfig(max_concurrent=2, max_queue=10, queue_timeout=5.0))
+    running = 0
+    peak = 0
+
+    async def work():
+        nonlocal running, peak
+        async with bulkhead:
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(work() for _ in range(8)))
+
+    assert peak == 2
+    assert bulkhead.in_flight == 0
+    assert bulkhead.queued == 0
+    assert bulkhead.completed == 8
+
+
+async def test_rejects_fast_when_queue_is_full():
+    """Fila cheia gera BulkheadFullError imediatamente"""
+    bulkhead = Bulkhead("test", BulkheadConfig(max_concurrent=1, max_queue=1, queue_timeout=5.0))
+    gate = asyncio.Event()
+
+    async def hold():
+        async with bulkhead:
+            await gate.wait()
+
+    holder = asyncio.create_task(hold())
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    assert bulkhead.in_flight == 1
+    assert bulkhead.queued == 1
+
+    with pytest.raises(BulkheadFullError) as exc_info:
+        await bulkhead.acquire()
+    assert exc_info.value.reason == "queue_full"
+    assert bulkhead.rejected == 1
+
+    gate.set()
+    await asyncio.gather(holder, waiter)
+    assert bulkhead.in_flight == 0
+
+
+async def test_rejects_after_queue_timeout():
+    """Espera na fila é limitada por queue_timeout"""
+    bulkhead = Bulkhead("test", BulkheadConfig(max_concurrent=1, max_queue=5, queue_timeout=0.01))
+    await bulkhead.acquire()
+
+    with pytest.raises(BulkheadFullError) as exc_info:
+        await bulkhead.acquire()
+
+    assert exc_info.value.reason == "queue_timeout"
+    assert bulkhead.queued == 0
+    bulkhead.release()
+    assert bulkhead.in_flight == 0
+
+
+async def test_cancelled_waiter_does_not_leak_slot():
+    """Cancelar quem está na fila não consome vaga"""
+    bulkhead = Bulkhead("test", BulkheadConfig(max_concurrent=1, max_queue=5, queue_timeout=5.0))
+    await bulkhead.acquire()
+
+    waiter = asyncio.create_task(bulkhead.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    bulkhead.release()
+    assert bulkhead.in_flight == 0
+    assert bulkhead.queued == 0
+
+
+def test_manager_returns_named_bulkheads_with_defaults():
+    """Cada dependência tem seu próprio bulkhead configurado"""
+    manager = BulkheadManager()
+
+    whatsapp_bulkhead = manager.get("whatsapp_api")
+    assert manager.get("whatsapp_api") is whatsapp_bulkhead
+    assert whatsapp_bulkhead.config.max_concurrent == BulkheadManager.DEFAULTS["whatsapp_api"].max_concurrent
+    assert set(manager.get_all_stats()) == {"whatsapp_api"}
+
+
+async def test_timeout_after_grant_returns_slot(monkeypatch):
+    """Vaga entregue no mesmo tick do timeout da fila é devolvida"""
+    bulkhead = Bulkhead("test", BulkheadConfig(max_concurrent=1, max_queue=5, queue_timeout=5.0))
+    await bulkhead.acquire()
+
+    async def granted_then_timeout(waiter, timeout):
+        bulkhead.release()  # _drain entrega a vaga ao waiter
+        assert waiter.done()
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr("app.services.bulkhead.asyncio.wait_for", granted_then_timeout)
+    with pytest.raises(BulkheadFullError):
+        await bulkhead.acquire()
+
+    assert bulkhead.in_flight == 0
+    assert bulkhead.queued == 0
+
+
+async def test_database_bulkhead_follows_connection_checkout(database, monkeypatch):
+    """Sessão ociosa não ocupa o bulkhead "database"; a conexão em uso sim"""
+    from sqlalchemy import text
+
+    from app import database as app_database
+
+    manager = BulkheadManager()
+    monkeypatch.setattr(app_database, "bulkhead_manager", manager)
+    bulkhead = manager.get("database")
+    async with database("bulkhead.db", poolclass=app_database.BulkheadQueuePool) as test_db:
+        async with test_db.session_factory() as session:
+            assert bulkhead.in_flight == 0
+            await session.execute(text("SELECT 1"))
+            assert bulkhead.in_flight == 1
+            await session.commit()
+            assert bulkhead.in_flight == 0
+    assert bulkhead.in_flight == 0
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da execução do CrewAI fora do event loop (pool de threads, reuso de crews, timeouts)
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import crew_agents
+from app.services.bulkhead import Bulkhead, BulkheadConfig, BulkheadFullError
+from app.services.crew_agents import WhatsAppAgentCrew
+from app.services.crew_pool import CrewTimeoutError, CrewWorkerPool
+from app.services.lead_store import lead_store
+
+
+class StubLLM:
+    """Backend de LLM offline: bloqueia a thread como uma chamada HTTP real"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def complete(self, role, prompt):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.latency)
+        with self._lock:
+            self.running -= 1
+        return f"[{role}] {prompt.strip().splitlines()[0]}"
+
+
+class StubAgent:
+    def __init__(self, role, **kwargs):
+        self.role = role
+        self.goal = kwargs.get("goal", "")
+        self.backstory = kwargs.get("backstory", "")
+
+
+class StubTask:
+    def __init__(self, description, expected_output, agent):
+        self.description = description
+        self.agent = agent
+
+
+class StubCrew:
+    llm = StubLLM()
+
+    def __init__(self, agents, tasks=None, process=None, **kwargs):
+        self.agents = agents
+        self.tasks = tasks or []
+
+    def kickoff(self, inputs=None):
+        task = self.tasks[0]
+        return self.llm.complete(task.agent.role, task.description.format(**(inputs or {})))
+
+
+def _pool(llm, max_concurrent=2, max_queue=10, task_timeout=5.0):
+    def build(role):
+        crew = StubCrew([StubAgent(role)], [StubTask("{task_description}", "", StubAgent(role))])
+        crew.llm = llm
+        return crew
+    bulkhead = Bulkhead("crewai-test", BulkheadConfig(max_concurrent=max_concurrent, max_queue=max_queue,
+                                                        queue_timeout=5.0))
+    return CrewWorkerPool(build, bulkhead, task_timeout)
+
+
+async def test_kickoff_runs_off_the_event_loop_with_reused_crews():
+    llm = StubLLM(latency=0.2)
+    pool = _pool(llm, max_concurrent=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticking = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(pool.run("scheduler", {"task_description": f"pedido {i}"}) for i in range(6)))
+    elapsed = time.perf_counter() - started
+    ticking.cancel()
+    pool.shutdown(wait=True)
+
+    assert sorted(results) == sorted(f"[scheduler] pedido {i}" for i in range(6))
+    assert llm.peak == 2 and 0.55 < elapsed < 1.2  # 3 ondas de 2
+    assert ticks > elapsed / 0.01 * 0.5  # o loop continuou respondendo
+    stats = pool.get_stats()
+    assert stats["crews_built"] == 2 and stats["idle_crews"] == {"scheduler": 2}
+    assert stats["completed"] == 6 and stats["running"] == 0
+
+
+async def test_timeout_keeps_slot_until_thread_finishes():
+    pool = _pool(StubLLM(latency=0.3), max_concurrent=1, task_timeout=0.05)
+
+    with pytest.raises(CrewTimeoutError):
+        await pool.run("sales", {"task_description": "promoção"})
+    # A thread ainda está no kickoff: a vaga continua ocupada
+    assert pool.get_stats()["running"] == 1 and pool.get_stats()["saturation"] == 1.0
+
+    await asyncio.sleep(0.4)
+    stats = pool.get_stats()
+    assert stats["running"] == 0 and stats["timeouts"] == 1 and stats["completed"] == 1
+    pool.shutdown(wait=True)
+
+
+async def test_saturated_pool_rejects_and_cancelled_waiters_do_not_run():
+    llm = StubLLM(latency=0.2)
+    pool = _pool(llm, max_concurrent=1, max_queue=1)
+
+    first = asyncio.create_task(pool.run("support", {"task_description": "a"}))
+    await asyncio.sleep(0.02)
+    queued = asyncio.create_task(pool.run("support", {"task_description": "b"}))
+    await asyncio.sleep(0.02)
+    with pytest.raises(BulkheadFullError):
+        await pool.run("support", {"task_description": "c"})
+
+    queued.cancel()
+    assert await first == "[support] a"
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert llm.calls == 1 and pool.get_stats()["rejected"] == 1
+    pool.shutdown(wait=True)
+
+
+async def test_whatsapp_crew_uses_pool_with_stub_backend(monkeypatch):
+    monkeypatch.setattr(crew_agents, "_crewai_loaded", True)
+    monkeypatch.setattr(crew_agents, "_Agent", StubAgent)
+    monkeypatch.setattr(crew_agents, "_Task", StubTask)
+    monkeypatch.setattr(crew_agents, "_Crew", StubCrew)
+    monkeypatch.setattr(crew_agents, "_Process", SimpleNamespace(sequential="sequential", hierarchical="hierarchical"))
+    monkeypatch.setattr(StubCrew, "llm", StubLLM(latency=0.05))
+
+    crew = WhatsAppAgentCrew()
+    crew.pool = CrewWorkerPool(crew._build_role_crew, Bulkhead("crewai-e2e", BulkheadConfig(2, 10, 5.0)), 5.0)
+
+    results = await asyncio.gather(*(
+        crew.process_message("Quero agendar um corte amanhã às 10h", f"55119000000{i:02d}") for i in range(4)
+    ))
+    crew.pool.shutdown(wait=True)
+    await lead_store.stop()  # Iniciado pelo lead scoring
+
+    assert all(result["status"] == "success" for result in results)
+    assert all(result["response"].startswith("[") for result in results)
+    stats = crew.get_crew_analytics()["worker_pool"]
+    assert stats["completed"] == 4 and stats["crews_built"] <= 2
+
+
+def test_role_crews_do_not_share_agents(monkeypatch):
+    monkeypatch.setattr(crew_agents, "_Agent", StubAgent)
+    monkeypatch.setattr(crew_agents, "_Task", StubTask)
+    monkeypatch.setattr(crew_agents, "_Crew", StubCrew)
+    monkeypatch.setattr(crew_agents, "_Process", SimpleNamespace(sequential="sequential", hierarchical="hierarchical"))
+
+    crew = WhatsAppAgentCrew()
+    crew._initialize_agents()
+    first = crew._build_role_crew(crew_agents.AgentRole.SCHEDULER)
+    second = crew._build_role_crew(crew_agents.AgentRole.SCHEDULER)
+    crew.pool.shutdown(wait=True)
+
+    agents = {id(first.agents[0]), id(second.agents[0]), id(crew.agents[crew_agents.AgentRole.SCHEDULER])}
+    assert len(agents) == 3
+    assert first.tasks[0].agent is first.agents[0]
+    assert first.agents[0].role == second.agents[0].role == "Especialista em Agendamentos"
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes das métricas do dashboard (MetricsService)
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from app.models.database import Appointment, Business, Conversation, Message, Service, User
+from app.services.analytics_rollups import AnalyticsRollupService
+from app.services.data import MetricsService
+
+
+async def test_dashboard_metrics_single_query_over_rollups(database):
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    async with database("metrics.db", count_statements=True) as test_db:
+        factory, statements = test_db.session_factory, test_db.statements
+        async with factory() as db:
+            db.add(Business(id=1, name="Studio"))
+            db.add(Service(id=1, business_id=1, name="Corte", duration_minutes=30, price="R$ 50,00"))
+            db.add_all([User(id=1, wa_id="5511977770001"), User(id=2, wa_id="5511977770002")])
+            db.add_all([
+                Conversation(id=1, user_id=1, status="active"),
+                Conversation(id=2, user_id=2, status="human"),
+                Conversation(id=3, user_id=2, status="closed"),
+            ])
+            db.add_all([
+                Message(user_id=1, conversation_id=1, direction="in", created_at=today - timedelta(seconds=1)),
+                Message(user_id=1, conversation_id=1, direction="in", created_at=today),
+                Message(user_id=1, conversation_id=1, direction="out", created_at=today + timedelta(hours=23)),
+                Message(user_id=2, conversation_id=2, direction="in", created_at=today + timedelta(days=1)),
+            ])
+            db.add_all([
+                Appointment(user_id=1, business_id=1, service_id=1, date_time=today + timedelta(days=2),
+                            end_time=today + timedelta(days=2, minutes=30), status="pendente"),
+                Appointment(user_id=2, business_id=1, service_id=1, date_time=today + timedelta(days=3),
+                            end_time=today + timedelta(days=3, minutes=30), status="confirmado"),
+            ])
+            await db.commit()
+
+        # O dashboard lê as séries dos rollups, não das tabelas brutas
+        await AnalyticsRollupService(session_factory=factory).compact(until=today + timedelta(days=2))
+
+        async with factory() as db:
+            statements.clear()
+            metrics = await MetricsService.get_dashboard_metrics(db)
+
+        assert metrics == {
+            "total_users": 2,
+            "total_conversations": 3,
+            "messages_today": 2,
+            "pending_appointments": 1,
+            "human_conversations": 1,
+        }
+        assert len(statements) == 1
+        assert "date(" not in statements[0].lower()
+        assert "analytics_rollups" in statements[0] and "FROM messages" not in statements[0]
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do cálculo de disponibilidade do DynamicSchedulingService
+
+Inclui benchmark de slots/s e consultas por chamada: varredura em memória
+versus a verificação antiga de um SELECT de agendamento + um de bloqueio por slot.
+"""
+
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app.models.database import Appointment, BlockedTime, Business
+from app.services.availability_index import availability_index
+from app.services.dynamic_scheduling import DynamicSchedulingService
+
+OPEN_ALL_WEEK = {
+    day: {"open": "09:00", "close": "19:00", "closed": False}
+    for day in ["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"]
+}
+
+
+@asynccontextmanager
+async def _service(database):
+    async with database("scheduling.db", count_statements=True) as test_db:
+        async with test_db.session_factory() as session:
+            session.add(Business(id=1, name="Studio", business_hours=OPEN_ALL_WEEK))
+            await session.commit()
+            test_db.statements.clear()
+            yield DynamicSchedulingService(session, business_id=1), test_db.statements
+        availability_index.invalidate()
+
+
+def _at(day: date, hhmm: str) -> datetime:
+    return datetime.combine(day, datetime.strptime(hhmm, "%H:%M").time())
+
+
+def _appointment(day: date, start: str, end: str, status: str = "confirmado") -> Appointment:
+    return Appointment(user_id=1, business_id=1, service_id=1, status=status,
+                       date_time=_at(day, start), end_time=_at(day, end))
+
+
+def _block(day: date, start: str, end: str) -> BlockedTime:
+    return BlockedTime(business_id=1, start_date=_at(day, "00:00"), end_date=_at(day, "23:59"),
+                       start_time=_at(day, start), end_time=_at(day, end))
+
+
+async def test_slots_reflect_appointments_and_blocks(database):
+    async with _service(database) as (service, _):
+        day = date.today() + timedelta(days=7)
+        service.db_session.add_all([
+            _appointment(day, "10:00", "11:00"),
+            _appointment(day, "14:15", "14:45", status="pendente"),
+            _appointment(day, "16:00", "16:30", status="cancelado"),
+            _block(day, "12:00", "13:00"),
+            _block(day, "17:10", "17:20"),
+        ])
+        await service.db_session.commit()
+
+        slots = {slot["time_str"]: slot for slot in await service.get_available_slots(day)}
+
+        assert len(slots) == 20
+        assert slots["09:30"]["available"]
+        assert slots["10:00"]["reason"] == slots["10:30"]["reason"] == "booked"
+        assert slots["14:00"]["reason"] == slots["14:30"]["reason"] == "booked"
+        assert slots["16:00"]["available"]
+        assert slots["12:00"]["reason"] == slots["12:30"]["reason"] == "blocked"
+        assert slots["17:00"]["reason"] == "blocked"
+        assert slots["13:00"]["available"]
+
+
+async def test_booked_flags_match_per_slot_queries(database):
+    async with _service(database) as (service, _):
+        day = date.today() + timedelta(days=3)
+        service.db_session.add_all([
+            _appointment(day, "09:00", "09:20"),
+            _appointment(day, "09:40", "10:40"),
+            _appointment(day, "13:00", "13:30"),
+            _appointment(day, "15:10", "15:50"),
+            _appointment(day, "18:30", "19:00"),
+        ])
+        await service.db_session.commit()
+
+        slots = await service.get_available_slots(day)
+
+        for slot in slots:
+            legacy = await service._is_slot_booked(slot["datetime"], 30)
+            assert (slot["reason"] == "booked") == legacy, slot["time_str"]
+
+
+async def test_queries_do_not_grow_with_slots_or_days(database):
+    async with _service(database) as (service, queries):
+        start = date.today() + timedelta(days=1)
+
+        await service.get_available_slots(start)
+        cold = len(queries)
+
+        queries.clear()
+        await service.get_available_slots(start)
+        single_day = len(queries)
+
+        queries.clear()
+        week = await service.get_available_slots_for_range(start, start + timedelta(days=6))
+
+        assert cold == single_day == 4  # negócio, configuração, agendamentos e bloqueios
+        assert len(queries) == 4
+        assert len(week) == 7 and all(len(slots) == 20 for slots in week.values())
+
+
+async def test_slots_include_reschedules_and_recurring_blocks(database):
+    async with _service(database) as (service, queries):
+        day = date.today() + timedelta(days=4)
+        service.db_session.add_all([
+            _appointment(day, "09:00", "10:00", status="reagendado"),
+            BlockedTime(business_id=1, start_date=_at(day, "00:00"), end_date=_at(day + timedelta(days=30), "23:59"),
+                        start_time=_at(day, "12:00"), end_time=_at(day, "13:00"),
+                        is_recurring=True, recurrence_pattern={"type": "daily"}),
+        ])
+        await service.db_session.commit()
+
+        slots = {slot["time_str"]: slot for slot in await service.get_available_slots(day + timedelta(days=1))}
+        assert slots["12:00"]["reason"] == slots["12:30"]["reason"] == "blocked"
+        assert slots["09:00"]["available"]
+
+        slots = {slot["time_str"]: slot for slot in await service.get_available_slots(day)}
+        assert slots["09:00"]["reason"] == slots["09:30"]["reason"] == "booked"
+        assert await service._is_slot_booked(_at(day, "09:00"), 30)
+
+        service.db_session.add(_block(day, "15:00", "16:00"))
+        await service.db_session.commit()
+
+        queries.clear()
+        slots = {slot["time_str"]: slot for slot in await service.get_available_slots(day)}
+        assert slots["15:00"]["reason"] == slots["15:30"]["reason"] == "blocked"
+        assert len(queries) == 4
+
+
+async def test_slots_see_writes_that_skipped_the_local_index(database):
+    """Outro worker agenda sem passar por este processo: o banco continua sendo a fonte"""
+    async with _service(database) as (service, _):
+        day = date.today() + timedelta(days=6)
+        await availability_index.load(service.db_session, 1)
+
+        await service.db_session.execute(insert(Appointment), [{
+            "user_id": 1, "business_id": 1, "service_id": 1, "status": "confirmado",
+            "date_time": _at(day, "11:00"), "end_time": _at(day, "11:30"),
+        }])
+        await service.db_session.commit()
+
+        slots = {slot["time_str"]: slot for slot in await service.get_available_slots(day)}
+        assert slots["11:00"]["reason"] == "booked"
+
+
+def test_day_grid_follows_business_hours():
+    business = Business(id=1, name="Studio", business_hours=OPEN_ALL_WEEK)
+    grid = DynamicSchedulingService._build_day_grid(business, date.today(), 30, 0)
+
+    assert len(grid) == 20
+    assert grid[0]["time_str"] == "09:00"
+    assert grid[-1]["time_str"] == "18:30"
+
+
+@pytest.mark.load
+async def test_benchmark_availability_slots_per_second(database):
+    async with _service(database) as (service, queries):
+        day = date.today() + timedelta(days=2)
+        for hour in range(9, 19, 2):
+            service.db_session.add(_appointment(day, f"{hour:02d}:00", f"{hour:02d}:45"))
+        service.db_session.add(_block(day, "12:00", "12:30"))
+        await service.db_session.commit()
+
+        runs = 20
+
+        queries.clear()
+        started = time.perf_counter()
+        for _ in range(runs):
+            slots = await service.get_available_slots(day)
+        sweep_seconds = time.perf_counter() - started
+        sweep_queries = len(queries) / runs
+
+        queries.clear()
+        started = time.perf_counter()
+        for _ in range(runs):
+            for slot in slots:
+                await service._is_slot_booked(slot["datetime"], 30)
+                await service._is_slot_blocked(slot["datetime"], 30)
+        legacy_seconds = time.perf_counter() - started
+        legacy_queries = len(queries) / runs
+
+        assert sweep_queries == 4
+        assert legacy_queries == 2 * len(slots)
+        assert sweep_seconds < legacy_seconds
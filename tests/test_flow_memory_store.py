@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da memória do fluxo conversacional (LRU com TTL, forma compacta, Redis)
+"""
+
+import gc
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+from app.services.conversation_flow import ConversationFlowService, ConversationState
+from app.services.flow_memory_store import (
+    FlowMemoryStore, FlowMemoryStoreConfig, RedisFlowMemoryStore
+)
+
+MESSAGES = [
+    "Oi, bom dia!",
+    "Quanto custa o corte de cabelo?",
+    "Aliás, vocês aceitam pix?",
+    "Quero agendar para amanhã",
+    "Voltando ao preço, tem promoção?",
+]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SharedRedis:
+    """Redis assíncrono em processo, compartilhado entre "workers" (get/pipeline)"""
+
+    def __init__(self, data=None):
+        self.data = {} if data is None else data
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    def pipeline(self, transaction=False):
+        return _SharedPipeline(self.data)
+
+
+class _SharedPipeline:
+    def __init__(self, data):
+        self.data = data
+        self.ops = []
+
+    def setex(self, key, ttl, value):
+        self.ops.append((key, value))
+
+    def delete(self, key):
+        self.ops.append((key, None))
+
+    async def execute(self):
+        for key, value in self.ops:
+            if value is None:
+                self.data.pop(key, None)
+            else:
+                self.data[key] = value
+
+
+def _service(config=None, clock=time.monotonic, store_class=FlowMemoryStore, **kwargs):
+    services = []
+    store = store_class(lambda memory: services[0]._encode_memory(memory),
+                        lambda data: services[0]._decode_memory(data),
+                        config or FlowMemoryStoreConfig(), clock, **kwargs)
+    services.append(ConversationFlowService(store=store))
+    return services[0]
+
+
+def test_compact_form_round_trips_summary():
+    service = _service()
+    for message in MESSAGES:
+        service.process_message_flow(message, "5511900000001")
+    service.mark_topic_resolved("5511900000001", "pricing")
+    memory = service.store.get("5511900000001")
+    memory.user_preferences["barbeiro"] = "João"
+    memory.pending_questions.append("Tem estacionamento?")
+
+    encoded = service._encode_memory(memory)
+    restored = service._decode_memory(encoded)
+
+    assert restored == memory
+    assert restored.topic_history.maxlen == memory.topic_history.maxlen
+    assert "keywords" not in encoded and len(encoded) < 1200
+
+
+def test_history_window_is_bounded():
+    service = _service(FlowMemoryStoreConfig(history_window=3))
+    memory = service.store.get_or_create("5511900000001", service._new_memory)
+    memory.pending_questions.extend(f"pergunta {i}" for i in range(20))
+    for _ in range(10):
+        service.process_message_flow("Quanto custa a barba?", "5511900000001")
+
+    assert len(memory.topic_history) == 3
+    assert len(memory.pending_questions) == 3
+    assert memory.pending_questions[-1] == "pergunta 19"
+
+
+def test_idle_conversations_expire_and_store_is_capped():
+    clock = FakeClock()
+    service = _service(FlowMemoryStoreConfig(idle_ttl=60, max_local=3), clock)
+    service.process_message_flow("Oi", "5511900000001")
+    clock.now = 30
+    service.process_message_flow("Oi", "5511900000002")
+
+    clock.now = 61
+    assert service.get_conversation_summary("5511900000001") == {"status": "no_conversation"}
+    assert service.get_conversation_summary("5511900000002")["current_state"] == ConversationState.GREETING.value
+
+    for i in range(3, 7):
+        service.process_message_flow("Oi", f"551190000000{i}")
+    assert [phone for phone, _ in service.conversation_memories.items()] == [
+        "5511900000004", "5511900000005", "5511900000006"
+    ]
+    assert service.store.stats["expired"] == 1 and service.store.stats["evicted"] == 2
+
+
+@pytest.mark.load
+def test_soak_memory_stays_flat_for_a_million_phones():
+    clock = FakeClock()
+    service = _service(FlowMemoryStoreConfig(idle_ttl=60, max_local=20000), clock)
+    store, new_memory = service.store, service._new_memory
+    history_entry = {"topic_id": "pricing", "state": ConversationState.PRICING,
+                     "timestamp": None, "message_preview": "Quanto custa o corte?"}
+
+    started = time.perf_counter()
+    samples = {}
+    for i in range(1_000_000):
+        clock.now += 0.001
+        phone = f"55{i:011d}"
+        memory = store.get_or_create(phone, new_memory)
+        memory.topic_history.append(dict(history_entry))
+        store.save(phone, memory)
+        if i + 1 in (100_000, 1_000_000):
+            gc.collect()
+            samples[i + 1] = sys.getallocatedblocks()
+    per_message = (time.perf_counter() - started) / 1_000_000
+
+    assert len(store) == 20000
+    assert samples[1_000_000] < samples[100_000] * 1.1
+    assert per_message < 0.0001
+
+
+async def test_redis_reads_happen_in_prefetch_not_in_the_sync_flow():
+    clock = FakeClock()
+    config = FlowMemoryStoreConfig(backend="redis", local_ttl=5.0)
+    shared = {}
+    worker_a = _service(config, clock, RedisFlowMemoryStore, async_client=SharedRedis(shared))
+    redis_b = SharedRedis(shared)
+    worker_b = _service(config, clock, RedisFlowMemoryStore, async_client=redis_b)
+    phone = "5511999990000"
+
+    worker_a.process_message_flow("Quanto custa o corte?", phone)
+    assert await worker_a.store.flush() == 1
+
+    # Sem prefetch o passo síncrono só enxerga o cache local
+    assert worker_b.get_conversation_summary(phone) == {"status": "no_conversation"}
+    assert redis_b.gets == 0
+
+    await worker_b.prefetch_memory(phone)
+    worker_b.process_message_flow("Quero agendar amanhã", phone)
+    assert redis_b.gets == 1
+    assert set(worker_b.get_conversation_summary(phone)["active_topics"]) >= {"pricing", "scheduling"}
+
+    # Alteração pendente ou cópia recente: prefetch não vai ao Redis
+    await worker_b.prefetch_memory(phone)
+    await worker_b.store.flush()
+    await worker_b.prefetch_memory(phone)
+    assert redis_b.gets == 1
+
+    # Cópia local velha é relida
+    clock.now += 10
+    await worker_a.prefetch_memory(phone)
+    assert worker_a.get_conversation_summary(phone)["current_state"] == ConversationState.SCHEDULING.value
+    await worker_a.store.stop()
+    await worker_b.store.stop()
+
+
+async def test_prefetch_keeps_local_copy_when_redis_fails():
+    class BrokenRedis(SharedRedis):
+        async def get(self, key):
+            raise ConnectionError("redis indisponível")
+
+    clock = FakeClock()
+    service = _service(FlowMemoryStoreConfig(backend="redis", local_ttl=0), clock, RedisFlowMemoryStore,
+                       async_client=BrokenRedis())
+    service.process_message_flow("Quanto custa o corte?", "5511999990001")
+    service.store._dirty.clear()  # Como se já tivesse sido gravada
+
+    await service.prefetch_memory("5511999990001")
+    assert service.store.stats["redis_errors"] == 1
+    assert "pricing" in service.get_conversation_summary("5511999990001")["active_topics"]
+
+
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="TEST_REDIS_URL não definido")
+async def test_redis_backend_shares_state_between_workers():
+    config = FlowMemoryStoreConfig(backend="redis", redis_url=os.environ["TEST_REDIS_URL"], local_ttl=0)
+    worker_a = _service(config, store_class=RedisFlowMemoryStore)
+    worker_b = _service(config, store_class=RedisFlowMemoryStore)
+    phone = f"test-{uuid.uuid4().hex}"
+    try:
+        worker_a.process_message_flow("Quanto custa o corte?", phone)
+        await worker_b.prefetch_memory(phone)
+        assert worker_b.get_conversation_summary(phone) == {"status": "no_conversation"}
+
+        assert await worker_a.store.flush() == 1
+        await worker_b.prefetch_memory(phone)
+        worker_b.process_message_flow("Quero agendar amanhã", phone)
+        await worker_b.store.flush()
+
+        await worker_a.prefetch_memory(phone)
+        summary = worker_a.get_conversation_summary(phone)
+        assert summary["current_state"] == ConversationState.SCHEDULING.value
+        assert set(summary["active_topics"]) >= {"pricing", "scheduling"}
+        assert await worker_a.store.async_client.ttl(f"flow_memory:{phone}") > 0
+    finally:
+        worker_a.reset_conversation(phone)
+        await worker_a.store.stop()
+        await worker_b.store.stop()
+        await worker_a.store.async_client.aclose()
+        await worker_b.store.async_client.aclose()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do get-or-create de usuário/conversa com upsert e cache quente
+"""
+
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.models.database import Conversation, User
+from app.services.data import ConversationService, UserService
+from app.services.identity_cache import identity_cache
+
+CONCURRENT_FIRST_MESSAGES = 50
+
+
+async def test_miss_is_one_statement_and_hit_is_zero(database):
+    async with database("identity.db", count_statements=True, connect_args={"timeout": 30}) as test_db:
+        async with test_db.session() as db:
+            test_db.statements.clear()
+            user = await UserService.get_or_create_user(db, "5511999990001", nome="Ana")
+            conversation = await ConversationService.get_or_create_conversation(db, user.id)
+            assert len(test_db.statements) == 2
+            assert user.nome == "Ana" and conversation.status == "active"
+
+        async with test_db.session() as db:
+            test_db.statements.clear()
+            cached_user = await UserService.get_or_create_user(db, "5511999990001")
+            cached_conversation = await ConversationService.get_or_create_conversation(db, cached_user.id)
+            assert test_db.statements == []
+            assert (cached_user.id, cached_conversation.id) == (user.id, conversation.id)
+            assert cached_user in db and cached_conversation in db
+
+
+async def test_existing_rows_are_returned_without_cache(database):
+    async with database("identity.db", count_statements=True, connect_args={"timeout": 30}) as test_db:
+        async with test_db.session() as db:
+            user = await UserService.get_or_create_user(db, "5511999990002", nome="Bia")
+            conversation = await ConversationService.get_or_create_conversation(db, user.id)
+
+        identity_cache.clear()
+        async with test_db.session() as db:
+            again = await UserService.get_or_create_user(db, "5511999990002", nome="Outro nome")
+            assert again.id == user.id and again.nome == "Bia"
+            assert (await ConversationService.get_or_create_conversation(db, user.id)).id == conversation.id
+
+
+async def test_concurrent_first_messages_create_one_user_and_one_conversation(database):
+    async with database("identity.db", count_statements=True, connect_args={"timeout": 30}) as test_db:
+        async def first_message():
+            async with test_db.session() as db:
+                user = await UserService.get_or_create_user(db, "5511999990003")
+                conversation = await ConversationService.get_or_create_conversation(db, user.id)
+                return user.id, conversation.id
+
+        results = await asyncio.gather(*(first_message() for _ in range(CONCURRENT_FIRST_MESSAGES)))
+
+        assert len(set(results)) == 1
+        async with test_db.session() as db:
+            assert await db.scalar(select(func.count()).select_from(User)) == 1
+            assert await db.scalar(select(func.count()).select_from(Conversation)) == 1
+
+
+async def test_closing_conversation_invalidates_cache(database):
+    async with database("identity.db", count_statements=True, connect_args={"timeout": 30}) as test_db:
+        async with test_db.session() as db:
+            user = await UserService.get_or_create_user(db, "5511999990004")
+            conversation = await ConversationService.get_or_create_conversation(db, user.id)
+            await ConversationService.update_conversation_status(db, conversation.id, "closed")
+
+            new_conversation = await ConversationService.get_or_create_conversation(db, user.id)
+            assert new_conversation.id != conversation.id
+            assert new_conversation.status == "active"
+
+
+async def test_update_user_info_invalidates_cache(database):
+    async with database("identity.db", count_statements=True, connect_args={"timeout": 30}) as test_db:
+        async with test_db.session() as db:
+            user = await UserService.get_or_create_user(db, "5511999990005")
+            await UserService.update_user_info(db, user.id, nome="Carla")
+
+        async with test_db.session() as db:
+            assert (await UserService.get_or_create_user(db, "5511999990005")).nome == "Carla"
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da execução especulativa do HybridLLMCrewService (race, fast-with-fallback, both)
+"""
+
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-hybrid-speculation-0000")
+
+from app.services.bulkhead import Bulkhead, BulkheadConfig
+from app.services.crew_pool import CrewWorkerPool
+from app.services.hybrid_llm_crew import HybridLLMCrewService
+
+GOOD_ANSWER = "Temos horários amanhã às 10h e às 15h para corte. Qual fica melhor para você?"
+
+
+def _llm_response(text=GOOD_ANSWER, confidence=0.9):
+    return SimpleNamespace(text=text, intent="schedule", confidence=confidence, interactive_buttons=None,
+                           suggested_actions=[{"type": "show_slots"}], metadata={"response_time": 0.4})
+
+
+class FakeLLM:
+    def __init__(self, latency=0.0, response=None):
+        self.latency = latency
+        self.response = response or _llm_response()
+        self.calls = 0
+
+    async def process_message(self, user_id, conversation_id, message, message_type):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.response
+
+
+class FakeCrew:
+    def __init__(self, latency, response=GOOD_ANSWER, success=True):
+        self.latency = latency
+        self.response = response
+        self.success = success
+        self.calls = 0
+        self.cancelled = 0
+
+    async def process_message(self, message, user_phone, context=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"success": self.success, "response": self.response, "agent_used": "scheduler"}
+
+
+class PoolCrew:
+    """CrewAI cujo kickoff roda no CrewWorkerPool, como no WhatsAppAgentCrew"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def process_message(self, message, user_phone, context=None):
+        text = await self.pool.run("scheduler", {"task_description": message})
+        return {"success": True, "response": text, "agent_used": "scheduler"}
+
+
+def _service(mode, llm, crew, threshold=60.0):
+    service = HybridLLMCrewService(speculation_mode=mode, quality_threshold=threshold)
+    service.llm_service = llm
+    service.crew_service = crew
+    return service
+
+
+async def _hybrid(service, analysis_response=None):
+    analysis = {"llm_response": analysis_response}
+    started = time.perf_counter()
+    result = await service._process_hybrid("5511900000001", "c1", "Quero agendar amanhã", "text", analysis)
+    return result, time.perf_counter() - started
+
+
+async def test_race_with_gated_analysis_answer_never_starts_crew():
+    llm, crew = FakeLLM(), FakeCrew(latency=1.0)
+    service = _service("race", llm, crew)
+
+    result, elapsed = await _hybrid(service, analysis_response=_llm_response())
+
+    assert result["response"] == GOOD_ANSWER and result["chosen_source"] == "llm_passed_gate"
+    assert elapsed < 0.1 and crew.calls == 0
+    assert llm.calls == 0  # Reaproveita a resposta da análise inicial
+    comparison = result["hybrid_comparison"]
+    assert comparison["quality_gate"] == {"llm": True} and not comparison["crew_started"]
+    assert comparison["cancelled"] == [] and comparison["wasted_work_ratio"] == 0.0
+    stats = service.get_speculation_stats()
+    assert stats["turns"] == 1 and stats["gate_passed"] == 1 and stats["wasted_seconds"] == 0.0
+
+
+@pytest.mark.parametrize("level", ["deferred", "unavailable"])
+async def test_degraded_analysis_is_not_a_fast_answer(level):
+    """Mensagem de retorno da escada (adiado/indisponível) não vence: o CrewAI responde"""
+    fallback = _llm_response(text="Desculpe, não consegui responder agora.", confidence=1.0)
+    fallback.metadata["degradation_level"] = level
+    llm, crew = FakeLLM(response=fallback), FakeCrew(latency=0.01)
+    service = _service("race", llm, crew)
+
+    result, _ = await _hybrid(service, analysis_response=fallback)
+
+    assert result["response"] == GOOD_ANSWER and result["chosen_source"] == "crew_passed_gate"
+    assert llm.calls == 0 and crew.calls == 1
+    comparison = result["hybrid_comparison"]
+    assert comparison["crew_started"] and comparison["quality_gate"] == {"llm": False, "crew": True}
+
+
+async def test_cancelled_crew_waste_counts_until_kickoff_thread_finishes():
+    def build(role):
+        return SimpleNamespace(kickoff=lambda inputs=None: time.sleep(0.3) or "crew")
+
+    pool = CrewWorkerPool(build, Bulkhead("crewai-speculation", BulkheadConfig(1, 5, 5.0)), 5.0)
+    service = _service("race", FakeLLM(latency=0.05), PoolCrew(pool))
+
+    result, elapsed = await _hybrid(service)
+
+    comparison = result["hybrid_comparison"]
+    assert result["chosen_source"] == "llm_passed_gate" and elapsed < 0.2
+    assert comparison["cancelled"] == ["crew"] and comparison["crew_threads_running"] == 1
+    # A thread segue no kickoff: o desperdício só fecha quando ela termina
+    assert service.get_speculation_stats()["wasted_seconds"] < 0.1
+    await asyncio.sleep(0.35)
+    assert service.get_speculation_stats()["wasted_seconds"] == pytest.approx(0.3, abs=0.05)
+    assert pool.get_stats()["running"] == 0
+    pool.shutdown(wait=True)
+
+
+def test_zero_quality_threshold_is_kept():
+    assert _service("race", FakeLLM(), FakeCrew(latency=0), threshold=0).quality_threshold == 0
+
+
+async def test_race_lets_slower_llm_lose_to_gated_crew():
+    llm, crew = FakeLLM(latency=0.5), FakeCrew(latency=0.05)
+    service = _service("race", llm, crew)
+
+    result, elapsed = await _hybrid(service)
+
+    assert result["agent_used"] == "scheduler" and result["chosen_source"] == "crew_passed_gate"
+    assert elapsed < 0.3 and result["hybrid_comparison"]["cancelled"] == ["llm"]
+
+
+async def test_fast_with_fallback_waits_for_crew_when_llm_fails_gate():
+    weak = _llm_response(text="Ok", confidence=0.1)
+    weak.suggested_actions = []
+    llm, crew = FakeLLM(), FakeCrew(latency=0.1)
+    service = _service("fast-with-fallback", llm, crew)
+
+    result, _ = await _hybrid(service, analysis_response=weak)
+
+    assert result["chosen_source"] == "crew_passed_gate" and crew.cancelled == 0
+    assert result["hybrid_comparison"]["quality_gate"] == {"llm": False, "crew": True}
+
+    # Mesmo com o CrewAI terminando antes, a resposta do LLM aprovada vale
+    llm, crew = FakeLLM(latency=0.2), FakeCrew(latency=0.01)
+    service = _service("fast-with-fallback", llm, crew)
+    result, _ = await _hybrid(service)
+    assert result["chosen_source"] == "llm_passed_gate" and not result["hybrid_comparison"]["cancelled"]
+
+
+async def test_both_waits_for_every_path_and_records_waste():
+    llm, crew = FakeLLM(), FakeCrew(latency=0.2, success=False)
+    service = _service("both", llm, crew)
+
+    result, elapsed = await _hybrid(service, analysis_response=_llm_response())
+
+    assert elapsed >= 0.2 and crew.cancelled == 0
+    assert result["chosen_source"] == "llm_better_quality"
+    assert result["hybrid_comparison"]["quality_gate"] == {"llm": True, "crew": False}
+    assert service.get_speculation_stats()["wasted_work_ratio"] > 0.9
+
+
+@pytest.mark.load
+async def test_benchmark_race_vs_both():
+    turns = 20
+
+    async def run(mode):
+        service = _service(mode, FakeLLM(latency=0.01), FakeCrew(latency=0.2))
+        started = time.perf_counter()
+        await asyncio.gather(*(_hybrid(service) for _ in range(turns)))
+        return (time.perf_counter() - started), service.get_speculation_stats()
+
+    race_time, race_stats = await run("race")
+    both_time, both_stats = await run("both")
+
+    assert race_time < both_time / 3
+    assert race_stats["wasted_seconds"] < both_stats["wasted_seconds"]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da paginação por keyset (conversas e agendamentos)
+"""
+
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.models.database import Appointment, Business, Conversation, Message, Service, User
+from app.services.data import AppointmentService, ConversationService
+from app.utils.pagination import decode_cursor, encode_cursor
+
+NOW = datetime(2026, 10, 18, 15, 0, tzinfo=timezone.utc)
+
+
+@asynccontextmanager
+async def _studio(database):
+    async with database("pages.db", count_statements=True) as test_db:
+        await _seed(test_db.session_factory)
+        yield test_db.session_factory, test_db.statements
+
+
+async def _seed(factory):
+    async with factory() as db:
+        db.add(Business(id=1, name="Studio"))
+        db.add(Service(id=1, business_id=1, name="Corte", duration_minutes=30, price="R$ 50,00"))
+        db.add_all([User(id=i, wa_id=f"55119555500{i:02d}", nome=f"Cliente {i}") for i in range(1, 10)])
+        # Empates em last_message_at: a ordem é desempatada pelo id
+        db.add_all([
+            Conversation(id=i, user_id=i, status="closed", last_message_at=NOW - timedelta(minutes=i // 2))
+            for i in range(1, 8)
+        ])
+        # Sem last_message_at: vêm depois de todas, por id decrescente
+        db.add_all([Conversation(id=i, user_id=i, status="closed") for i in (8, 9)])
+        db.add_all([
+            Message(user_id=1, conversation_id=1, direction="in", content="oi", created_at=NOW - timedelta(minutes=2)),
+            Message(user_id=1, conversation_id=1, direction="out", content="Olá! " + "x" * 200, created_at=NOW),
+        ])
+        db.add_all([
+            Appointment(id=i, user_id=i, business_id=1, service_id=1, status="pendente" if i % 2 else "confirmado",
+                        date_time=NOW + timedelta(hours=i // 2), end_time=NOW + timedelta(hours=i // 2, minutes=30))
+            for i in range(1, 8)
+        ])
+        await db.commit()
+        await db.execute(update(Conversation).where(Conversation.id.in_([8, 9])).values(last_message_at=None))
+        await db.commit()
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    values = (NOW, 42)
+    assert decode_cursor(encode_cursor(values), (datetime, int)) == values
+    assert decode_cursor(encode_cursor([None, 7]), ((datetime, type(None)), int)) == (None, 7)
+    assert decode_cursor(None, (datetime, int)) is None
+    for token in ("não-é-cursor", encode_cursor([1, 2, 3]), encode_cursor(["ontem", 1]),
+                  encode_cursor([NOW, "1"]), encode_cursor([NOW, True]), encode_cursor([{"dt": 5}, 1]),
+                  encode_cursor([{"dt": "amanhã"}, 1]), encode_cursor([None, 1])):
+        with pytest.raises(ValueError):
+            decode_cursor(token, (datetime, int))
+
+
+async def test_conversation_pages_are_stable_and_constant_cost(database):
+    async with _studio(database) as (factory, statements):
+        async with factory() as db:
+            ids, cursor, per_page = [], None, []
+            while True:
+                statements.clear()
+                page = await ConversationService.get_conversations_page(db, limit=3, cursor=cursor)
+                per_page.append(len(statements))
+                ids.extend(item["id"] for item in page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+
+            first = (await ConversationService.get_conversations_for_dashboard(db, limit=1))[0]
+
+        # Mais recentes primeiro; no empate, maior id primeiro; sem data no fim
+        assert ids == [1, 3, 2, 5, 4, 7, 6, 9, 8]
+        # Só a página em que a faixa com data acaba consulta também a cauda sem data
+        assert per_page == [1, 1, 2]
+        assert first["message_count"] == 2 and first["unread_count"] == 1
+        assert first["last_message"]["direction"] == "out"
+        assert len(first["last_message"]["preview"]) == 120
+        assert first["user"] == {"id": 1, "nome": "Cliente 1", "telefone": None, "wa_id": "5511955550001"}
+
+
+async def test_appointment_pages_follow_date_order_and_filters(database):
+    async with _studio(database) as (factory, statements):
+        async with factory() as db:
+            first = await AppointmentService.get_appointments_page(db, limit=4)
+            second = await AppointmentService.get_appointments_page(db, limit=4, cursor=first["next_cursor"])
+            pending = await AppointmentService.get_appointments_page(
+                db, limit=10, status="pendente", start=NOW + timedelta(hours=1)
+            )
+
+            newest = await AppointmentService.get_all_appointments(db, limit=3)
+            with pytest.raises(ValueError):
+                await AppointmentService.get_appointments_page(db, cursor="???")
+            with pytest.raises(ValueError):
+                await AppointmentService.get_appointments_page(db, cursor=encode_cursor([{"x": 1}, "a"]))
+
+        assert [a["id"] for a in first["items"] + second["items"]] == [1, 2, 3, 4, 5, 6, 7]
+        assert second["next_cursor"] is None
+        assert first["items"][0]["service"]["name"] == "Corte"
+        assert [a["id"] for a in pending["items"]] == [3, 5, 7]
+        assert [a["id"] for a in newest] == [7, 6, 5]
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do armazenamento de leads (conjunto quente, índice incremental, SQLite)
+"""
+
+import random
+import time
+from datetime import datetime
+
+import pytest
+
+from app.services.lead_scoring import LeadCategory, LeadScore, LeadScoringService
+from app.services.lead_store import LeadProfileUnavailable, LeadStore, LeadStoreConfig
+
+
+def _score(value):
+    category = next(c for limit, c in ((30, "cold"), (60, "warm"), (80, "hot"), (95, "qualified"), (100, "opportunity"))
+                    if value <= limit)
+    return LeadScore(total_score=value, category=LeadCategory(category), factors={}, recommendations=[],
+                     priority_level=1, confidence=0.5, next_actions=[], estimated_value=value * 2,
+                     conversion_probability=value / 100)
+
+
+def _brute_force(latest):
+    """Analytics e top-N recalculados do zero, como antes"""
+    scores = list(latest.values())
+    return {
+        "total_leads": len(scores),
+        "average_score": sum(scores) / len(scores),
+        "highest_score": max(scores),
+        "lowest_score": min(scores),
+        "category_distribution": {c.value: sum(1 for s in scores if _score(s).category == c) for c in LeadCategory},
+        "hot_leads": len([s for s in scores if s >= 61]),
+        "qualified_leads": len([s for s in scores if s >= 81]),
+        "opportunities": len([s for s in scores if s >= 96]),
+    }
+
+
+def _store(session_factory, hot_set_size=1000):
+    return LeadStore(LeadStoreConfig(hot_set_size=hot_set_size), session_factory=session_factory)
+
+
+def test_index_matches_recomputation_after_updates():
+    store = LeadStore(LeadStoreConfig(hot_set_size=5))
+    store.index.add_categories(c.value for c in LeadCategory)
+    rnd = random.Random(7)
+    latest = {}
+    for _ in range(2000):
+        phone = f"55119{rnd.randint(0, 300):08d}"
+        latest[phone] = float(rnd.randint(0, 100))
+        store.put(phone, None, _score(latest[phone]), {})
+
+    analytics = store.index.analytics()
+    expected = _brute_force(latest)
+    assert analytics.pop("average_score") == pytest.approx(expected.pop("average_score"))
+    assert analytics == expected
+    assert [s.score for s in store.index.top(10)] == sorted(latest.values(), reverse=True)[:10]
+    assert len(store.hot) == 5 and store.stats["evictions"] > 0
+
+
+async def test_profiles_survive_eviction_and_restart(database):
+    async with database("leads.db") as test_db:
+        factories = test_db.session_factory
+        service = LeadScoringService(store=_store(factories, hot_set_size=2))
+        await service.score_lead("Oi, quanto custa o corte?", "5511900000001", {"total_spent": 120.0})
+        await service.score_lead("Quero agendar hoje, é urgente", "5511900000002")
+        await service.score_lead("Olá", "5511900000003")
+
+        # Fora do conjunto quente, ainda não gravado: vem da fila de gravação
+        assert "5511900000001" not in service.lead_database
+        await service.score_lead("Posso marcar amanhã?", "5511900000001")
+        assert await service.store.flush() == 3
+
+        # Fora do conjunto quente e já gravado: vem do banco
+        await service.score_lead("Oi", "5511900000002")
+        await service.score_lead("Oi", "5511900000003")
+        await service.score_lead("Tem horário sábado?", "5511900000001")
+        assert service.store.stats["db_loads"] == 3
+        await service.store.stop()
+
+        restarted = LeadScoringService(store=_store(factories))
+        assert await restarted.store.refresh() == 3
+        reloaded, original = restarted.get_lead_analytics(), service.get_lead_analytics()
+        assert reloaded.pop("average_score") == pytest.approx(original.pop("average_score"))
+        assert reloaded == original
+        assert restarted.get_top_leads(3) == service.get_top_leads(3)
+
+        await restarted.score_lead("Quanto fica a barba?", "5511900000001")
+        profile = restarted.lead_database["5511900000001"]["profile"]
+        assert profile.total_interactions == 4
+        assert profile.total_spent == 120.0
+        assert len(profile.interaction_history) == 4
+        await restarted.store.stop()
+
+
+async def test_unreadable_profile_is_not_overwritten(database):
+    async with database("leads.db") as test_db:
+        factories = test_db.session_factory
+        service = LeadScoringService(store=_store(factories, hot_set_size=1))
+        await service.score_lead("Oi, quanto custa o corte?", "5511900000001", {"total_spent": 120.0})
+        await service.score_lead("Olá", "5511900000002")
+        await service.store.flush()
+
+        def broken_session():
+            raise ConnectionError("banco fora do ar")
+
+        service.store.session_factory = broken_session
+        with pytest.raises(LeadProfileUnavailable):
+            await service.store.load_profile("5511900000001")
+
+        # Pontua com perfil provisório, mas não enfileira nada por cima do gravado
+        lead_score = await service.score_lead("Quero agendar", "5511900000001")
+        assert lead_score.total_score > 0
+        assert service.store.get_stats()["pending"] == 0 and service.store.stats["load_errors"] == 2
+
+        service.store.session_factory = factories
+        await service.score_lead("Quero agendar", "5511900000001")
+        profile = service.lead_database["5511900000001"]["profile"]
+        assert profile.total_interactions == 2 and profile.total_spent == 120.0
+        await service.store.stop()
+
+
+async def test_refresh_applies_changes_from_other_workers(database):
+    async with database("leads.db") as test_db:
+        factories = test_db.session_factory
+        worker_a, worker_b = _store(factories), _store(factories)
+        worker_b.put("5511900000001", "perfil antigo", _score(20), {"phone": "5511900000001"})
+        await worker_b.flush()
+
+        worker_a.put("5511900000001", "perfil", _score(20), {"phone": "5511900000001"})
+        worker_a.put("5511900000002", "perfil", _score(90), {"phone": "5511900000002"})
+        await worker_a.flush()
+        worker_a.put("5511900000001", "perfil", _score(70), {"phone": "5511900000001"})
+        await worker_a.flush()
+
+        await worker_b.refresh()
+        # O tique de fundo também pode ter aplicado parte das alterações
+        assert worker_b.stats["refreshed"] == 2
+        assert worker_b.get("5511900000001") is None  # Perfil quente desatualizado descartado
+        assert worker_b.index.analytics() == worker_a.index.analytics()
+
+        # Leitura incremental: sem alterações novas, nada muda
+        assert await worker_b.refresh() == 0
+        await worker_a.stop()
+        await worker_b.stop()
+
+
+@pytest.mark.load
+def test_benchmark_analytics_and_top_leads():
+    store = LeadStore(LeadStoreConfig(hot_set_size=1000))
+    rnd = random.Random(3)
+    legacy = {}
+    for i in range(20000):
+        phone = f"55119{i:08d}"
+        lead_score = _score(float(rnd.randint(0, 100)))
+        store.put(phone, None, lead_score, {})
+        legacy[phone] = {"last_score": lead_score, "last_updated": datetime.now()}
+
+    def legacy_queries():
+        scores = [data["last_score"].total_score for data in legacy.values()]
+        categories = [data["last_score"].category.value for data in legacy.values()]
+        {category.value: categories.count(category.value) for category in LeadCategory}
+        sorted(legacy.items(), key=lambda item: item[1]["last_score"].total_score, reverse=True)[:10]
+        return sum(scores) / len(scores)
+
+    rounds = 20
+    started = time.perf_counter()
+    for _ in range(rounds):
+        legacy_queries()
+    per_legacy = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        store.index.analytics()
+        store.index.top(10)
+    per_index = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for i in range(2000):
+        store.put(f"55119{i:08d}", None, _score(float(rnd.randint(0, 100))), {})
+    per_put = (time.perf_counter() - started) / 2000
+
+    assert per_index < 0.001 and per_index < per_legacy / 100
+    assert per_put < 0.001
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do armazenamento de contextos do AdvancedLLMService (LRU, tique de expiração, Redis)
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-context-store-000000000")
+
+from app.services.llm_advanced import (
+    ConversationContext, ConversationState, ConversationStateManager, Intent, IntentType,
+    context_from_json, context_to_json
+)
+from app.services.llm_context_store import BoundedDict, LLMContextStore, LLMContextStoreConfig
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Subconjunto do redis.asyncio usado pelo store (pipeline, getdel)"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def pipeline(self, transaction=False):
+        redis, commands = self, []
+
+        class Pipeline:
+            def setex(self, key, ttl, value):
+                commands.append(("setex", key, ttl, value))
+
+            def delete(self, key):
+                commands.append(("delete", key))
+
+            async def execute(self):
+                for command in commands:
+                    if command[0] == "setex":
+                        redis.data[command[1]] = command[3].encode()
+                        redis.ttls[command[1]] = command[2]
+                    else:
+                        redis.data.pop(command[1], None)
+
+        return Pipeline()
+
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+
+
+def _manager(clock=None, redis=None, **config):
+    store = LLMContextStore(context_to_json, context_from_json, LLMContextStoreConfig(**config),
+                            clock or time.monotonic, redis_client=redis)
+    return ConversationStateManager(store)
+
+
+def _context(user_id="5511900000001"):
+    context = ConversationContext(
+        user_id=user_id,
+        conversation_id=user_id,
+        state=ConversationState.COLLECTING_INFO,
+        current_intent=Intent(IntentType.SCHEDULE_CREATE, 0.9, {"service": "corte"}, ["date", "time"]),
+        collected_data={"date": "2026-10-20"},
+        message_history=[{"role": "user", "content": "Quero marcar", "timestamp": datetime.now().isoformat()}],
+        metadata={"last_function_result": {"success": True}}
+    )
+    return context
+
+
+def test_context_round_trips():
+    context = _context()
+    assert context_from_json(context_to_json(context)) == context
+
+
+async def test_capacity_eviction_spills_and_rehydrates_lazily():
+    redis = FakeRedis()
+    manager = _manager(redis=redis, max_resident=2, spill_ttl=600)
+    first = _context("5511900000001")
+    manager.update_context(first)
+    manager.get_context("5511900000002", "5511900000002")
+    manager.get_context("5511900000003", "5511900000003")
+
+    assert "5511900000001_5511900000001" not in manager.contexts
+    # Ainda na fila: volta sem ir ao Redis
+    assert await manager.load_context("5511900000001", "5511900000001") is first
+
+    manager.get_context("5511900000004", "5511900000004")
+    assert await manager.store.flush() == 2
+    manager.get_context("5511900000005", "5511900000005")
+    assert await manager.store.flush() == 1
+    assert redis.ttls["llm_context:5511900000001_5511900000001"] == 600
+
+    restored = await manager.load_context("5511900000001", "5511900000001")
+    assert restored == first and restored is not first
+    assert "llm_context:5511900000001_5511900000001" not in redis.data
+    assert len(manager.contexts) == 2
+
+    stats = manager.store.get_stats()
+    assert stats["resident"] == 2 and stats["evicted_capacity"] == 5 and stats["rehydrated"] == 2
+
+
+async def test_idle_tick_only_touches_expired_head():
+    clock = FakeClock()
+    redis = FakeRedis()
+    manager = _manager(clock, redis, idle_ttl=60)
+    for i in range(10):
+        clock.now = i * 10
+        manager.get_context(f"user{i}", "c")
+
+    clock.now = 125  # user0..user6 ociosos há mais de 60s
+    manager.get_context("user2", "c")
+    assert manager.store.expire() == 6
+    assert [key for key, _ in manager.contexts.items()] == ["user7_c", "user8_c", "user9_c", "user2_c"]
+
+    await manager.store.flush()
+    assert len(redis.data) == 6
+    assert (await manager.load_context("user0", "c")).user_id == "user0"
+
+
+async def test_clear_removes_spilled_copy_and_without_redis_evictions_are_dropped():
+    redis = FakeRedis()
+    manager = _manager(redis=redis, max_resident=1)
+    manager.get_context("a", "1")
+    manager.get_context("b", "1")
+    await manager.store.flush()
+    assert "llm_context:a_1" in redis.data
+
+    assert manager.clear_context("a", "1") is False
+    await manager.store.flush()
+    assert "llm_context:a_1" not in redis.data
+    assert (await manager.load_context("a", "1")).state == ConversationState.INITIAL
+
+    local = _manager(max_resident=1)
+    local.get_context("a", "1")
+    local.get_context("b", "1")
+    assert local.store.get_stats()["dropped"] == 1 and local.store.get_stats()["spill_pending"] == 0
+
+
+def test_bounded_dict_keeps_most_recent_writes():
+    cache = BoundedDict(3)
+    for i in range(5):
+        cache[f"k{i}"] = i
+    cache["k2"] = 20
+    assert list(cache.items()) == [("k3", 3), ("k4", 4), ("k2", 20)]
+
+
+@pytest.mark.load
+def test_benchmark_idle_tick_vs_full_scan():
+    clock = FakeClock()
+    manager = _manager(clock, max_resident=200_000, idle_ttl=1800)
+    legacy = {}
+    for i in range(100_000):
+        clock.now = i * 0.01
+        context = manager.get_context(f"55119{i:08d}", "c")
+        legacy[f"55119{i:08d}_c"] = context
+
+    clock.now = 10 + 1800  # 1% dos contextos expirou
+    started = time.perf_counter()
+    expired = manager.store.expire()
+    per_tick = time.perf_counter() - started
+
+    cutoff = datetime.now() - timedelta(hours=2)
+    started = time.perf_counter()
+    old = [key for key, ctx in legacy.items() if ctx.updated_at < cutoff]
+    per_scan = time.perf_counter() - started
+
+    assert expired == 1000 and old == []  # Pela hora de parede nada tem 2h: a varredura percorre tudo à toa
+    assert per_tick < per_scan
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da escada de degradação do AdvancedLLMService com um LLM falso lento
+"""
+
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-degradation-0000000000")
+
+from app.services import llm_advanced
+from app.services.llm_advanced import AdvancedLLMService, PromptTemplate
+from app.services.llm_degradation import DegradationConfig, DegradationLadder, DegradationLevel
+
+
+class SlowFakeLLM:
+    """Cliente OpenAI falso cuja latência depende de max_tokens"""
+
+    def __init__(self, full_delay: float, reduced_delay: float, reduced_max_tokens: int = 150):
+        self.full_delay = full_delay
+        self.reduced_delay = reduced_delay
+        self.reduced_max_tokens = reduced_max_tokens
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens, **kwargs):
+        self.calls.append(max_tokens)
+        reduced = max_tokens <= self.reduced_max_tokens
+        await asyncio.sleep(self.reduced_delay if reduced else self.full_delay)
+        content = json.dumps({"intent": "general_info", "confidence": 0.9}) if max_tokens == 300 else "resposta"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        )
+
+
+@pytest.fixture
+def service(monkeypatch):
+    async def static_prompt(user_message: str = "", **kwargs):
+        return "Você é um assistente."
+
+    monkeypatch.setattr(PromptTemplate, "get_system_base_with_database", staticmethod(static_prompt))
+    monkeypatch.setattr(llm_advanced.cost_tracker, "track_usage", lambda **kwargs: None)
+
+    svc = AdvancedLLMService()
+    svc._start_cleanup_on_first_use = False
+    svc.degradation_ladder = DegradationLadder(DegradationConfig(
+        slo_seconds=1.0, full_timeout=0.3, reduced_timeout=0.2, template_timeout=0.2
+    ))
+    return svc
+
+
+def _use_llm(svc, llm):
+    svc.intent_detector.client = llm
+    svc.data_collector.client = llm
+    svc.response_generator.client = llm
+
+
+async def test_fast_llm_uses_full_generation(service):
+    _use_llm(service, SlowFakeLLM(full_delay=0.0, reduced_delay=0.0))
+
+    response = await service.process_message("5511999990000", "1", "Olá!")
+
+    assert response.metadata["degradation_level"] == "full"
+    assert service.degradation_ladder.metrics["full"]["success"] == 1
+
+
+async def test_slow_llm_falls_back_to_reduced_generation(service):
+    llm = SlowFakeLLM(full_delay=1.0, reduced_delay=0.01)
+    _use_llm(service, llm)
+
+    response = await service.process_message("5511999990001", "1", "Quero agendar")
+
+    assert response.metadata["degradation_level"] == "reduced"
+    assert llm.calls[-1] == service.degradation_ladder.config.reduced_max_tokens
+    assert service.degradation_ladder.metrics["full"]["timeout"] == 1
+    # O degrau abandonado é cancelado e devolve a vaga do limitador
+    assert llm_advanced.openai_concurrency_limiter.in_flight == 0
+
+
+async def test_unavailable_llm_answers_from_business_templates(service, monkeypatch):
+    _use_llm(service, SlowFakeLLM(full_delay=5.0, reduced_delay=5.0))
+
+    async def hours_text():
+        return "🕘 Segunda a Sexta: 9h às 18h"
+
+    from app.services.business_data import business_data_service
+    monkeypatch.setattr(business_data_service, "get_business_hours_formatted_text", hours_text)
+
+    response = await service.process_message("5511999990002", "1", "Qual o horário de funcionamento?")
+
+    assert response.metadata["degradation_level"] == "template"
+    assert "Segunda a Sexta" in response.text
+
+
+async def test_unavailable_llm_without_template_defers_turn(service):
+    _use_llm(service, SlowFakeLLM(full_delay=5.0, reduced_delay=5.0))
+
+    response = await service.process_message("5511999990003", "1", "Me conta uma novidade", allow_defer=True)
+
+    assert response.text == DegradationLadder.DEFERRED_MESSAGE
+    assert response.metadata["degradation_level"] == DegradationLevel.DEFERRED.value
+    assert len(service.degradation_ladder.deferred_turns) == 1
+
+    # LLM recuperado: o turno adiado é reprocessado
+    _use_llm(service, SlowFakeLLM(full_delay=0.0, reduced_delay=0.0))
+    results = await service.process_deferred_turns()
+
+    assert len(results) == 1
+    turn, reply = results[0]
+    assert turn.user_id == "5511999990003"
+    assert reply.metadata["degradation_level"] == "full"
+    assert len(service.degradation_ladder.deferred_turns) == 0
+
+    # O reprocessamento não registra a mensagem do usuário de novo
+    context = await service.state_manager.load_context("5511999990003", "1")
+    user_turns = [m for m in context.message_history if m["role"] == "user"]
+    assert [m["content"] for m in user_turns] == ["Me conta uma novidade"]
+
+
+async def test_callers_that_do_not_defer_get_unavailable_response(service):
+    """Só quem entrega respostas tardias (webhook) enfileira o turno"""
+    _use_llm(service, SlowFakeLLM(full_delay=5.0, reduced_delay=5.0))
+
+    response = await service.process_message("5511999990005", "1", "Me conta uma novidade")
+
+    assert response.text == DegradationLadder.UNAVAILABLE_MESSAGE
+    assert response.metadata["degradation_level"] == DegradationLevel.UNAVAILABLE.value
+    assert not service.degradation_ladder.deferred_turns
+    assert service.degradation_ladder.metrics["unavailable"]["success"] == 1
+
+
+async def test_ladder_respects_turn_slo():
+    ladder = DegradationLadder(DegradationConfig(
+        slo_seconds=0.2, full_timeout=0.15, reduced_timeout=0.15, template_timeout=0.15
+    ))
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result = await ladder.run(
+        {level: slow for level in (DegradationLevel.FULL, DegradationLevel.REDUCED, DegradationLevel.TEMPLATE)},
+        llm_advanced.DeferredTurn(user_id="u", conversation_id="c", message="m")
+    )
+
+    assert result is None
+    assert loop.time() - start < 0.35
+    assert ladder.metrics["template"]["skipped"] == 1
+
+
+async def test_deferred_worker_sends_reply_when_llm_recovers(service, monkeypatch):
+    _use_llm(service, SlowFakeLLM(full_delay=5.0, reduced_delay=5.0))
+    service.degradation_ladder.config.drain_interval = 0.05
+    await service.process_message("5511999990004", "1", "Me conta uma novidade", allow_defer=True)
+
+    sent = []
+
+    async def send_text_message(to, message):
+        sent.append((to, message))
+        return {"messages": [{"id": "wamid.1"}]}
+
+    async def store_reply(turn, text):
+        pass
+
+    from app.services.whatsapp import whatsapp_service
+    monkeypatch.setattr(whatsapp_service, "send_text_message", send_text_message)
+    monkeypatch.setattr(service, "_store_deferred_reply", store_reply)
+
+    service.start_deferred_worker()
+    _use_llm(service, SlowFakeLLM(full_delay=0.0, reduced_delay=0.0))
+    await asyncio.sleep(0.2)
+    await service.degradation_ladder.stop()
+
+    assert sent == [("5511999990004", "resposta")]
+    deferred = service.degradation_ladder.get_stats()["steps"]["deferred"]
+    assert deferred["replayed"] == 1 and deferred["dropped"] == 0
+
+
+async def test_deferred_turns_are_dropped_and_counted():
+    ladder = DegradationLadder(DegradationConfig(max_deferred=2, max_attempts=2))
+    for i in range(3):
+        ladder._defer(llm_advanced.DeferredTurn(user_id=f"u{i}", conversation_id="c", message="m"))
+
+    assert [turn.user_id for turn in ladder.deferred_turns] == ["u1", "u2"]
+    assert ladder.metrics["deferred"]["dropped"] == 1
+
+    async def failing(turn):
+        raise RuntimeError("LLM ainda indisponível")
+
+    # A primeira falha interrompe o lote e devolve o turno ao início da fila
+    await ladder.process_deferred(failing)
+    assert [turn.user_id for turn in ladder.deferred_turns] == ["u1", "u2"]
+    await ladder.process_deferred(failing)
+    assert [turn.user_id for turn in ladder.deferred_turns] == ["u2"]
+    assert ladder.metrics["deferred"]["dropped"] == 2
+
+    await ladder.stop()
+    assert not ladder.deferred_turns and ladder.metrics["deferred"]["dropped"] == 3
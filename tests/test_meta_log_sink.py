@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do MetaLogSink (auditoria da Meta API gravada em lote)
+
+Inclui benchmark de throughput do log de entrada do webhook: commit por
+requisição (comportamento anterior) versus enfileiramento no sink.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.database import MetaLog
+from app.services.meta_log_sink import MetaLogSink, MetaLogSinkConfig, OverflowPolicy
+
+WEBHOOK_PAYLOAD = {
+    "object": "whatsapp_business_account",
+    "entry": [{"id": "1", "changes": [{"field": "messages", "value": {
+        "messages": [{"from": "5511999990000", "id": "wamid.X", "type": "text", "text": {"body": "Olá"}}]
+    }}]}]
+}
+WEBHOOK_HEADERS = {"content-type": "application/json", "x-hub-signature-256": "sha256=abc", "user-agent": "facebookexternalua"}
+
+
+async def _count(session_factory) -> int:
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(MetaLog))
+
+
+async def test_records_are_written_in_batches(database):
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=100, flush_interval=60), session_factory)
+
+        for i in range(250):
+            sink.log("in", endpoint="/webhook", method="POST", status_code=200, payload={"i": i})
+        await sink.stop()
+
+        assert await _count(session_factory) == 250
+        assert sink.stats["flushes"] == 3
+        assert sink.get_stats()["buffered"] == 0
+
+
+async def test_partial_batch_is_flushed_by_interval(database):
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=100, flush_interval=0.05), session_factory)
+
+        sink.log("out", endpoint="/messages", method="POST", status_code=200)
+        await asyncio.sleep(0.2)
+
+        assert await _count(session_factory) == 1
+        await sink.stop()
+
+
+@pytest.mark.parametrize("policy,kept", [
+    (OverflowPolicy.DROP_OLDEST, [2, 3, 4]),
+    (OverflowPolicy.DROP_NEWEST, [0, 1, 2]),
+])
+def test_overflow_policy_bounds_memory(policy, kept):
+    sink = MetaLogSink(MetaLogSinkConfig(max_buffer=3, overflow_policy=policy))
+
+    for i in range(5):
+        sink.log("in", payload={"i": i})
+
+    assert [record["payload"]["i"] for record in sink.buffer] == kept
+    assert sink.stats["dropped"] == 2
+
+
+async def test_failed_flush_keeps_records_for_retry(database):
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+
+        class BrokenSession:
+            async def __aenter__(self):
+                raise ConnectionError("banco indisponível")
+
+            async def __aexit__(self, *exc):
+                return False
+
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=10, flush_interval=60, max_buffer=15), BrokenSession)
+        for i in range(12):
+            sink.log("in", payload={"i": i})
+
+        assert await sink.flush() == 0
+        assert len(sink.buffer) == 12
+        assert sink.stats["failed"] == 10
+
+        sink.session_factory = session_factory
+        await sink.stop()
+        assert await _count(session_factory) == 12
+
+
+async def test_rejected_records_are_isolated_without_blocking_the_rest(database):
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=8, flush_interval=60), session_factory)
+
+        for i in range(20):
+            # Payload não serializável: o banco recusa o lote inteiro
+            sink.log("in", endpoint="/webhook", payload={"i": object()} if i in (3, 17) else {"i": i})
+
+        assert await sink.flush() == 18
+        assert sink.stats["dead_lettered"] == 2
+        assert len(sink.buffer) == 0
+        assert await _count(session_factory) == 18
+
+        sink.log("in", endpoint="/webhook", payload={"i": 20})
+        await sink.stop()
+        assert await _count(session_factory) == 19
+
+
+async def test_connection_loss_during_isolation_requeues_in_order(database):
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=8, flush_interval=60), session_factory)
+        for i in range(8):
+            sink.log("in", payload={"i": object()} if i == 0 else {"i": i})
+
+        writes = []
+        original_write = sink._write
+
+        async def write_then_disconnect(batch):
+            writes.append(len(batch))
+            if len(writes) > 1:
+                return ConnectionError("banco indisponível")
+            return await original_write(batch)
+
+        sink._write = write_then_disconnect
+        assert await sink.flush() == 0
+        assert [record["payload"]["i"] for record in list(sink.buffer)[1:]] == list(range(1, 8))
+        assert sink.stats["dead_lettered"] == 0
+
+
+@pytest.mark.load
+async def test_benchmark_webhook_logging_throughput(database, monkeypatch):
+    """Throughput do log de entrada do webhook com logging ligado"""
+    from app.routes import webhook
+
+    async with database("meta_logs.db") as test_db:
+        session_factory = test_db.session_factory
+        requests, clients = 1000, 20
+
+        async def run(log_one) -> float:
+            queue = asyncio.Queue()
+            for _ in range(requests):
+                queue.put_nowait(None)
+
+            async def client():
+                while not queue.empty():
+                    queue.get_nowait()
+                    async with session_factory() as db:
+                        await log_one(db)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(clients)))
+            return requests / (time.perf_counter() - start)
+
+        async def commit_per_request(db):
+            db.add(MetaLog(direction="in", endpoint="/webhook", method="POST", status_code=200,
+                           headers=WEBHOOK_HEADERS, payload=WEBHOOK_PAYLOAD))
+            await db.commit()
+
+        baseline = await run(commit_per_request)
+
+        sink = MetaLogSink(MetaLogSinkConfig(batch_size=200, flush_interval=0.05), session_factory)
+        monkeypatch.setattr(webhook, "meta_log_sink", sink)
+
+        async def batched(db):
+            await webhook._log_incoming_request_secure(db, WEBHOOK_PAYLOAD, WEBHOOK_HEADERS)
+
+        batched_rate = await run(batched)
+        await sink.stop()
+
+        assert await _count(session_factory) == 2 * requests
+        assert batched_rate > baseline * 2
+        assert sink.stats["flushes"] < requests / 10
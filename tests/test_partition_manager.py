@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da manutenção de partições mensais (messages/meta_logs)
+
+A parte que fala com o banco roda só com TEST_POSTGRES_URL definido.
+"""
+
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app.services.partition_manager import (
+    PartitionConfig,
+    PartitionManager,
+    add_months,
+    create_partition_statements,
+    expired_partitions,
+    iter_archive,
+    parse_partition_month,
+    partition_name,
+    write_archive,
+)
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name("messages", date(2026, 3, 1)) == "messages_p202603"
+    assert parse_partition_month("messages", "messages_p202603") == date(2026, 3, 1)
+    assert parse_partition_month("messages", "messages_default") is None
+    assert parse_partition_month("messages", "meta_logs_p202603") is None
+
+
+def test_expired_partitions_respects_retention_window():
+    names = [partition_name("meta_logs", date(2026, month, 1)) for month in range(1, 13)] + ["meta_logs_default"]
+
+    expired = expired_partitions("meta_logs", names, today=date(2026, 10, 18), retention_months=3)
+
+    # Mantém agosto, setembro e outubro
+    assert expired == [partition_name("meta_logs", date(2026, month, 1)) for month in range(1, 8)]
+
+
+def test_archive_round_trip(tmp_path):
+    rows = [
+        {"id": 1, "content": "Olá", "created_at": datetime(2026, 1, 5, tzinfo=timezone.utc), "raw_payload": {"a": 1}},
+        {"id": 2, "content": None, "created_at": datetime(2026, 1, 6, tzinfo=timezone.utc), "raw_payload": None},
+    ]
+
+    info = write_archive(tmp_path / "messages" / "messages_p202601.jsonl.gz", [rows[:1], rows[1:]])
+
+    assert info["rows"] == 2 and len(info["sha256"]) == 64
+    restored = list(iter_archive(tmp_path / "messages" / "messages_p202601.jsonl.gz"))
+    assert [row["content"] for row in restored] == ["Olá", None]
+    assert restored[0]["raw_payload"] == {"a": 1}
+    assert not list((tmp_path / "messages").glob("*.tmp"))
+
+
+def test_month_with_rows_in_default_is_drained_before_create():
+    assert create_partition_statements("meta_logs", date(2026, 11, 1), drain_default=False) == [
+        "CREATE TABLE IF NOT EXISTS meta_logs_p202611 PARTITION OF meta_logs "
+        "FOR VALUES FROM ('2026-11-01') TO ('2026-12-01')"
+    ]
+
+    statements = create_partition_statements("meta_logs", date(2026, 11, 1), drain_default=True)
+
+    in_month = "created_at >= '2026-11-01' AND created_at < '2026-12-01'"
+    assert statements == [
+        "ALTER TABLE meta_logs DETACH PARTITION meta_logs_default",
+        "CREATE TABLE IF NOT EXISTS meta_logs_p202611 PARTITION OF meta_logs "
+        "FOR VALUES FROM ('2026-11-01') TO ('2026-12-01')",
+        f"INSERT INTO meta_logs_p202611 SELECT * FROM meta_logs_default WHERE {in_month}",
+        f"DELETE FROM meta_logs_default WHERE {in_month}",
+        "ALTER TABLE meta_logs ATTACH PARTITION meta_logs_default DEFAULT",
+    ]
+
+
+async def test_maintenance_is_noop_outside_postgres(database, tmp_path):
+    async with database("plain.db") as test_db:
+        manager = PartitionManager(PartitionConfig(archive_dir=str(tmp_path)), engine_factory=lambda: test_db.engine)
+        assert await manager.run_maintenance() == {}
+
+
+async def _create_partitioned_meta_logs(engine):
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS meta_logs CASCADE"))
+        await conn.execute(text(
+            "CREATE TABLE meta_logs (id SERIAL, direction VARCHAR(10) NOT NULL, payload JSON, "
+            "created_at TIMESTAMPTZ NOT NULL DEFAULT now(), PRIMARY KEY (id, created_at)) "
+            "PARTITION BY RANGE (created_at)"
+        ))
+        await conn.execute(text(
+            "CREATE TABLE meta_logs_p202601 PARTITION OF meta_logs "
+            "FOR VALUES FROM ('2026-01-01') TO ('2026-02-01')"
+        ))
+        await conn.execute(text(
+            "INSERT INTO meta_logs (direction, payload, created_at) "
+            "VALUES ('in', '{\"x\": 1}', '2026-01-10'), ('out', NULL, '2026-01-11')"
+        ))
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL não definido")
+async def test_postgres_creates_future_and_archives_expired_partitions(database, tmp_path):
+    async with database(url=os.environ["TEST_POSTGRES_URL"]) as test_db:
+        engine = test_db.engine
+        try:
+            await _create_partitioned_meta_logs(engine)
+
+            config = PartitionConfig(months_ahead=2, retention_months={"meta_logs": 3}, archive_dir=str(tmp_path))
+            manager = PartitionManager(config, engine_factory=lambda: engine)
+            manager.TABLES = ("meta_logs",)
+            report = await manager.run_maintenance(today=date(2026, 10, 18))
+
+            assert report["meta_logs"]["created"] == ["meta_logs_p202610", "meta_logs_p202611", "meta_logs_p202612"]
+            assert [info["rows"] for info in report["meta_logs"]["archived"]] == [2]
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT to_regclass('meta_logs_p202601')"))).scalar() is None
+            assert len(list(iter_archive(tmp_path / "meta_logs" / "meta_logs_p202601.jsonl.gz"))) == 2
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text("DROP TABLE IF EXISTS meta_logs CASCADE"))
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL não definido")
+async def test_postgres_moves_rows_out_of_default_partition(database, tmp_path):
+    async with database(url=os.environ["TEST_POSTGRES_URL"]) as test_db:
+        engine = test_db.engine
+        try:
+            await _create_partitioned_meta_logs(engine)
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE meta_logs_default PARTITION OF meta_logs DEFAULT"))
+                # Além das partições criadas: cai na default
+                await conn.execute(text(
+                    "INSERT INTO meta_logs (direction, created_at) "
+                    "VALUES ('in', '2026-11-05'), ('out', '2026-11-06'), ('in', '2027-03-01')"
+                ))
+
+            config = PartitionConfig(months_ahead=2, retention_months={"meta_logs": 12}, archive_dir=str(tmp_path))
+            manager = PartitionManager(config, engine_factory=lambda: engine)
+            manager.TABLES = ("meta_logs",)
+            report = await manager.run_maintenance(today=date(2026, 10, 18))
+
+            assert "error" not in report["meta_logs"]
+            assert "meta_logs_p202611" in report["meta_logs"]["created"]
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT count(*) FROM meta_logs_p202611"))).scalar() == 2
+                assert (await conn.execute(text("SELECT count(*) FROM meta_logs_default"))).scalar() == 1
+                assert (await conn.execute(text("SELECT count(*) FROM meta_logs"))).scalar() == 5
+                assert (await conn.execute(text(
+                    "SELECT relispartition FROM pg_class WHERE relname = 'meta_logs_default'"
+                ))).scalar() is True
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text("DROP TABLE IF EXISTS meta_logs CASCADE"))
+
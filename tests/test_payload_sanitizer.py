@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do sanitizador de payload WhatsApp em passada única
+"""
+
+import html
+import json
+import random
+import re
+import time
+
+import pytest
+
+from app.utils.whatsapp_sanitizer import WhatsAppSanitizer, sanitize_message, sanitize_whatsapp_data
+
+
+# ----------------------------------------------------------------------
+# Implementação anterior (referência de equivalência)
+# ----------------------------------------------------------------------
+
+def legacy_payload(payload):
+    if len(json.dumps(payload)) > WhatsAppSanitizer.LIMITS['payload_size']:
+        raise ValueError("Payload muito grande")
+
+    def value(item):
+        if isinstance(item, dict):
+            return {key_of(k): value(v) for k, v in item.items()}
+        if isinstance(item, list):
+            return [value(v) for v in item]
+        if isinstance(item, str):
+            item = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', item[:10000])
+            return html.escape(item, quote=True)
+        return item
+
+    def key_of(key):
+        return re.sub(r'[^\w\-_.]', '', key)[:100] or "unknown_key"
+
+    return value(payload)
+
+
+def legacy_remove_dangerous_content(content):
+    if not content:
+        return ""
+    content = re.sub(r'<[^>]*>', '', content)
+    content = re.sub(r'<[^<]*$', '', content)
+    for pattern in WhatsAppSanitizer.DANGEROUS_CHARS['sql_injection']:
+        content = content.replace(pattern, '')
+    xss_patterns = [r'javascript\s*:', r'vbscript\s*:', r'data\s*:', r'on\w+\s*=', r'eval\s*\(',
+                    r'expression\s*\(', r'script\b', r'iframe\b', r'object\b', r'embed\b', r'form\b', r'input\b']
+    for pattern in xss_patterns:
+        content = re.sub(pattern, '', content, flags=re.IGNORECASE)
+    for pattern in WhatsAppSanitizer.DANGEROUS_CHARS['xss']:
+        content = re.sub(re.escape(pattern), '', content, flags=re.IGNORECASE)
+    for pattern in WhatsAppSanitizer.DANGEROUS_CHARS['command_injection']:
+        content = content.replace(pattern, '')
+    for pattern in WhatsAppSanitizer.DANGEROUS_CHARS['path_traversal']:
+        content = content.replace(pattern, '')
+    for char, escaped in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;')):
+        content = content.replace(char, escaped)
+    return content
+
+
+# ----------------------------------------------------------------------
+# Corpus com o formato real dos webhooks da Cloud API
+# ----------------------------------------------------------------------
+
+def _envelope(value):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "102290129340398",
+            "changes": [{"field": "messages", "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "15550783881", "phone_number_id": "106540352242922"},
+                **value
+            }}]
+        }]
+    }
+
+
+def _contact(name):
+    return {"contacts": [{"profile": {"name": name}, "wa_id": "5511987654321"}]}
+
+
+def _message(index, **fields):
+    return {
+        "from": "5511987654321",
+        "id": f"wamid.HBgNNTUxMTk4NzY1NDMyMRUCABIYFjNFQjBDNzE4RkI0RjYzQjQ4MkE{index:04d}A==",
+        "timestamp": str(1760000000 + index),
+        **fields
+    }
+
+
+def build_corpus(size=50):
+    corpus = []
+    for i in range(size):
+        kind = i % 6
+        if kind == 0:
+            value = {**_contact("Maria José"), "messages": [_message(
+                i, type="text", text={"body": f"Oi! Quanto custa o corte {i}? Posso ir amanhã às 14h 😊"})]}
+        elif kind == 1:
+            value = {**_contact("João <b>\x07"), "messages": [_message(i, type="image", image={
+                "caption": "Foto do cabelo & \"referência\" pra escova", "mime_type": "image/jpeg",
+                "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08=", "id": f"{i}27390"})]}
+        elif kind == 2:
+            value = {**_contact("Ana"), "messages": [_message(i, type="interactive", interactive={
+                "type": "list_reply",
+                "list_reply": {"id": f"srv_{i}", "title": "Corte + Escova", "description": "R$ 80,00 – 1h"}})]}
+        elif kind == 3:
+            value = {"statuses": [{
+                "id": f"wamid.HBgNNTUxMTk4NzY1NDMyMRUCABEYEjA{i:04d}", "status": "delivered",
+                "timestamp": str(1760000000 + i), "recipient_id": "5511987654321",
+                "conversation": {"id": f"9a1c{i}", "origin": {"type": "service"}},
+                "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}}]}
+        elif kind == 4:
+            value = {**_contact("Carla O'Neil"), "messages": [_message(
+                i, type="document", context={"from": "15550783881", "id": "wamid.ABC"},
+                document={"filename": "comprovante <pix>.pdf", "mime_type": "application/pdf", "id": str(i)})]}
+        else:
+            value = {"statuses": [{
+                "id": f"wamid.X{i}", "status": "failed", "timestamp": "1760000000",
+                "recipient_id": "5511987654321",
+                "errors": [{"code": 131047, "title": "Re-engagement message",
+                            "message": "More than 24 hours have passed", "error_data": {"details": "<24h>"}}]}]}
+        corpus.append(_envelope(value))
+    return corpus
+
+
+def test_payload_output_matches_previous_sanitizer():
+    odd = {"entry": [{"id": "1", "weird key!": "\x00tab\tand\nnewline <x>", "numbers": [1, 2.5, None, True],
+                      "changes": [], "long": "a" * 12000, "": "empty key", "nested": [["'q'", {"k": "v&"}]]}]}
+
+    for payload in build_corpus() + [odd]:
+        assert sanitize_whatsapp_data(payload) == legacy_payload(payload)
+
+
+def test_oversized_payload_is_rejected_during_walk():
+    payload = _envelope({"messages": [_message(i, type="text", text={"body": "x" * 1000}) for i in range(20)]})
+    limits = {**WhatsAppSanitizer.LIMITS, "payload_size": 10_000}
+    original = WhatsAppSanitizer.LIMITS
+    WhatsAppSanitizer.LIMITS = limits
+    try:
+        with pytest.raises(ValueError, match="Payload muito grande"):
+            sanitize_whatsapp_data(payload)
+    finally:
+        WhatsAppSanitizer.LIMITS = original
+
+    with pytest.raises(ValueError):
+        sanitize_whatsapp_data({"entry": [{"when": object()}]})
+    with pytest.raises(ValueError):
+        sanitize_whatsapp_data({"entry": {"id": "1"}})
+
+
+def test_dangerous_content_removal_matches_previous_passes():
+    samples = [
+        "Oi, bom dia! Gostaria de agendar um corte amanhã às 14h, pode ser? 😊",
+        "<script>alert(1)</script> oi", "R$ 50,00 & R$ 60", "it's \"fine\"", "DROP TABLE users; --",
+        "../../etc/passwd", "onclick=alert(1)", "JavaScript : void", "<b>negrito</b>", "a<b<c>d",
+        "texto <sem fechar", "sCRİPT ſcript", "data : x", "eval (1) EXPRESSION(2)", "formulário input",
+    ]
+    rnd = random.Random(42)
+    alphabet = "abcdefijlmnoprstvxADEFIOSJ <>;&|$`/.\\-*:=()'\"\nİıſ"
+    samples += ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40))) for _ in range(3000)]
+    samples += ["".join(rnd.choice(["on", "script", "<", ">", "=", "data", ":", "x", " "]) for _ in range(8))
+                for _ in range(2000)]
+
+    for sample in samples:
+        assert WhatsAppSanitizer._remove_dangerous_content(sample) == legacy_remove_dangerous_content(sample), sample
+
+    assert sanitize_message("Olá <b>Maria</b>,   tudo bem?\n\n\n\nAté", "text") == "Olá Maria, tudo bem?\n\nAté"
+
+
+@pytest.mark.load
+def test_benchmark_payload_sanitization():
+    corpus = build_corpus(600)
+    messages = [
+        payload["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"]
+        for payload in corpus if "text" in payload["entry"][0]["changes"][0]["value"].get("messages", [{}])[0]
+    ]
+
+    def measure(function, items):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        return (time.perf_counter() - started) / len(items)
+
+    legacy = measure(legacy_payload, corpus)
+    current = measure(sanitize_whatsapp_data, corpus)
+    legacy_message = measure(legacy_remove_dangerous_content, messages)
+    current_message = measure(WhatsAppSanitizer._remove_dangerous_content, messages)
+
+    assert current < 0.001
+    assert current_message < 0.0005
+    assert current < legacy and current_message < legacy_message
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do roteamento de leituras para a réplica (duas bases SQLite)
+"""
+
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import User
+from app.services.read_replica import ReadReplicaRouter, ReplicaConfig
+
+
+class LaggingRouter(ReadReplicaRouter):
+    """Réplica SQLite com atraso de replicação controlado pelo teste"""
+    lag = 0.0
+
+    async def measure_lag(self) -> float:
+        await super().measure_lag()
+        return self.lag
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@asynccontextmanager
+async def _databases(database, replica_path=None):
+    async with database("primary.db") as primary, database("replica.db") as replica:
+        for test_db, wa_id in ((primary, "5511900000001"), (replica, "5511900000002")):
+            async with test_db.session_factory() as db:
+                db.add(User(wa_id=wa_id))
+                await db.commit()
+        if replica_path is None:
+            yield primary.session_factory, replica.session_factory
+            return
+
+        unreachable = create_async_engine(f"sqlite+aiosqlite:///{replica_path}")
+        try:
+            yield primary.session_factory, sessionmaker(unreachable, class_=AsyncSession, expire_on_commit=False)
+        finally:
+            await unreachable.dispose()
+
+
+async def _read_wa_id(router):
+    async with router.session() as db:
+        return (await db.execute(select(User.wa_id))).scalar_one()
+
+
+async def test_reads_go_to_replica_and_fall_back_when_stale(database):
+    clock = Clock()
+    async with _databases(database) as (primary, replica):
+        router = LaggingRouter(primary, replica, ReplicaConfig(max_staleness=5.0, check_interval=10.0), clock=clock)
+
+        assert await _read_wa_id(router) == "5511900000002"
+
+        # Atraso acima do limite só é percebido na próxima verificação
+        router.lag = 30.0
+        assert await _read_wa_id(router) == "5511900000002"
+        clock.now = 10.0
+        assert await _read_wa_id(router) == "5511900000001"
+        assert router.last_lag == 30.0
+
+        router.lag = 1.0
+        clock.now = 20.0
+        assert await _read_wa_id(router) == "5511900000002"
+
+        stats = router.get_stats()
+        assert (stats["replica_reads"], stats["primary_reads"], stats["fallbacks"]) == (3, 1, 1)
+
+
+async def test_unreachable_replica_falls_back_to_primary(database, tmp_path):
+    async with _databases(database, replica_path=tmp_path / "missing" / "replica.db") as (primary, replica):
+        router = ReadReplicaRouter(primary, replica, ReplicaConfig())
+
+        assert await _read_wa_id(router) == "5511900000001"
+        assert router.get_stats()["healthy"] is False
+        assert router.get_stats()["replica_errors"] == 1
+
+
+async def test_without_replica_everything_reads_from_primary(database):
+    async with _databases(database) as (primary, _):
+        router = ReadReplicaRouter(primary)
+
+        assert await _read_wa_id(router) == "5511900000001"
+        assert router.get_stats()["configured"] is False
+
+
+def test_sync_engine_for_dashboard_falls_back(tmp_path):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    try:
+        assert ReadReplicaRouter(None, sync_primary=primary, sync_replica=replica).sync_engine() is replica
+        assert ReadReplicaRouter(None, sync_primary=primary, sync_replica=broken).sync_engine() is primary
+        assert ReadReplicaRouter(None, sync_primary=primary).sync_engine() is primary
+    finally:
+        for engine in (primary, replica, broken):
+            engine.dispose()
+
+
+def test_dashboard_metrics_endpoint_reads_through_read_session():
+    from app.database import get_read_db
+    from app.main import app
+
+    route = next(route for route in app.routes if getattr(route, "path", None) == "/metrics/dashboard")
+    assert [dependency.call for dependency in route.dependant.dependencies] == [get_read_db]
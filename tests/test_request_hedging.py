@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do hedging de requisições OpenAI (intenção e extração de dados)
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import llm_hedging
+from app.services.bulkhead import Bulkhead, BulkheadConfig
+from app.services.llm_hedging import HedgeBudget, HedgingConfig, RequestHedger
+
+
+class TailLatencyLLM:
+    """Cliente falso: latência rápida, exceto pelas chamadas listadas em slow_calls"""
+
+    def __init__(self, fast: float = 0.01, slow: float = 1.0, slow_calls=()):
+        self.fast = fast
+        self.slow = slow
+        self.slow_calls = set(slow_calls)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, model="gpt-3.5-turbo", **kwargs):
+        index = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.slow if index in self.slow_calls else self.fast)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return SimpleNamespace(
+            call=index,
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+        )
+
+
+@pytest.fixture
+def hedge_costs(monkeypatch):
+    costs = []
+    monkeypatch.setattr(llm_hedging.cost_tracker, "track_hedge_usage", lambda **kwargs: costs.append(kwargs))
+    return costs
+
+
+def _hedger(limiter: Bulkhead = None, **overrides) -> RequestHedger:
+    config = HedgingConfig(enabled=True, min_delay=0.02, min_samples=5, budget_burst=5.0)
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return RequestHedger(config, limiter=limiter)
+
+
+async def _warm_up(hedger: RequestHedger, llm: TailLatencyLLM, samples: int = 5):
+    for _ in range(samples):
+        await hedger.execute("intent_detection", llm.create, model="gpt-3.5-turbo")
+
+
+async def test_slow_primary_is_hedged_and_loser_cancelled(hedge_costs):
+    hedger = _hedger()
+    llm = TailLatencyLLM(slow_calls={5})
+    await _warm_up(hedger, llm)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    result = await hedger.execute("intent_detection", llm.create, model="gpt-3.5-turbo")
+    await asyncio.sleep(0)
+
+    assert result.call == 6  # a cópia venceu
+    assert loop.time() - start < 0.5
+    assert llm.cancelled == 1
+    assert hedger.stats["hedged"] == 1
+    assert hedger.stats["hedge_wins"] == 1
+    assert hedge_costs == [{"model": "gpt-3.5-turbo", "input_tokens": 100, "output_tokens": 20}]
+
+    # Registra a latência (censurada) da principal, não a da cópia mais rápida
+    assert hedger.trackers["intent_detection"].samples[-1] >= hedger.config.min_delay + llm.fast
+
+
+async def test_no_hedge_before_enough_samples_or_when_disabled(hedge_costs):
+    llm = TailLatencyLLM(slow=0.1, slow_calls={0})
+    hedger = _hedger()
+    await hedger.execute("intent_detection", llm.create)
+    assert llm.calls == 1
+
+    disabled = _hedger(enabled=False)
+    llm = TailLatencyLLM(slow=0.1, slow_calls={5})
+    await _warm_up(disabled, llm)
+    await disabled.execute("intent_detection", llm.create)
+
+    assert llm.calls == 6
+    assert disabled.stats["hedged"] == 0
+    assert hedge_costs == []
+
+
+async def test_budget_caps_extra_requests(hedge_costs):
+    hedger = _hedger(budget_burst=1.0, budget_ratio=0.0)
+    llm = TailLatencyLLM(slow=0.1, slow_calls=set(range(40, 100)))
+    await _warm_up(hedger, llm, samples=40)  # poucas amostras lentas não movem o p95
+
+    for _ in range(3):
+        await hedger.execute("intent_detection", llm.create)
+
+    assert hedger.stats["hedged"] == 1
+    assert hedger.stats["budget_exhausted"] == 2
+    assert len(hedge_costs) == 1
+
+
+async def test_failed_hedge_falls_back_to_primary(hedge_costs):
+    hedger = _hedger()
+    llm = TailLatencyLLM(slow=0.1, slow_calls={5})
+    await _warm_up(hedger, llm)
+
+    async def flaky(**kwargs):
+        if llm.calls == 6:
+            llm.calls += 1
+            raise RuntimeError("erro transitório")
+        return await llm.create(**kwargs)
+
+    result = await hedger.execute("intent_detection", flaky)
+
+    assert result.call == 5
+    assert hedger.stats["hedge_wins"] == 0
+
+
+async def test_queue_wait_in_limiter_does_not_trigger_hedge(hedge_costs):
+    """O atraso do hedge conta a partir da vaga no limiter, não da espera na fila"""
+    limiter = Bulkhead("test_openai", BulkheadConfig(max_concurrent=1, max_queue=10, queue_timeout=5.0))
+    hedger = _hedger(limiter)
+    llm = TailLatencyLLM()
+    await _warm_up(hedger, llm)
+
+    await limiter.acquire()
+    call = asyncio.ensure_future(limiter.call(hedger.wrap("intent_detection", llm.create)))
+    await asyncio.sleep(0.1)  # bem acima do atraso do hedge, ainda na fila
+    limiter.release()
+    await call
+
+    assert llm.calls == 6
+    assert hedger.stats["hedged"] == 0
+    assert hedger.trackers["intent_detection"].samples[-1] < 0.05
+
+
+async def test_no_hedge_without_free_limiter_slot(hedge_costs):
+    """Limiter saturado: a principal segue sozinha e a cópia não soma carga"""
+    limiter = Bulkhead("test_openai", BulkheadConfig(max_concurrent=2, max_queue=10, queue_timeout=5.0))
+    hedger = _hedger(limiter)
+    llm = TailLatencyLLM(slow=0.1, slow_calls={5})
+    await _warm_up(hedger, llm)
+
+    await limiter.acquire()  # outra chamada ocupando a segunda vaga
+    await limiter.call(hedger.wrap("intent_detection", llm.create))
+    limiter.release()
+
+    assert llm.calls == 6
+    assert hedger.stats["hedged"] == 0
+    assert hedger.stats["limiter_busy"] == 1
+    assert limiter.in_flight == 0
+
+
+async def test_hedge_takes_its_own_limiter_slot(hedge_costs):
+    limiter = Bulkhead("test_openai", BulkheadConfig(max_concurrent=4, max_queue=10, queue_timeout=5.0))
+    hedger = _hedger(limiter)
+    llm = TailLatencyLLM(slow_calls={5})
+    await _warm_up(hedger, llm)
+
+    peak = 0
+    create = llm.create
+
+    async def observed(**kwargs):
+        nonlocal peak
+        peak = max(peak, limiter.in_flight)
+        return await create(**kwargs)
+
+    result = await limiter.call(hedger.wrap("intent_detection", observed))
+
+    assert result.call == 6
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_hedge_delay_tracks_latency_percentile():
+    hedger = _hedger(min_delay=0.0, percentile=90.0)
+    tracker = hedger.trackers.setdefault("data_extraction", llm_hedging.LatencyTracker(100))
+    for i in range(1, 101):
+        tracker.record(i / 100)
+
+    assert hedger.hedge_delay("data_extraction") == pytest.approx(0.91)
+
+
+def test_budget_refills_with_primary_requests():
+    budget = HedgeBudget(ratio=0.5, burst=1.0)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_spend()
+
+
+async def test_caller_cancellation_cancels_outstanding_requests(hedge_costs):
+    for burst in (5.0, 0.0):  # com hedge e com orçamento esgotado
+        hedger = _hedger(budget_burst=burst, budget_ratio=0.0)
+        llm = TailLatencyLLM(slow_calls={5, 6})
+        await _warm_up(hedger, llm)
+
+        caller = asyncio.ensure_future(hedger.execute("intent_detection", llm.create, model="gpt-3.5-turbo"))
+        await asyncio.sleep(0.01)  # ainda esperando o atraso do hedge
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+
+        assert llm.cancelled == 1
+        assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+
+
+def test_zero_budget_ratio_is_respected(monkeypatch):
+    monkeypatch.setattr(llm_hedging.settings, "openai_hedging_budget_ratio", 0.0, raising=False)
+    assert llm_hedging._load_config().budget_ratio == 0.0
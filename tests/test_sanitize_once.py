@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da proveniência do conteúdo sanitizado (cada verificação roda uma vez)
+"""
+
+import pickle
+import time
+from collections import Counter
+
+import pytest
+
+from app.routes import webhook
+from app.utils import whatsapp_sanitizer
+from app.utils.provenance import CHECK_SECURITY, CHECK_SQL, SanitizedText, TrustedPayload
+from app.utils.validators import RobustValidator
+from app.utils.whatsapp_sanitizer import (
+    WhatsAppSanitizer, WhatsAppSecurityValidator, sanitize_message, sanitize_whatsapp_data, validate_security
+)
+
+
+def _payload(message):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "102290129340398", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "contacts": [{"profile": {"name": "Maria"}, "wa_id": "5511987654321"}],
+            "messages": [{"from": "5511987654321", "id": "wamid.HBgNNTUxMTk4NzY1NDMyMRUCABIYFjNF",
+                          "timestamp": "1760000000", **message}]
+        }}]}]
+    }
+
+
+TEXT = {"type": "text", "text": {"body": "Oi!  Quanto custa o corte amanhã?\n\n\n\nObrigada"}}
+LIST_REPLY = {"type": "interactive", "interactive": {
+    "type": "list_reply", "list_reply": {"id": "srv_1", "title": "Corte + Escova"}}}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Conta as execuções de cada verificação"""
+    counter = Counter()
+
+    def count(owner, name, wrap):
+        original = owner.__dict__[name].__func__
+
+        def counted(*args, **kwargs):
+            counter[name] += 1
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(owner, name, wrap(counted))
+
+    count(WhatsAppSanitizer, "_sanitize_tree", classmethod)
+    count(WhatsAppSanitizer, "_remove_dangerous_content", classmethod)
+    count(WhatsAppSecurityValidator, "is_potential_spam", staticmethod)
+    count(WhatsAppSecurityValidator, "is_potential_phishing", staticmethod)
+    count(RobustValidator, "sanitize_sql_input", staticmethod)
+    return counter
+
+
+async def _pipeline(message):
+    """Etapas do webhook por mensagem, com as revalidações das etapas seguintes"""
+    payload = sanitize_whatsapp_data(_payload(message))
+    payload = sanitize_whatsapp_data(payload)
+    value = payload["entry"][0]["changes"][0]["value"]
+    content = await webhook._extract_message_content_secure(value["messages"][0])
+    validate_security(content)
+    validate_security(content)
+    # Etapas posteriores que recebem o texto já tratado
+    content = sanitize_message(content, "text")
+    security = validate_security(content)
+    return payload, content, security
+
+
+async def test_each_check_runs_once_per_text_message(calls):
+    payload, content, security = await _pipeline(TEXT)
+
+    assert isinstance(payload, TrustedPayload)
+    assert content == "Oi! Quanto custa o corte amanhã?\n\nObrigada"
+    assert security == {"is_spam": False, "is_phishing": False, "is_malware": False}
+    assert content.has(CHECK_SECURITY)
+    assert calls == Counter({
+        "_sanitize_tree": 1, "_remove_dangerous_content": 1, "is_potential_spam": 1, "is_potential_phishing": 1
+    })
+
+
+async def test_interactive_reply_is_not_sanitized_twice(calls):
+    _, content, _ = await _pipeline(LIST_REPLY)
+
+    assert content == "Corte + Escova"
+    assert calls["_remove_dangerous_content"] == 1
+    assert calls["is_potential_spam"] == 1
+
+
+def test_transformed_text_loses_its_marks(calls):
+    content = sanitize_message("Bom dia, tudo bem?", "text")
+    validate_security(content)
+
+    assert type(content[:3]) is str
+    assert type(content + "!") is str
+    validate_security(content + "!")
+    assert calls["is_potential_spam"] == 2
+
+    # Legenda de mídia tem regras próprias: texto já tratado como texto passa por elas
+    sanitize_message(content, "image")
+    assert calls["_remove_dangerous_content"] == 3
+
+
+def test_sql_input_is_escaped_once(calls):
+    once = RobustValidator.sanitize_sql_input("O'Neil")
+    twice = RobustValidator.sanitize_sql_input(once)
+
+    assert twice == "O''Neil" and twice is once
+    assert once.has(CHECK_SQL)
+    assert calls["sanitize_sql_input"] == 2
+
+    restored = pickle.loads(pickle.dumps(once))
+    assert isinstance(restored, SanitizedText) and restored.has(CHECK_SQL)
+
+
+@pytest.mark.load
+async def test_benchmark_sanitize_once(monkeypatch):
+    messages = [
+        {"type": "text", "text": {"body": f"Oi, bom dia! Queria saber se tem horário {i} amanhã de tarde pra "
+                                          f"corte e escova, e quanto fica? Obrigada 😊"}}
+        for i in range(1000)
+    ]
+
+    async def measure():
+        # Melhor de 5 rodadas: ignora pausas do GC e de outros processos
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            for message in messages:
+                await _pipeline(message)
+            timings.append((time.perf_counter() - started) / len(messages))
+        return min(timings)
+
+    with_provenance = await measure()
+    monkeypatch.setattr(whatsapp_sanitizer, "has_checks", lambda value, *checks: False)
+    without_provenance = await measure()
+
+    assert with_provenance < without_provenance
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do ConversationStateManager no Redis: índice de ativas, MGET em lote e SCAN
+"""
+
+import fnmatch
+import os
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+
+from app.services.state_manager import (
+    _SAVE_IF_VERSION_LUA,
+    ConversationState, ConversationStateManager, ConversationStatus, ConversationMessage, MessageRole
+)
+from app.services.strategy_base import BaseStrategy, StrategyResponse
+
+
+class CountingRedis(fakeredis.aioredis.FakeRedis):
+    """fakeredis (com Lua real) que conta idas ao servidor: um comando ou um pipeline"""
+
+    round_trips = 0
+
+    async def execute_command(self, *args, **options):
+        self.round_trips += 1
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def counted(raise_on_error=True):
+            self.round_trips += 1
+            return await execute(raise_on_error)
+        pipe.execute = counted
+        return pipe
+
+
+async def _redis():
+    redis = CountingRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    # Script já carregado no servidor, como em regime (senão a 1ª chamada faz NOSCRIPT + SCRIPT LOAD)
+    await redis.script_load(_SAVE_IF_VERSION_LUA)
+    redis.round_trips = 0
+    return redis
+
+
+class FakeRedis:
+    """Subconjunto do redis.asyncio (decode_responses=True) que conta idas ao servidor; só para o benchmark"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.zsets = {}
+        self.round_trips = 0
+
+    def _alive(self, key):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    # Comandos (síncronos aqui; as versões awaitable contam uma ida cada)
+    def _get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def _setex(self, key, ttl, value):
+        self.data[key] = value
+        self.expires[key] = time.time() + ttl
+
+    def _delete(self, key):
+        self.expires.pop(key, None)
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def _mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def _ttl(self, key):
+        if not self._alive(key):
+            return -2
+        return int(self.expires[key] - time.time()) if key in self.expires else -1
+
+    def _expire(self, key, ttl):
+        if self._alive(key):
+            self.expires[key] = time.time() + ttl
+
+    def _zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def _zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    def _score_range(self, key, low, high):
+        low = float(low)
+        high = float(high)
+        return [m for m, score in sorted(self.zsets.get(key, {}).items(), key=lambda i: i[1]) if low <= score <= high]
+
+    def _zremrangebyscore(self, key, low, high):
+        members = self._score_range(key, low, high)
+        for member in members:
+            del self.zsets[key][member]
+        return len(members)
+
+    def _zrangebyscore(self, key, low, high):
+        return self._score_range(key, low, high)
+
+    def __getattr__(self, name):
+        command = getattr(self, f"_{name}")
+
+        async def call(*args, **kwargs):
+            self.round_trips += 1
+            return command(*args, **kwargs)
+        return call
+
+    async def keys(self, pattern):
+        self.round_trips += 1
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatch(key, pattern)]
+
+    async def scan_iter(self, match, count):
+        keys = [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatch(key, match)]
+        for i in range(0, len(keys), count):
+            self.round_trips += 1
+            for key in keys[i:i + count]:
+                yield key
+
+    def pipeline(self, transaction=False):
+        redis, commands = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                command = getattr(redis, f"_{name}")
+                return lambda *args, **kwargs: commands.append((command, args, kwargs))
+
+            async def execute(self):
+                redis.round_trips += 1
+                return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+        return Pipeline()
+
+
+def _manager(redis):
+    manager = ConversationStateManager()
+    manager.redis_client = redis
+    manager.redis_available = True
+    manager._initialized = True
+    return manager
+
+
+def _state(user_id, status=ConversationStatus.ACTIVE, minutes_ago=0):
+    state = ConversationState(user_id=user_id, phone=user_id, status=status)
+    state.last_activity = datetime.now() - timedelta(minutes=minutes_ago)
+    state.add_message(ConversationMessage(MessageRole.USER, "Quero agendar um corte", datetime.now()))
+    state.last_activity = datetime.now() - timedelta(minutes=minutes_ago)
+    return state
+
+
+async def test_active_index_follows_saves_and_deletes():
+    redis = await _redis()
+    manager = _manager(redis)
+    await manager.save_state("a", _state("a"))
+    await manager.save_state("b", _state("b", ConversationStatus.BOOKING_FLOW))
+    await manager.save_state("c", _state("c", ConversationStatus.COMPLETED))
+    await manager.save_state("d", _state("d"))
+    await manager.update_status("d", ConversationStatus.EXPIRED)
+    manager.memory_cache.clear()  # Outro worker: só o Redis
+
+    assert sorted(await manager.get_active_conversations()) == ["a", "b"]
+
+    await manager.delete_state("a")
+    await redis.zadd("conversation_index:active", {"b": time.time() - 1})  # Conversa venceu
+    assert await manager.get_active_conversations() == []
+    assert await redis.zcard("conversation_index:active") == 0
+    assert 0 < await redis.ttl("conversation_state:b") <= manager.default_ttl
+
+
+async def test_get_states_matches_get_state_with_one_mget_per_batch():
+    redis = await _redis()
+    manager = _manager(redis)
+    for i in range(1200):
+        await manager.save_state(f"user{i}", _state(f"user{i}"))
+    local = _state("only-local")
+    manager.memory_cache.clear()
+    manager.memory_cache["only-local"] = local
+
+    user_ids = [f"user{i}" for i in range(1200)] + ["only-local", "unknown"]
+    redis.round_trips = 0
+    states = await manager.get_states(user_ids)
+    assert redis.round_trips == 3  # 1202 chaves em lotes de 500
+
+    manager.memory_cache.clear()
+    manager.memory_cache["only-local"] = local
+    for user_id in ["user0", "user1199", "only-local"]:
+        expected = await manager.get_state(user_id)
+        assert states[user_id].to_json() == expected.to_json()
+    assert states["unknown"].status == ConversationStatus.INACTIVE and states["unknown"].messages == []
+
+
+async def test_rebuild_index_from_legacy_keys_with_scan():
+    redis = await _redis()
+    pipe = redis.pipeline(transaction=False)
+    for i in range(1100):
+        status = ConversationStatus.ACTIVE if i % 2 else ConversationStatus.COMPLETED
+        pipe.set(f"conversation_state:user{i}", _state(f"user{i}", status).to_json())  # Sem TTL
+    pipe.set("conversation_state:old", _state("old", minutes_ago=120).to_json())
+    await pipe.execute()
+    manager = _manager(redis)
+
+    assert await manager.rebuild_active_index() == 550
+    assert sorted(await manager.get_active_conversations()) == sorted(f"user{i}" for i in range(1, 1100, 2))
+    assert all([await redis.ttl(key) > 0 for key in await redis.keys("conversation_state:*")])
+
+
+class EchoStrategy(BaseStrategy):
+    def __init__(self):
+        super().__init__("hybrid")
+
+    async def execute(self, context):
+        return StrategyResponse(True, "Claro! Qual serviço e horário você prefere?", self.name, 0.01)
+
+    def can_handle(self, context):
+        return True
+
+    def get_priority(self, context):
+        return 50
+
+
+class NoLeadScoring:
+    async def calculate_lead_score(self, **kwargs):
+        return None
+
+
+async def test_session_writes_once_and_replays_changes_on_conflict():
+    redis = await _redis()
+    worker_a, worker_b = _manager(redis), _manager(redis)
+    await worker_a.save_state("u1", _state("u1"))
+
+    redis.round_trips = 0
+    async with worker_a.session("u1") as session:
+        session.add_message(ConversationMessage(MessageRole.USER, "Pode ser amanhã?", datetime.now()))
+        session.start_booking_flow()
+        # Outro worker grava o mesmo estado no meio do turno
+        await worker_b.add_message("u1", ConversationMessage(MessageRole.USER, "Às 10h", datetime.now()))
+        assert redis.round_trips == 3
+    assert redis.round_trips == 3 + 3  # conflito, recarga, gravação
+
+    stored = ConversationState.from_json(await redis.get("conversation_state:u1"))
+    assert [m.content for m in stored.messages] == ["Quero agendar um corte", "Às 10h", "Pode ser amanhã?"]
+    assert stored.status == ConversationStatus.BOOKING_FLOW and stored.version == 3
+    assert worker_a.stats["conflicts"] == 1
+    assert await redis.zscore("conversation_index:active", "u1") is not None
+
+
+async def test_strategy_turn_reads_and_writes_state_once(monkeypatch):
+    from app.services.strategy_manager import StrategyManager
+
+    redis = await _redis()
+    manager = StrategyManager(state_manager=_manager(redis))
+    manager.strategies = {"hybrid": EchoStrategy()}
+    manager.lead_scoring = NoLeadScoring()
+    manager.config["cache_enabled"] = False
+
+    async def no_cached_score(*args, **kwargs):
+        return None
+    monkeypatch.setattr("app.services.strategy_manager.cache_service.get_cached_lead_score", no_cached_score)
+
+    serializations = []
+    to_json = ConversationState.to_json
+    monkeypatch.setattr(ConversationState, "to_json", lambda self: serializations.append(1) or to_json(self))
+
+    for turn in range(3):
+        redis.round_trips = 0
+        result = await manager.process("Quero agendar um corte", "5511900000001", "5511900000001")
+        assert result.success
+        assert redis.round_trips == 2 and len(serializations) == turn + 1  # GET + gravação condicionada
+
+    state = ConversationState.from_json(await redis.get("conversation_state:5511900000001"))
+    assert len(state.messages) == 6 and state.strategy_history == ["hybrid"] * 3
+    assert state.phone == "5511900000001" and state.status == ConversationStatus.BOOKING_FLOW
+    assert state.booking_context.step == "service_selection"
+
+
+@pytest.mark.load
+async def test_benchmark_active_conversations_round_trips():
+    redis = FakeRedis()
+    manager = _manager(redis)
+    pipe = redis.pipeline()
+    for i in range(100_000):
+        state = _state(f"user{i}", ConversationStatus.ACTIVE if i % 10 == 0 else ConversationStatus.COMPLETED)
+        pipe.setex(f"conversation_state:user{i}", 1800, state.to_json())
+        if i % 10 == 0:
+            pipe.zadd("conversation_index:active", {f"user{i}": manager._expires_at(state)})
+    await pipe.execute()
+
+    redis.round_trips = 0
+    started = time.perf_counter()
+    legacy = []
+    for key in await redis.keys("conversation_state:*"):
+        data = await redis.get(key)
+        state = ConversationState.from_json(data)
+        if not state.is_expired() and state.status in (ConversationStatus.ACTIVE, ConversationStatus.BOOKING_FLOW):
+            legacy.append(key.split(":")[-1])
+    legacy_time, legacy_trips = time.perf_counter() - started, redis.round_trips
+
+    redis.round_trips = 0
+    started = time.perf_counter()
+    active = await manager.get_active_conversations()
+    states = await manager.get_states(active)
+    indexed_time, indexed_trips = time.perf_counter() - started, redis.round_trips
+
+    assert sorted(active) == sorted(legacy) and len(states) == 10_000
+    assert indexed_trips == 1 + 10_000 // 500 and legacy_trips > 100_000
+    assert indexed_time < legacy_time
+
+
+@pytest.mark.load
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="TEST_REDIS_URL não definido")
+async def test_benchmark_against_real_redis():
+    import redis.asyncio as aioredis
+
+    client = aioredis.from_url(os.environ["TEST_REDIS_URL"], decode_responses=True)
+    manager = _manager(client)
+    try:
+        await client.delete("conversation_index:active")
+        pipe = client.pipeline(transaction=False)
+        for i in range(100_000):
+            state = _state(f"bench{i}", ConversationStatus.ACTIVE if i % 10 == 0 else ConversationStatus.COMPLETED)
+            pipe.setex(f"conversation_state:bench{i}", 600, state.to_json())
+            if i % 10 == 0:
+                pipe.zadd("conversation_index:active", {f"bench{i}": manager._expires_at(state)})
+        await pipe.execute()
+
+        started = time.perf_counter()
+        legacy = 0
+        for key in await client.keys("conversation_state:bench*"):
+            state = ConversationState.from_json(await client.get(key))
+            legacy += state.status == ConversationStatus.ACTIVE
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        active = await manager.get_active_conversations()
+        await manager.get_states(active)
+        indexed_time = time.perf_counter() - started
+
+        assert len(active) == legacy == 10_000
+        assert indexed_time < legacy_time
+    finally:
+        keys = [key async for key in client.scan_iter(match="conversation_state:bench*", count=1000)]
+        for i in range(0, len(keys), 1000):
+            await client.delete(*keys[i:i + 1000])
+        await client.delete("conversation_index:active")
+        await client.aclose()
+
+
+@pytest.mark.skipif(not os.getenv("TEST_REDIS_URL"), reason="TEST_REDIS_URL não definido")
+async def test_session_conflict_against_real_redis():
+    import redis.asyncio as aioredis
+
+    client = aioredis.from_url(os.environ["TEST_REDIS_URL"], decode_responses=True)
+    worker_a, worker_b = _manager(client), _manager(client)
+    user_id = f"session-test-{time.time_ns()}"
+    try:
+        await worker_a.save_state(user_id, _state(user_id))
+        async with worker_a.session(user_id) as session:
+            session.add_message(ConversationMessage(MessageRole.USER, "primeira", datetime.now()))
+            await worker_b.add_message(user_id, ConversationMessage(MessageRole.USER, "segunda", datetime.now()))
+
+        stored = ConversationState.from_json(await client.get(f"conversation_state:{user_id}"))
+        assert [m.content for m in stored.messages][-2:] == ["segunda", "primeira"]
+        assert worker_a.stats["conflicts"] == 1
+    finally:
+        await worker_a.delete_state(user_id)
+        await client.aclose()
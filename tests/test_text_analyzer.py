@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do analisador de texto compartilhado (fluxo, lead scoring, handoff, spam)
+"""
+
+import re
+import time
+
+import pytest
+
+from app.services.conversation_flow import ConversationFlowEngine
+from app.services.intelligent_handoff import IntelligentHandoffService
+from app.services.lead_scoring import LeadScoringEngine
+from app.utils.text_analyzer import TextAnalyzer, fold, required_literals, text_analyzer
+from app.utils.whatsapp_sanitizer import SPAM_PATTERNS, WhatsAppSecurityValidator
+
+
+def test_keyword_sets_match_overlapping_and_prefix_keywords():
+    analyzer = TextAnalyzer()
+    analyzer.register_keywords("price", ["quanto", "quanto custa", "custa", "preço"])
+    analyzer.register_keywords("greeting", ["oi", "olá"])
+
+    features = analyzer.analyze("Olá! Quanto custa? Qual o PRECO")
+
+    assert features.folded == "ola! quanto custa? qual o preco"
+    assert features.hits("price") == {"quanto", "quanto custa", "custa", "preço"}
+    assert features.hits("greeting") == {"olá"}
+    assert not analyzer.analyze("tudo certo").has("price")
+
+
+def test_analysis_is_memoized_until_sets_change():
+    analyzer = TextAnalyzer()
+    analyzer.register_keywords("a", ["corte"])
+    first = analyzer.analyze("quero um corte")
+    assert analyzer.analyze("quero um corte") is first
+
+    analyzer.register_keywords("a", ["corte"])
+    assert analyzer.analyze("quero um corte") is first
+
+    analyzer.register_keywords("b", ["quero"])
+    assert analyzer.analyze("quero um corte").hits("b") == {"quero"}
+    assert analyzer.get_stats()["rebuilds"] == 2
+
+
+def test_pattern_sets_report_first_matching_pattern_in_order():
+    analyzer = TextAnalyzer()
+    analyzer.register_patterns("rule", [r"\b(reclamação|péssimo)\b", r"\b(cancelar)\b"])
+
+    features = analyzer.analyze("Vou CANCELAR, atendimento pessimo")
+
+    assert analyzer.match_pattern(features, "rule") == r"\b(reclamação|péssimo)\b"
+    assert analyzer.match_pattern(analyzer.analyze("bom dia"), "rule") is None
+
+
+def test_required_literals_prefilter_patterns():
+    assert required_literals(r"\b(investment|investimento).*(risk.?free)\b") == ["investment", "investimento"]
+    assert required_literals(r"http[s]?://bit\.ly") == ["://bit.ly"]
+    assert required_literals(r"(.)\1{10,}") is None
+
+    analyzer = TextAnalyzer()
+    analyzer.register_patterns("rule", [r"\bpyramid.?scheme\b", r"(.)\1{3,}"])
+    assert analyzer.match_pattern(analyzer.analyze("a pyramid-scheme"), "rule") == r"\bpyramid.?scheme\b"
+    assert analyzer.match_pattern(analyzer.analyze("aaaa"), "rule") == r"(.)\1{3,}"
+    assert analyzer.match_pattern(analyzer.analyze("pyramid"), "rule") is None
+
+
+def test_consumers_read_the_shared_feature_bag():
+    flow = ConversationFlowEngine()
+    lead = LeadScoringEngine()
+    IntelligentHandoffService()
+
+    message = "Oi, nao posso ir hoje, quanto custa reagendar? E urgente"
+    topics = [topic.topic_id for topic in flow._detect_topics(message)]
+    behavior = lead._analyze_message_behavior(message)
+    before = text_analyzer.get_stats()["analyzed"]
+    lead._analyze_buying_intention(message, None)
+
+    assert topics == ["scheduling", "pricing", "cancellation", "greeting"]
+    assert behavior["urgency_indicators"] == 6
+    # Segundo consumidor reaproveita a análise da mesma mensagem
+    assert text_analyzer.get_stats()["analyzed"] == before
+    assert text_analyzer.match_pattern(text_analyzer.analyze("o app nao funciona"), "handoff.complaint_detection")
+    assert WhatsAppSecurityValidator.is_potential_spam("Parabéns, você foi selecionado")
+    assert WhatsAppSecurityValidator.is_potential_phishing("please verify your account")
+    assert not WhatsAppSecurityValidator.is_potential_spam("Bom dia, tem horário amanhã?")
+
+
+@pytest.mark.load
+def test_benchmark_per_message_analysis():
+    flow = ConversationFlowEngine()
+    lead = LeadScoringEngine()
+    handoff = IntelligentHandoffService()
+    keyword_lists = [topic.keywords for topic in flow.topic_definitions.values()]
+    keyword_lists += list(flow.context_patterns.values())
+    keyword_lists += [lead.urgency_keywords, lead.price_keywords, lead.buying_signals, lead.decision_authority]
+    patterns = [p for rule in handoff.config["handoff_rules"] for p in rule["trigger_patterns"]] + SPAM_PATTERNS
+
+    messages = [
+        f"Oi, bom dia! Gostaria de saber quanto custa o corte {i} e se posso agendar para amanhã "
+        f"à tarde, é urgente porque tenho um evento na próxima semana"
+        for i in range(2000)
+    ]
+
+    def legacy(message):
+        # Um laço de substring por conjunto e um re.search por regra, como antes
+        lower = message.lower()
+        hits = [sum(1 for keyword in keywords if keyword in lower) for keywords in keyword_lists]
+        return hits, [re.search(pattern, lower) for pattern in patterns]
+
+    started = time.perf_counter()
+    for message in messages:
+        legacy(message)
+    per_legacy = (time.perf_counter() - started) / len(messages)
+
+    analyzer = TextAnalyzer(cache_size=10)
+    for index, keywords in enumerate(keyword_lists):
+        analyzer.register_keywords(str(index), keywords)
+    analyzer.register_patterns("rules", patterns)
+    started = time.perf_counter()
+    for message in messages:
+        features = analyzer.analyze(message)
+        analyzer.match_pattern(features, "rules")
+    per_shared = (time.perf_counter() - started) / len(messages)
+
+    assert fold("Não") == "nao"
+    assert per_shared < 0.002
+    assert per_shared < per_legacy
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da unidade de trabalho por mensagem recebida (commits por turno)
+"""
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.database import Conversation, Message, User
+from app.services.data import ConversationService, MessageService, UserService
+from app.services.identity_cache import identity_cache
+from app.services.unit_of_work import unit_of_work
+
+
+async def _turn(db, wa_id: str):
+    async with unit_of_work(db):
+        user = await UserService.get_or_create_user(db, wa_id)
+        conversation = await ConversationService.get_or_create_conversation(db, user.id)
+        await MessageService.create_message(db, user.id, conversation.id, "in", "Oi")
+    await MessageService.create_message(db, user.id, conversation.id, "out", "Olá! Como posso ajudar?")
+    return user, conversation
+
+
+async def test_message_turn_uses_two_commits(database):
+    async with database("uow.db", count_commits=True) as test_db:
+        async with test_db.session() as db:
+            await _turn(db, "5511988880001")
+            assert len(test_db.commits) == 2
+
+            test_db.commits.clear()
+            await _turn(db, "5511988880001")
+            assert len(test_db.commits) == 2
+
+        async with test_db.session() as db:
+            assert await db.scalar(select(func.count()).select_from(Message)) == 4
+
+
+async def test_create_message_bumps_last_message_at_in_same_commit(database):
+    async with database("uow.db", count_commits=True) as test_db:
+        async with test_db.session() as db:
+            user, conversation = await _turn(db, "5511988880002")
+            test_db.commits.clear()
+            message = await MessageService.create_message(db, user.id, conversation.id, "out", "Até mais")
+            assert len(test_db.commits) == 1
+            assert message.id is not None and message.created_at is not None
+
+        async with test_db.session() as db:
+            stored = await db.get(Conversation, conversation.id)
+            assert stored.last_message_at is not None
+
+
+async def test_failure_rolls_back_whole_unit_and_skips_cache(database):
+    async with database("uow.db", count_commits=True) as test_db:
+        async with test_db.session() as db:
+            with pytest.raises(RuntimeError):
+                async with unit_of_work(db):
+                    user = await UserService.get_or_create_user(db, "5511988880003")
+                    await ConversationService.get_or_create_conversation(db, user.id)
+                    raise RuntimeError("falha no meio do turno")
+
+            assert test_db.commits == []
+            assert identity_cache.get_user("5511988880003") is None
+
+        async with test_db.session() as db:
+            assert await db.scalar(select(func.count()).select_from(User)) == 0
+            assert await db.scalar(select(func.count()).select_from(Conversation)) == 0